@@ -1,13 +1,31 @@
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from ..config import app_config
+from .versioning import StoreVersions
+from .changes import ChangeLog, change_follower
+from .snapshots import SnapshotDict
+from contextlib import nullcontext
 
-# In-memory 'database' for simplicity
-users_db = {}
-rides_db = {}
-driving_events_db = {}
-driver_scores_db = {}
-incident_reports_db = {}
+# In-memory 'database' for simplicity. Dicts with copy-on-write snapshots, so a scan
+# in one request thread never sees another thread's writes half-way (app/snapshots.py).
+users_db = SnapshotDict()
+rides_db = SnapshotDict()
+driving_events_db = SnapshotDict()
+driver_scores_db = SnapshotDict()
+incident_reports_db = SnapshotDict()
+trip_traces_db = SnapshotDict()  # ride_id -> compact GPS trace (app/polyline.py)
+event_summaries_db = SnapshotDict()  # 'driver:type:hour' -> hourly summary of compacted events (app/retention.py)
+ride_groups_db = SnapshotDict()  # group_id -> pooled trip proposal over several rides (app/pooling.py)
+webhook_endpoints_db = SnapshotDict()  # endpoint id -> partner webhook subscription (app/webhooks.py)
+webhook_outbox_db = SnapshotDict()  # notification id -> notification waiting for delivery, or failed
+driver_positions_db = None  # shared-store mode only: driver_id -> last heartbeat (app/locations.py)
+anomaly_alerts_db = None  # shared-store mode only: alert_id -> anomaly alert (app/anomaly.py)
+
+# Rides and users partitioned into region shards, each with its own locks (app/shards.py).
+if app_config.STORE_SHARD_PRECISION:
+    from .shards import RegionShardedStore, ride_position, home_position
+    users_db = RegionShardedStore(home_position, app_config.STORE_SHARD_PRECISION, app_config.STORE_FANOUT_THREADS)
+    rides_db = RegionShardedStore(ride_position, app_config.STORE_SHARD_PRECISION, app_config.STORE_FANOUT_THREADS)
 
 class IDManager:
     def __init__(self):
@@ -15,6 +33,10 @@ class IDManager:
         self.ride_id_counter = 0
         self.driving_event_id_counter = 0
         self.incident_report_id_counter = 0
+        self.ride_group_id_counter = 0
+        self.webhook_endpoint_id_counter = 0
+        self.notification_id_counter = 0
+        self.anomaly_alert_id_counter = 0
 
     def get_next_user_id(self):
         self.user_id_counter += 1
@@ -32,21 +54,211 @@ class IDManager:
         self.incident_report_id_counter += 1
         return self.incident_report_id_counter
 
+    def get_next_ride_group_id(self):
+        self.ride_group_id_counter += 1
+        return self.ride_group_id_counter
+
+    def get_next_webhook_endpoint_id(self):
+        self.webhook_endpoint_id_counter += 1
+        return self.webhook_endpoint_id_counter
+
+    def get_next_notification_id(self):
+        self.notification_id_counter += 1
+        return self.notification_id_counter
+
+    def get_next_anomaly_alert_id(self):
+        self.anomaly_alert_id_counter += 1
+        return self.anomaly_alert_id_counter
+
 id_manager = IDManager()
+store_versions = StoreVersions()
+change_log = ChangeLog()
+
+# Multi-process mode (serve.py): swap the dicts for stores in a shared SQLite file.
+# Must happen here, before the blueprints import the stores by name.
+if app_config.SHARED_STORE_PATH:
+    from .shared_store import SharedStore, SharedIDManager, SharedStoreVersions, SharedChangeLog, read_snapshot
+    users_db = SharedStore(app_config.SHARED_STORE_PATH, 'users')
+    rides_db = SharedStore(app_config.SHARED_STORE_PATH, 'rides')
+    driving_events_db = SharedStore(app_config.SHARED_STORE_PATH, 'driving_events')
+    driver_scores_db = SharedStore(app_config.SHARED_STORE_PATH, 'driver_scores')
+    incident_reports_db = SharedStore(app_config.SHARED_STORE_PATH, 'incident_reports')
+    trip_traces_db = SharedStore(app_config.SHARED_STORE_PATH, 'trip_traces')
+    event_summaries_db = SharedStore(app_config.SHARED_STORE_PATH, 'event_summaries')
+    ride_groups_db = SharedStore(app_config.SHARED_STORE_PATH, 'ride_groups')
+    webhook_endpoints_db = SharedStore(app_config.SHARED_STORE_PATH, 'webhook_endpoints')
+    webhook_outbox_db = SharedStore(app_config.SHARED_STORE_PATH, 'webhook_outbox')
+    driver_positions_db = SharedStore(app_config.SHARED_STORE_PATH, 'driver_positions')
+    anomaly_alerts_db = SharedStore(app_config.SHARED_STORE_PATH, 'anomaly_alerts')
+    id_manager = SharedIDManager(app_config.SHARED_STORE_PATH)
+    store_versions = SharedStoreVersions(app_config.SHARED_STORE_PATH)
+    change_log = SharedChangeLog(app_config.SHARED_STORE_PATH)
+
 jwt = JWTManager()
 
+
+def rebuild_indexes():
+    """Rebuilds every derived in-memory index from the stores; returns the change seq they reflect."""
+    from .leaderboard import score_index
+    from .ride_history import ride_history
+    from .analytics import rollups
+    from .search import incident_search
+    from .heatmap import heatmap
+    from .pooling import pooling
+    from .retention import retention
+    from .webhooks import webhooks
+    from .locations import driver_locations
+    from .anomaly import anomaly_detector
+    snapshot = read_snapshot(app_config.SHARED_STORE_PATH) if app_config.SHARED_STORE_PATH else nullcontext()
+    with snapshot:
+        seq = change_log.last_seq
+        score_index.rebuild(driver_scores_db.values())
+        ride_history.rebuild(rides_db.values())
+        rollups.rebuild(rides_db.values(), driving_events_db.values(), event_summaries_db.values())
+        incident_search.rebuild(incident_reports_db.values())
+        heatmap.rebuild(driving_events_db.values(), incident_reports_db.values())
+        pooling.rebuild(rides_db.values())
+        retention.rebuild(driving_events_db.values(), event_summaries_db.values())
+        webhooks.rebuild(webhook_outbox_db.values())
+        driver_locations.rebuild()
+        anomaly_detector.rebuild(driving_events_db.values())
+    return seq
+
+
+def _follow_other_workers():
+    """Applies writes made by other workers (shared-store mode) to this worker's indexes."""
+    from .leaderboard import score_index
+    from .ride_history import ride_history
+    from .analytics import rollups
+    from .search import incident_search
+    from .heatmap import heatmap, hour_of
+    from .pooling import pooling
+    from .ride_events import ride_status_broker
+
+    def on_ride(change):
+        if change['op'] == 'upsert':
+            ride_history.add_ride(change['record'])
+            rollups.apply_ride(change['record'])
+            pooling.update(change['record'])
+            ride_status_broker.publish(change['record'])
+
+    def on_event(change):
+        # Events are immutable: version 1 is the insert, deletes are retention compacting them.
+        if change['op'] == 'upsert' and change['record'].get('version') == 1:
+            heatmap.add_event(change['record'])
+            rollups.event_logged(change['record'])
+
+    def on_summary(change):
+        if change['op'] == 'delete':
+            summary = change['record']
+            rollups.events_dropped(summary['driver_id'], hour_of(summary['hour']), summary['count'])
+
+    def on_score(change):
+        if change['op'] == 'upsert':
+            score_index.update(change['record'])
+        else:
+            score_index.remove(change['key'])
+
+    def on_incident(change):
+        if change['op'] != 'upsert':
+            return
+        if change['record'].get('version') == 1:
+            heatmap.add_incident(change['record'])
+            incident_search.add(change['record'])
+        else:
+            incident_search.upsert(change['record'])
+
+    change_follower.register('rides', on_ride)
+    change_follower.register('driving_events', on_event)
+    change_follower.register('event_summaries', on_summary)
+    change_follower.register('driver_scores', on_score)
+    change_follower.register('incident_reports', on_incident)
+    change_follower.on_gap(rebuild_indexes)
+
+
 def create_app(config_object=app_config):
     app = Flask(__name__)
     app.config.from_object(config_object)
+
+    from .json_provider import FastJSONProvider, record_cache
+    app.json = FastJSONProvider(app)
+    record_cache.init_app(app)
+
+    # First, so captured timings include the other request hooks.
+    from .capture import traffic_capture
+    traffic_capture.init_app(app)
+
+    # ?fields= and ?profile=, and compression; its after_request hook runs just before capture's.
+    from .response_profiles import response_profiles
+    response_profiles.init_app(app)
+
     jwt.init_app(app)
+    change_log.init_app(app)
+
+    from .jobs import jobs
+    jobs.init_app(app)
+
+    from .locations import driver_locations
+    driver_locations.init_app(app)
+
+    from .heatmap import heatmap
+    heatmap.init_app(app)
+
+    from .pooling import pooling
+    pooling.init_app(app)
+
+    from .eta import eta
+    eta.init_app(app)
+
+    from .anomaly import anomaly_detector
+    anomaly_detector.init_app(app)
+
+    from .analytics import rollups
+    from .retention import retention
+    rollups.init_app(app)
+    retention.init_app(app)
+
+    from .webhooks import webhooks
+    webhooks.init_app(app)
+
+    # Derived indexes are rebuilt from the stores at startup. In shared-store mode the
+    # rebuild reads one snapshot, and other workers' later writes are replayed from
+    # the change log after its last seq (app/changes.py ChangeFollower).
+    follow_from = rebuild_indexes()
+    if app_config.SHARED_STORE_PATH and not change_follower.active:
+        _follow_other_workers()
+        change_follower.start(change_log, follow_from, app.config.get('CHANGE_FOLLOW_INTERVAL_MS', 200) / 1000)
+    retention.start_background()
+
+    from .idempotency import idempotency_cache
+    from .rate_limit import rate_limiter
+    if app_config.SHARED_STORE_PATH:
+        # Keys and buckets must be seen by every worker, or a retry landing on another
+        # worker runs twice and each worker grants the full rate.
+        from .shared_store import SharedIdempotencyCache, SharedTokenBucketStore
+        SharedIdempotencyCache(app_config.SHARED_STORE_PATH).init_app(app)
+        rate_limiter.buckets = SharedTokenBucketStore(app_config.SHARED_STORE_PATH)
+    else:
+        idempotency_cache.init_app(app)
+    rate_limiter.init_app(app)
 
     from .auth import auth_bp
     from .routes import main_bp
     from .monitoring_routes import monitoring_bp # Import new blueprint
+    from .changes_routes import changes_bp
+    from .analytics_routes import analytics_bp
+    from .webhooks_routes import webhooks_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(main_bp, url_prefix='/api')
     app.register_blueprint(monitoring_bp, url_prefix='/api/monitoring') # Register it
+    app.register_blueprint(changes_bp, url_prefix='/api')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(webhooks_bp, url_prefix='/api/webhooks')
+
+    # Handlers and schedules are registered by now; replay the journal and start the workers.
+    jobs.start()
+    webhooks.start()
 
     @app.route('/health')
     def health_check():
@@ -0,0 +1,198 @@
+"""Incrementally maintained fleet analytics rollups.
+
+Ride state transitions and event ingestion update small counter tables as a side
+effect, and the analytics endpoints read only these tables:
+
+* per hour (of request): requested / completed / cancelled rides and fare totals
+* per status: rides currently in each status
+* per driver: completed / cancelled rides, fare totals, events per hour
+
+Outcomes are attributed to the hour the ride was requested. The rollups are
+therefore a pure function of the current ride and event records (including the
+hourly event summaries that app/retention.py compacts old events into).
+`flask rebuild-rollups` recomputes them from scratch. POST /api/analytics/rebuild does
+the same inside a running server and reports any drift from the live tables.
+"""
+import threading
+
+import click
+from flask.cli import with_appcontext
+
+from .heatmap import hour_of
+
+
+def _hour_row():
+    return {"requested": 0, "completed": 0, "cancelled": 0, "fare_total": 0.0, "fares": 0}
+
+
+def _driver_row():
+    return {"completed": 0, "cancelled": 0, "fare_total": 0.0, "fares": 0, "events": 0, "events_by_hour": {}}
+
+
+class FleetRollups:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.by_hour = {}
+        self.by_status = {}
+        self.by_driver = {}
+        self._ride_status = {}  # ride id -> status counted in by_status, for apply_ride
+
+    def init_app(self, app):
+        app.cli.add_command(rebuild_rollups_command)
+        app.extensions['rollups'] = self
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # --- maintenance hooks ---
+
+    def _apply_outcome(self, ride, status):
+        if status not in ('completed', 'cancelled'):
+            return
+        hour_row = self.by_hour.setdefault(hour_of(ride.get('requested_at')), _hour_row())
+        hour_row[status] += 1
+        fare = ride.get('fare') if status == 'completed' else None
+        if fare is not None:
+            hour_row['fare_total'] += fare
+            hour_row['fares'] += 1
+        if ride.get('driver_id') is not None:
+            driver_row = self.by_driver.setdefault(ride['driver_id'], _driver_row())
+            driver_row[status] += 1
+            if fare is not None:
+                driver_row['fare_total'] += fare
+                driver_row['fares'] += 1
+
+    def _requested(self, ride):
+        self.by_hour.setdefault(hour_of(ride.get('requested_at')), _hour_row())['requested'] += 1
+        self.by_status[ride['status']] = self.by_status.get(ride['status'], 0) + 1
+        self._ride_status[ride['id']] = ride['status']
+
+    def _status_changed(self, ride, old_status):
+        self.by_status[old_status] = self.by_status.get(old_status, 0) - 1
+        self.by_status[ride['status']] = self.by_status.get(ride['status'], 0) + 1
+        self._ride_status[ride['id']] = ride['status']
+        self._apply_outcome(ride, ride['status'])
+
+    def ride_requested(self, ride):
+        with self._lock:
+            self._requested(ride)
+
+    def ride_status_changed(self, ride, old_status):
+        with self._lock:
+            self._status_changed(ride, old_status)
+
+    def apply_ride(self, ride):
+        """Counts a ride written by another worker (shared-store mode), given only its new state."""
+        with self._lock:
+            old_status = self._ride_status.get(ride['id'])
+            if old_status is None:
+                self._requested(ride)
+                self._apply_outcome(ride, ride['status'])
+            elif old_status != ride['status']:
+                self._status_changed(ride, old_status)
+
+    def _count_events(self, driver_id, hour, count):
+        driver_row = self.by_driver.setdefault(driver_id, _driver_row())
+        driver_row['events'] += count
+        remaining = driver_row['events_by_hour'].get(hour, 0) + count
+        if remaining:
+            driver_row['events_by_hour'][hour] = remaining
+        else:
+            driver_row['events_by_hour'].pop(hour, None)
+
+    def event_logged(self, event):
+        hour = hour_of(event.get('timestamp'))
+        if hour is None:
+            hour = hour_of(event.get('logged_at'))
+        with self._lock:
+            self._count_events(event['driver_id'], hour, 1)
+
+    def events_dropped(self, driver_id, hour, count):
+        # Retention dropped a summary (or raw events that were not worth summarizing).
+        with self._lock:
+            self._count_events(driver_id, hour, -count)
+
+    # --- rebuild / verification ---
+
+    def rebuild(self, rides, events, summaries=()):
+        fresh = FleetRollups()
+        for ride in rides:
+            fresh._requested(ride)
+            fresh._apply_outcome(ride, ride['status'])
+        for event in events:
+            fresh.event_logged(event)
+        for summary in summaries:
+            fresh._count_events(summary['driver_id'], hour_of(summary['hour']), summary['count'])
+        with self._lock:
+            self.by_hour, self.by_status, self.by_driver = fresh.by_hour, fresh.by_status, fresh.by_driver
+            self._ride_status = fresh._ride_status
+        return self
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "by_hour": {h: dict(row) for h, row in self.by_hour.items()},
+                "by_status": {s: n for s, n in self.by_status.items() if n},
+                "by_driver": {d: dict(row, events_by_hour=dict(row['events_by_hour'])) for d, row in self.by_driver.items()},
+            }
+
+    # --- reads ---
+
+    def hourly(self, from_hour, to_hour):
+        with self._lock:
+            return [dict(self.by_hour[h], hour=h) for h in sorted(self.by_hour)
+                    if h is not None and from_hour <= h <= to_hour]
+
+    def summary(self):
+        with self._lock:
+            totals = _hour_row()
+            for row in self.by_hour.values():
+                for field in totals:
+                    totals[field] += row[field]
+            by_status = {s: n for s, n in self.by_status.items() if n}
+            driver_hours = sum(len(row['events_by_hour']) for row in self.by_driver.values())
+            events = sum(row['events'] for row in self.by_driver.values())
+        return totals, by_status, driver_hours, events
+
+    def driver(self, driver_id):
+        with self._lock:
+            row = self.by_driver.get(driver_id)
+            return dict(row, events_by_hour=dict(row['events_by_hour'])) if row else _driver_row()
+
+
+def _diff(live, rebuilt, path=''):
+    if isinstance(live, dict) and isinstance(rebuilt, dict):
+        for key in sorted(set(live) | set(rebuilt), key=repr):
+            yield from _diff(live.get(key), rebuilt.get(key), f"{path}/{key}")
+    elif isinstance(live, float) or isinstance(rebuilt, float):
+        if abs((live or 0) - (rebuilt or 0)) > 1e-6:
+            yield f"{path}: live={live} rebuilt={rebuilt}"
+    elif live != rebuilt:
+        yield f"{path}: live={live} rebuilt={rebuilt}"
+
+
+def rebuild_and_diff(rides, events, summaries=()):
+    """Rebuilds the live rollups from the stores; returns how the old tables differed."""
+    before = rollups.snapshot()
+    rollups.rebuild(rides, events, summaries)
+    return list(_diff(before, rollups.snapshot()))
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the analytics rollups from rides_db and driving_events_db."""
+    # A fresh process has nothing live to compare against; POST /api/analytics/rebuild verifies a running server.
+    from . import rides_db, driving_events_db, event_summaries_db
+    rollups.rebuild(rides_db.values(), driving_events_db.values(), event_summaries_db.values())
+    totals, by_status, driver_hours, events = rollups.summary()
+    click.echo(f"Rebuilt rollups from {len(rides_db)} rides and {len(driving_events_db)} events.")
+    click.echo(f"requested={totals['requested']} completed={totals['completed']} cancelled={totals['cancelled']} "
+               f"statuses={by_status} active driver-hours={driver_hours}")
+
+
+rollups = FleetRollups()
@@ -0,0 +1,91 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from app import rides_db, driving_events_db, event_summaries_db
+from app.analytics import rollups, rebuild_and_diff
+from app.heatmap import hour_of
+from app.retention import hour_iso
+from app.monitoring_routes import is_admin_user
+import datetime
+
+analytics_bp = Blueprint('analytics_bp', __name__)
+
+# All reads come from the rollup tables in app/analytics.py, never from the stores.
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def _average(total, count):
+    return round(total / count, 2) if count else None
+
+
+@analytics_bp.route('/rides/summary', methods=['GET'])
+@jwt_required()
+def rides_summary():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    totals, by_status, driver_hours, events = rollups.summary()
+    return jsonify({
+        "requested": totals['requested'], "completed": totals['completed'], "cancelled": totals['cancelled'],
+        "completion_rate": _rate(totals['completed'], totals['requested']),
+        "cancellation_rate": _rate(totals['cancelled'], totals['requested']),
+        "average_fare": _average(totals['fare_total'], totals['fares']),
+        "rides_by_status": by_status,
+        "events": events, "active_driver_hours": driver_hours,
+        "events_per_driver_hour": _average(events, driver_hours),
+    }), 200
+
+
+@analytics_bp.route('/rides/hourly', methods=['GET'])
+@jwt_required()
+def rides_hourly():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    now = datetime.datetime.utcnow()
+    from_hour = hour_of(request.args.get('from', (now - datetime.timedelta(hours=24)).isoformat()))
+    to_hour = hour_of(request.args.get('to', now.isoformat()))
+    if from_hour is None or to_hour is None or from_hour > to_hour:
+        return jsonify({"error": "from/to must be ISO 8601 timestamps with from <= to"}), 400
+    max_hours = current_app.config.get('ANALYTICS_MAX_QUERY_HOURS', 24 * 366)
+    if to_hour - from_hour + 1 > max_hours:
+        return jsonify({"error": f"Time range is limited to {max_hours} hours"}), 400
+
+    hours = [{
+        "hour": hour_iso(row['hour']), "requested": row['requested'],
+        "completed": row['completed'], "cancelled": row['cancelled'],
+        "completion_rate": _rate(row['completed'], row['requested']),
+        "cancellation_rate": _rate(row['cancelled'], row['requested']),
+        "average_fare": _average(row['fare_total'], row['fares']),
+    } for row in rollups.hourly(from_hour, to_hour)]
+    return jsonify({"hours": hours}), 200
+
+
+@analytics_bp.route('/drivers/<int:driver_id>', methods=['GET'])
+@jwt_required()
+def driver_analytics(driver_id):
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    row = rollups.driver(driver_id)
+    active_hours = len(row['events_by_hour'])
+    return jsonify({
+        "driver_id": driver_id, "completed": row['completed'], "cancelled": row['cancelled'],
+        "average_fare": _average(row['fare_total'], row['fares']),
+        "events": row['events'], "active_hours": active_hours,
+        "events_per_active_hour": _average(row['events'], active_hours),
+        "events_by_hour": {hour_iso(h): n for h, n in sorted(row['events_by_hour'].items()) if h is not None},
+    }), 200
+
+
+@analytics_bp.route('/rebuild', methods=['POST'])
+@jwt_required()
+def rebuild_rollups():
+    # Recomputes every rollup from the stores and reports any drift from the incrementally maintained tables.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    differences = rebuild_and_diff(rides_db.values(), driving_events_db.values(), event_summaries_db.values())
+    return jsonify({"rides": len(rides_db), "events": len(driving_events_db), "differences": differences}), 200
@@ -0,0 +1,183 @@
+"""Real-time detection of bursts of harsh driving events.
+
+log_driving_event feeds every event to the detector. Each (driver, event type) with a
+rule in ANOMALY_RULES gets a bucketed ring buffer covering the rule's window: a few
+fixed-size arrays, reused as time moves on. Counting an event touches one bucket and
+sums a constant number of buckets. When the count reaches the threshold an alert is
+raised, and the same driver/type can only alert again after a cooldown. Drivers are
+kept in an LRU capped at max_drivers, so memory stays bounded as the fleet grows.
+
+In shared-store mode (serve.py workers) every worker also counts the events logged
+by the others, fed from the change follower, so a burst spread over workers is seen
+as one. Only the worker that logged the event crossing the threshold raises the
+alert; the others start the cooldown for it. Alerts are kept in the shared
+anomaly_alerts store, so GET /api/monitoring/alerts lists every worker's alerts.
+
+Event times come from the client, so they are clamped to the server clock: one event
+stamped in the future would otherwise push the window ahead and make every later
+event look too old to count.
+"""
+import datetime
+import itertools
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+from .changes import change_follower
+
+# event_type -> (threshold, window seconds)
+DEFAULT_RULES = {
+    'hard_braking': (3, 300),
+    'harsh_braking': (3, 300),
+    'rapid_acceleration': (3, 300),
+    'speeding': (5, 600),
+}
+
+
+class SlidingWindowCounter:
+    __slots__ = ('bucket_seconds', 'counts', 'epochs', 'last_alert')
+
+    def __init__(self, window_seconds, buckets=10):
+        self.bucket_seconds = window_seconds / buckets
+        self.counts = array('I', [0]) * buckets
+        self.epochs = array('q', [-1]) * buckets
+        self.last_alert = None
+
+    def add(self, timestamp):
+        """Counts an event and returns the events in the window ending at it, or None if it is too old."""
+        buckets = len(self.counts)
+        epoch = int(timestamp // self.bucket_seconds)
+        if epoch <= max(self.epochs) - buckets:
+            return None
+        index = epoch % buckets
+        if self.epochs[index] != epoch:
+            self.epochs[index] = epoch
+            self.counts[index] = 0
+        self.counts[index] += 1
+        oldest = epoch - buckets
+        return sum(count for count, e in zip(self.counts, self.epochs) if oldest < e <= epoch)
+
+
+def _event_time(event):
+    try:
+        moment = datetime.datetime.fromisoformat(str(event.get('timestamp')).replace('Z', '+00:00'))
+    except ValueError:
+        moment = datetime.datetime.utcnow()
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+class AnomalyDetector:
+    def __init__(self, rules=None, buckets=10, cooldown_seconds=600, max_alerts=1000, max_drivers=100000,
+                 clock=time.time):
+        self.clock = clock
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.buckets = buckets
+        self.cooldown_seconds = cooldown_seconds
+        self.max_drivers = max_drivers
+        self.auto_incident = False
+        self._drivers = OrderedDict()  # driver_id -> {event_type: SlidingWindowCounter}
+        self._alerts = deque(maxlen=max_alerts)
+        self._alert_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.store = None  # shared-store mode: alert_id -> alert, written by every worker
+        self._next_alert_id = None
+
+    def init_app(self, app):
+        self.rules = dict(app.config.get('ANOMALY_RULES', self.rules))
+        self.buckets = app.config.get('ANOMALY_WINDOW_BUCKETS', self.buckets)
+        self.cooldown_seconds = app.config.get('ANOMALY_ALERT_COOLDOWN_SECONDS', self.cooldown_seconds)
+        self.max_drivers = app.config.get('ANOMALY_MAX_DRIVERS', self.max_drivers)
+        self.auto_incident = app.config.get('ANOMALY_AUTO_INCIDENT', self.auto_incident)
+        self._alerts = deque(maxlen=app.config.get('ANOMALY_MAX_ALERTS', self._alerts.maxlen))
+        if app.config.get('SHARED_STORE_PATH') and self.store is None:
+            from . import anomaly_alerts_db, id_manager
+            self.store, self._next_alert_id = anomaly_alerts_db, id_manager.get_next_anomaly_alert_id
+            change_follower.register('driving_events', self._remote_event)
+        app.extensions['anomaly_detector'] = self
+
+    def _remote_event(self, change):
+        # Events are immutable, so version 1 is the insert; deletes are retention compacting them.
+        if change['op'] == 'upsert' and change['record'].get('version') == 1:
+            self.observe(change['record'], local=False)
+
+    def rebuild(self, events):
+        """Refills the windows from the stored events still inside one; raises no alerts."""
+        horizon = self.clock() - max((window for _threshold, window in self.rules.values()), default=0)
+        with self._lock:
+            self._drivers.clear()
+        for event in events:
+            if event.get('event_type') in self.rules and _event_time(event) > horizon:
+                self.observe(event, local=False)
+
+    def clear(self):
+        with self._lock:
+            self._drivers.clear()
+            self._alerts.clear()
+            self._alert_ids = itertools.count(1)
+
+    def observe(self, event, local=True):
+        """Counts a logged driving event; returns the alert it raised, if any.
+
+        Events logged elsewhere (local=False) count and start the cooldown, but raise nothing.
+        """
+        rule = self.rules.get(event.get('event_type'))
+        if rule is None:
+            return None
+        threshold, window_seconds = rule
+        timestamp = min(_event_time(event), self.clock())
+        driver_id = event.get('driver_id')
+        with self._lock:
+            counters = self._drivers.get(driver_id)
+            if counters is None:
+                counters = self._drivers[driver_id] = {}
+                if len(self._drivers) > self.max_drivers:
+                    self._drivers.popitem(last=False)
+            else:
+                self._drivers.move_to_end(driver_id)
+            counter = counters.get(event['event_type'])
+            if counter is None:
+                counter = counters[event['event_type']] = SlidingWindowCounter(window_seconds, self.buckets)
+            count = counter.add(timestamp)
+            if count is None or count < threshold:
+                return None
+            if counter.last_alert is not None and timestamp - counter.last_alert < self.cooldown_seconds:
+                return None
+            counter.last_alert = timestamp
+            if not local:
+                return None
+            alert = {
+                "alert_id": next(self._alert_ids) if self.store is None else self._next_alert_id(), "driver_id": driver_id, "event_type": event['event_type'],
+                "count": count, "threshold": threshold, "window_seconds": window_seconds,
+                "event_id": event.get('event_id'), "ride_id": event.get('ride_id'),
+                "triggered_at": datetime.datetime.utcnow().isoformat(), "incident_report_id": None,
+            }
+            if self.store is None:
+                self._alerts.append(alert)
+        if self.store is not None:
+            self._save(alert)
+        return alert
+
+    def attach_incident(self, alert, report_id):
+        alert['incident_report_id'] = report_id
+        if self.store is not None:
+            self.store[alert['alert_id']] = alert
+
+    def _save(self, alert):
+        self.store[alert['alert_id']] = alert
+        # IDs are global, so the alert ANOMALY_MAX_ALERTS before this one is the oldest to drop.
+        self.store.pop(alert['alert_id'] - self._alerts.maxlen, None)
+
+    def alerts(self, driver_id=None, limit=100):
+        """Most recent alerts first."""
+        if self.store is not None:
+            stored = sorted(self.store.values(), key=lambda a: a['alert_id'], reverse=True)
+            return [a for a in stored if driver_id is None or a['driver_id'] == driver_id][:limit]
+        with self._lock:
+            matching = [a for a in reversed(self._alerts) if driver_id is None or a['driver_id'] == driver_id]
+        return matching[:limit]
+
+
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,214 @@
+"""ASGI entry point for the Flask app.
+
+Long-lived ride status streams are served natively on the event loop, so thousands of
+subscribers cost one coroutine each instead of one thread each. Every other request is
+bridged to the WSGI app: the body is read asynchronously (slow uploads never hold a
+thread), then the view runs on a bounded thread pool, which is also where CPU-bound
+work such as bcrypt hashing ends up.
+"""
+import asyncio
+import io
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_jwt_extended import decode_token
+
+from app import rides_db
+from app.ride_events import (ride_status_broker, AsyncQueueSubscriber, sse_message,
+                             SSE_KEEPALIVE, TERMINAL_STATUSES)
+
+STREAM_PATH = re.compile(r'^/api/rides/(\d+)/stream$')
+
+
+class ASGIAdapter:
+    def __init__(self, flask_app, max_threads=None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads or flask_app.config.get('ASGI_WORKER_THREADS', 16),
+            thread_name_prefix='packnride-wsgi')
+        self.keepalive = flask_app.config.get('STREAM_KEEPALIVE_SECONDS', 15)
+        # Streams bypass Flask's before_request hooks (rate limits, MAX_CONCURRENT_REQUESTS), so they are capped per user here.
+        self.max_streams_per_user = flask_app.config.get('STREAM_MAX_PER_USER')
+        self.max_body = flask_app.config.get('ASGI_MAX_BODY_BYTES', 16 * 1024 * 1024)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        match = STREAM_PATH.match(scope['path'])
+        if match and scope['method'] == 'GET':
+            await self._stream_ride_status(int(match.group(1)), scope, receive, send)
+        else:
+            await self._call_wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- Native ride status stream ---
+
+    async def _send_json(self, send, status, payload):
+        body = self.flask_app.json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _identity(self, scope):
+        headers = dict(scope.get('headers', []))
+        auth = headers.get(b'authorization', b'').decode('latin1')
+        if not auth.startswith('Bearer '):
+            return None
+        try:
+            with self.flask_app.app_context():
+                decoded = decode_token(auth[len('Bearer '):])
+        except Exception:
+            return None
+        return decoded.get(self.flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub'))
+
+    async def _stream_ride_status(self, ride_id, scope, receive, send):
+        identity = self._identity(scope)
+        if not isinstance(identity, dict):
+            await self._send_json(send, 401, {"msg": "Missing or invalid Authorization header"})
+            return
+        user_id = identity.get('id')
+
+        ride = rides_db.get(ride_id)
+        if not ride:
+            await self._send_json(send, 404, {"error": "Ride not found"})
+            return
+        if not (ride['passenger_id'] == user_id or (ride['driver_id'] and ride['driver_id'] == user_id)):
+            await self._send_json(send, 403, {"error": "Access forbidden: You are not part of this ride"})
+            return
+
+        subscriber = AsyncQueueSubscriber(asyncio.get_running_loop())
+        if not ride_status_broker.subscribe(ride_id, subscriber, user_id, self.max_streams_per_user):
+            await self._send_json(send, 429, {"error": "Too many open ride streams"})
+            return
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+            await send({'type': 'http.response.body', 'body': sse_message(ride), 'more_body': True})
+            status = ride['status']
+            while status not in TERMINAL_STATUSES:
+                update = asyncio.ensure_future(subscriber.get())
+                done, _ = await asyncio.wait({update, disconnected}, timeout=self.keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    update.cancel()
+                    return
+                if update not in done:
+                    update.cancel()
+                    await send({'type': 'http.response.body', 'body': SSE_KEEPALIVE, 'more_body': True})
+                    continue
+                payload = update.result()
+                status = payload['status']
+                await send({'type': 'http.response.body', 'body': sse_message(payload), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            ride_status_broker.unsubscribe(ride_id, subscriber)
+
+    async def _wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    # --- WSGI bridge ---
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return False
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def _environ(self, scope, body):
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+            'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            value = value.decode('latin1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    def _start_wsgi(self, environ):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+        result = self.flask_app(environ, start_response)
+        body_iter = iter(result)
+        first = next(body_iter, b'')
+        return started, first, result, body_iter
+
+    async def _call_wsgi(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        if body is False:
+            await self._send_json(send, 413, {"error": "Request body too large"})
+            return
+
+        loop = asyncio.get_running_loop()
+        started, chunk, result, body_iter = await loop.run_in_executor(
+            self.executor, self._start_wsgi, self._environ(scope, body))
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        try:
+            while True:
+                # Streamed responses are pulled chunk by chunk on the pool.
+                next_chunk = await loop.run_in_executor(self.executor, next, body_iter, None)
+                if next_chunk is None:
+                    await send({'type': 'http.response.body', 'body': chunk})
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = next_chunk
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+
+def create_asgi_app(flask_app):
+    return ASGIAdapter(flask_app)
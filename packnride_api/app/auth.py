@@ -3,7 +3,8 @@ from app import users_db
 from app.utils import hash_password, verify_password
 from flask_jwt_extended import create_access_token
 import datetime
-from app import id_manager
+from app import id_manager, store_versions, change_log
+from app.versioning import bump_version
 
 
 auth_bp = Blueprint('auth_bp', __name__)
@@ -30,6 +31,12 @@ def register():
     if not isinstance(is_admin, bool):
         return jsonify({"error": "Invalid is_admin flag. Must be true or false."}), 400
 
+    # Optional home position: drivers are stored in the shard of their home region (app/shards.py).
+    home = {f: data[f] for f in ('home_lat', 'home_lon') if f in data}
+    if home and (len(home) != 2 or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in home.values())
+                 or not -90 <= home['home_lat'] <= 90 or not -180 <= home['home_lon'] <= 180):
+        return jsonify({"error": "home_lat and home_lon must be given together as valid coordinates"}), 400
+
     if email in users_db:
         return jsonify({"error": "Email already registered"}), 409
 
@@ -45,7 +52,10 @@ def register():
         "is_admin": is_admin, # Store is_admin status
         "registered_on": datetime.datetime.utcnow().isoformat()
     }
+    user_obj.update(home)
+    bump_version(store_versions, 'users', user_obj)
     users_db[email] = user_obj
+    change_log.record('users', email, user_obj)
 
     return jsonify({
         "message": "User registered successfully",
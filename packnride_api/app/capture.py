@@ -0,0 +1,204 @@
+"""Traffic capture: every request's method, path, body, identity and timing, for replay.py.
+
+Off unless TRAFFIC_CAPTURE_PATH is set (or open() is called). Each finished request
+appends one JSON line to a gzip file; when TRAFFIC_CAPTURE_MAX_BYTES of lines have
+been written, the file is rotated like logging's RotatingFileHandler (path.1 is the
+newest rotated file) and at most TRAFFIC_CAPTURE_BACKUPS old files are kept.
+read_capture() reads them back oldest first.
+
+A line looks like
+    {"t": 12.031, "method": "POST", "path": "/api/rides/request", "body": {...},
+     "identity": {"id": 3, ...}, "headers": {"Idempotency-Key": "..."}, "status": 201, "ms": 0.84,
+     "bytes": 412}
+where t is when the request arrived, in seconds since capture started (open() writes
+a {"capture_started": ...} line first), ms is the time the app took and bytes the
+size of the response body as sent (compressed, if it was). Bodies
+are kept only when they are JSON; passwords and secrets in them are replaced by
+REDACTED, so a replay that registers and then logs in with the same body still
+matches. Streamed responses (status and change streams) are recorded with
+"stream": true and skipped by replays.
+
+Lines are gzip-compressed in memory and flushed to disk at most once a second, so
+a crash loses about the last second of capture.
+"""
+import atexit
+import datetime
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+REDACTED = '[redacted]'
+REDACTED_KEYS = frozenset(('password', 'password_hash', 'secret'))
+CAPTURED_HEADERS = ('Idempotency-Key', 'If-None-Match', 'If-Match', 'Accept-Encoding')
+_CAPTURED_ENVIRON = [(name, 'HTTP_' + name.upper().replace('-', '_')) for name in CAPTURED_HEADERS]
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k in REDACTED_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+class TrafficCapture:
+    def __init__(self, max_bytes=64 * 1024 * 1024, backups=10, flush_seconds=1.0):
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_seconds = flush_seconds
+        self.path = None
+        self._file = None
+        self._written = 0
+        self._flushed_at = 0.0
+        self._started = 0.0
+        self._lock = threading.Lock()
+        self.records = 0
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('TRAFFIC_CAPTURE_MAX_BYTES', self.max_bytes)
+        self.backups = app.config.get('TRAFFIC_CAPTURE_BACKUPS', self.backups)
+        # The hooks stay registered; they return at once while capture is off.
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['traffic_capture'] = self
+        if app.config.get('TRAFFIC_CAPTURE_PATH'):
+            self.open(app.config['TRAFFIC_CAPTURE_PATH'])
+
+    @property
+    def active(self):
+        return self._file is not None
+
+    def open(self, path):
+        with self._lock:
+            self._close_file()
+            self.path = path
+            self._file = gzip.open(path, 'ab')
+            self._written = 0
+            self._started = time.perf_counter()
+            self._flushed_at = time.monotonic()
+            self.records = 0
+            header = {"capture_started": datetime.datetime.utcnow().isoformat()}
+            self._file.write((json.dumps(header) + '\n').encode())
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # --- request hooks ---
+
+    def _before_request(self):
+        if self._file is not None:
+            g._capture_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('_capture_started', None)
+        if started is None or self._file is None:
+            return response
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        line = {"t": round(started - self._started, 3), "method": request.method,
+                "path": request.full_path.rstrip('?')}
+        body = request.get_json(silent=True)
+        if body is not None:
+            line["body"] = redact(body)
+        identity = self._identity()
+        if identity is not None:
+            line["identity"] = identity
+        environ = request.environ
+        headers = {name: environ[key] for name, key in _CAPTURED_ENVIRON if key in environ}
+        if headers:
+            line["headers"] = headers
+        line["status"] = response.status_code
+        line["ms"] = round(elapsed_ms, 3)
+        if response.is_streamed:
+            line["stream"] = True
+        else:
+            line["bytes"] = response.content_length  # body as sent, after compression
+        self._write((json.dumps(line, separators=(',', ':')) + '\n').encode())
+        return response
+
+    @staticmethod
+    def _identity():
+        try:
+            return get_jwt_identity()  # already decoded by the view's @jwt_required()
+        except RuntimeError:
+            pass
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            return None
+
+    def _write(self, data):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(data)
+            self._written += len(data)
+            self.records += 1
+            now = time.monotonic()
+            if self._written >= self.max_bytes:
+                self._rotate()
+            elif now - self._flushed_at >= self.flush_seconds:
+                self._file.flush(zlib.Z_SYNC_FLUSH)
+                self._flushed_at = now
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = gzip.open(self.path, 'ab')
+        self._written = 0
+
+
+def capture_files(path):
+    """The capture file and its rotated predecessors, oldest first."""
+    rotated = [p for p in glob.glob(glob.escape(path) + '.*') if p.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda p: int(p.rsplit('.', 1)[1]), reverse=True)
+    return rotated + ([path] if os.path.exists(path) else [])
+
+
+def read_capture(path):
+    """Yields captured requests from every file of a capture, oldest first.
+
+    t restarts at 0 with each open(); later captures are shifted to follow the earlier ones.
+    """
+    offset = last = 0.0
+    for name in capture_files(path):
+        with gzip.open(name, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # torn last line
+                    if 'capture_started' in record:
+                        offset = last
+                        continue
+                    record['t'] += offset
+                    last = max(last, record['t'])
+                    yield record
+            except EOFError:
+                pass  # file still being written, or left by a crash
+
+
+traffic_capture = TrafficCapture()
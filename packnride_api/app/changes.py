@@ -0,0 +1,224 @@
+"""Global change sequence feeding the "changes since" sync endpoint.
+
+Every insert/update/delete across the stores is appended to a change log under a
+monotonically increasing sequence number. The newest entries stay in memory; older
+ones are spilled to an append-only NDJSON file (when CHANGELOG_SPILL_PATH is set) or
+dropped, a small batch at a time and outside the log's lock, so no write stalls on
+the file. Readers ask for everything after the last sequence they saw, within the
+log's epoch: sequences restart with the process, and a cursor from an earlier
+epoch must not be read against the new numbering.
+"""
+import bisect
+import json
+import threading
+import time
+
+from .versioning import new_epoch
+
+# Fields that must never leave the service through the feed.
+REDACTED_FIELDS = {'users': ('password_hash',), 'webhook_endpoints': ('secret',)}
+
+# One sparse index entry per this many spilled changes, to seek into the spill file.
+_SPILL_INDEX_EVERY = 1000
+
+# Most entries spilled by one write once the in-memory log is full.
+_SPILL_BATCH = 256
+
+
+def redact(store, record):
+    if record is not None:
+        record = dict(record)
+        for field in REDACTED_FIELDS.get(store, ()):
+            record.pop(field, None)
+    return record
+
+
+def _entry(seq, store, key, op, record):
+    return {"seq": seq, "store": store, "key": key, "op": op, "ts": time.time(), "record": redact(store, record)}
+
+
+class ChangeLog:
+    def __init__(self, max_in_memory=100000, spill_path=None):
+        self.max_in_memory = max_in_memory
+        self.spill_path = spill_path
+        self._entries = []  # contiguous by seq, so seq s sits at index s - first seq
+        self._last_seq = 0
+        self._oldest_seq = 1  # oldest sequence still retrievable (memory or spill file)
+        self._spill_index = []  # sorted [(seq, byte offset)]
+        self._spill_size = 0
+        self.epoch = new_epoch()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()  # one spilling writer at a time
+
+    def init_app(self, app):
+        self.max_in_memory = app.config.get('CHANGELOG_MAX_IN_MEMORY', self.max_in_memory)
+        self.spill_path = app.config.get('CHANGELOG_SPILL_PATH', self.spill_path)
+        if self.spill_path:
+            open(self.spill_path, 'wb').close()
+        app.extensions['change_log'] = self
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    @property
+    def oldest_seq(self):
+        return self._oldest_seq
+
+    def reset(self):
+        with self._spill_lock, self._lock:
+            self._entries.clear()
+            self._last_seq = 0
+            self._oldest_seq = 1
+            self._spill_index = []
+            self._spill_size = 0
+            self.epoch = new_epoch()
+            if self.spill_path:
+                open(self.spill_path, 'wb').close()
+
+    def record(self, store, key, record, op='upsert'):
+        with self._lock:
+            self._last_seq += 1
+            seq = self._last_seq
+            self._entries.append(_entry(seq, store, key, op, record))
+            full = len(self._entries) > self.max_in_memory
+        if full:
+            self._spill()
+        return seq
+
+    def _spill(self):
+        if not self._spill_lock.acquire(blocking=False):
+            return  # another writer is spilling; the log may run a batch over until it is done
+        try:
+            with self._lock:
+                if len(self._entries) <= self.max_in_memory:
+                    return
+                count = min(_SPILL_BATCH, max(1, len(self._entries) // 2))
+                evicted = self._entries[:count]
+            if self.spill_path:
+                self._write_spill(evicted)
+            with self._lock:
+                del self._entries[:count]  # only spills remove entries, and reset waits for this one
+                if not self.spill_path:
+                    self._oldest_seq = self._entries[0]['seq'] if self._entries else self._last_seq + 1
+        finally:
+            self._spill_lock.release()
+
+    def _write_spill(self, evicted):
+        # Readers keep reading the batch from memory until it is removed, after it is on disk.
+        with open(self.spill_path, 'ab') as spill:
+            for entry in evicted:
+                if entry['seq'] % _SPILL_INDEX_EVERY == 1 or not self._spill_index:
+                    self._spill_index.append((entry['seq'], self._spill_size))
+                line = json.dumps(entry).encode() + b'\n'
+                spill.write(line)
+                self._spill_size += len(line)
+
+    def _read_spilled(self, since, until):
+        pos = bisect.bisect_right(self._spill_index, (since + 1, float('inf'))) - 1
+        offset = self._spill_index[max(pos, 0)][1]
+        with open(self.spill_path, 'rb') as spill:
+            spill.seek(offset)
+            for line in spill:
+                entry = json.loads(line)
+                if entry['seq'] > until:
+                    return
+                if entry['seq'] > since:
+                    yield entry
+
+    def since(self, since, limit):
+        """Yields up to limit changes with seq > since, oldest first."""
+        with self._lock:
+            first_in_memory = self._entries[0]['seq'] if self._entries else self._last_seq + 1
+            start = max(0, since + 1 - first_in_memory)
+            in_memory = self._entries[start:start + limit]
+            read_spill = bool(self.spill_path and self._spill_index and since + 1 < first_in_memory)
+        sent = 0
+        if read_spill:
+            for entry in self._read_spilled(since, first_in_memory - 1):
+                if sent >= limit:
+                    return
+                yield entry
+                sent += 1
+        for entry in in_memory:
+            if sent >= limit:
+                return
+            yield entry
+            sent += 1
+
+
+class ChangeFollower:
+    """Applies other workers' writes to this process's derived indexes (shared-store mode).
+
+    Each worker keeps its own in-memory indexes (ride history, leaderboard, ...) and
+    updates them inline for the writes it handles. Writes made by other workers reach
+    it only through the shared change log, which a background thread tails by seq,
+    handing each change to the handlers registered for its store. Changes this
+    process recorded itself were applied inline already and are skipped. If the log
+    was pruned past the cursor, the on_gap callbacks rebuild everything instead.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._gap_handlers = []
+        self._change_log = None
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def active(self):
+        return self._change_log is not None
+
+    def register(self, store, handler):
+        self._handlers.setdefault(store, []).append(handler)
+
+    def on_gap(self, handler):
+        self._gap_handlers.append(handler)
+
+    def start(self, change_log, cursor, interval_seconds=0.2):
+        """Follows change_log from cursor, the last seq already reflected in the indexes."""
+        self._change_log = change_log
+        self._cursor = cursor
+        change_log.track_local_writes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval_seconds,), name='change-follower', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._change_log = None
+
+    def _run(self, interval_seconds):
+        while not self._stop.wait(interval_seconds):
+            self.catch_up()
+
+    def catch_up(self, batch=1000):
+        """Applies everything recorded since the cursor; returns how many changes were applied."""
+        if self._change_log is None:
+            return 0
+        applied = 0
+        with self._lock:
+            while True:
+                if self._change_log.oldest_seq > self._cursor + 1:
+                    self._cursor = self._change_log.last_seq
+                    for handler in self._gap_handlers:
+                        handler()
+                entries = list(self._change_log.since(self._cursor, batch))
+                if not entries:
+                    return applied
+                for entry in entries:
+                    self._cursor = entry['seq']
+                    if self._change_log.is_local_write(entry['seq']):
+                        continue
+                    for handler in self._handlers.get(entry['store'], ()):
+                        handler(entry)
+                    applied += 1
+
+
+change_follower = ChangeFollower()
+
@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+from app import change_log
+from app.monitoring_routes import is_admin_user
+
+changes_bp = Blueprint('changes_bp', __name__)
+
+
+@changes_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_changes():
+    # Incremental sync feed: NDJSON, one change per line, oldest first.
+    # Clients pass the last seq they processed as `since` and repeat until X-Changes-Last-Seq is reached.
+    # Seqs restart with the log, so clients also pass back X-Changes-Epoch as `epoch`.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    since = request.args.get('since', 0, type=int)
+    max_limit = current_app.config.get('CHANGES_PAGE_LIMIT', 10000)
+    limit = request.args.get('limit', max_limit, type=int)
+    if since < 0 or limit <= 0:
+        return jsonify({"error": "since must be >= 0 and limit must be > 0"}), 400
+    limit = min(limit, max_limit)
+
+    epoch = request.args.get('epoch')
+    if epoch is not None and epoch != change_log.epoch:
+        return jsonify({
+            "error": "The change log was restarted and sequences renumbered; do a full resync.",
+            "epoch": change_log.epoch
+        }), 410, {'X-Changes-Epoch': change_log.epoch}
+
+    oldest_seq = change_log.oldest_seq
+    if since + 1 < oldest_seq:
+        return jsonify({
+            "error": "Changes before the requested sequence are no longer retained; do a full resync.",
+            "oldest_seq": oldest_seq
+        }), 410, {'X-Changes-Epoch': change_log.epoch}
+
+    last_seq = change_log.last_seq
+    encode = current_app.json.dumps
+
+    def generate():
+        for entry in change_log.since(since, limit):
+            yield encode(entry) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Changes-Last-Seq': str(last_seq), 'X-Changes-Epoch': change_log.epoch})
@@ -0,0 +1,134 @@
+"""Travel-time estimates from a precomputed cell-to-cell matrix.
+
+The matrix is built offline from the road graph (write_matrix below) for a grid of
+rows x cols square cells of cell_km, starting at an origin corner. The file is a
+header followed by cells x cells little-endian uint16 travel times in seconds, row-major by
+origin cell, with UNKNOWN where no route was found. It is memory-mapped read-only,
+so loading is instant, lookups are two cell computations and one index, and
+pre-forked workers share a single copy in the page cache.
+
+Points outside the grid, unknown entries and a missing file fall back to the
+straight-line distance times a circuity factor at fallback_speed_kmh. Every
+answer says which source it came from.
+"""
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from .locations import haversine_km
+
+MAGIC = b'PNRETA01'
+HEADER = struct.Struct('<8sdddII')  # magic, origin lat, origin lon, cell km, rows, cols
+UNKNOWN = 0xFFFF
+KM_PER_DEGREE = 111.32
+
+
+def write_matrix(path, origin_lat, origin_lon, cell_km, rows, cols, seconds):
+    """Writes a matrix file. seconds yields cells * cells travel times, row-major by origin cell."""
+    values = array('H', (min(int(s), UNKNOWN) for s in seconds))
+    if len(values) != (rows * cols) ** 2:
+        raise ValueError("expected %d travel times, got %d" % ((rows * cols) ** 2, len(values)))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, origin_lat, origin_lon, cell_km, rows, cols))
+        values.tofile(f)
+
+
+def cell_center(origin_lat, origin_lon, cell_km, cols, index):
+    """(lat, lon) of the centre of a grid cell, for matrix builders."""
+    row, col = divmod(index, cols)
+    lat = origin_lat + (row + 0.5) * cell_km / KM_PER_DEGREE
+    return lat, origin_lon + (col + 0.5) * cell_km / (KM_PER_DEGREE * math.cos(math.radians(origin_lat)))
+
+
+class EtaService:
+    def __init__(self, fallback_speed_kmh=25.0, circuity=1.3):
+        self.fallback_speed_kmh = fallback_speed_kmh
+        self.circuity = circuity
+        self._map = None
+        self._times = None
+        self._grid = None  # (origin lat, origin lon, cell km, rows, cols, km per degree of longitude)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.fallback_speed_kmh = app.config.get('ETA_FALLBACK_SPEED_KMH', self.fallback_speed_kmh)
+        self.circuity = app.config.get('ETA_CIRCUITY', self.circuity)
+        path = app.config.get('ETA_MATRIX_PATH')
+        if path:
+            self.load(path)
+        app.extensions['eta'] = self
+
+    def load(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("ETA matrices are little-endian; this host is not")
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size >= HEADER.size else None
+        if mapped is not None:
+            magic, origin_lat, origin_lon, cell_km, rows, cols = HEADER.unpack_from(mapped)
+        if mapped is None or magic != MAGIC or size != HEADER.size + 2 * (rows * cols) ** 2:
+            if mapped is not None:
+                mapped.close()
+            raise ValueError("%s is not an ETA matrix" % path)
+        times = memoryview(mapped)[HEADER.size:].cast('H')
+        with self._lock:
+            self._release()
+            self._map, self._times = mapped, times
+            self._grid = (origin_lat, origin_lon, cell_km, rows, cols,
+                          KM_PER_DEGREE * math.cos(math.radians(origin_lat)))
+
+    def _release(self):
+        if self._times is not None:
+            self._times.release()
+            self._map.close()
+        self._map = self._times = self._grid = None
+
+    def clear(self):
+        with self._lock:
+            self._release()
+
+    @property
+    def loaded(self):
+        return self._grid is not None
+
+    def _cell(self, lat, lon):
+        origin_lat, origin_lon, cell_km, rows, cols, lon_km = self._grid
+        row = int(math.floor((lat - origin_lat) * KM_PER_DEGREE / cell_km))
+        col = int(math.floor((lon - origin_lon) * lon_km / cell_km))
+        if 0 <= row < rows and 0 <= col < cols:
+            return row * cols + col
+        return None
+
+    def _estimate(self, from_lat, from_lon, to_lat, to_lon):
+        km = haversine_km(from_lat, from_lon, to_lat, to_lon) * self.circuity
+        return {"seconds": int(round(km / self.fallback_speed_kmh * 3600)), "source": 'estimate'}
+
+    def seconds(self, from_lat, from_lon, to_lat, to_lon):
+        """{"seconds", "source"} for one trip; source is 'matrix' or 'estimate'."""
+        return self.batch([(from_lat, from_lon)], (to_lat, to_lon))[0]
+
+    def batch(self, origins, destination):
+        """ETAs from each (lat, lon) origin to one destination, e.g. candidate drivers to a pickup."""
+        to_lat, to_lon = destination
+        with self._lock:
+            if self._grid is None:
+                return [self._estimate(lat, lon, to_lat, to_lon) for lat, lon in origins]
+            cells = self._grid[3] * self._grid[4]
+            to_cell = self._cell(to_lat, to_lon)
+            results = []
+            for lat, lon in origins:
+                from_cell = self._cell(lat, lon) if to_cell is not None else None
+                value = UNKNOWN if from_cell is None else self._times[from_cell * cells + to_cell]
+                if value == UNKNOWN:
+                    results.append(self._estimate(lat, lon, to_lat, to_lon))
+                else:
+                    results.append({"seconds": value, "source": 'matrix'})
+            return results
+
+
+eta = EtaService()
@@ -0,0 +1,198 @@
+"""Incremental geohash x hour heatmap of driving events and incidents.
+
+Each ingested event increments one counter per supported geohash precision in the
+tile for its hour. The geohash is computed once at the finest precision as an
+integer, and coarser cells are prefixes of it (a bit shift). A tile maps cell codes
+to slots and holds one array('I') of counts per layer (event type, or 'incident').
+Queries add up the tiles for the requested hours and precision. They never touch
+the event stores.
+
+Hours come from client-supplied timestamps, so they are bounded by the server clock:
+hours in the future are counted in the current hour, and tiles are pruned relative to
+the current hour rather than the newest one seen.
+"""
+import datetime
+import threading
+import time
+from array import array
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+MIN_PRECISION = 2
+MAX_PRECISION = 7  # ~150 m cells
+INCIDENT_LAYER = 'incident'
+
+
+def geohash_code(lat, lon, precision=MAX_PRECISION):
+    """Geohash as an integer of 5 * precision interleaved bits (longitude first)."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    code = 0
+    for i in range(5 * precision):
+        code <<= 1
+        if i % 2 == 0:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                code |= 1
+                lon_lo = mid
+            else:
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                code |= 1
+                lat_lo = mid
+            else:
+                lat_hi = mid
+    return code
+
+
+def geohash_string(code, precision):
+    return ''.join(GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 0x1f] for i in range(precision))
+
+
+def geohash_bounds(code, precision):
+    """(min_lat, min_lon, max_lat, max_lon) of a cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    bits = 5 * precision
+    for i in range(bits):
+        bit = (code >> (bits - 1 - i)) & 1
+        if i % 2 == 0:
+            mid = (lon_lo + lon_hi) / 2
+            lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def zoom_to_precision(zoom):
+    """Slippy-map zoom level to the geohash precision whose cells suit it."""
+    return max(MIN_PRECISION, min(MAX_PRECISION, zoom // 3 + 1))
+
+
+def hour_of(timestamp):
+    """Hour number (hours since the epoch, UTC) of an ISO 8601 timestamp, or None."""
+    try:
+        moment = datetime.datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() // 3600)
+
+
+class _Tile:
+    __slots__ = ('slots', 'counts')
+
+    def __init__(self):
+        self.slots = {}   # cell code -> slot
+        self.counts = {}  # layer -> array('I') indexed by slot
+
+    def add(self, code, layer):
+        slot = self.slots.get(code)
+        if slot is None:
+            slot = self.slots[code] = len(self.slots)
+        counts = self.counts.get(layer)
+        if counts is None:
+            counts = self.counts[layer] = array('I')
+        if len(counts) <= slot:
+            counts.frombytes(bytes(counts.itemsize * (slot + 1 - len(counts))))
+        counts[slot] += 1
+
+
+class Heatmap:
+    def __init__(self, retention_hours=24 * 90, clock=time.time):
+        self.retention_hours = retention_hours
+        self.clock = clock
+        self._tiles = {}  # (hour, precision) -> _Tile
+        self._hours = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.retention_hours = app.config.get('HEATMAP_RETENTION_HOURS', self.retention_hours)
+        app.extensions['heatmap'] = self
+
+    def clear(self):
+        with self._lock:
+            self._tiles = {}
+            self._hours = set()
+
+    def add(self, lat, lon, hour, layer):
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return False
+        if hour is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return False
+        now_hour = int(self.clock() // 3600)
+        hour = min(hour, now_hour)
+        if hour <= now_hour - self.retention_hours:
+            return False
+        code = geohash_code(lat, lon)
+        with self._lock:
+            if hour not in self._hours:
+                self._hours.add(hour)
+                self._prune(now_hour)
+            for precision in range(MIN_PRECISION, MAX_PRECISION + 1):
+                tile = self._tiles.get((hour, precision))
+                if tile is None:
+                    tile = self._tiles[(hour, precision)] = _Tile()
+                tile.add(code >> (5 * (MAX_PRECISION - precision)), layer)
+        return True
+
+    def add_event(self, event):
+        hour = hour_of(event.get('timestamp'))
+        if hour is None:
+            hour = hour_of(event.get('logged_at'))
+        return self.add(event.get('location_lat'), event.get('location_lon'), hour, event.get('event_type'))
+
+    def add_incident(self, report):
+        if report.get('location_lat') is None or report.get('location_lon') is None:
+            return False
+        return self.add(report['location_lat'], report['location_lon'], hour_of(report.get('created_at')), INCIDENT_LAYER)
+
+    def rebuild(self, events, incidents):
+        # Events already compacted by retention (app/retention.py) are not restored.
+        self.clear()
+        for event in events:
+            self.add_event(event)
+        for report in incidents:
+            self.add_incident(report)
+
+    def _prune(self, now_hour):
+        cutoff = now_hour - self.retention_hours
+        for hour in [h for h in self._hours if h <= cutoff]:
+            self._hours.discard(hour)
+            for precision in range(MIN_PRECISION, MAX_PRECISION + 1):
+                self._tiles.pop((hour, precision), None)
+
+    def query(self, bbox, precision, from_hour, to_hour, layers=None):
+        """Per-cell counts inside bbox for hours from_hour..to_hour (inclusive), busiest first."""
+        min_lat, min_lon, max_lat, max_lon = bbox
+        totals = {}
+        with self._lock:
+            for hour in range(from_hour, to_hour + 1):
+                tile = self._tiles.get((hour, precision))
+                if tile is None:
+                    continue
+                for layer, counts in tile.counts.items():
+                    if layers and layer not in layers:
+                        continue
+                    for code, slot in tile.slots.items():
+                        if slot < len(counts) and counts[slot]:
+                            by_layer = totals.setdefault(code, {})
+                            by_layer[layer] = by_layer.get(layer, 0) + counts[slot]
+        cells = []
+        for code, by_layer in totals.items():
+            lat_lo, lon_lo, lat_hi, lon_hi = geohash_bounds(code, precision)
+            if lat_hi < min_lat or lat_lo > max_lat or lon_hi < min_lon or lon_lo > max_lon:
+                continue
+            cells.append({
+                "geohash": geohash_string(code, precision),
+                "lat": (lat_lo + lat_hi) / 2, "lon": (lon_lo + lon_hi) / 2,
+                "count": sum(by_layer.values()), "by_type": by_layer,
+            })
+        cells.sort(key=lambda c: c['count'], reverse=True)
+        return cells
+
+
+heatmap = Heatmap()
@@ -0,0 +1,160 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'done', 'status', 'body', 'mimetype', 'expires_at')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.status = None
+        self.body = None
+        self.mimetype = None
+        self.expires_at = None
+
+
+class IdempotencyCache:
+    """Bounded TTL cache of responses keyed by (user id, Idempotency-Key).
+
+    The first request for a key becomes the leader and runs the view; concurrent
+    duplicates wait on the leader's entry instead of running the view again.
+    Entries still running are kept apart from completed ones and count against
+    max_entries, but only completed entries are evicted.
+    """
+
+    def __init__(self, ttl_seconds=86400, max_entries=10000, wait_seconds=10.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_seconds = wait_seconds
+        self._entries = OrderedDict()  # completed, in completion order
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('IDEMPOTENCY_TTL_SECONDS', self.ttl_seconds)
+        self.max_entries = app.config.get('IDEMPOTENCY_MAX_ENTRIES', self.max_entries)
+        self.wait_seconds = app.config.get('IDEMPOTENCY_WAIT_SECONDS', self.wait_seconds)
+        app.extensions['idempotency'] = self
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._in_flight.clear()
+
+    def __len__(self):
+        return len(self._entries) + len(self._in_flight)
+
+    def _evict(self, now):
+        # Entries are kept in completion order, so expired ones sit at the front.
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at is not None and entry.expires_at <= now:
+                self._entries.popitem(last=False)
+            elif len(self._entries) + len(self._in_flight) > self.max_entries:
+                self._entries.popitem(last=False)
+            else:
+                break
+
+    def begin(self, key, fingerprint):
+        """Returns (entry, is_leader). Non-leaders must wait on entry.done."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._in_flight.get(key) or self._entries.get(key)
+            if entry is None or (entry.expires_at is not None and entry.expires_at <= now):
+                entry = _Entry(fingerprint)
+                self._in_flight[key] = entry
+                return entry, True
+            return entry, False
+
+    def complete(self, key, entry, status, body, mimetype):
+        entry.status = status
+        entry.body = body
+        entry.mimetype = mimetype
+        with self._lock:
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            if self._in_flight.get(key) is entry:
+                del self._in_flight[key]
+                self._entries.pop(key, None)  # an expired predecessor
+                self._entries[key] = entry
+            self._evict(time.monotonic())
+        entry.done.set()
+
+    def abandon(self, key, entry):
+        # Leader failed (exception or 5xx): forget the key so a retry runs the view.
+        with self._lock:
+            if self._in_flight.get(key) is entry:
+                del self._in_flight[key]
+        entry.done.set()
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def _request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _replay(entry):
+    response = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+    response.headers[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Makes a JWT-protected POST view safe to retry with an Idempotency-Key header.
+
+    Must be applied below @jwt_required() so the caller's identity is available.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        idem_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idem_key:
+            return view(*args, **kwargs)
+        if len(idem_key) > 255:
+            return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+
+        cache = current_app.extensions.get('idempotency', idempotency_cache)
+        identity = get_jwt_identity() or {}
+        key = (identity.get('id'), idem_key)
+        fingerprint = _request_fingerprint()
+
+        while True:
+            entry, is_leader = cache.begin(key, fingerprint)
+            if is_leader:
+                break
+            if entry.fingerprint != fingerprint:
+                return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+            if not entry.done.wait(cache.wait_seconds):
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+            if entry.status is not None:
+                return _replay(entry)
+            # The leader gave up without a result; try to take over the key.
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            cache.abandon(key, entry)
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            cache.abandon(key, entry)
+        else:
+            cache.complete(key, entry, response.status_code, response.get_data(), response.mimetype)
+        return response
+
+    return wrapper
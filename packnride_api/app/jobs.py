@@ -0,0 +1,310 @@
+"""In-process background jobs: deferred work off the request path, and periodic schedules.
+
+Handlers are registered by name (jobs.register, or the jobs.task decorator) and
+take the job's payload. enqueue() files a job on a heap ordered by (run_at,
+priority, id) and returns at once; a pool of JOBS_WORKERS threads waits on a
+condition for the earliest job to fall due and runs it. Lower priority numbers
+run first among jobs due at the same time. every() adds a periodic schedule: the
+job is filed again one interval after its slot, skipping slots missed while it ran.
+
+A job enqueued with a dedup_key is not filed again while one with the same key is
+still queued; enqueue() returns the queued job's id instead.
+
+With JOBS_QUEUE_PATH set, deferred jobs survive restarts. Each enqueue and each
+finish is appended to an NDJSON journal (flushed, not fsynced), and start() files
+the unfinished ones again before rewriting the journal with just those. Payloads
+must then be JSON. Periodic schedules are not journalled: they are declared again
+by the code that starts the app.
+
+stop() stops taking jobs off the queue, waits for running ones, then calls the
+on_shutdown hooks; it runs at interpreter exit too. stats() reports per-handler
+runs, failures, run and queue-wait times.
+"""
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ('id', 'name', 'payload', 'run_at', 'priority', 'dedup_key', 'interval', 'enqueued_at')
+
+    def __init__(self, job_id, name, payload, run_at, priority, dedup_key, interval=None, enqueued_at=None):
+        self.id = job_id
+        self.name = name
+        self.payload = payload
+        self.run_at = run_at
+        self.priority = priority
+        self.dedup_key = dedup_key
+        self.interval = interval
+        self.enqueued_at = run_at if enqueued_at is None else enqueued_at
+
+    def __lt__(self, other):
+        return (self.run_at, self.priority, self.id) < (other.run_at, other.priority, other.id)
+
+    def as_dict(self):
+        return {"id": self.id, "name": self.name, "payload": self.payload, "run_at": self.run_at,
+                "priority": self.priority, "dedup_key": self.dedup_key}
+
+
+class JobScheduler:
+    def __init__(self, workers=2, queue_path=None, clock=time.time):
+        self.workers = workers
+        self.queue_path = queue_path
+        self.clock = clock
+        self._handlers = {}
+        self._shutdown_hooks = []
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._journal = None
+        self._journal_lines = 0
+        self._reset()
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self._heap = []
+        self._queued_keys = {}  # dedup_key -> job id
+        self._ids = itertools.count(1)
+        self._running = 0
+        self._metrics = {}
+
+    def init_app(self, app):
+        self.workers = app.config.get('JOBS_WORKERS', self.workers)
+        self.queue_path = app.config.get('JOBS_QUEUE_PATH', self.queue_path)
+        app.extensions['jobs'] = self
+
+    # --- registration ---
+
+    def register(self, name, handler):
+        self._handlers[name] = handler
+
+    def task(self, name):
+        def decorator(handler):
+            self.register(name, handler)
+            return handler
+        return decorator
+
+    def on_shutdown(self, hook):
+        self._shutdown_hooks.append(hook)
+
+    # --- queueing ---
+
+    def enqueue(self, name, payload=None, delay=0, priority=0, dedup_key=None):
+        """Files a job to run after delay seconds; returns its id (or the queued duplicate's)."""
+        if name not in self._handlers:
+            raise KeyError(f"no job handler registered as {name!r}")
+        with self._cond:
+            if dedup_key is not None and dedup_key in self._queued_keys:
+                return self._queued_keys[dedup_key]
+            job = _Job(next(self._ids), name, payload, self.clock() + delay, priority, dedup_key)
+            self._journal_write({"op": "enqueue", **job.as_dict()})
+            self._file(job)
+            return job.id
+
+    def every(self, name, interval_seconds, payload=None, first_delay=None, priority=0):
+        """Runs the handler every interval_seconds, starting after first_delay (default: one interval)."""
+        if name not in self._handlers:
+            raise KeyError(f"no job handler registered as {name!r}")
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds must be > 0")
+        delay = interval_seconds if first_delay is None else first_delay
+        with self._cond:
+            self._file(_Job(next(self._ids), name, payload, self.clock() + delay, priority,
+                            f"every:{name}", interval=interval_seconds))
+
+    def _file(self, job):
+        heapq.heappush(self._heap, job)
+        if job.dedup_key is not None:
+            self._queued_keys[job.dedup_key] = job.id
+        self._cond.notify()
+
+    def queued(self):
+        with self._cond:
+            return len(self._heap)
+
+    # --- running ---
+
+    def _take(self, now):
+        """Pops the next due job, or returns None. Caller holds the condition."""
+        if not self._heap or self._heap[0].run_at > now:
+            return None
+        job = heapq.heappop(self._heap)
+        if job.dedup_key is not None and self._queued_keys.get(job.dedup_key) == job.id:
+            del self._queued_keys[job.dedup_key]
+        self._running += 1
+        return job
+
+    def _run(self, job):
+        started = self.clock()
+        error = None
+        try:
+            handler = self._handlers.get(job.name)
+            if handler is None:
+                raise KeyError(f"no job handler registered as {job.name!r}")
+            handler(job.payload)
+        except Exception as exc:  # a failing job must not take the worker down
+            error = f"{type(exc).__name__}: {exc}"
+            logger.exception("job %s (%s) failed", job.id, job.name)
+        finished = self.clock()
+        with self._cond:
+            self._running -= 1
+            metrics = self._metrics.setdefault(job.name, {
+                "runs": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                "total_wait_seconds": 0.0, "max_wait_seconds": 0.0, "last_error": None})
+            seconds, wait = finished - started, max(started - job.run_at, 0.0)
+            metrics["runs"] += 1
+            metrics["total_seconds"] += seconds
+            metrics["max_seconds"] = max(metrics["max_seconds"], seconds)
+            metrics["total_wait_seconds"] += wait
+            metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], wait)
+            if error is not None:
+                metrics["failures"] += 1
+                metrics["last_error"] = error
+            if job.interval is not None:
+                if not self._stopping:
+                    slots = max(int((finished - job.run_at) // job.interval) + 1, 1)
+                    job.run_at += slots * job.interval
+                    self._file(job)
+            else:
+                self._journal_write({"op": "done", "id": job.id})
+            self._cond.notify_all()
+
+    def run_pending(self, now=None):
+        """Runs every due job in the calling thread; returns how many ran. For tests and CLIs."""
+        ran = 0
+        while True:
+            with self._cond:
+                job = self._take(self.clock() if now is None else now)
+            if job is None:
+                return ran
+            self._run(job)
+            ran += 1
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    job = self._take(self.clock())
+                    if job is not None:
+                        break
+                    timeout = self._heap[0].run_at - self.clock() if self._heap else None
+                    self._cond.wait(timeout)
+            self._run(job)
+
+    def start(self):
+        """Replays the journal, then starts the worker threads (none when JOBS_WORKERS is 0)."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            if self.queue_path and self._journal is None:
+                self._replay()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'jobs-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Lets running jobs finish, runs the shutdown hooks and closes the journal. Queued jobs stay queued."""
+        with self._cond:
+            if self._stopping and not self._threads:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        self._threads = []
+        for hook in self._shutdown_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("job shutdown hook failed")
+        with self._cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def clear(self):
+        """Drops every queued job and metric; for tests. Handlers and hooks stay registered."""
+        with self._cond:
+            self._reset()
+            if self._journal is not None:
+                self._journal.truncate(0)
+                self._journal.flush()
+                self._journal_lines = 0
+
+    # --- journal ---
+
+    def _journal_write(self, entry):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        self._journal_lines += 1
+        if self._journal_lines > 1000 and self._journal_lines > 4 * len(self._heap):
+            self._compact()
+
+    def _replay(self):
+        pending = {}
+        if os.path.exists(self.queue_path):
+            with open(self.queue_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from a crash
+                    if entry.get('op') == 'enqueue':
+                        pending[entry['id']] = entry
+                    elif entry.get('op') == 'done':
+                        pending.pop(entry['id'], None)
+        last_id = max(pending, default=0)
+        self._ids = itertools.count(last_id + 1)
+        for entry in sorted(pending.values(), key=lambda e: e['id']):
+            self._file(_Job(entry['id'], entry['name'], entry['payload'], entry['run_at'],
+                            entry['priority'], entry['dedup_key']))
+        self._journal = open(self.queue_path, 'a')
+        self._compact()
+
+    def _compact(self):
+        """Rewrites the journal with only the queued deferred jobs."""
+        temp_path = self.queue_path + '.tmp'
+        lines = 0
+        with open(temp_path, 'w') as f:
+            for job in sorted(self._heap):
+                if job.interval is None:
+                    f.write(json.dumps({"op": "enqueue", **job.as_dict()}, separators=(',', ':')) + '\n')
+                    lines += 1
+        self._journal.close()
+        os.replace(temp_path, self.queue_path)
+        self._journal = open(self.queue_path, 'a')
+        self._journal_lines = lines
+
+    # --- metrics ---
+
+    def stats(self):
+        with self._cond:
+            handlers = {}
+            for name, m in self._metrics.items():
+                handlers[name] = {
+                    "runs": m["runs"], "failures": m["failures"],
+                    "avg_ms": round(m["total_seconds"] / m["runs"] * 1000, 3),
+                    "max_ms": round(m["max_seconds"] * 1000, 3),
+                    "avg_wait_ms": round(m["total_wait_seconds"] / m["runs"] * 1000, 3),
+                    "max_wait_ms": round(m["max_wait_seconds"] * 1000, 3),
+                    "last_error": m["last_error"],
+                }
+            return {"queued": len(self._heap), "running": self._running, "workers": len(self._threads),
+                    "durable": self._journal is not None, "handlers": handlers}
+
+
+jobs = JobScheduler()
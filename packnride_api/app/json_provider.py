@@ -0,0 +1,156 @@
+"""JSON provider that uses orjson when it is installed.
+
+Falls back to Flask's stdlib-based DefaultJSONProvider otherwise, with the same key
+sorting and debug indentation either way. Records that never change after they are
+stored (driving events) can be encoded once and reused as RawJSON via record_cache,
+which pays off with the stdlib encoder and with orjson 3.9+ (Fragment), the version
+requirements.txt pins; with an older orjson the cache is bypassed.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson installed
+    orjson = None
+
+_FRAGMENT = getattr(orjson, 'Fragment', None)
+
+
+class RawJSON:
+    """Already-encoded JSON that is embedded verbatim in a response."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def _slots_as_dict(o):
+    slots = getattr(type(o), '__slots__', None)
+    if slots is None:
+        return None
+    if isinstance(slots, str):
+        slots = (slots,)
+    return {name: getattr(o, name) for name in slots if hasattr(o, name)}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    use_orjson = orjson is not None
+
+    @property
+    def supports_raw_json(self):
+        # orjson before 3.9 has no Fragment; splicing placeholders into its output
+        # costs more than just encoding the records again.
+        return not self.use_orjson or _FRAGMENT is not None
+
+    def _encode(self, obj, indent=False):
+        raws = []
+        nonce = None
+
+        def default(o):
+            if isinstance(o, RawJSON):
+                if _FRAGMENT is not None and self.use_orjson:
+                    return _FRAGMENT(o.data)
+                # Leave a placeholder and splice the bytes in after encoding. The
+                # per-call nonce keeps user strings from being mistaken for one.
+                nonlocal nonce
+                if nonce is None:
+                    nonce = os.urandom(4).hex()
+                raws.append(o.data)
+                return '\x00%s:%d\x00' % (nonce, len(raws) - 1)
+            as_dict = _slots_as_dict(o)
+            if as_dict is not None:
+                return as_dict
+            return DefaultJSONProvider.default(o)
+
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            data = orjson.dumps(obj, default=default, option=option)
+        else:
+            kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+            data = super().dumps(obj, default=default, **kwargs).encode()
+
+        if raws:
+            placeholder = re.compile(rb'"\\u0000' + nonce.encode() + rb':(\d+)\\u0000"')
+            data = placeholder.sub(lambda m: raws[int(m.group(1))], data)
+        return data
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def dumpb(self, obj):
+        return self._encode(obj)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # ?fields= / ?profile= (app/response_profiles.py); error bodies are left whole.
+        shape = g.get('response_shape') if has_request_context() else None
+        if shape is not None and not (isinstance(obj, dict) and 'error' in obj):
+            obj = shape(obj)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._encode(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+class RecordCache:
+    """LRU cache of encoded immutable records, keyed by (namespace, key)."""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._provider = None
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('JSON_RECORD_CACHE_SIZE', self.max_entries)
+        self._provider = app.json
+        app.extensions['json_record_cache'] = self
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def encoded(self, namespace, key, record):
+        """Returns record as RawJSON, encoding it only on the first call for this key."""
+        if (not self.max_entries or not isinstance(self._provider, FastJSONProvider)
+                or not self._provider.supports_raw_json):
+            return record
+        if has_request_context() and g.get('response_shape') is not None:
+            return record  # ?fields=/?profile= reshape the dict; encoded bytes would have to be parsed back
+        cache_key = (namespace, key)
+        with self._lock:
+            raw = self._entries.get(cache_key)
+            if raw is not None:
+                self._entries.move_to_end(cache_key)
+                return raw
+        raw = RawJSON(self._provider.dumpb(record))
+        with self._lock:
+            self._entries[cache_key] = raw
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return raw
+
+
+record_cache = RecordCache()
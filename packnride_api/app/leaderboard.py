@@ -0,0 +1,117 @@
+"""Ordered indexes over driver scores for leaderboard / top-K queries.
+
+Each score metric keeps a sorted list of (value, driver_id), maintained with bisect
+whenever a score record is written. Reading the best or worst k drivers is a slice
+from one end, with no pass over driver_scores_db.
+
+Filtering by updated_since uses a second sorted list of (last_updated, driver_id).
+With r drivers updated since then out of n, top() either selects the k best of the
+r recent ones (O(r log k)) or walks the metric list until k of them are found
+(about k * n / r steps), whichever is smaller, so the filtered path costs at most
+about sqrt(k * n). Timestamps are compared as naive UTC ISO 8601 strings; the route
+normalizes updated_since to that form.
+"""
+import bisect
+import heapq
+import threading
+
+SCORE_METRICS = ('overall_safety_score', 'efficiency_score', 'punctuality_score')
+
+
+class ScoreIndex:
+    def __init__(self, metrics=SCORE_METRICS):
+        self.metrics = metrics
+        self._sorted = {metric: [] for metric in metrics}
+        self._current = {}  # driver_id -> ({metric: value}, last_updated_timestamp)
+        self._by_time = []  # sorted (last_updated_timestamp, driver_id), for drivers that have one
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._sorted = {metric: [] for metric in self.metrics}
+            self._current = {}
+            self._by_time = []
+
+    def rebuild(self, score_records):
+        records = list(score_records)
+        with self._lock:
+            self._current = {}
+            self._sorted = {metric: [] for metric in self.metrics}
+            self._by_time = []
+            for record in records:
+                values = {m: record[m] for m in self.metrics if record.get(m) is not None}
+                updated = record.get('last_updated_timestamp')
+                self._current[record['driver_id']] = (values, updated)
+                for metric, value in values.items():
+                    self._sorted[metric].append((value, record['driver_id']))
+                if updated is not None:
+                    self._by_time.append((updated, record['driver_id']))
+            for entries in self._sorted.values():
+                entries.sort()
+            self._by_time.sort()
+
+    def update(self, score_record):
+        driver_id = score_record['driver_id']
+        values = {m: score_record[m] for m in self.metrics if score_record.get(m) is not None}
+        updated = score_record.get('last_updated_timestamp')
+        with self._lock:
+            old_values, old_updated = self._current.get(driver_id, ({}, None))
+            for metric in self.metrics:
+                old, new = old_values.get(metric), values.get(metric)
+                if old == new:
+                    continue
+                entries = self._sorted[metric]
+                if old is not None:
+                    del entries[bisect.bisect_left(entries, (old, driver_id))]
+                if new is not None:
+                    bisect.insort(entries, (new, driver_id))
+            if old_updated != updated:
+                if old_updated is not None:
+                    del self._by_time[bisect.bisect_left(self._by_time, (old_updated, driver_id))]
+                if updated is not None:
+                    bisect.insort(self._by_time, (updated, driver_id))
+            self._current[driver_id] = (values, updated)
+
+    def remove(self, driver_id):
+        with self._lock:
+            values, updated = self._current.pop(driver_id, ({}, None))
+            for metric, value in values.items():
+                entries = self._sorted[metric]
+                del entries[bisect.bisect_left(entries, (value, driver_id))]
+            if updated is not None:
+                del self._by_time[bisect.bisect_left(self._by_time, (updated, driver_id))]
+
+    def top(self, metric, k, descending=True, updated_since=None):
+        """[(driver_id, value, last_updated_timestamp)] for the k best (or worst) drivers by metric."""
+        with self._lock:
+            entries = self._sorted[metric]
+            if updated_since is not None:
+                start = bisect.bisect_left(self._by_time, (updated_since,))
+                recent = len(self._by_time) - start
+                if recent * recent <= k * len(entries):
+                    return self._top_of_recent(metric, k, descending, start)
+            ordered = reversed(entries) if descending else iter(entries)
+            result = []
+            for value, driver_id in ordered:
+                if len(result) >= k:
+                    break
+                last_updated = self._current[driver_id][1]
+                if updated_since is not None and (last_updated is None or last_updated < updated_since):
+                    continue
+                result.append((driver_id, value, last_updated))
+            return result
+
+    def _top_of_recent(self, metric, k, descending, start):
+        candidates = []
+        for updated, driver_id in self._by_time[start:]:
+            value = self._current[driver_id][0].get(metric)
+            if value is not None:
+                candidates.append((value, driver_id, updated))
+        select = heapq.nlargest if descending else heapq.nsmallest
+        return [(driver_id, value, updated) for value, driver_id, updated in select(k, candidates)]
+
+    def __len__(self):
+        return len(self._current)
+
+
+score_index = ScoreIndex()
@@ -0,0 +1,237 @@
+"""Live driver positions reported by the location heartbeat.
+
+Positions live in a dict keyed by driver id plus a coarse lat/lon grid for nearby
+lookups. Expiry uses a hashed timing wheel holding at most one entry per driver: a
+heartbeat only moves the driver's deadline, and when the wheel reaches the slot it
+either drops the driver or re-files it under the newer deadline. Both heartbeats and
+expiry are O(1) per driver, with no periodic full scans.
+
+In shared-store mode (serve.py workers) every heartbeat is also written to the
+driver_positions store and the change log; each worker's table applies the other
+workers' heartbeats from the change follower and is reloaded from the store at
+startup, so a driver's position is visible whichever worker served the heartbeat.
+"""
+import math
+import threading
+import time
+
+from .changes import change_follower
+
+DRIVER_STATUSES = ('available', 'busy', 'offline')
+
+# Slot layout of a position entry (a list, to keep 100k+ entries small).
+LAT, LON, STATUS, HEADING, SPEED, UPDATED_AT, EXPIRES_AT, CELL, NAME = range(9)
+
+
+class TimingWheel:
+    def __init__(self, horizon, tick=1.0):
+        self.tick = tick
+        self.slots = int(math.ceil(horizon / tick)) + 2
+        self._buckets = [[] for _ in range(self.slots)]
+        self._current = None  # last tick number processed
+
+    def schedule(self, key, deadline):
+        tick = int(deadline // self.tick)
+        if self._current is not None and tick <= self._current:
+            tick = self._current + 1
+        self._buckets[tick % self.slots].append(key)
+
+    def advance(self, now):
+        """Returns the keys filed under every tick that has passed since the last call."""
+        target = int(now // self.tick)
+        if self._current is None:
+            self._current = target
+            return []
+        due = []
+        steps = min(target - self._current, self.slots)
+        for step in range(1, steps + 1):
+            index = (self._current + step) % self.slots
+            if self._buckets[index]:
+                due.extend(self._buckets[index])
+                self._buckets[index] = []
+        self._current = max(self._current, target)
+        return due
+
+
+class DriverLocationTable:
+    def __init__(self, ttl_seconds=30, cell_degrees=0.01, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.cell_degrees = cell_degrees
+        self.clock = clock
+        self._positions = {}
+        self._cells = {}
+        self._wheel = TimingWheel(ttl_seconds)
+        self._lock = threading.Lock()
+        self.store = None  # shared-store mode: driver_id -> last heartbeat, for the other workers
+        self.change_log = None
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('DRIVER_LOCATION_TTL_SECONDS', self.ttl_seconds)
+        self.cell_degrees = app.config.get('DRIVER_LOCATION_CELL_DEGREES', self.cell_degrees)
+        self.clear()
+        if app.config.get('SHARED_STORE_PATH') and self.store is None:
+            from . import driver_positions_db, change_log
+            self.store, self.change_log = driver_positions_db, change_log
+            change_follower.register('driver_positions', self._remote_position)
+        app.extensions['driver_locations'] = self
+
+    def rebuild(self):
+        """Reloads the positions other workers shared (shared-store mode); expired ones are skipped."""
+        if self.store is None:
+            return
+        self.clear()
+        for position in self.store.values():
+            self._apply_shared(position)
+
+    def _remote_position(self, change):
+        if change['op'] == 'upsert':
+            self._apply_shared(change['record'])
+        else:
+            with self._lock:
+                self._drop(change['key'])
+
+    def _apply_shared(self, position):
+        age = time.time() - position['updated_at']
+        if age < self.ttl_seconds:
+            location = position['location']
+            self._apply(position['id'], location['lat'], location['lon'], position['current_status'],
+                        position['heading'], position['speed_kmh'], position['name'], position['updated_at'], age)
+
+    def clear(self):
+        with self._lock:
+            self._positions = {}
+            self._cells = {}
+            self._wheel = TimingWheel(self.ttl_seconds)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _cell(self, lat, lon):
+        return (int(lat // self.cell_degrees), int(lon // self.cell_degrees))
+
+    def _drop(self, driver_id):
+        entry = self._positions.pop(driver_id, None)
+        if entry is not None:
+            members = self._cells.get(entry[CELL])
+            if members is not None:
+                members.discard(driver_id)
+                if not members:
+                    del self._cells[entry[CELL]]
+
+    def _expire(self, now):
+        for driver_id in self._wheel.advance(now):
+            entry = self._positions.get(driver_id)
+            if entry is None:
+                continue
+            if entry[EXPIRES_AT] <= now:
+                self._drop(driver_id)
+            else:
+                self._wheel.schedule(driver_id, entry[EXPIRES_AT])
+
+    def update(self, driver_id, lat, lon, status='available', heading=None, speed_kmh=None, name=None):
+        """Records a heartbeat; True if the driver had no live position before."""
+        created = self._apply(driver_id, lat, lon, status, heading, speed_kmh, name, time.time())
+        position = self.get(driver_id) if self.store is not None else None
+        if position is not None:
+            self.store[driver_id] = position
+            self.change_log.record('driver_positions', driver_id, position)
+        return created
+
+    def _apply(self, driver_id, lat, lon, status, heading, speed_kmh, name, updated_at, age=0.0):
+        now = self.clock()
+        expires_at = now + self.ttl_seconds - age
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self._expire(now)
+            entry = self._positions.get(driver_id)
+            if entry is None:
+                entry = [lat, lon, status, heading, speed_kmh, updated_at, expires_at, cell, name]
+                self._positions[driver_id] = entry
+                self._cells.setdefault(cell, set()).add(driver_id)
+                self._wheel.schedule(driver_id, entry[EXPIRES_AT])
+                return True
+            if entry[CELL] != cell:
+                members = self._cells[entry[CELL]]
+                members.discard(driver_id)
+                if not members:
+                    del self._cells[entry[CELL]]
+                self._cells.setdefault(cell, set()).add(driver_id)
+                entry[CELL] = cell
+            entry[LAT] = lat
+            entry[LON] = lon
+            entry[STATUS] = status
+            entry[HEADING] = heading
+            entry[SPEED] = speed_kmh
+            entry[UPDATED_AT] = updated_at
+            # The wheel entry stays where it is and is re-filed lazily when it fires.
+            entry[EXPIRES_AT] = expires_at
+            if name is not None:
+                entry[NAME] = name
+            return False
+
+    def remove(self, driver_id):
+        with self._lock:
+            self._drop(driver_id)
+        if self.store is not None and self.store.pop(driver_id, None) is not None:
+            self.change_log.record('driver_positions', driver_id, None, op='delete')
+
+    def expire(self):
+        with self._lock:
+            self._expire(self.clock())
+
+    def get(self, driver_id):
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._positions.get(driver_id)
+            return self._as_dict(driver_id, entry) if entry is not None else None
+
+    def nearby(self, lat, lon, radius_km, status='available', limit=50):
+        """Drivers within radius_km of (lat, lon), nearest first."""
+        now = self.clock()
+        lat_cells = int(math.ceil(radius_km / (111.32 * self.cell_degrees)))
+        lon_scale = max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = int(math.ceil(radius_km / (111.32 * lon_scale * self.cell_degrees)))
+        center_lat, center_lon = self._cell(lat, lon)
+        found = []
+        with self._lock:
+            self._expire(now)
+            # Wide searches over a sparse grid walk the populated cells instead of the box,
+            # so the time spent holding the lock is bounded by the number of drivers.
+            if (2 * lat_cells + 1) * (2 * lon_cells + 1) > len(self._cells):
+                cells = [members for (cell_lat, cell_lon), members in self._cells.items()
+                         if abs(cell_lat - center_lat) <= lat_cells and abs(cell_lon - center_lon) <= lon_cells]
+            else:
+                cells = [self._cells.get((center_lat + dlat, center_lon + dlon), ())
+                         for dlat in range(-lat_cells, lat_cells + 1)
+                         for dlon in range(-lon_cells, lon_cells + 1)]
+            for members in cells:
+                for driver_id in members:
+                    entry = self._positions[driver_id]
+                    if status and entry[STATUS] != status:
+                        continue
+                    distance = haversine_km(lat, lon, entry[LAT], entry[LON])
+                    if distance <= radius_km:
+                        found.append((distance, driver_id, entry))
+            found.sort(key=lambda item: item[0])
+            return [dict(self._as_dict(driver_id, entry), distance_km=round(distance, 3))
+                    for distance, driver_id, entry in found[:limit]]
+
+    def _as_dict(self, driver_id, entry):
+        return {
+            "id": driver_id, "name": entry[NAME],
+            "location": {"lat": entry[LAT], "lon": entry[LON]},
+            "current_status": entry[STATUS], "heading": entry[HEADING], "speed_kmh": entry[SPEED],
+            "updated_at": entry[UPDATED_AT],
+        }
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+driver_locations = DriverLocationTable()
@@ -1,6 +1,18 @@
-from flask import Blueprint, request, jsonify
-from app import driving_events_db, users_db, id_manager, driver_scores_db, incident_reports_db # Added incident_reports_db
+from flask import Blueprint, request, jsonify, current_app
+from app import driving_events_db, event_summaries_db, users_db, id_manager, driver_scores_db, incident_reports_db, store_versions, change_log
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.idempotency import idempotent
+from app.json_provider import record_cache
+from app.anomaly import anomaly_detector
+from app.leaderboard import score_index, SCORE_METRICS
+from app.analytics import rollups
+from app.search import incident_search
+from app.retention import retention
+from app.jobs import jobs
+from app.webhooks import webhooks
+from app.heatmap import heatmap, hour_of, zoom_to_precision
+from app.snapshots import snapshot
+from app.versioning import bump_version, update_record, record_etag, collection_etag, not_modified, with_etag
 import datetime
 
 monitoring_bp = Blueprint('monitoring_bp', __name__)
@@ -13,6 +25,7 @@ def is_admin_user():
 # --- Driving Event Endpoints ---
 @monitoring_bp.route('/events', methods=['POST'])
 @jwt_required()
+@idempotent
 def log_driving_event():
     current_user_identity = get_jwt_identity()
     data = request.get_json()
@@ -46,8 +59,25 @@ def log_driving_event():
         "location_lat": data.get('location_lat'), "location_lon": data.get('location_lon'),
         "details": details, "logged_at": datetime.datetime.utcnow().isoformat()
     }
+    bump_version(store_versions, 'driving_events', event_obj)
     driving_events_db[event_id] = event_obj
-    return jsonify({"message": "Driving event logged successfully", "event": event_obj}), 201
+    change_log.record('driving_events', event_id, event_obj)
+    heatmap.add_event(event_obj)
+    rollups.event_logged(event_obj)
+    retention.event_logged(event_obj)
+
+    response = {"message": "Driving event logged successfully", "event": event_obj}
+    alert = anomaly_detector.observe(event_obj)
+    if alert is not None:
+        if anomaly_detector.auto_incident:
+            report = create_incident_report(
+                driver_id, 'anomaly_alert',
+                f"{alert['count']} {alert['event_type']} events within {alert['window_seconds']}s (threshold {alert['threshold']}).",
+                reporter_id=None, ride_id=ride_id,
+                location_lat=event_obj['location_lat'], location_lon=event_obj['location_lon'])
+            anomaly_detector.attach_incident(alert, report['report_id'])
+        response['alert'] = alert
+    return jsonify(response), 201
 
 
 @monitoring_bp.route('/drivers/<int:driver_id>/events', methods=['GET'])
@@ -65,6 +95,11 @@ def get_driver_events(driver_id):
         return jsonify({"error": f"Driver with id {driver_id} not found."}), 404
 
     event_type_filter = request.args.get('event_type')
+    etag = collection_etag(store_versions, 'driving_events', driver_id, event_type_filter)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
     driver_events = []
     for _event_id, event in driving_events_db.items(): # Corrected variable name
         if event['driver_id'] == driver_id:
@@ -73,7 +108,31 @@ def get_driver_events(driver_id):
             driver_events.append(event)
 
     driver_events.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-    return jsonify({"driver_id": driver_id, "events": driver_events}), 200
+    # Events never change once logged, so each one is encoded only once.
+    encoded_events = [record_cache.encoded('driving_event', e['event_id'], e) for e in driver_events]
+    return with_etag((jsonify({"driver_id": driver_id, "events": encoded_events}), 200), etag)
+
+@monitoring_bp.route('/drivers/<int:driver_id>/event-summaries', methods=['GET'])
+@jwt_required()
+def get_driver_event_summaries(driver_id):
+    # Hourly summaries of the events that retention has compacted; raw events stay under /events.
+    current_user_identity = get_jwt_identity()
+    is_current_user_the_driver = (current_user_identity.get('user_type') == 'driver' and
+                                  current_user_identity.get('id') == driver_id)
+
+    if not is_admin_user() and not is_current_user_the_driver:
+        return jsonify({"error": "Unauthorized. Admin access or viewing own data required."}), 403
+
+    event_type_filter = request.args.get('event_type')
+    etag = collection_etag(store_versions, 'event_summaries', driver_id, event_type_filter)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    summaries = [s for s in event_summaries_db.values()
+                 if s['driver_id'] == driver_id and (not event_type_filter or s['event_type'] == event_type_filter)]
+    summaries.sort(key=lambda s: (s['hour'], s['event_type']), reverse=True)
+    return with_etag((jsonify({"driver_id": driver_id, "summaries": summaries}), 200), etag)
 
 # --- Driver Performance Score Endpoints ---
 @monitoring_bp.route('/drivers/<int:driver_id>/score', methods=['GET'])
@@ -91,14 +150,19 @@ def get_driver_score(driver_id):
         return jsonify({"error": f"Driver with id {driver_id} not found."}), 404
 
     score = driver_scores_db.get(driver_id)
+    etag = record_etag('score', driver_id, score.get('version') if score else 0)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
     if not score:
-        return jsonify({
+        return with_etag((jsonify({
             "driver_id": driver_id, "overall_safety_score": None, "efficiency_score": None,
             "punctuality_score": None, "feedback_summary": "No score data available yet.",
             "last_updated_timestamp": None
-        }), 200
+        }), 200), etag)
 
-    return jsonify(score), 200
+    return with_etag((jsonify(score), 200), etag)
 
 
 @monitoring_bp.route('/drivers/<int:driver_id>/score', methods=['PUT'])
@@ -115,48 +179,99 @@ def update_driver_score(driver_id):
     if not data:
         return jsonify({"error": "Invalid input, JSON required"}), 400
 
-    current_score = driver_scores_db.get(driver_id, {})
-    updated_fields = False
-
-    if 'overall_safety_score' in data:
-        score_val = data['overall_safety_score']
-        if not (isinstance(score_val, (int, float)) and 0 <= score_val <= 100):
-            return jsonify({"error": "Invalid overall_safety_score. Must be a number between 0 and 100."}), 400
-        current_score['overall_safety_score'] = score_val
-        updated_fields = True
-
-    if 'efficiency_score' in data:
-        score_val = data['efficiency_score']
-        if not (isinstance(score_val, (int, float)) and 0 <= score_val <= 100):
-            return jsonify({"error": "Invalid efficiency_score. Must be a number between 0 and 100."}), 400
-        current_score['efficiency_score'] = score_val
-        updated_fields = True
-
-    if 'punctuality_score' in data:
-        score_val = data['punctuality_score']
-        if not (isinstance(score_val, (int, float)) and 0 <= score_val <= 100):
-            return jsonify({"error": "Invalid punctuality_score. Must be a number between 0 and 100."}), 400
-        current_score['punctuality_score'] = score_val
-        updated_fields = True
+    # Validate every field before writing anything, so a bad field never leaves a partial update.
+    changes = {}
+    for field in ('overall_safety_score', 'efficiency_score', 'punctuality_score'):
+        if field in data:
+            score_val = data[field]
+            if not (isinstance(score_val, (int, float)) and 0 <= score_val <= 100):
+                return jsonify({"error": f"Invalid {field}. Must be a number between 0 and 100."}), 400
+            changes[field] = score_val
 
     if 'feedback_summary' in data:
         summary = data['feedback_summary']
         if not isinstance(summary, str):
             return jsonify({"error": "Invalid feedback_summary. Must be a string."}), 400
-        current_score['feedback_summary'] = summary
-        updated_fields = True
+        changes['feedback_summary'] = summary
 
-    if not updated_fields and not driver_scores_db.get(driver_id):
+    if not changes and not driver_scores_db.get(driver_id):
          return jsonify({"error": "No valid score fields provided for update."}), 400
 
-    current_score['driver_id'] = driver_id
-    current_score['last_updated_timestamp'] = datetime.datetime.utcnow().isoformat()
+    # One read-modify-write on a copy (snapshots being scanned may hold the stored dict).
+    def apply(score):
+        score = dict(score or {}, **changes)
+        score['driver_id'] = driver_id
+        score['last_updated_timestamp'] = datetime.datetime.utcnow().isoformat()
+        return bump_version(store_versions, 'driver_scores', score)
 
-    driver_scores_db[driver_id] = current_score
+    current_score = update_record(driver_scores_db, driver_id, apply)
+    change_log.record('driver_scores', driver_id, current_score)
+    score_index.update(current_score)
     return jsonify({"message": "Driver score updated successfully", "score": current_score}), 200
 
+@monitoring_bp.route('/leaderboard', methods=['GET'])
+@jwt_required()
+def get_leaderboard():
+    # e.g. ?metric=overall_safety_score&order=asc&k=100 for the 100 least safe drivers
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    metric = request.args.get('metric', 'overall_safety_score')
+    order = request.args.get('order', 'desc')
+    k = request.args.get('k', 10, type=int)
+    updated_since = request.args.get('updated_since')
+    if metric not in SCORE_METRICS:
+        return jsonify({"error": f"Invalid metric. Must be one of: {', '.join(SCORE_METRICS)}"}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+    max_k = current_app.config.get('LEADERBOARD_MAX_K', 1000)
+    if not 0 < k <= max_k:
+        return jsonify({"error": f"k must be between 1 and {max_k}"}), 400
+    if updated_since is not None:
+        # Stored timestamps are naive UTC isoformat strings; compare like with like.
+        try:
+            moment = datetime.datetime.fromisoformat(updated_since.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({"error": "updated_since must be an ISO 8601 timestamp"}), 400
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        updated_since = moment.isoformat()
+
+    top = score_index.top(metric, k, descending=(order == 'desc'), updated_since=updated_since)
+    return jsonify({
+        "metric": metric, "order": order, "k": k,
+        "drivers": [{"rank": rank, "driver_id": driver_id, metric: value, "last_updated_timestamp": updated}
+                    for rank, (driver_id, value, updated) in enumerate(top, start=1)]
+    }), 200
+
 # --- Incident Logging & Reporting Endpoints ---
 
+def create_incident_report(driver_id, incident_type, description, reporter_id, ride_id=None, status='open',
+                           location_lat=None, location_lon=None):
+    # Shared by the incidents endpoint and automatic anomaly incidents (reporter_id None).
+    report_id = id_manager.get_next_incident_report_id()
+    report_obj = {
+        "report_id": report_id, "driver_id": driver_id, "ride_id": ride_id,
+        "reported_by_user_id": reporter_id, "incident_type": incident_type,
+        "description": description, "status": status,
+        "created_at": datetime.datetime.utcnow().isoformat(),
+        "updated_at": datetime.datetime.utcnow().isoformat(),
+        "resolution_notes": None,
+        "location_lat": location_lat, "location_lon": location_lon
+    }
+    bump_version(store_versions, 'incident_reports', report_obj)
+    # Indexed first: a report must never be stored (and change-logged) but missing from search.
+    incident_search.add(report_obj)
+    try:
+        incident_reports_db[report_id] = report_obj
+        change_log.record('incident_reports', report_id, report_obj)
+    except Exception:
+        incident_search.remove(report_obj)
+        raise
+    heatmap.add_incident(report_obj)
+    webhooks.notify('incident.opened', report_obj)
+    return report_obj
+
 @monitoring_bp.route('/incidents', methods=['POST'])
 @jwt_required()
 def log_incident_report():
@@ -180,6 +295,8 @@ def log_incident_report():
     description = data.get('description')
     ride_id = data.get('ride_id')
     status = data.get('status', 'open')
+    if not isinstance(incident_type, str) or not isinstance(description, str):
+        return jsonify({"error": "incident_type and description must be strings"}), 400
 
     target_driver_exists = any(u['id'] == driver_id and u['user_type'] == 'driver' for u in users_db.values())
     if not target_driver_exists:
@@ -189,16 +306,15 @@ def log_incident_report():
     if status not in valid_statuses:
         return jsonify({"error": f"Invalid status. Must be one of: {', '.join(valid_statuses)}"}), 400
 
-    report_id = id_manager.get_next_incident_report_id()
-    report_obj = {
-        "report_id": report_id, "driver_id": driver_id, "ride_id": ride_id,
-        "reported_by_user_id": reporter_id, "incident_type": incident_type,
-        "description": description, "status": status,
-        "created_at": datetime.datetime.utcnow().isoformat(),
-        "updated_at": datetime.datetime.utcnow().isoformat(),
-        "resolution_notes": None
-    }
-    incident_reports_db[report_id] = report_obj
+    # Optional, feeds the heatmap
+    location_lat = data.get('location_lat')
+    location_lon = data.get('location_lon')
+    if (location_lat is None) != (location_lon is None) or not all(
+            v is None or isinstance(v, (int, float)) for v in (location_lat, location_lon)):
+        return jsonify({"error": "location_lat and location_lon must be given together as numbers"}), 400
+
+    report_obj = create_incident_report(driver_id, incident_type, description, reporter_id, ride_id, status,
+                                        location_lat, location_lon)
     return jsonify({"message": "Incident reported successfully", "report": report_obj}), 201
 
 
@@ -210,8 +326,13 @@ def get_all_incidents():
 
     filter_driver_id = request.args.get('driver_id', type=int)
     filter_status = request.args.get('status')
+    etag = collection_etag(store_versions, 'incident_reports', filter_driver_id, filter_status)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
 
-    all_incidents = list(incident_reports_db.values())
+    # A copy-on-write snapshot: reports filed during the scan neither block it nor show up half-way.
+    all_incidents = list(snapshot(incident_reports_db).values())
 
     if filter_driver_id is not None:
         all_incidents = [report for report in all_incidents if report['driver_id'] == filter_driver_id]
@@ -220,7 +341,38 @@ def get_all_incidents():
         all_incidents = [report for report in all_incidents if report['status'] == filter_status]
 
     all_incidents.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return jsonify({"incidents": all_incidents}), 200
+    # Reports can be updated, so the cached encoding is keyed on their version as well.
+    encoded_incidents = [record_cache.encoded('incident_report', (r['report_id'], r.get('version')), r)
+                         for r in all_incidents]
+    return with_etag((jsonify({"incidents": encoded_incidents}), 200), etag)
+
+
+@monitoring_bp.route('/incidents/search', methods=['GET'])
+@jwt_required()
+def search_incidents():
+    # Ranked (BM25) term search over description, incident_type and resolution_notes.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    limit = request.args.get('limit', 20, type=int)
+    if not 0 < limit <= 100:
+        return jsonify({"error": "limit must be between 1 and 100"}), 400
+    mode = request.args.get('match', 'all')
+    if mode not in ('all', 'any'):
+        return jsonify({"error": "match must be 'all' or 'any'"}), 400
+
+    total, hits = incident_search.search(
+        query, limit, driver_id=request.args.get('driver_id', type=int),
+        status=request.args.get('status'), match_all=(mode == 'all'))
+    results = []
+    for score, report_id in hits:
+        report = incident_reports_db.get(report_id)
+        if report is not None:
+            results.append({"score": round(score, 4), "report": report})
+    return jsonify({"query": query, "total_matches": total, "results": results}), 200
 
 
 @monitoring_bp.route('/incidents/<int:report_id>', methods=['GET'])
@@ -232,7 +384,12 @@ def get_incident_report_details(report_id):
     report = incident_reports_db.get(report_id)
     if not report:
         return jsonify({"error": f"Incident report with id {report_id} not found."}), 404
-    return jsonify(report), 200
+
+    etag = record_etag('incident', report_id, report.get('version'))
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag((jsonify(report), 200), etag)
 
 
 @monitoring_bp.route('/incidents/<int:report_id>', methods=['PUT'])
@@ -244,6 +401,8 @@ def update_incident_report(report_id):
     report = incident_reports_db.get(report_id)
     if not report:
         return jsonify({"error": f"Incident report with id {report_id} not found."}), 404
+    # Edit a copy: snapshots being scanned (get_all_incidents) may hold the stored dict.
+    indexed_report, report = report, dict(report)
 
     data = request.get_json()
     if not data:
@@ -270,5 +429,82 @@ def update_incident_report(report_id):
         return jsonify({"error": "No valid fields provided for update."}), 400
 
     report['updated_at'] = datetime.datetime.utcnow().isoformat()
+    bump_version(store_versions, 'incident_reports', report)
     incident_reports_db[report_id] = report
+    change_log.record('incident_reports', report_id, report)
+    incident_search.replace(indexed_report, report)
     return jsonify({"message": "Incident report updated successfully", "report": report}), 200
+
+
+@monitoring_bp.route('/alerts', methods=['GET'])
+@jwt_required()
+def get_anomaly_alerts():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    driver_id = request.args.get('driver_id', type=int)
+    limit = request.args.get('limit', 100, type=int)
+    if limit <= 0:
+        return jsonify({"error": "limit must be > 0"}), 400
+    return jsonify({"alerts": anomaly_detector.alerts(driver_id, limit)}), 200
+
+
+@monitoring_bp.route('/retention', methods=['GET'])
+@jwt_required()
+def get_retention_status():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    queued_events, queued_summaries = retention.queued()
+    return jsonify({
+        "policies": {event_type: {"raw_days": raw_days, "summary_days": summary_days}
+                     for event_type, (raw_days, summary_days) in retention.policies.items()},
+        "raw_events": len(driving_events_db), "summaries": len(event_summaries_db),
+        "queued_events": queued_events, "queued_summaries": queued_summaries,
+        "last_pass": retention.last_pass, "totals": retention.totals,
+    }), 200
+
+
+@monitoring_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def get_job_stats():
+    # Background job queue of this worker process, with per-handler run and queue-wait times.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+    return jsonify(jobs.stats()), 200
+
+# --- Heatmap ---
+
+@monitoring_bp.route('/heatmap', methods=['GET'])
+@jwt_required()
+def get_heatmap():
+    # Served from precomputed geohash x hour tiles; no event scan.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+
+    try:
+        bbox = [float(v) for v in request.args.get('bbox', '-90,-180,90,180').split(',')]
+        if len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "bbox must be min_lat,min_lon,max_lat,max_lon"}), 400
+
+    zoom = request.args.get('zoom', 12, type=int)
+    now = datetime.datetime.utcnow()
+    from_arg = request.args.get('from', (now - datetime.timedelta(hours=24)).isoformat())
+    to_arg = request.args.get('to', now.isoformat())
+    from_hour, to_hour = hour_of(from_arg), hour_of(to_arg)
+    if from_hour is None or to_hour is None or from_hour > to_hour:
+        return jsonify({"error": "from/to must be ISO 8601 timestamps with from <= to"}), 400
+    max_hours = current_app.config.get('HEATMAP_MAX_QUERY_HOURS', 24 * 31)
+    if to_hour - from_hour + 1 > max_hours:
+        return jsonify({"error": f"Time range is limited to {max_hours} hours"}), 400
+
+    types = request.args.get('types')
+    layers = set(types.split(',')) if types else None
+    precision = zoom_to_precision(zoom)
+    cells = heatmap.query(bbox, precision, from_hour, to_hour, layers)
+    return jsonify({
+        "precision": precision, "bbox": bbox, "from": from_arg, "to": to_arg,
+        "total": sum(c['count'] for c in cells), "cells": cells
+    }), 200
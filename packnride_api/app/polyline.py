@@ -0,0 +1,140 @@
+"""Compact GPS traces for rides.
+
+Points are stored as integer deltas (lat/lon in 1e-6 degrees, time in whole seconds).
+The deltas use the encoded-polyline character scheme: zigzag sign folding, then 5-bit
+varint groups offset into printable ASCII. A trace stays a plain JSON-friendly dict,
+so it fits every store backend. Appending a batch only encodes the new points,
+because the last absolute point is carried in the trace.
+
+A typical 1 Hz trace costs about 5 bytes per point (~300 B per trip minute), against
+~50 bytes per point as JSON. The stored trace is always full resolution (audits,
+fare checks). Douglas-Peucker simplification is applied on read for display.
+"""
+import math
+
+COORD_SCALE = 1000000  # 1e-6 degrees, ~0.1 m
+EARTH_RADIUS_M = 6371000.0
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def _decode_values(encoded):
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            yield ~(value >> 1) if value & 1 else value >> 1
+            value = shift = 0
+
+
+def new_trace(ride_id):
+    return {"ride_id": ride_id, "point_count": 0, "first_t": None, "last": None, "encoded": ""}
+
+
+def append_points(trace, points):
+    """Appends (lat, lon, t) points to trace in place; t must not go backwards."""
+    if not points:
+        return trace
+    prev_lat, prev_lon, prev_t = trace['last'] or (0, 0, int(points[0][2]))
+    out = []
+    for lat, lon, t in points:
+        ilat, ilon, it = round(lat * COORD_SCALE), round(lon * COORD_SCALE), int(t)
+        if it < prev_t:
+            raise ValueError("Trace points must be in time order")
+        if trace['last'] is None and not out:
+            it_delta = it  # first point carries its absolute time
+        else:
+            it_delta = it - prev_t
+        _encode_value(ilat - prev_lat, out)
+        _encode_value(ilon - prev_lon, out)
+        _encode_value(it_delta, out)
+        prev_lat, prev_lon, prev_t = ilat, ilon, it
+    if trace['last'] is None:
+        trace['first_t'] = int(points[0][2])
+    trace['encoded'] += ''.join(out)
+    trace['last'] = [prev_lat, prev_lon, prev_t]
+    trace['point_count'] += len(points)
+    return trace
+
+
+def decode_points(encoded):
+    """Full-resolution [(lat, lon, t), ...] from a stored trace encoding."""
+    points = []
+    lat = lon = t = 0
+    values = _decode_values(encoded)
+    for dlat in values:
+        lat += dlat
+        lon += next(values)
+        t += next(values)
+        points.append((lat / COORD_SCALE, lon / COORD_SCALE, t))
+    return points
+
+
+def encode_polyline(points, precision=5):
+    """Standard two-dimensional encoded polyline string, as consumed by map SDKs."""
+    scale = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon, *_ in points:
+        ilat, ilon = round(lat * scale), round(lon * scale)
+        _encode_value(ilat - prev_lat, out)
+        _encode_value(ilon - prev_lon, out)
+        prev_lat, prev_lon = ilat, ilon
+    return ''.join(out)
+
+
+def _segment_distance_m(point, start, end, cos_lat):
+    # Equirectangular projection around the trace: accurate to well under a metre at city scale.
+    px, py = point[1] * cos_lat, point[0]
+    ax, ay = start[1] * cos_lat, start[0]
+    bx, by = end[1] * cos_lat, end[0]
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        ex, ey = px - ax, py - ay
+    else:
+        u = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+        ex, ey = px - (ax + u * dx), py - (ay + u * dy)
+    return math.radians(math.hypot(ex, ey)) * EARTH_RADIUS_M
+
+
+def simplify(points, tolerance_m):
+    """Douglas-Peucker: drops points closer than tolerance_m to the simplified line."""
+    if tolerance_m <= 0 or len(points) < 3:
+        return list(points)
+    cos_lat = math.cos(math.radians(points[0][0]))
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, worst_index = 0.0, None
+        for i in range(first + 1, last):
+            distance = _segment_distance_m(points[i], points[first], points[last], cos_lat)
+            if distance > worst:
+                worst, worst_index = distance, i
+        if worst_index is not None and worst > tolerance_m:
+            keep[worst_index] = 1
+            stack.append((first, worst_index))
+            stack.append((worst_index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def trace_stats(trace):
+    encoded_bytes = len(trace['encoded'])
+    duration = (trace['last'][2] - trace['first_t']) if trace['last'] else 0
+    minutes = duration / 60
+    return {
+        "point_count": trace['point_count'],
+        "duration_seconds": duration,
+        "encoded_bytes": encoded_bytes,
+        "bytes_per_point": round(encoded_bytes / trace['point_count'], 2) if trace['point_count'] else None,
+        "bytes_per_minute": round(encoded_bytes / minutes, 1) if minutes else None,
+    }
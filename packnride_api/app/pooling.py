@@ -0,0 +1,246 @@
+"""Shared-ride pooling: groups pending pooled rides heading the same way.
+
+Rides requested with "pool": true and coordinates are indexed by pickup cell and
+heading sector (the bearing from pickup to dropoff, in 45 degree sectors). A ride's
+candidates are the rides in the 3x3 pickup cells around it, in its own or a
+neighbouring sector, whose dropoff is within max_dropoff_km of its own. Cells are
+max_pickup_km wide, so nobody further away can qualify. Only candidates are ever
+paired, and a triple extends a feasible pair with a rider who is feasible with both
+(dropping a rider's stops never lengthens anyone else's trip, so a feasible triple
+is made of feasible pairs). Triples are only built from each rider's max_partners
+best pairs. The search stays proportional to local density rather
+than to the square of all pending rides.
+
+A group is feasible if some stop order (each pickup before its dropoff) keeps every
+rider's in-vehicle distance within (1 + max_detour) of their direct trip, and the
+wait their pickup gains from earlier stops within max_wait_seconds at speed_kmh.
+Within a group, distances are planar (the riders are a few km apart), and stop
+orders are abandoned as soon as they are no shorter than the best so far. A matching pass picks disjoint groups greedily, largest saving first.
+"""
+import heapq
+import itertools
+import math
+import threading
+
+from .locations import haversine_km
+
+SECTORS = 8
+KM_PER_DEGREE = 111.32
+
+
+def bearing_sector(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlambda = math.radians(lon2 - lon1)
+    bearing = math.degrees(math.atan2(math.sin(dlambda) * math.cos(phi2),
+                                      math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)))
+    return int(((bearing + 360 + 180 / SECTORS) % 360) // (360 / SECTORS))
+
+
+def ride_coordinates(ride):
+    """(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon) of a ride, or None if it has none."""
+    values = tuple(ride.get(f) for f in ('pickup_lat', 'pickup_lon', 'dropoff_lat', 'dropoff_lon'))
+    return values if all(isinstance(v, (int, float)) for v in values) else None
+
+
+def _sequences(rider_count):
+    """Every stop order for rider_count riders: (rider, is_dropoff) tuples, pickups before dropoffs."""
+    stops = [(r, d) for r in range(rider_count) for d in (False, True)]
+    for order in itertools.permutations(stops):
+        picked = set()
+        for rider, is_dropoff in order:
+            if is_dropoff and rider not in picked:
+                break
+            picked.add(rider)
+        else:
+            yield order
+
+
+_SEQUENCES = {n: list(_sequences(n)) for n in (2, 3)}
+
+
+class PoolingEngine:
+    def __init__(self, max_pickup_km=2.0, max_dropoff_km=3.0, max_detour=0.4, max_wait_seconds=600,
+                 speed_kmh=30.0, max_group_size=3, max_partners=8):
+        self.max_pickup_km = max_pickup_km
+        self.max_dropoff_km = max_dropoff_km
+        self.max_detour = max_detour
+        self.max_wait_seconds = max_wait_seconds
+        self.speed_kmh = speed_kmh
+        self.max_group_size = max_group_size
+        self.max_partners = max_partners
+        self._rides = {}  # ride_id -> (pickup, dropoff, direct_km, cell key)
+        self._cells = {}  # (cell_lat, cell_lon, sector) -> set of ride ids
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_pickup_km = app.config.get('POOL_MAX_PICKUP_KM', self.max_pickup_km)
+        self.max_dropoff_km = app.config.get('POOL_MAX_DROPOFF_KM', self.max_dropoff_km)
+        self.max_detour = app.config.get('POOL_MAX_DETOUR', self.max_detour)
+        self.max_wait_seconds = app.config.get('POOL_MAX_WAIT_SECONDS', self.max_wait_seconds)
+        self.speed_kmh = app.config.get('POOL_SPEED_KMH', self.speed_kmh)
+        self.max_group_size = min(3, app.config.get('POOL_MAX_GROUP_SIZE', self.max_group_size))
+        self.max_partners = app.config.get('POOL_MAX_PARTNERS', self.max_partners)
+        app.extensions['pooling'] = self
+
+    def clear(self):
+        with self._lock:
+            self._rides = {}
+            self._cells = {}
+
+    def __len__(self):
+        return len(self._rides)
+
+    @staticmethod
+    def poolable(ride):
+        return (ride.get('pool') and ride.get('status') == 'pending' and ride.get('group_id') is None
+                and ride_coordinates(ride) is not None)
+
+    def _cell(self, lat, lon):
+        size = self.max_pickup_km / KM_PER_DEGREE
+        return int(math.floor(lat / size)), int(math.floor(lon / (size / max(math.cos(math.radians(lat)), 0.01))))
+
+    def _add(self, ride):
+        plat, plon, dlat, dlon = ride_coordinates(ride)
+        key = self._cell(plat, plon) + (bearing_sector(plat, plon, dlat, dlon),)
+        self._rides[ride['id']] = ((plat, plon), (dlat, dlon), haversine_km(plat, plon, dlat, dlon), key)
+        self._cells.setdefault(key, set()).add(ride['id'])
+
+    def _remove(self, ride_id):
+        entry = self._rides.pop(ride_id, None)
+        if entry is not None:
+            members = self._cells[entry[3]]
+            members.discard(ride_id)
+            if not members:
+                del self._cells[entry[3]]
+
+    def update(self, ride):
+        """Indexes the ride while it can be pooled, and drops it once it cannot."""
+        with self._lock:
+            self._remove(ride['id'])
+            if self.poolable(ride):
+                self._add(ride)
+
+    def rebuild(self, rides):
+        with self._lock:
+            self._rides = {}
+            self._cells = {}
+            for ride in rides:
+                if self.poolable(ride):
+                    self._add(ride)
+
+    def _candidates(self, ride_id, rides, cells):
+        (plat, plon), (dlat, dlon), _direct, (cell_lat, cell_lon, sector) = rides[ride_id]
+        # Planar distances in km; exact enough over a few km, and far cheaper than haversine here.
+        lon_factor = math.cos(math.radians(plat)) ** 2
+        max_pickup = (self.max_pickup_km / KM_PER_DEGREE) ** 2
+        max_dropoff = (self.max_dropoff_km / KM_PER_DEGREE) ** 2
+        found = set()
+        for dlat_cell in (-1, 0, 1):
+            for dlon_cell in (-1, 0, 1):
+                for dsector in (-1, 0, 1):
+                    key = (cell_lat + dlat_cell, cell_lon + dlon_cell, (sector + dsector) % SECTORS)
+                    for other in cells.get(key, ()):
+                        (oplat, oplon), (odlat, odlon), _, _ = rides[other]
+                        if ((plat - oplat) ** 2 + lon_factor * (plon - oplon) ** 2 <= max_pickup
+                                and (dlat - odlat) ** 2 + lon_factor * (dlon - odlon) ** 2 <= max_dropoff):
+                            found.add(other)
+        found.discard(ride_id)
+        return found
+
+    def _best_order(self, ride_ids, rides):
+        """Shortest feasible stop order for the riders as (route_km, order), or None."""
+        entries = [rides[ride_id] for ride_id in ride_ids]
+        points = [point for pickup, dropoff, _, _ in entries for point in (pickup, dropoff)]
+        x_scale = KM_PER_DEGREE * math.cos(math.radians(points[0][0]))
+        points = [(lon * x_scale, lat * KM_PER_DEGREE) for lat, lon in points]
+        distance = [[math.hypot(a[0] - b[0], a[1] - b[1]) for b in points] for a in points]
+        max_ride_km = [entry[2] * (1 + self.max_detour) for entry in entries]
+        max_wait_km = self.max_wait_seconds / 3600 * self.speed_kmh
+        best_km, best_order = math.inf, None
+        for order in _SEQUENCES[len(entries)]:
+            route_km, position, picked_at = 0.0, None, {}
+            for rider, is_dropoff in order:
+                index = 2 * rider + is_dropoff
+                if position is not None:
+                    route_km += distance[position][index]
+                    if route_km >= best_km:
+                        break
+                position = index
+                if not is_dropoff:
+                    picked_at[rider] = route_km
+                    # The first pickup waits for nothing; later ones wait for the earlier stops.
+                    if route_km > max_wait_km:
+                        break
+                elif route_km - picked_at[rider] > max_ride_km[rider]:
+                    break
+            else:
+                best_km, best_order = route_km, order
+        return None if best_order is None else (best_km, best_order)
+
+    def evaluate(self, ride_ids, best=None, rides=None):
+        """Best feasible stop order for the riders: (route_km, saved_km, stops) or None."""
+        rides = self._rides if rides is None else rides
+        best = best or self._best_order(ride_ids, rides)
+        if best is None:
+            return None
+        route_km, order = best
+        saved_km = sum(rides[ride_id][2] for ride_id in ride_ids) - route_km
+        if saved_km <= 0:
+            return None
+        stops = [{"ride_id": ride_ids[rider], "stop": 'dropoff' if is_dropoff else 'pickup'} for rider, is_dropoff in order]
+        return round(route_km, 3), round(saved_km, 3), stops
+
+    def match(self):
+        """Proposes disjoint pooled groups among the indexed rides, largest saving first.
+
+        Returns [(ride_ids, route_km, saved_km, stops)] and stats about the search.
+        """
+        # Entries are immutable tuples, so copies of the two dicts are a consistent index to
+        # search while requests keep updating the live one.
+        with self._lock:
+            rides = dict(self._rides)
+            cells = {key: tuple(members) for key, members in self._cells.items()}
+        proposals, pairs_checked, triples_checked = [], 0, 0
+        feasible = {ride_id: [] for ride_id in rides}
+        for ride_id in rides:
+            for other in self._candidates(ride_id, rides, cells):
+                if other < ride_id:
+                    continue
+                pairs_checked += 1
+                best = self._best_order([ride_id, other], rides)
+                if best is None:
+                    continue
+                pair = self.evaluate([ride_id, other], best, rides)
+                saved_km = -math.inf if pair is None else pair[1]
+                feasible[ride_id].append((saved_km, other))
+                feasible[other].append((saved_km, ride_id))
+                if pair is not None:
+                    proposals.append(((ride_id, other),) + pair)
+
+        if self.max_group_size >= 3:
+            # Only a rider's best partners are extended, so dense hotspots stay linear.
+            partners = {ride_id: {other for _, other in heapq.nlargest(self.max_partners, pairs)}
+                        for ride_id, pairs in feasible.items()}
+            for ride_id, others in partners.items():
+                for other in others:
+                    if other < ride_id:
+                        continue
+                    for third in others & partners[other]:
+                        if third <= other:
+                            continue
+                        triples_checked += 1
+                        triple = self.evaluate([ride_id, other, third], rides=rides)
+                        if triple is not None:
+                            proposals.append(((ride_id, other, third),) + triple)
+
+        proposals.sort(key=lambda p: p[2], reverse=True)
+        taken, groups = set(), []
+        for ride_ids, route_km, saved_km, stops in proposals:
+            if taken.isdisjoint(ride_ids):
+                taken.update(ride_ids)
+                groups.append((list(ride_ids), route_km, saved_km, stops))
+        stats = {"pending": len(rides), "pairs_checked": pairs_checked, "triples_checked": triples_checked}
+        return groups, stats
+
+
+pooling = PoolingEngine()
@@ -0,0 +1,147 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+
+class TokenBucketStore:
+    """Token buckets keyed by (client, route), held in LRU order.
+
+    Every operation is O(1): a bucket is refilled lazily when it is touched, and
+    buckets idle for longer than idle_seconds (or beyond max_buckets) are evicted
+    from the cold end of the ordered dict.
+    """
+
+    def __init__(self, max_buckets=100000, idle_seconds=300):
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        self._buckets = OrderedDict()  # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def consume(self, key, rate, burst, now=None):
+        """Takes one token. Returns 0 when allowed, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(burst), now]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+
+            # Evict at most a couple of cold buckets per call to keep the cost constant.
+            for _ in range(2):
+                oldest_key, oldest = next(iter(self._buckets.items()))
+                if oldest_key != key and (len(self._buckets) > self.max_buckets
+                                          or now - oldest[1] > self.idle_seconds):
+                    self._buckets.popitem(last=False)
+                else:
+                    break
+
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / rate
+
+
+class ConcurrencyLimiter:
+    """Non-blocking cap on the number of requests being handled at once."""
+
+    def __init__(self, max_concurrent=64):
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+
+class RateLimiter:
+    """Per-user, per-route admission control registered as request hooks."""
+
+    def __init__(self):
+        self.enabled = True
+        self.default_limit = None
+        self.route_limits = {}
+        self.exempt = set()
+        self.buckets = TokenBucketStore()
+        self.concurrency = ConcurrencyLimiter()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.default_limit = app.config.get('RATELIMIT_DEFAULT')
+        self.route_limits = dict(app.config.get('RATELIMIT_ROUTES', {}))
+        self.exempt = set(app.config.get('RATELIMIT_EXEMPT', ()))
+        self.buckets.max_buckets = app.config.get('RATELIMIT_MAX_BUCKETS', self.buckets.max_buckets)
+        self.buckets.idle_seconds = app.config.get('RATELIMIT_IDLE_SECONDS', self.buckets.idle_seconds)
+        self.concurrency.max_concurrent = app.config.get('MAX_CONCURRENT_REQUESTS', self.concurrency.max_concurrent)
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['rate_limiter'] = self
+
+    def reset(self):
+        self.buckets.clear()
+
+    def _client_key(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except (JWTExtendedException, PyJWTError):
+            # Let the view's own @jwt_required() report the bad token.
+            identity = None
+        if isinstance(identity, dict) and identity.get('id') is not None:
+            return 'user:%s' % identity['id']
+        return 'ip:%s' % request.remote_addr
+
+    def _before_request(self):
+        if not self.enabled or request.endpoint is None or request.endpoint in self.exempt:
+            return None
+
+        if not self.concurrency.try_acquire():
+            response = jsonify({"error": "Server is busy, please retry shortly"})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        g._ratelimit_acquired = True
+
+        limit = self.route_limits.get(request.endpoint, self.default_limit)
+        if not limit:
+            return None
+        rate, burst = limit
+        wait = self.buckets.consume((self._client_key(), request.endpoint), rate, burst)
+        if wait:
+            response = jsonify({"error": "Rate limit exceeded"})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+            return response
+        return None
+
+    def _teardown_request(self, _exc):
+        if g.pop('_ratelimit_acquired', False):
+            self.concurrency.release()
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,213 @@
+"""Sparse fieldsets, the compact response profile, and response compression.
+
+Every JSON response built with jsonify can be trimmed and compacted by the client:
+
+    ?fields=id,status,driver_id              only these keys of the response object
+    ?fields=rides.id,rides.status,next_cursor  dotted paths reach into nested objects;
+                                             lists are walked element by element
+    ?profile=compact                         short keys (COMPACT_KEYS) and timestamps as
+                                             epoch seconds (TIMESTAMP_KEYS)
+
+Paths name the full keys, also with profile=compact, and keys a response doesn't
+have are left out. A field set is parsed and compiled into nested projection
+functions once and cached, so a request only pays for walking its own response.
+The shape is applied by the JSON provider while the response is encoded (after
+views set their ETags); error bodies ({"error": ...}) are never reshaped, and
+server-sent event streams are not JSON responses. Shaped responses are built from
+the records themselves rather than the record cache's encoded copies, and their
+ETags carry a suffix per shape (shape_tag).
+
+Responses of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed with brotli
+(when the brotli package is installed) or gzip, whichever the client's
+Accept-Encoding prefers, in an after_request hook, which also appends the coding
+to the ETag. Traffic captures record the bytes each response put on the wire
+(app/capture.py).
+"""
+import datetime
+import functools
+import gzip
+import hashlib
+import re
+
+from flask import g, jsonify, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - exercised only without brotli installed
+    brotli = None
+
+PROFILES = ('full', 'compact')
+
+COMPACT_KEYS = {
+    'passenger_id': 'pid', 'driver_id': 'did', 'ride_id': 'rid', 'event_id': 'eid', 'report_id': 'iid',
+    'group_id': 'gid', 'reported_by_user_id': 'by', 'status': 'st', 'version': 'v', 'fare': 'fr',
+    'pickup_location': 'pu', 'dropoff_location': 'do', 'pickup_lat': 'pula', 'pickup_lon': 'pulo',
+    'dropoff_lat': 'dola', 'dropoff_lon': 'dolo', 'location_lat': 'la', 'location_lon': 'lo',
+    'location': 'loc', 'current_status': 'cst', 'vehicle_type': 'vt', 'distance_km': 'km',
+    'heading': 'hd', 'speed_kmh': 'kmh', 'user_type': 'ut', 'is_admin': 'adm', 'event_type': 'et',
+    'incident_type': 'it', 'description': 'ds', 'resolution_notes': 'rn', 'details': 'dt',
+    'timestamp': 'ts', 'requested_at': 'rqt', 'updated_at': 'upt', 'created_at': 'crt',
+    'registered_on': 'rgt', 'logged_at': 'lgt', 'started_at': 'sdt', 'triggered_at': 'trt',
+    'last_updated_timestamp': 'lut', 'overall_safety_score': 'oss', 'efficiency_score': 'efs',
+    'punctuality_score': 'pns', 'feedback_summary': 'fbs', 'available_drivers': 'drivers',
+    'next_cursor': 'nc', 'message': 'msg',
+}
+TIMESTAMP_KEYS = frozenset(('timestamp', 'requested_at', 'updated_at', 'created_at', 'registered_on',
+                            'logged_at', 'started_at', 'triggered_at', 'last_updated_timestamp'))
+_FIELD_PATH = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+def epoch_seconds(value):
+    """An ISO 8601 timestamp (naive ones are UTC) as epoch seconds; anything else as it is."""
+    if not isinstance(value, str):
+        return value
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if moment.tzinfo is None:
+        return round((moment - _EPOCH).total_seconds(), 3)  # stored timestamps; 2x faster than .timestamp()
+    return round(moment.timestamp(), 3)
+
+
+def compact(value):
+    """value with every key shortened and every timestamp converted."""
+    if isinstance(value, dict):
+        return {COMPACT_KEYS.get(k, k): epoch_seconds(v) if k in TIMESTAMP_KEYS
+                else v if v.__class__ in _SCALARS else compact(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [v if v.__class__ in _SCALARS else compact(v) for v in value]
+    return value
+
+
+def _identity(value):
+    return value
+
+
+def _leaf(name, profile):
+    if profile != 'compact':
+        return _identity
+    if name in TIMESTAMP_KEYS:
+        return epoch_seconds
+    return compact
+
+
+def _compile(tree, profile):
+    steps = tuple((name, COMPACT_KEYS.get(name, name) if profile == 'compact' else name,
+                   _leaf(name, profile) if sub is None else _compile(sub, profile))
+                  for name, sub in tree.items())
+
+    def project(value):
+        if isinstance(value, list):
+            return [project(v) for v in value]
+        if not isinstance(value, dict):
+            return value
+        return {out: shape(value[name]) for name, out, shape in steps if name in value}
+
+    return project
+
+
+def parse_fields(spec, max_fields=100):
+    """The sorted tuple of dotted paths in a fields= value; ValueError if it is malformed."""
+    paths = tuple(sorted({p.strip() for p in spec.split(',')}))
+    if not paths or len(paths) > max_fields or not all(_FIELD_PATH.match(p) for p in paths):
+        raise ValueError(f"fields must be a comma-separated list of at most {max_fields} (dotted) key names")
+    return paths
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_shape(paths, profile='full'):
+    """One function applying the field set (sorted dotted paths, or None for all) and profile."""
+    if paths is None:
+        return compact if profile == 'compact' else _identity
+    tree = {}
+    for path in paths:
+        node = tree
+        *parents, last = path.split('.')
+        for name in parents:
+            if node.get(name, {}) is None:
+                break  # the whole parent is already selected
+            node = node.setdefault(name, {})
+        else:
+            node[last] = None
+    return _compile(tree, profile)
+
+
+@functools.lru_cache(maxsize=1024)
+def shape_for(spec, profile='full', max_fields=100):
+    """compile_shape for a raw fields= value (None for all fields), so repeats skip parsing too."""
+    return compile_shape(parse_fields(spec, max_fields) if spec is not None else None, profile)
+
+
+@functools.lru_cache(maxsize=1024)
+def shape_tag(spec, profile='full', max_fields=100):
+    """ETag suffix for a shape; the same for field sets that differ only in order or spacing."""
+    paths = parse_fields(spec, max_fields) if spec is not None else None
+    return '-' + hashlib.sha1(repr((paths, profile)).encode()).hexdigest()[:8]
+
+
+class ResponseProfiles:
+    def __init__(self, max_fields=100, compression_min_bytes=1024, gzip_level=5, brotli_quality=4):
+        self.max_fields = max_fields
+        self.compression_min_bytes = compression_min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def init_app(self, app):
+        self.max_fields = app.config.get('RESPONSE_MAX_FIELDS', self.max_fields)
+        self.compression_min_bytes = app.config.get('RESPONSE_COMPRESSION_MIN_BYTES', self.compression_min_bytes)
+        self.gzip_level = app.config.get('RESPONSE_GZIP_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('RESPONSE_BROTLI_QUALITY', self.brotli_quality)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['response_profiles'] = self
+
+    def _before_request(self):
+        # g can outlive a request when an app context is already pushed (tests, CLI).
+        g.pop('response_shape', None)
+        g.pop('etag_variant', None)
+        args = request.args
+        if 'fields' not in args and 'profile' not in args:
+            return None
+        profile = args.get('profile', 'full')
+        if profile not in PROFILES:
+            return jsonify({"error": f"profile must be one of: {', '.join(PROFILES)}"}), 400
+        try:
+            g.response_shape = shape_for(args.get('fields'), profile, self.max_fields)  # applied by FastJSONProvider.response
+            g.etag_variant = shape_tag(args.get('fields'), profile, self.max_fields)  # app/versioning.py
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return None
+
+    def _after_request(self, response):
+        if response.mimetype != 'application/json' or response.is_streamed:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (not self.compression_min_bytes or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)):
+            return response
+        data = response.get_data()
+        if len(data) < self.compression_min_bytes:
+            return response
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+            response.set_data(brotli.compress(data, quality=self.brotli_quality))
+            coding = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=self.gzip_level, mtime=0))
+            coding = 'gzip'
+        else:
+            return response
+        response.headers['Content-Encoding'] = coding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag('%s-%s' % (etag, coding), weak)  # a strong tag names one exact body
+        return response
+
+
+response_profiles = ResponseProfiles()
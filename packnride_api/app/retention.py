@@ -0,0 +1,339 @@
+"""Tiered retention for driving events: raw -> per-driver hourly summaries -> dropped.
+
+EVENT_RETENTION_POLICIES maps an event_type ('*' for the rest) to (raw_days,
+summary_days), both counted from the hour the event happened. Once an event is
+raw_days old it is deleted from driving_events_db and folded into an
+event_summaries_db record for its (driver, event_type, hour); the summary is
+deleted once it is summary_days old. None keeps that tier forever, and
+summary_days <= raw_days drops events without keeping a summary.
+
+Nothing is ever scanned to find expired records. Each event is filed on ingest
+under the hour it expires, in a calendar queue: a dict from expiry hour to an
+array('q') of event ids (8 bytes per event), plus a heap of those hours.
+Summaries are filed the same way when they are created. A compaction slice pops
+due ids in batches until its time budget (RETENTION_SLICE_MS) is spent. A pass
+runs slices back to back, sleeping RETENTION_PAUSE_MS between them, so request
+threads get the GIL back within a few milliseconds.
+
+A periodic background job (app/jobs.py) runs a pass every RETENTION_INTERVAL_SECONDS.
+`flask compact-events` runs one pass from the command line. The analytics rollups
+count summarized events exactly like raw ones, and forget them when a summary is
+dropped; summary deletes in the change log carry the dropped summary for that.
+
+Under serve.py only one worker compacts. It files the events other workers ingest
+from the shared change log (ChangeFollower), so the store is never rescanned either.
+"""
+import datetime
+import heapq
+import threading
+import time
+from array import array
+
+import click
+from flask.cli import with_appcontext
+
+from . import driving_events_db, event_summaries_db, store_versions, change_log
+from .changes import change_follower
+from .analytics import rollups
+from .heatmap import hour_of
+from .jobs import jobs
+from .json_provider import record_cache
+from .versioning import bump_version
+
+DEFAULT_POLICY = (30, 365)
+
+
+def event_hour(event):
+    hour = hour_of(event.get('timestamp'))
+    return hour if hour is not None else hour_of(event.get('logged_at'))
+
+
+def current_hour():
+    return int(time.time() // 3600)
+
+
+def hour_iso(hour):
+    return datetime.datetime.fromtimestamp(hour * 3600, datetime.timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def summary_key(driver_id, event_type, hour):
+    return f"{driver_id}:{event_type}:{hour}"
+
+
+def _resident_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            import resource
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, ImportError):
+        return None
+
+
+class _CalendarQueue:
+    """Keys filed under an expiry hour; take() pops keys whose hour has come."""
+
+    def __init__(self, typecode=None):
+        self._typecode = typecode
+        self._buckets = {}
+        self._hours = []
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def push(self, hour, key):
+        bucket = self._buckets.get(hour)
+        if bucket is None:
+            bucket = self._buckets[hour] = array(self._typecode) if self._typecode else []
+            heapq.heappush(self._hours, hour)
+        bucket.append(key)
+
+    def due(self, now_hour):
+        return bool(self._hours) and self._hours[0] <= now_hour
+
+    def take(self, now_hour, count):
+        taken = []
+        while self._hours and self._hours[0] <= now_hour and len(taken) < count:
+            bucket = self._buckets[self._hours[0]]
+            n = min(count - len(taken), len(bucket))
+            taken.extend(bucket[len(bucket) - n:])
+            del bucket[len(bucket) - n:]
+            if not bucket:
+                del self._buckets[heapq.heappop(self._hours)]
+        return taken
+
+
+class RetentionEngine:
+    def __init__(self):
+        self.policies = {'*': DEFAULT_POLICY}
+        self.interval_seconds = 0
+        self.slice_seconds = 0.005
+        self.pause_seconds = 0.02
+        self.batch_size = 256
+        self.filing = True
+        self._lock = threading.Lock()    # queues
+        self._run_lock = threading.Lock()  # one pass at a time
+        self._reset()
+
+    def _reset(self):
+        self._raw = _CalendarQueue('q')
+        self._summaries = _CalendarQueue()
+        self.last_pass = None
+        self.totals = {"events_compacted": 0, "summaries_dropped": 0, "passes": 0}
+
+    def init_app(self, app):
+        self.policies = dict(app.config.get('EVENT_RETENTION_POLICIES', self.policies))
+        self.interval_seconds = app.config.get('RETENTION_INTERVAL_SECONDS', self.interval_seconds)
+        slice_ms = app.config.get('RETENTION_SLICE_MS', self.slice_seconds * 1000)
+        if slice_ms <= 0:
+            raise ValueError("RETENTION_SLICE_MS must be > 0")
+        self.slice_seconds = slice_ms / 1000
+        self.pause_seconds = app.config.get('RETENTION_PAUSE_MS', self.pause_seconds * 1000) / 1000
+        if app.config.get('SHARED_STORE_PATH'):
+            # Only the compacting worker needs the queues; it learns of other workers' events from the change log.
+            self.filing = self.interval_seconds > 0
+            if self.filing:
+                change_follower.register('driving_events', self._remote_event)
+        jobs.register('retention.compact', lambda _payload: self.run_pass())
+        app.cli.add_command(compact_events_command)
+        app.extensions['retention'] = self
+
+    def start_background(self):
+        if self.interval_seconds > 0:
+            jobs.every('retention.compact', self.interval_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def policy(self, event_type):
+        return self.policies.get(event_type, self.policies.get('*', DEFAULT_POLICY))
+
+    def _summary_expiry(self, event_type, hour):
+        summary_days = self.policy(event_type)[1]
+        return None if summary_days is None else hour + summary_days * 24
+
+    # --- filing ---
+
+    def _file_event(self, event):
+        raw_days = self.policy(event['event_type'])[0]
+        hour = event_hour(event)
+        if raw_days is not None and hour is not None:
+            # Client clocks run ahead; a future-stamped event is kept raw_days from now, not from its stamp.
+            self._raw.push(min(hour, current_hour()) + raw_days * 24, event['event_id'])
+
+    def _file_summary(self, summary):
+        expiry = self._summary_expiry(summary['event_type'], hour_of(summary['hour']))
+        if expiry is not None:
+            self._summaries.push(expiry, summary_key(summary['driver_id'], summary['event_type'], hour_of(summary['hour'])))
+
+    def event_logged(self, event):
+        if not self.filing:
+            return
+        with self._lock:
+            self._file_event(event)
+
+    def _remote_event(self, change):
+        # Events are immutable, so version 1 is the insert; deletes are this worker's own compaction.
+        if change['op'] == 'upsert' and change['record'].get('version') == 1:
+            self.event_logged(change['record'])
+
+    def rebuild(self, events, summaries):
+        if not self.filing:
+            return
+        with self._lock:
+            self._raw = _CalendarQueue('q')
+            self._summaries = _CalendarQueue()
+            for event in events:
+                self._file_event(event)
+            for summary in summaries:
+                self._file_summary(summary)
+
+    def queued(self):
+        with self._lock:
+            return len(self._raw), len(self._summaries)
+
+    # --- compaction ---
+
+    def _fold(self, event_ids, now_hour):
+        """Deletes the given raw events and folds them into their hourly summaries."""
+        folded, created, deleted = {}, set(), 0
+        for event_id in event_ids:
+            try:
+                event = driving_events_db.pop(event_id)
+            except KeyError:  # already gone (another worker, or a rebuild filed it twice)
+                continue
+            deleted += 1
+            record_cache.discard('driving_event', event_id)
+            change_log.record('driving_events', event_id, None, op='delete')
+            hour = event_hour(event)
+            key = summary_key(event['driver_id'], event['event_type'], hour)
+            summary = folded.get(key)
+            if summary is None:
+                summary = event_summaries_db.get(key)
+                if summary is None:
+                    created.add(key)
+                    summary = {"driver_id": event['driver_id'], "event_type": event['event_type'],
+                               "hour": hour_iso(hour), "count": 0, "first_timestamp": None,
+                               "last_timestamp": None, "location_lat": None, "location_lon": None, "located": 0}
+                folded[key] = summary = dict(summary)
+            summary['count'] += 1
+            timestamp = event.get('timestamp')
+            if timestamp is not None:
+                summary['first_timestamp'] = min(summary['first_timestamp'] or timestamp, timestamp)
+                summary['last_timestamp'] = max(summary['last_timestamp'] or timestamp, timestamp)
+            lat, lon = event.get('location_lat'), event.get('location_lon')
+            if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+                # Running centroid of the folded positions.
+                summary['located'] += 1
+                centroid_lat, centroid_lon = summary['location_lat'] or 0.0, summary['location_lon'] or 0.0
+                summary['location_lat'] = centroid_lat + (lat - centroid_lat) / summary['located']
+                summary['location_lon'] = centroid_lon + (lon - centroid_lon) / summary['located']
+        if deleted:
+            store_versions.bump('driving_events')
+
+        expired = False
+        for key, summary in folded.items():
+            hour = hour_of(summary['hour'])
+            expiry = self._summary_expiry(summary['event_type'], hour)
+            if expiry is not None and expiry <= now_hour:
+                # Already past its own retention (summary_days <= raw_days): drop instead of writing.
+                # The delete is logged even for a summary never written, so other workers' rollups see the drop.
+                if key in created or event_summaries_db.pop(key, None) is not None:
+                    change_log.record('event_summaries', key, summary, op='delete')
+                    expired = True
+                rollups.events_dropped(summary['driver_id'], hour, summary['count'])
+                continue
+            bump_version(store_versions, 'event_summaries', summary)
+            event_summaries_db[key] = summary
+            change_log.record('event_summaries', key, summary)
+            if key in created:
+                with self._lock:
+                    self._file_summary(summary)
+        if expired:
+            store_versions.bump('event_summaries')
+        return deleted
+
+    def _drop(self, keys):
+        dropped = 0
+        for key in keys:
+            try:
+                summary = event_summaries_db.pop(key)
+            except KeyError:
+                continue
+            dropped += 1
+            change_log.record('event_summaries', key, summary, op='delete')
+            rollups.events_dropped(summary['driver_id'], hour_of(summary['hour']), summary['count'])
+        if dropped:
+            store_versions.bump('event_summaries')
+        return dropped
+
+    def compact_slice(self, now_hour):
+        """Compacts due records until the slice budget is spent; returns (events, summaries, more due).
+
+        Every slice handles at least one batch, so a pass always makes progress.
+        """
+        deadline = time.perf_counter() + self.slice_seconds
+        events = summaries = 0
+        while True:
+            with self._lock:
+                event_ids = self._raw.take(now_hour, self.batch_size)
+                keys = [] if event_ids else self._summaries.take(now_hour, self.batch_size)
+            if event_ids:
+                events += self._fold(event_ids, now_hour)
+            elif keys:
+                summaries += self._drop(keys)
+            else:
+                return events, summaries, False
+            if time.perf_counter() >= deadline:
+                break
+        with self._lock:
+            more = self._raw.due(now_hour) or self._summaries.due(now_hour)
+        return events, summaries, more
+
+    def run_pass(self, now_hour=None):
+        """Compacts everything due at now_hour in time slices; returns the pass report."""
+        now_hour = current_hour() if now_hour is None else now_hour
+        with self._run_lock:
+            change_follower.catch_up()
+            report = {"started_at": datetime.datetime.utcnow().isoformat(), "now_hour": hour_iso(now_hour),
+                      "raw_events_before": len(driving_events_db), "summaries_before": len(event_summaries_db),
+                      "resident_bytes_before": _resident_bytes(),
+                      "events_compacted": 0, "summaries_dropped": 0, "slices": 0, "max_slice_ms": 0.0}
+            started = time.perf_counter()
+            more = True
+            while more:
+                slice_started = time.perf_counter()
+                events, summaries, more = self.compact_slice(now_hour)
+                report['slices'] += 1
+                report['max_slice_ms'] = max(report['max_slice_ms'], (time.perf_counter() - slice_started) * 1000)
+                report['events_compacted'] += events
+                report['summaries_dropped'] += summaries
+                if more and self.pause_seconds:
+                    time.sleep(self.pause_seconds)
+            report['seconds'] = round(time.perf_counter() - started, 3)
+            report['max_slice_ms'] = round(report['max_slice_ms'], 2)
+            report.update(raw_events_after=len(driving_events_db), summaries_after=len(event_summaries_db),
+                          resident_bytes_after=_resident_bytes())
+            self.last_pass = report
+            self.totals['passes'] += 1
+            self.totals['events_compacted'] += report['events_compacted']
+            self.totals['summaries_dropped'] += report['summaries_dropped']
+            return report
+
+
+@click.command('compact-events')
+@click.option('--now', 'now', default=None, help='ISO 8601 time to compact as of (default: now).')
+@with_appcontext
+def compact_events_command(now):
+    """Apply the event retention policies once."""
+    now_hour = hour_of(now) if now else None
+    if now and now_hour is None:
+        raise click.BadParameter('must be an ISO 8601 timestamp', param_hint='--now')
+    report = retention.run_pass(now_hour)
+    click.echo(f"Compacted {report['events_compacted']} events and dropped {report['summaries_dropped']} summaries "
+               f"in {report['seconds']} s ({report['slices']} slices, longest {report['max_slice_ms']} ms).")
+    click.echo(f"raw events {report['raw_events_before']} -> {report['raw_events_after']}, "
+               f"summaries {report['summaries_before']} -> {report['summaries_after']}")
+
+
+retention = RetentionEngine()
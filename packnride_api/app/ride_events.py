@@ -0,0 +1,108 @@
+import json
+import queue
+import threading
+
+TERMINAL_STATUSES = ('completed', 'cancelled')
+
+
+class QueueSubscriber:
+    """Subscriber for a thread that blocks waiting on updates (threaded WSGI mode)."""
+
+    def __init__(self, maxsize=16):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def deliver(self, payload):
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            # A slow reader only needs the latest status; drop the oldest update.
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(payload)
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncQueueSubscriber:
+    """Subscriber owned by an asyncio task; updates are handed over to its event loop."""
+
+    def __init__(self, loop, maxsize=16):
+        import asyncio
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, payload):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(payload)
+
+    def deliver(self, payload):
+        self._loop.call_soon_threadsafe(self._put, payload)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class RideStatusBroker:
+    """Fans ride status changes out to whoever is subscribed to that ride."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._per_user = {}  # user_id -> open subscriptions
+        self._owners = {}    # subscriber -> user_id
+        self._lock = threading.Lock()
+
+    def subscribe(self, ride_id, subscriber, user_id=None, max_per_user=None):
+        """Returns False (and subscribes nothing) if user_id already holds max_per_user streams."""
+        with self._lock:
+            if user_id is not None:
+                held = self._per_user.get(user_id, 0)
+                if max_per_user is not None and held >= max_per_user:
+                    return False
+                self._per_user[user_id] = held + 1
+                self._owners[subscriber] = user_id
+            self._subscribers.setdefault(ride_id, set()).add(subscriber)
+            return True
+
+    def unsubscribe(self, ride_id, subscriber):
+        with self._lock:
+            subs = self._subscribers.get(ride_id)
+            if subs is not None:
+                subs.discard(subscriber)
+                if not subs:
+                    del self._subscribers[ride_id]
+            user_id = self._owners.pop(subscriber, None)
+            if user_id is not None:
+                held = self._per_user.pop(user_id) - 1
+                if held:
+                    self._per_user[user_id] = held
+
+    def subscriber_count(self, ride_id=None):
+        with self._lock:
+            if ride_id is not None:
+                return len(self._subscribers.get(ride_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def publish(self, ride):
+        with self._lock:
+            subs = list(self._subscribers.get(ride['id'], ()))
+        if not subs:
+            return
+        payload = dict(ride)
+        for subscriber in subs:
+            subscriber.deliver(payload)
+
+
+def sse_message(payload, event='status'):
+    return ('event: %s\ndata: %s\n\n' % (event, json.dumps(payload))).encode()
+
+
+SSE_KEEPALIVE = b': keepalive\n\n'
+
+ride_status_broker = RideStatusBroker()
@@ -0,0 +1,80 @@
+"""Per-passenger and per-driver ride id indexes behind GET /api/rides/mine.
+
+Ride ids are allocated when a ride is requested, so id order is requested_at order.
+Each user's index is a sorted array('q') of ride ids. Passengers only ever append,
+and drivers insert by bisect, since an older pending ride can be accepted after a
+newer one. A page is a bisect to the cursor followed by a walk backwards, so latency
+depends on the page size (and status filter selectivity), not on how many rides exist.
+"""
+import bisect
+import sys
+import threading
+from array import array
+
+
+class RideHistoryIndex:
+    def __init__(self):
+        self._by_role = {'passenger': {}, 'driver': {}}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._by_role = {'passenger': {}, 'driver': {}}
+
+    def add(self, role, user_id, ride_id):
+        with self._lock:
+            ids = self._by_role[role].get(user_id)
+            if ids is None:
+                ids = self._by_role[role][user_id] = array('q')
+            if not ids or ids[-1] < ride_id:
+                ids.append(ride_id)
+            else:
+                position = bisect.bisect_left(ids, ride_id)
+                if position == len(ids) or ids[position] != ride_id:
+                    ids.insert(position, ride_id)
+
+    def add_ride(self, ride):
+        """Indexes a ride under its passenger and driver; safe to repeat."""
+        self.add('passenger', ride['passenger_id'], ride['id'])
+        if ride.get('driver_id') is not None:
+            self.add('driver', ride['driver_id'], ride['id'])
+
+    def rebuild(self, rides):
+        by_role = {'passenger': {}, 'driver': {}}
+        for ride in rides:
+            for role, user_id in (('passenger', ride.get('passenger_id')), ('driver', ride.get('driver_id'))):
+                if user_id is not None:
+                    by_role[role].setdefault(user_id, []).append(ride['id'])
+        for users in by_role.values():
+            for user_id, ids in users.items():
+                users[user_id] = array('q', sorted(ids))
+        with self._lock:
+            self._by_role = by_role
+
+    def page(self, role, user_id, before=None, limit=20, accept=None):
+        """Up to limit ride ids older than before (newest first) that pass accept(ride_id).
+
+        Returns (ride_ids, next_cursor); next_cursor is None on the last page.
+        """
+        with self._lock:
+            ids = self._by_role[role].get(user_id)
+            if not ids:
+                return [], None
+            position = len(ids) if before is None else bisect.bisect_left(ids, before)
+            result = []
+            while position > 0 and len(result) < limit:
+                position -= 1
+                if accept is None or accept(ids[position]):
+                    result.append(ids[position])
+            return result, (result[-1] if position > 0 else None)
+
+    def memory_bytes(self):
+        with self._lock:
+            total = 0
+            for users in self._by_role.values():
+                total += sys.getsizeof(users)
+                total += sum(sys.getsizeof(ids) + sys.getsizeof(user_id) for user_id, ids in users.items())
+            return total
+
+
+ride_history = RideHistoryIndex()
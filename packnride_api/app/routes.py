@@ -1,7 +1,21 @@
-from flask import Blueprint, jsonify, request
-from app import rides_db, users_db, id_manager # Import DBs and ID manager
+from flask import Blueprint, jsonify, request, Response, current_app, stream_with_context
+from app import rides_db, users_db, trip_traces_db, ride_groups_db, id_manager, store_versions, change_log # Import DBs and ID manager
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.idempotency import idempotent
+from app.versioning import bump_version, compare_and_set, update_record, record_etag, not_modified, with_etag
+from app.monitoring_routes import is_admin_user
+from app.polyline import new_trace, append_points, decode_points, simplify, encode_polyline, trace_stats
+from app.ride_history import ride_history
+from app.analytics import rollups
+from app.locations import driver_locations, haversine_km, DRIVER_STATUSES
+from app.pooling import pooling, ride_coordinates
+from app.eta import eta
+from app.jobs import jobs
+from app.webhooks import webhooks
+from app.snapshots import snapshot
+from app.ride_events import ride_status_broker, QueueSubscriber, sse_message, SSE_KEEPALIVE, TERMINAL_STATUSES
 import datetime
+import math
 import random # For mock fare estimation
 
 main_bp = Blueprint('main_bp', __name__)
@@ -14,6 +28,7 @@ def index():
 
 @main_bp.route('/rides/request', methods=['POST'])
 @jwt_required()
+@idempotent
 def request_ride():
     current_user_identity = get_jwt_identity() # This is the dict we stored
     passenger_id = current_user_identity.get('id')
@@ -32,6 +47,16 @@ def request_ride():
     if not pickup_location or not dropoff_location:
         return jsonify({"error": "Missing pickup_location or dropoff_location"}), 400
 
+    # Optional coordinates; a ride can only be pooled ("pool": true) when it has them.
+    coordinates = {f: data[f] for f in ('pickup_lat', 'pickup_lon', 'dropoff_lat', 'dropoff_lon') if f in data}
+    if coordinates and (len(coordinates) != 4 or not all(isinstance(v, (int, float)) for v in coordinates.values())
+                        or not all(-90 <= coordinates[f] <= 90 for f in ('pickup_lat', 'dropoff_lat'))
+                        or not all(-180 <= coordinates[f] <= 180 for f in ('pickup_lon', 'dropoff_lon'))):
+        return jsonify({"error": "pickup_lat, pickup_lon, dropoff_lat and dropoff_lon must be given together as valid coordinates"}), 400
+    pool = data.get('pool', False)
+    if not isinstance(pool, bool) or (pool and not coordinates):
+        return jsonify({"error": "'pool' must be a boolean, and pooled rides need coordinates"}), 400
+
     ride_id = id_manager.get_next_ride_id()
 
     ride_obj = {
@@ -45,9 +70,109 @@ def request_ride():
         "requested_at": datetime.datetime.utcnow().isoformat(),
         "updated_at": datetime.datetime.utcnow().isoformat()
     }
+    if coordinates:
+        ride_obj.update(coordinates)
+    if pool:
+        ride_obj.update(pool=True, group_id=None)
+    bump_version(store_versions, 'rides', ride_obj)
     rides_db[ride_id] = ride_obj
+    change_log.record('rides', ride_id, ride_obj)
+    ride_history.add('passenger', passenger_id, ride_id)
+    rollups.ride_requested(ride_obj)
+    pooling.update(ride_obj)
+    if pool:
+        # One pass shortly after a burst of pooled requests, off the request path.
+        jobs.enqueue('pooling.match', delay=current_app.config.get('POOL_MATCH_DELAY_SECONDS', 5),
+                     dedup_key='pooling.match')
+
+    return jsonify({"message": "Ride requested successfully", "ride": _with_eta(ride_obj)}), 201
+
+
+@main_bp.route('/rides/mine', methods=['GET'])
+@jwt_required()
+def list_my_rides():
+    # Newest first; pass next_cursor back as cursor for the following page.
+    current_user_identity = get_jwt_identity()
+    role = current_user_identity.get('user_type')
+    if role not in ('passenger', 'driver'):
+        return jsonify({"error": "Only passengers and drivers have ride history"}), 403
+
+    max_page = current_app.config.get('RIDE_HISTORY_MAX_PAGE', 100)
+    limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor', type=int)
+    if not 0 < limit <= max_page:
+        return jsonify({"error": f"limit must be between 1 and {max_page}"}), 400
+    statuses = request.args.get('status')
+    statuses = set(statuses.split(',')) if statuses else None
 
-    return jsonify({"message": "Ride requested successfully", "ride": ride_obj}), 201
+    rides = {}
+
+    def accept(ride_id):
+        ride = rides_db.get(ride_id)
+        if ride is None or (statuses and ride['status'] not in statuses):
+            return False
+        rides[ride_id] = ride
+        return True
+
+    ride_ids, next_cursor = ride_history.page(role, current_user_identity.get('id'), cursor, limit, accept)
+    return jsonify({"rides": [rides[ride_id] for ride_id in ride_ids], "next_cursor": next_cursor}), 200
+
+
+
+@main_bp.route('/rides/pending', methods=['GET'])
+@jwt_required()
+def list_pending_rides_nearby():
+    # Dispatch view for drivers: pending rides whose pickup is within radius_km, nearest first.
+    if get_jwt_identity().get('user_type') != 'driver':
+        return jsonify({"error": "Only drivers can list pending rides"}), 403
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', current_app.config.get('NEARBY_DEFAULT_RADIUS_KM', 5.0), type=float)
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat and lon are required numbers within range"}), 400
+    max_radius_km = current_app.config.get('NEARBY_MAX_RADIUS_KM', 50.0)
+    if not 0 < radius_km <= max_radius_km or limit <= 0:
+        return jsonify({"error": f"radius_km must be in (0, {max_radius_km:g}] and limit positive"}), 400
+
+    lat_span = radius_km / 111.32
+    lon_span = radius_km / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+    if hasattr(rides_db, 'shards_in'):  # only the regions around the position are read
+        scanned = rides_db.shards_in(max(lat - lat_span, -90), max(lon - lon_span, -180),
+                                     min(lat + lat_span, 90), min(lon + lon_span, 180))
+    else:
+        scanned = [snapshot(rides_db)]
+    found = []
+    for rides in scanned:
+        for ride in rides.values():
+            if ride['status'] != 'pending' or ride.get('pickup_lat') is None or ride.get('pickup_lon') is None:
+                continue
+            if abs(ride['pickup_lat'] - lat) > lat_span or abs(ride['pickup_lon'] - lon) > lon_span:
+                continue
+            distance = haversine_km(lat, lon, ride['pickup_lat'], ride['pickup_lon'])
+            if distance <= radius_km:
+                found.append((distance, ride['id'], ride))
+    found.sort(key=lambda item: item[:2])
+    return jsonify({"rides": [dict(ride, distance_km=round(distance, 3)) for distance, _id, ride in found[:limit]]}), 200
+
+def _with_eta(ride):
+    """The ride with travel-time estimates, for rides requested with coordinates.
+
+    "trip" is pickup to dropoff. "driver" is the assigned driver's live position to the
+    pickup until it is reached, then to the dropoff while the ride is started. Estimates
+    are computed per response and never stored on the ride.
+    """
+    coordinates = ride_coordinates(ride)
+    if coordinates is None:
+        return ride
+    pickup_lat, pickup_lon, dropoff_lat, dropoff_lon = coordinates
+    estimates = {"trip": eta.seconds(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)}
+    target = {'accepted': (pickup_lat, pickup_lon), 'en_route_pickup': (pickup_lat, pickup_lon),
+              'started': (dropoff_lat, dropoff_lon)}.get(ride['status'])
+    position = driver_locations.get(ride['driver_id']) if target and ride['driver_id'] else None
+    if position:
+        estimates["driver"] = eta.seconds(position['location']['lat'], position['location']['lon'], *target)
+    return dict(ride, eta=estimates)
 
 
 @main_bp.route('/rides/<int:ride_id>', methods=['GET'])
@@ -65,7 +190,121 @@ def get_ride_details(ride_id):
     if not (ride['passenger_id'] == user_id or (ride['driver_id'] and ride['driver_id'] == user_id)):
         return jsonify({"error": "Access forbidden: You are not part of this ride"}), 403
 
-    return jsonify(ride), 200
+    ride = _with_eta(ride)
+    etag = record_etag('ride', ride_id, ride.get('version'))
+    live = ride.get('eta', {}).get('driver')
+    if live:
+        etag += '-eta%d' % live['seconds']  # the driver's ETA changes without a new ride version
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag((jsonify(ride), 200), etag)
+
+
+@main_bp.route('/rides/<int:ride_id>/stream', methods=['GET'])
+@jwt_required()
+def stream_ride_status(ride_id):
+    # Server-sent events: the current ride, then every status change until it ends.
+    # Under the threaded server each subscriber holds a worker thread; see app/asgi.py.
+    current_user_identity = get_jwt_identity()
+    user_id = current_user_identity.get('id')
+
+    ride = rides_db.get(ride_id)
+    if not ride:
+        return jsonify({"error": "Ride not found"}), 404
+
+    if not (ride['passenger_id'] == user_id or (ride['driver_id'] and ride['driver_id'] == user_id)):
+        return jsonify({"error": "Access forbidden: You are not part of this ride"}), 403
+
+    keepalive = current_app.config.get('STREAM_KEEPALIVE_SECONDS', 15)
+    subscriber = QueueSubscriber()
+    if not ride_status_broker.subscribe(ride_id, subscriber, user_id,
+                                        current_app.config.get('STREAM_MAX_PER_USER')):
+        return jsonify({"error": "Too many open ride streams"}), 429
+
+    def generate():
+        try:
+            yield sse_message(ride)
+            status = ride['status']
+            while status not in TERMINAL_STATUSES:
+                payload = subscriber.get(timeout=keepalive)
+                if payload is None:
+                    yield SSE_KEEPALIVE
+                    continue
+                status = payload['status']
+                yield sse_message(payload)
+        finally:
+            ride_status_broker.unsubscribe(ride_id, subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@main_bp.route('/rides/<int:ride_id>/trace', methods=['POST'])
+@jwt_required()
+def append_ride_trace(ride_id):
+    # The assigned driver uploads GPS fixes in batches while the trip is in progress.
+    current_user_identity = get_jwt_identity()
+    ride = rides_db.get(ride_id)
+    if not ride:
+        return jsonify({"error": "Ride not found"}), 404
+    if current_user_identity.get('user_type') != 'driver' or ride['driver_id'] != current_user_identity.get('id'):
+        return jsonify({"error": "Only the assigned driver can upload the trace"}), 403
+    if ride['status'] != 'started':
+        return jsonify({"error": f"Trace points are only accepted while the ride is started, current status: {ride['status']}"}), 409
+
+    data = request.get_json(silent=True)
+    points = data.get('points') if isinstance(data, dict) else None
+    if not isinstance(points, list) or not points:
+        return jsonify({"error": "'points' must be a non-empty list"}), 400
+    max_points = current_app.config.get('TRACE_MAX_BATCH_POINTS', 1000)
+    if len(points) > max_points:
+        return jsonify({"error": f"At most {max_points} points per batch"}), 400
+    try:
+        batch = [(float(p['lat']), float(p['lon']), float(p['t'])) for p in points]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Each point needs numeric lat, lon and t (unix seconds)"}), 400
+    if any(not (-90 <= lat <= 90 and -180 <= lon <= 180) for lat, lon, _t in batch):
+        return jsonify({"error": "lat/lon out of range"}), 400
+
+    # One read-append-write, so concurrent batches (on any worker) never drop points.
+    def append(trace):
+        return bump_version(store_versions, 'trip_traces', append_points(trace or new_trace(ride_id), batch))
+
+    try:
+        trace = update_record(trip_traces_db, ride_id, append)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    change_log.record('trip_traces', ride_id, trace)
+
+    return jsonify({"ride_id": ride_id, "point_count": trace['point_count']}), 200
+
+
+@main_bp.route('/rides/<int:ride_id>/trace', methods=['GET'])
+@jwt_required()
+def get_ride_trace(ride_id):
+    # tolerance_m=0 (default) returns every stored point for audits; a few metres is plenty for maps.
+    current_user_identity = get_jwt_identity()
+    user_id = current_user_identity.get('id')
+    ride = rides_db.get(ride_id)
+    if not ride:
+        return jsonify({"error": "Ride not found"}), 404
+    if not (ride['passenger_id'] == user_id or (ride['driver_id'] and ride['driver_id'] == user_id) or is_admin_user()):
+        return jsonify({"error": "Access forbidden: You are not part of this ride"}), 403
+
+    tolerance_m = request.args.get('tolerance_m', 0.0, type=float)
+    output_format = request.args.get('format', 'points')
+    if tolerance_m < 0 or output_format not in ('points', 'polyline'):
+        return jsonify({"error": "tolerance_m must be >= 0 and format one of: points, polyline"}), 400
+
+    trace = trip_traces_db.get(ride_id) or new_trace(ride_id)
+    points = simplify(decode_points(trace['encoded']), tolerance_m)
+    response = {"ride_id": ride_id, "tolerance_m": tolerance_m, "returned_points": len(points), "stats": trace_stats(trace)}
+    if output_format == 'polyline':
+        response["polyline"] = encode_polyline(points)
+    else:
+        response["points"] = [{"lat": lat, "lon": lon, "t": t} for lat, lon, t in points]
+    return jsonify(response), 200
 
 
 @main_bp.route('/rides/<int:ride_id>/accept', methods=['POST'])
@@ -81,6 +320,7 @@ def accept_ride(ride_id):
     ride = rides_db.get(ride_id)
     if not ride:
         return jsonify({"error": "Ride not found"}), 404
+    read_version, ride = ride.get('version'), dict(ride)
 
     if ride['status'] != 'pending':
         return jsonify({"error": f"Ride cannot be accepted, current status: {ride['status']}"}), 400
@@ -91,10 +331,19 @@ def accept_ride(ride_id):
     ride['driver_id'] = driver_id
     ride['status'] = 'accepted'
     ride['updated_at'] = datetime.datetime.utcnow().isoformat()
+    bump_version(store_versions, 'rides', ride)
 
-    rides_db[ride_id] = ride # Update the ride in our 'DB'
+    # Another driver (possibly on another worker) may have accepted it since we read it.
+    if not compare_and_set(rides_db, ride_id, ride, read_version):
+        return jsonify({"error": "Ride already accepted by another driver"}), 409
+    change_log.record('rides', ride_id, ride)
+    ride_history.add('driver', driver_id, ride_id)
+    rollups.ride_status_changed(ride, 'pending')
+    pooling.update(ride)
+    ride_status_broker.publish(ride)
+    webhooks.notify('ride.accepted', ride)
 
-    return jsonify({"message": "Ride accepted successfully", "ride": ride}), 200
+    return jsonify({"message": "Ride accepted successfully", "ride": _with_eta(ride)}), 200
 
 
 @main_bp.route('/rides/<int:ride_id>/status', methods=['PUT'])
@@ -107,6 +356,7 @@ def update_ride_status(ride_id):
     ride = rides_db.get(ride_id)
     if not ride:
         return jsonify({"error": "Ride not found"}), 404
+    read_version, ride = ride.get('version'), dict(ride)
 
     data = request.get_json()
     if not data or 'status' not in data:
@@ -138,40 +388,225 @@ def update_ride_status(ride_id):
     if not can_update:
          return jsonify({"error": f"Cannot transition from '{ride['status']}' to '{new_status}' or not authorized"}), 403
 
+    old_status = ride['status']
     ride['status'] = new_status
     ride['updated_at'] = datetime.datetime.utcnow().isoformat()
-    rides_db[ride_id] = ride
+    bump_version(store_versions, 'rides', ride)
+    if not compare_and_set(rides_db, ride_id, ride, read_version):
+        return jsonify({"error": "Ride was updated concurrently, retry with its current status"}), 409
+    change_log.record('rides', ride_id, ride)
+    rollups.ride_status_changed(ride, old_status)
+    pooling.update(ride)
+    ride_status_broker.publish(ride)
+    if new_status == 'completed':
+        webhooks.notify('ride.completed', ride)
+
+    return jsonify({"message": f"Ride status updated to {new_status}", "ride": _with_eta(ride)}), 200
+
+
+# --- Shared-ride pooling ---
+
+def _assign_group(ride_ids, group_id):
+    """Sets group_id on every ride that is still poolable; on a lost race, undoes the ones already set."""
+    assigned = []
+    for ride_id in ride_ids:
+        ride = rides_db.get(ride_id)
+        if ride is None or not pooling.poolable(ride):
+            break
+        read_version, ride = ride.get('version'), dict(ride, group_id=group_id)
+        ride['updated_at'] = datetime.datetime.utcnow().isoformat()
+        bump_version(store_versions, 'rides', ride)
+        if not compare_and_set(rides_db, ride_id, ride, read_version):
+            break
+        assigned.append(ride)
+    else:
+        return assigned
+    for ride in assigned:
+        # Retried until the group is off the ride: a driver may have accepted it meanwhile,
+        # and the group it would otherwise point at is never stored.
+        while True:
+            current = rides_db.get(ride['id'])
+            if current is None or current.get('group_id') != group_id:
+                break
+            ungrouped = dict(current, group_id=None, updated_at=datetime.datetime.utcnow().isoformat())
+            bump_version(store_versions, 'rides', ungrouped)
+            if compare_and_set(rides_db, ride['id'], ungrouped, current['version']):
+                change_log.record('rides', ride['id'], ungrouped)
+                pooling.update(ungrouped)
+                break
+    return None
+
+
+def propose_pooled_groups():
+    """One matching pass: stores the proposed groups and assigns them to their rides."""
+    proposals, stats = pooling.match()
+    groups = []
+    for ride_ids, route_km, saved_km, stops in proposals:
+        group_id = id_manager.get_next_ride_group_id()
+        rides = _assign_group(ride_ids, group_id)
+        if rides is None:
+            continue  # a rider was accepted, cancelled or grouped elsewhere since the index was read
+        group = {
+            "group_id": group_id, "ride_ids": ride_ids, "stops": stops, "route_km": route_km,
+            "saved_km": saved_km, "status": "proposed", "created_at": datetime.datetime.utcnow().isoformat(),
+        }
+        bump_version(store_versions, 'ride_groups', group)
+        ride_groups_db[group_id] = group
+        change_log.record('ride_groups', group_id, group)
+        for ride in rides:
+            change_log.record('rides', ride['id'], ride)
+            pooling.update(ride)
+            ride_status_broker.publish(ride)
+        groups.append(group)
+    return groups, stats
+
+
+@jobs.task('pooling.match')
+def _pooling_match_job(_payload):
+    propose_pooled_groups()
+
+
+@main_bp.route('/rides/pool/match', methods=['POST'])
+@jwt_required()
+def match_pooled_rides():
+    # Passes also run as background jobs shortly after pooled requests; this runs one now.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
 
-    return jsonify({"message": f"Ride status updated to {new_status}", "ride": ride}), 200
+    groups, stats = propose_pooled_groups()
+    return jsonify(dict(stats, groups=groups)), 200
+
+
+@main_bp.route('/rides/groups/<int:group_id>', methods=['GET'])
+@jwt_required()
+def get_ride_group(group_id):
+    group = ride_groups_db.get(group_id)
+    if not group:
+        return jsonify({"error": "Ride group not found"}), 404
+    user_id = get_jwt_identity().get('id')
+    rides = [rides_db.get(ride_id) for ride_id in group['ride_ids']]
+    if not (is_admin_user() or any(r and user_id in (r['passenger_id'], r['driver_id']) for r in rides)):
+        return jsonify({"error": "Access forbidden: You are not part of this group"}), 403
+    return jsonify(group), 200
+
+
+# --- Travel-time estimates ---
+
+def _point(value):
+    """(lat, lon) from {"lat": .., "lon": ..}, or None if it is not a valid position."""
+    if not isinstance(value, dict):
+        return None
+    lat, lon = value.get('lat'), value.get('lon')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (lat, lon)):
+        return None
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+
+@main_bp.route('/eta/batch', methods=['POST'])
+@jwt_required()
+def batch_eta():
+    # Dispatch scores many candidate drivers against one pickup in a single call.
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+    data = request.get_json(silent=True) or {}
+    destination = _point(data.get('destination'))
+    origins = data.get('origins')
+    if destination is None or not isinstance(origins, list):
+        return jsonify({"error": "Expected {\"origins\": [{\"lat\", \"lon\"}, ...], \"destination\": {\"lat\", \"lon\"}}"}), 400
+    max_batch = current_app.config.get('ETA_MAX_BATCH', 1000)
+    if len(origins) > max_batch:
+        return jsonify({"error": f"At most {max_batch} origins per request"}), 400
+    points = [_point(origin) for origin in origins]
+    if None in points:
+        return jsonify({"error": "Every origin needs a valid lat and lon"}), 400
+    return jsonify({"etas": eta.batch(points, destination), "matrix_loaded": eta.loaded}), 200
 
 
 # --- Driver Endpoints ---
 
+@main_bp.route('/drivers/me/location', methods=['PUT'])
+@jwt_required()
+def update_driver_location():
+    # High-frequency heartbeat (every few seconds); positions expire after DRIVER_LOCATION_TTL_SECONDS.
+    current_user_identity = get_jwt_identity()
+    if current_user_identity.get('user_type') != 'driver':
+        return jsonify({"error": "Only drivers can report their location"}), 403
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Invalid input, JSON required"}), 400
+
+    status = data.get('status', 'available')
+    if status not in DRIVER_STATUSES:
+        return jsonify({"error": f"Invalid status. Must be one of: {', '.join(DRIVER_STATUSES)}"}), 400
+
+    driver_id = current_user_identity.get('id')
+    if status == 'offline':
+        driver_locations.remove(driver_id)
+        return '', 204
+
+    try:
+        lat, lon = float(data['lat']), float(data['lon'])
+        heading = float(data['heading']) if data.get('heading') is not None else None
+        speed_kmh = float(data['speed_kmh']) if data.get('speed_kmh') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "lat and lon are required numbers; heading and speed_kmh must be numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat/lon out of range"}), 400
+
+    # First heartbeat after going online: look up the name once so nearby results need no user scan.
+    name = None
+    if driver_locations.get(driver_id) is None:
+        user = users_db.get(current_user_identity.get('email'))
+        name = user['name'] if user else None
+    driver_locations.update(driver_id, lat, lon, status, heading, speed_kmh, name=name)
+    return '', 204
+
+def _drivers_on_active_rides():
+    def busy(rides):
+        return {ride['driver_id'] for ride in rides.values()
+                if ride['driver_id'] is not None and ride['status'] not in ('completed', 'cancelled')}
+
+    if hasattr(rides_db, 'map_shards'):
+        return set().union(*rides_db.map_shards(busy))  # each region scanned on its own snapshot
+    return busy(snapshot(rides_db))
+
 @main_bp.route('/drivers/nearby', methods=['GET'])
 @jwt_required() # Passenger needs to be logged in to see nearby drivers
 def get_nearby_drivers():
-    # This is a MOCKED endpoint. In a real app, this would involve geospatial queries.
     current_user_identity = get_jwt_identity()
     if current_user_identity.get('user_type') != 'passenger':
          return jsonify({"error": "Only passengers can search for nearby drivers"}), 403
 
-    # Mocking: Return a list of all 'driver' type users who are not currently on an active ride
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is not None and lon is not None:
+        radius_km = request.args.get('radius_km', current_app.config.get('NEARBY_DEFAULT_RADIUS_KM', 5.0), type=float)
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        if radius_km <= 0 or limit <= 0:
+            return jsonify({"error": "radius_km and limit must be positive"}), 400
+        max_radius_km = current_app.config.get('NEARBY_MAX_RADIUS_KM', 50.0)
+        if radius_km > max_radius_km:
+            return jsonify({"error": f"radius_km must be at most {max_radius_km:g}"}), 400
+        drivers = driver_locations.nearby(lat, lon, radius_km, limit=limit)
+        etas = eta.batch([(d['location']['lat'], d['location']['lon']) for d in drivers], (lat, lon))
+        for driver, estimate in zip(drivers, etas):
+            driver['eta'] = estimate
+        return jsonify({"available_drivers": drivers}), 200
+
+    # Without a position: every driver not on an active ride, with their live location when reported
     available_drivers = []
+    busy_drivers = _drivers_on_active_rides()
     for _email, user in users_db.items(): # Iterate through users_db which is keyed by email
-        if user['user_type'] == 'driver':
-            is_on_active_ride = False
-            for _ride_id, ride_data in rides_db.items(): # Iterate through rides_db
-                if ride_data['driver_id'] == user['id'] and ride_data['status'] not in ['completed', 'cancelled']:
-                    is_on_active_ride = True
-                    break
-            if not is_on_active_ride:
-                available_drivers.append({
-                    "id": user['id'],
-                    "name": user['name'],
-                    "mock_location": f"Nearby Location {random.randint(1, 100)}",
-                    "vehicle_type": "Sedan", # Mocked
-                    "current_status": "available" # Mocked
-                })
+        if user['user_type'] == 'driver' and user['id'] not in busy_drivers:
+            live = driver_locations.get(user['id'])
+            available_drivers.append({
+                "id": user['id'],
+                "name": user['name'],
+                "location": live['location'] if live else None,
+                "vehicle_type": "Sedan", # Mocked
+                "current_status": live['current_status'] if live else "unknown"
+            })
 
     return jsonify({"available_drivers": available_drivers}), 200
 
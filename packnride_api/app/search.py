@@ -0,0 +1,206 @@
+"""Inverted index with BM25 ranking over incident reports.
+
+The indexed text is description + incident_type + resolution_notes, tokenized into
+lowercase alphanumeric runs (so "CA 123-456" and "minor_accident" split the same way
+in documents and queries). Each term has a posting list of two parallel arrays:
+report ids (array('I'), sorted) and term frequencies (array('H')). Document length,
+driver id and status are kept in arrays indexed by report id, so filters and scoring
+never load the report records. Reports are indexed in create_incident_report; on update,
+update_incident_report removes the old text and indexes the new one. Updates made by
+another worker arrive without the old text, so upsert removes the report id from every
+posting list (one bisect per term) before indexing the new text.
+"""
+import bisect
+import heapq
+import math
+import re
+import sys
+import threading
+from array import array
+from collections import Counter
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+INDEXED_FIELDS = ('description', 'incident_type', 'resolution_notes')
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+def _document_terms(report):
+    return Counter(token for field in INDEXED_FIELDS for token in tokenize(report.get(field)))
+
+
+class IncidentSearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}               # term -> (array('I') ids, array('H') term frequencies)
+        self._lengths = array('I')        # report_id -> token count (0 = not indexed)
+        self._drivers = array('q')        # report_id -> driver_id
+        self._statuses = array('B')       # report_id -> status code
+        self._status_codes = {}
+        self._documents = 0
+        self._total_length = 0
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def rebuild(self, reports):
+        with self._lock:
+            self._reset()
+            for report in sorted(reports, key=lambda r: r['report_id']):
+                self._add(report)
+
+    def _ensure_slot(self, report_id):
+        missing = report_id + 1 - len(self._lengths)
+        if missing > 0:
+            self._lengths.frombytes(bytes(self._lengths.itemsize * missing))
+            self._drivers.frombytes(bytes(self._drivers.itemsize * missing))
+            self._statuses.frombytes(bytes(self._statuses.itemsize * missing))
+
+    def _status_code(self, status):
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self._status_codes) + 1
+        return code
+
+    def _add(self, report):
+        report_id = report['report_id']
+        terms = _document_terms(report)
+        self._ensure_slot(report_id)
+        for term, tf in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array('I'), array('H'))
+            ids, tfs = posting
+            tf = min(tf, 0xffff)
+            if not ids or ids[-1] < report_id:
+                ids.append(report_id)
+                tfs.append(tf)
+            else:
+                position = bisect.bisect_left(ids, report_id)
+                ids.insert(position, report_id)
+                tfs.insert(position, tf)
+        length = max(1, sum(terms.values()))
+        self._lengths[report_id] = length
+        self._drivers[report_id] = report.get('driver_id') or 0
+        self._statuses[report_id] = self._status_code(report.get('status'))
+        self._documents += 1
+        self._total_length += length
+
+    def _remove(self, report):
+        report_id = report['report_id']
+        if report_id >= len(self._lengths) or not self._lengths[report_id]:
+            return
+        for term in _document_terms(report):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            position = bisect.bisect_left(ids, report_id)
+            if position < len(ids) and ids[position] == report_id:
+                del ids[position]
+                del tfs[position]
+                if not ids:
+                    del self._postings[term]
+        self._documents -= 1
+        self._total_length -= self._lengths[report_id]
+        self._lengths[report_id] = 0
+
+    def add(self, report):
+        with self._lock:
+            self._add(report)
+
+    def replace(self, old_report, new_report):
+        """Re-indexes a report; old_report must hold the text that was indexed before."""
+        with self._lock:
+            self._remove(old_report)
+            self._add(new_report)
+
+    def remove(self, report):
+        with self._lock:
+            self._remove(report)
+
+    def upsert(self, report):
+        """(Re-)indexes a report whose previously indexed text is unknown."""
+        report_id = report['report_id']
+        with self._lock:
+            if report_id < len(self._lengths) and self._lengths[report_id]:
+                for term in list(self._postings):
+                    ids, tfs = self._postings[term]
+                    position = bisect.bisect_left(ids, report_id)
+                    if position < len(ids) and ids[position] == report_id:
+                        del ids[position]
+                        del tfs[position]
+                        if not ids:
+                            del self._postings[term]
+                self._documents -= 1
+                self._total_length -= self._lengths[report_id]
+                self._lengths[report_id] = 0
+            self._add(report)
+
+    def search(self, query, limit=20, driver_id=None, status=None, match_all=True):
+        """Returns (total matches, [(score, report_id)]) best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            postings = [self._postings.get(term) for term in terms]
+            if not terms or (match_all and any(p is None for p in postings)):
+                return 0, []
+            postings = [p for p in postings if p is not None]
+            status_code = self._status_codes.get(status) if status is not None else None
+            if status is not None and status_code is None:
+                return 0, []
+            documents = self._documents
+            average_length = self._total_length / documents if documents else 1.0
+            lengths, drivers, statuses = self._lengths, self._drivers, self._statuses
+
+            # Set operations run in C; only the surviving candidates are scored.
+            postings.sort(key=lambda p: len(p[0]))
+            if match_all:
+                candidates = set(postings[0][0])
+                for ids, _tfs in postings[1:]:
+                    candidates.intersection_update(ids)
+            else:
+                candidates = set().union(*(ids for ids, _tfs in postings))
+            if driver_id is not None:
+                candidates = [i for i in candidates if drivers[i] == driver_id]
+            if status_code is not None:
+                candidates = [i for i in candidates if statuses[i] == status_code]
+
+            scores = dict.fromkeys(candidates, 0.0)
+            length_base, length_factor = K1 * (1 - B), K1 * B / average_length
+            for ids, tfs in postings:
+                weight = _idf(documents, len(ids)) * (K1 + 1)
+                if len(scores) * 16 < len(ids):
+                    # Few candidates left: look their term frequencies up instead of walking the list.
+                    for report_id in scores:
+                        position = bisect.bisect_left(ids, report_id)
+                        if position < len(ids) and ids[position] == report_id:
+                            tf = tfs[position]
+                            scores[report_id] += weight * tf / (tf + length_base + length_factor * lengths[report_id])
+                else:
+                    for report_id, tf in zip(ids, tfs):
+                        if report_id in scores:
+                            scores[report_id] += weight * tf / (tf + length_base + length_factor * lengths[report_id])
+        best = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        return len(scores), [(scores[report_id], report_id) for report_id in best]
+
+    def memory_bytes(self):
+        with self._lock:
+            total = sys.getsizeof(self._postings)
+            for term, (ids, tfs) in self._postings.items():
+                total += sys.getsizeof(term) + sys.getsizeof(ids) + sys.getsizeof(tfs) + 56  # 56: the tuple
+            return total + sum(sys.getsizeof(a) for a in (self._lengths, self._drivers, self._statuses))
+
+
+def _idf(documents, frequency):
+    return math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+
+
+incident_search = IncidentSearchIndex()
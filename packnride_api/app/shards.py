@@ -0,0 +1,204 @@
+"""Region shards: in-memory stores partitioned by the geohash prefix of each record's position.
+
+Rides are placed by their pickup coordinates, users by their home coordinates
+(home_lat/home_lon given at registration, for drivers). With STORE_SHARD_PRECISION
+3 a region is a geohash cell of about 156 x 156 km, so each metro area gets its own
+shard; records without a position share the UNPLACED shard. Each shard is a
+SnapshotDict with its own lock and key index, plus a write lock taken by plain
+writes and compare-and-set alike, so writers in different regions never wait on
+each other and a snapshot copies only the chunks of its own shard.
+
+A directory maps every key to its region, so point reads (rides_db.get(ride_id),
+users_db.get(email)) still go straight to the record. shard_at(lat, lon) reads one
+region and shards_in(box) the few around a position (GET /api/rides/pending);
+map_shards(fn) runs fn on a snapshot of every shard and returns the results, for
+queries that span regions. With fan_out_threads > 1 the shards are
+handed to a thread pool, which only pays off where the scans can run in parallel
+(free-threaded Python builds); with the interpreter lock they run one after
+another, and a cross-region scan is no faster than one over a single store.
+
+A whole-store snapshot() joins the shards' snapshots, taken one after another:
+each shard is consistent, but a write landing in a later shard during the join
+may be seen while one in an earlier shard is not.
+"""
+import threading
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+
+from .snapshots import Snapshot, SnapshotDict, join
+
+UNPLACED = 'unplaced'  # region of records without a position
+
+
+def ride_position(ride):
+    lat, lon = ride.get('pickup_lat'), ride.get('pickup_lon')
+    return (lat, lon) if isinstance(lat, (int, float)) and isinstance(lon, (int, float)) else None
+
+
+def home_position(user):
+    lat, lon = user.get('home_lat'), user.get('home_lon')
+    return (lat, lon) if isinstance(lat, (int, float)) and isinstance(lon, (int, float)) else None
+
+
+class RegionShardedStore(MutableMapping):
+    def __init__(self, position_of, precision=3, fan_out_threads=8):
+        self.position_of = position_of
+        self.precision = precision
+        self.fan_out_threads = fan_out_threads
+        self._lock = threading.Lock()  # creating shards
+        self._shards = {}  # region -> SnapshotDict
+        self._write_locks = {}  # region -> lock held by compare_and_set / update_item
+        self._regions = {}  # key -> region
+        self._pool = None
+
+    def region_at(self, lat, lon):
+        """(row, column) of the geohash cell of the store's precision that holds (lat, lon)."""
+        lat_bits, lon_bits = divmod(5 * self.precision, 2)
+        lon_bits += lat_bits
+        row = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+        column = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+        return row, column
+
+    def region_of(self, record):
+        position = self.position_of(record)
+        return UNPLACED if position is None else self.region_at(*position)
+
+    def _shard(self, region):
+        shard = self._shards.get(region)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(region)
+                if shard is None:
+                    self._write_locks[region] = threading.Lock()
+                    shard = self._shards[region] = SnapshotDict()
+        return shard
+
+    # --- writes ---
+
+    def __setitem__(self, key, record):
+        # Plain writes take the lock compare_and_set takes, so neither overwrites the other unseen.
+        lock = self._lock_for(key, record)
+        try:
+            self._put(key, record)
+        finally:
+            lock.release()
+
+    def _lock_for(self, key, record):
+        """Acquires and returns the write lock of key's region (record's, for a new key)."""
+        while True:
+            region = self._regions.get(key)
+            if region is None:
+                region = self.region_of(record)
+                self._shard(region)
+            lock = self._write_locks[region]
+            lock.acquire()
+            if self._regions.get(key, region) == region:
+                return lock
+            lock.release()  # moved meanwhile: lock its new region instead
+
+    def _put(self, key, record):
+        region = self.region_of(record)
+        self._shard(region)[key] = record
+        previous = self._regions.get(key)
+        self._regions[key] = region
+        if previous is not None and previous != region:
+            self._shards[previous].pop(key, None)  # moved: readers find the new copy first
+
+    def __delitem__(self, key):
+        region = self._regions.pop(key)
+        del self._shards[region][key]
+
+    _missing = object()
+
+    def pop(self, key, default=_missing):
+        region = self._regions.pop(key, None)  # one step, as in SnapshotDict.pop
+        if region is None:
+            if default is self._missing:
+                raise KeyError(key)
+            return default
+        return self._shards[region].pop(key)
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards.values():
+                shard.clear()
+            self._regions.clear()
+
+    def compare_and_set(self, key, record, expected_version):
+        region = self._regions.get(key)
+        if region is None:
+            return False
+        with self._write_locks[region]:
+            current = self._shards[region].get(key)
+            if current is None or current.get('version') != expected_version:
+                return False
+            self._put(key, record)
+            return True
+
+    def update_item(self, key, update):
+        lock = self._lock_for(key, {})  # a new key is locked as UNPLACED
+        try:
+            record = update(self.get(key))
+            self._put(key, record)
+            return record
+        finally:
+            lock.release()
+
+    # --- reads ---
+
+    def __getitem__(self, key):
+        return self._shards[self._regions[key]][key]
+
+    def get(self, key, default=None):
+        region = self._regions.get(key)
+        if region is None:
+            return default
+        return self._shards[region].get(key, default)
+
+    def __contains__(self, key):
+        return key in self._regions
+
+    def __len__(self):
+        return len(self._regions)
+
+    def regions(self):
+        return [region for region, shard in list(self._shards.items()) if len(shard)]
+
+    def shard_at(self, lat, lon):
+        """Snapshot of the records in the region containing (lat, lon)."""
+        shard = self._shards.get(self.region_at(lat, lon))
+        return shard.snapshot() if shard is not None else Snapshot((), 0)
+
+    def shards_in(self, south, west, north, east):
+        """Snapshots of the regions overlapping the box, for queries around a position."""
+        first_row, first_column = self.region_at(south, west)
+        last_row, last_column = self.region_at(north, east)
+        shards = [self._shards.get((row, column)) for row in range(first_row, last_row + 1)
+                  for column in range(first_column, last_column + 1)]
+        return [shard.snapshot() for shard in shards if shard is not None]
+
+    def map_shards(self, fn):
+        """[fn(snapshot of a shard) for every shard], run through the fan-out pool."""
+        snapshots = [shard.snapshot() for shard in list(self._shards.values()) if len(shard)]
+        if len(snapshots) <= 1 or self.fan_out_threads <= 1:
+            return [fn(s) for s in snapshots]
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.fan_out_threads, thread_name_prefix='shard-fan-out')
+        return list(self._pool.map(fn, snapshots))
+
+    def snapshot(self):
+        return join(shard.snapshot() for shard in list(self._shards.values()))
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
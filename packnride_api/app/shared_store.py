@@ -0,0 +1,467 @@
+"""SQLite-backed stores for running several worker processes on one host.
+
+SharedStore is a drop-in replacement for the module-level dicts in app/__init__.py:
+every write goes straight to a local SQLite file in WAL mode, so all workers see the
+same data and readers never block the writer. SharedIDManager hands out IDs from
+counters in the same file with a single atomic UPSERT, keeping them globally unique.
+
+Routes always write a record back (rides_db[ride_id] = ride) after changing it, which
+is what makes write-through storage work without further changes. Writes that race
+(two drivers accepting one ride) go through compare_and_set, which only succeeds if
+the stored record still has the version the route read.
+
+Idempotency keys and rate-limit buckets live in the same file (SharedIdempotencyCache,
+SharedTokenBucketStore), so a retry or a burst is seen by every worker.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from .changes import redact
+from .versioning import new_epoch, set_epoch
+
+_TABLE_NAME_CHARS = set('abcdefghijklmnopqrstuvwxyz_')
+
+
+class _Connections(threading.local):
+    def __init__(self):
+        self.pid = None
+        self.by_path = {}
+
+
+_connections = _Connections()
+
+
+def connect(path):
+    """Returns this thread's connection to path, reopening it after a fork."""
+    if _connections.pid != os.getpid():
+        _connections.pid = os.getpid()
+        _connections.by_path = {}
+    conn = _connections.by_path.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _connections.by_path[path] = conn
+    return conn
+
+
+def close_connections():
+    for conn in _connections.by_path.values():
+        conn.close()
+    _connections.by_path = {}
+
+
+@contextlib.contextmanager
+def read_snapshot(path):
+    """Runs the block in one read transaction, so every store read in it sees the same state."""
+    conn = connect(path)
+    conn.execute('BEGIN')
+    try:
+        yield
+    finally:
+        conn.execute('COMMIT')
+
+
+def _encode_key(key):
+    if type(key) is int:  # most keys; same text as json.dumps, without the encoder
+        return str(key)
+    return json.dumps(key)
+
+
+class SharedStore(MutableMapping):
+    def __init__(self, path, table):
+        if not set(table) <= _TABLE_NAME_CHARS:
+            raise ValueError("Invalid table name: %r" % table)
+        self.path = path
+        self.table = table
+        connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS %s (k TEXT PRIMARY KEY, v TEXT NOT NULL)' % table)
+
+    def _conn(self):
+        return connect(self.path)
+
+    def __getitem__(self, key):
+        row = self._conn().execute('SELECT v FROM %s WHERE k = ?' % self.table,
+                                   (_encode_key(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._conn().execute('INSERT OR REPLACE INTO %s (k, v) VALUES (?, ?)' % self.table,
+                             (_encode_key(key), json.dumps(value)))
+
+    def __delitem__(self, key):
+        cur = self._conn().execute('DELETE FROM %s WHERE k = ?' % self.table, (_encode_key(key),))
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._conn().execute('SELECT 1 FROM %s WHERE k = ?' % self.table,
+                                    (_encode_key(key),)).fetchone() is not None
+
+    def __iter__(self):
+        for (k,) in self._conn().execute('SELECT k FROM %s' % self.table).fetchall():
+            yield json.loads(k)
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM %s' % self.table).fetchone()[0]
+
+    # Single-query versions of the Mapping views; the mixins would do one lookup per key.
+    def items(self):
+        rows = self._conn().execute('SELECT k, v FROM %s' % self.table).fetchall()
+        return [(json.loads(k), json.loads(v)) for k, v in rows]
+
+    def values(self):
+        rows = self._conn().execute('SELECT v FROM %s' % self.table).fetchall()
+        return [json.loads(v) for (v,) in rows]
+
+    def clear(self):
+        self._conn().execute('DELETE FROM %s' % self.table)
+
+    def iter_json(self):
+        """Yields each stored value as JSON text, without decoding it or loading the table at once."""
+        for (v,) in self._conn().execute('SELECT v FROM %s' % self.table):
+            yield v
+
+    def compare_and_set(self, key, value, expected_version):
+        """Writes value only if the stored record's version is still expected_version."""
+        cur = self._conn().execute(
+            "UPDATE %s SET v = ? WHERE k = ? AND json_extract(v, '$.version') IS ?" % self.table,
+            (json.dumps(value), _encode_key(key), expected_version))
+        return cur.rowcount == 1
+
+    def update_item(self, key, update):
+        """Atomically replaces the value at key with update(current value or None)."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT v FROM %s WHERE k = ?' % self.table, (_encode_key(key),)).fetchone()
+            value = update(json.loads(row[0]) if row else None)
+            conn.execute('INSERT OR REPLACE INTO %s (k, v) VALUES (?, ?)' % self.table,
+                         (_encode_key(key), json.dumps(value)))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return value
+
+    def update_many(self, pairs, encode=json.dumps):
+        """Writes many (key, value) pairs in one transaction; encode turns a value into JSON text."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO %s (k, v) VALUES (?, ?)' % self.table,
+                             ((_encode_key(k), encode(v)) for k, v in pairs))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+class SharedIDManager:
+    """Same interface as IDManager, backed by counters in the shared SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS id_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _next(self, name, count=1):
+        row = connect(self.path).execute(
+            'INSERT INTO id_counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value RETURNING value',
+            (name, count)).fetchone()
+        return row[0]
+
+    def reserve(self, name, count):
+        """Allocates count consecutive IDs in one statement; returns them as a range."""
+        last = self._next(name, count)
+        return range(last - count + 1, last + 1)
+
+    def advance_to(self, name, value):
+        """Makes sure IDs handed out later under name are above value."""
+        connect(self.path).execute(
+            'INSERT INTO id_counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)', (name, value))
+
+    def get_next_user_id(self):
+        return self._next('user')
+
+    def get_next_ride_id(self):
+        return self._next('ride')
+
+    def get_next_driving_event_id(self):
+        return self._next('driving_event')
+
+    def get_next_incident_report_id(self):
+        return self._next('incident_report')
+
+    def get_next_ride_group_id(self):
+        return self._next('ride_group')
+
+    def get_next_webhook_endpoint_id(self):
+        return self._next('webhook_endpoint')
+
+    def get_next_notification_id(self):
+        return self._next('notification')
+
+    def get_next_anomaly_alert_id(self):
+        return self._next('anomaly_alert')
+
+
+class SharedStoreVersions:
+    """Same interface as versioning.StoreVersions, so every worker sees each bump."""
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = SharedIDManager(path)
+        self._load_epoch()
+
+    def _load_epoch(self):
+        # One epoch per store file, shared by all workers; a new file gets a new one.
+        conn = connect(self.path)
+        conn.execute("INSERT OR IGNORE INTO id_counters (name, value) VALUES ('etag_epoch', ?)",
+                     (int(new_epoch(), 16),))
+        (epoch,) = conn.execute("SELECT value FROM id_counters WHERE name = 'etag_epoch'").fetchone()
+        set_epoch('%08x' % epoch)
+
+    def bump(self, name):
+        return self._ids._next('version:' + name)
+
+    def get(self, name):
+        row = connect(self.path).execute('SELECT value FROM id_counters WHERE name = ?',
+                                         ('version:' + name,)).fetchone()
+        return row[0] if row else 0
+
+    def reset(self):
+        connect(self.path).execute("DELETE FROM id_counters WHERE name LIKE 'version:%' OR name = 'etag_epoch'")
+        self._load_epoch()
+
+
+class SharedChangeLog:
+    """Same interface as changes.ChangeLog; the sequence is the SQLite rowid, so it is
+    global across workers. Rows beyond CHANGELOG_MAX_ROWS are pruned periodically."""
+
+    _PRUNE_EVERY = 1000
+
+    def __init__(self, path, max_rows=1000000):
+        self.path = path
+        self.max_rows = max_rows
+        self._writes = 0
+        self._local_seqs = None
+        self._local_lock = threading.Lock()
+        connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'store TEXT NOT NULL, k TEXT NOT NULL, op TEXT NOT NULL, ts REAL NOT NULL, record TEXT)')
+        # Seqs only restart with a new store file, which gets a new epoch; workers share it.
+        SharedIDManager(path)  # creates id_counters
+        conn = connect(path)
+        conn.execute("INSERT OR IGNORE INTO id_counters (name, value) VALUES ('changes_epoch', ?)",
+                     (int(new_epoch(), 16),))
+        (epoch,) = conn.execute("SELECT value FROM id_counters WHERE name = 'changes_epoch'").fetchone()
+        self.epoch = '%08x' % epoch
+
+    def init_app(self, app):
+        self.max_rows = app.config.get('CHANGELOG_MAX_ROWS', self.max_rows)
+        app.extensions['change_log'] = self
+
+    @property
+    def last_seq(self):
+        row = connect(self.path).execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    @property
+    def oldest_seq(self):
+        row = connect(self.path).execute('SELECT MIN(seq) FROM changes').fetchone()
+        return row[0] if row[0] is not None else self.last_seq + 1
+
+    def reset(self):
+        connect(self.path).execute('DELETE FROM changes')
+
+    def track_local_writes(self):
+        """Remember the seqs recorded by this process, so a ChangeFollower can skip them."""
+        self._local_seqs = set()
+
+    def is_local_write(self, seq):
+        with self._local_lock:
+            if self._local_seqs is not None and seq in self._local_seqs:
+                self._local_seqs.discard(seq)
+                return True
+            return False
+
+    def record(self, store, key, record, op='upsert'):
+        record = redact(store, record)
+        conn = connect(self.path)
+        # Held from the INSERT until the seq is remembered, so a follower never sees the row first.
+        with self._local_lock:
+            seq = conn.execute('INSERT INTO changes (store, k, op, ts, record) VALUES (?, ?, ?, ?, ?)',
+                               (store, json.dumps(key), op, time.time(),
+                                json.dumps(record) if record is not None else None)).lastrowid
+            if self._local_seqs is not None:
+                self._local_seqs.add(seq)
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM changes WHERE seq <= ?', (seq - self.max_rows,))
+        return seq
+
+    def since(self, since, limit):
+        rows = connect(self.path).execute(
+            'SELECT seq, store, k, op, ts, record FROM changes WHERE seq > ? ORDER BY seq LIMIT ?',
+            (since, limit)).fetchall()
+        for seq, store, key, op, ts, record in rows:
+            yield {"seq": seq, "store": store, "key": json.loads(key), "op": op, "ts": ts,
+                   "record": json.loads(record) if record is not None else None}
+
+
+class SharedTokenBucketStore:
+    """Same interface as rate_limit.TokenBucketStore, with the buckets in SQLite.
+
+    Each consume is one short write transaction. Buckets are refilled from wall-clock
+    time, since monotonic clocks are not comparable between processes.
+    """
+
+    _PRUNE_EVERY = 1000
+
+    def __init__(self, path, max_buckets=100000, idle_seconds=300):
+        self.path = path
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        self._calls = 0
+        connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets (k TEXT PRIMARY KEY, tokens REAL NOT NULL, refilled REAL NOT NULL)')
+
+    def __len__(self):
+        return connect(self.path).execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+
+    def clear(self):
+        connect(self.path).execute('DELETE FROM rate_buckets')
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        conn = connect(self.path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, refilled FROM rate_buckets WHERE k = ?', (_encode_key(key),)).fetchone()
+            tokens = float(burst) if row is None else min(float(burst), row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / rate
+            if not wait:
+                tokens -= 1.0
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (k, tokens, refilled) VALUES (?, ?, ?)',
+                         (_encode_key(key), tokens, now))
+            self._calls += 1
+            if self._calls % self._PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM rate_buckets WHERE refilled < ?', (now - self.idle_seconds,))
+                conn.execute('DELETE FROM rate_buckets WHERE k IN (SELECT k FROM rate_buckets ORDER BY refilled '
+                             'LIMIT max(0, (SELECT COUNT(*) FROM rate_buckets) - ?))', (self.max_buckets,))
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return wait
+
+
+class _SharedIdempotencyEntry:
+    """A claimed Idempotency-Key row. Waiting polls the row, so the entry is its own done event."""
+
+    _POLL_SECONDS = 0.02
+
+    def __init__(self, cache, key, fingerprint, claimed_at, status=None, body=None, mimetype=None):
+        self._cache = cache
+        self.key = key
+        self.fingerprint = fingerprint
+        self.claimed_at = claimed_at
+        self.status = status
+        self.body = body
+        self.mimetype = mimetype
+        self.done = self
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._cache._row(self.key)
+            if row is None or row[1] is not None:  # abandoned, or completed
+                if row is not None:
+                    _, self.status, self.body, self.mimetype, _ = row
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self._POLL_SECONDS)
+
+
+class SharedIdempotencyCache:
+    """Same interface as idempotency.IdempotencyCache, with the entries in SQLite.
+
+    The leader is whoever inserts the row (or takes over an expired or abandoned
+    one); duplicates on any worker poll that row until the leader completes it.
+    """
+
+    _PRUNE_EVERY = 1000
+
+    def __init__(self, path, ttl_seconds=86400, max_entries=10000, wait_seconds=10.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_seconds = wait_seconds
+        self._calls = 0
+        connect(path).execute(
+            'CREATE TABLE IF NOT EXISTS idempotency (k TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, '
+            'status INTEGER, body BLOB, mimetype TEXT, claimed_at REAL NOT NULL, expires_at REAL)')
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('IDEMPOTENCY_TTL_SECONDS', self.ttl_seconds)
+        self.max_entries = app.config.get('IDEMPOTENCY_MAX_ENTRIES', self.max_entries)
+        self.wait_seconds = app.config.get('IDEMPOTENCY_WAIT_SECONDS', self.wait_seconds)
+        app.extensions['idempotency'] = self
+
+    def clear(self):
+        connect(self.path).execute('DELETE FROM idempotency')
+
+    def __len__(self):
+        return connect(self.path).execute('SELECT COUNT(*) FROM idempotency').fetchone()[0]
+
+    def _row(self, key):
+        return connect(self.path).execute(
+            'SELECT fingerprint, status, body, mimetype, claimed_at FROM idempotency WHERE k = ?',
+            (_encode_key(key),)).fetchone()
+
+    def begin(self, key, fingerprint):
+        now = time.time()
+        conn = connect(self.path)
+        # A claim whose leader died without completing it is taken over once it is older than the wait.
+        claimed = conn.execute(
+            'INSERT INTO idempotency (k, fingerprint, claimed_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(k) DO UPDATE SET fingerprint = excluded.fingerprint, status = NULL, body = NULL, '
+            'mimetype = NULL, claimed_at = excluded.claimed_at, expires_at = NULL '
+            'WHERE expires_at <= ? OR (status IS NULL AND claimed_at < ?)',
+            (_encode_key(key), fingerprint, now, now, now - 2 * self.wait_seconds)).rowcount == 1
+        self._calls += 1
+        if self._calls % self._PRUNE_EVERY == 0:
+            self._prune(conn, now)
+        if claimed:
+            return _SharedIdempotencyEntry(self, key, fingerprint, now), True
+        row = self._row(key)
+        if row is None:  # abandoned between the two statements
+            return self.begin(key, fingerprint)
+        return _SharedIdempotencyEntry(self, key, row[0], row[4], *row[1:4]), False
+
+    def _prune(self, conn, now):
+        conn.execute('DELETE FROM idempotency WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM idempotency WHERE k IN (SELECT k FROM idempotency WHERE expires_at IS NOT NULL '
+                     'ORDER BY expires_at LIMIT max(0, (SELECT COUNT(*) FROM idempotency) - ?))', (self.max_entries,))
+
+    def complete(self, key, entry, status, body, mimetype):
+        connect(self.path).execute(
+            'UPDATE idempotency SET status = ?, body = ?, mimetype = ?, expires_at = ? '
+            'WHERE k = ? AND claimed_at = ?',
+            (status, body, mimetype, time.time() + self.ttl_seconds, _encode_key(key), entry.claimed_at))
+
+    def abandon(self, key, entry):
+        connect(self.path).execute('DELETE FROM idempotency WHERE k = ? AND claimed_at = ? AND status IS NULL',
+                                   (_encode_key(key), entry.claimed_at))
+
@@ -0,0 +1,184 @@
+"""Copy-on-write stores, so long scans read a stable snapshot while writers carry on.
+
+A plain dict can't be iterated by one thread while another inserts into it
+("dictionary changed size during iteration"), and locking it for the length of an
+admin scan would stall ingestion. SnapshotDict keeps its entries in chunks of up to
+CHUNK_SIZE keys, in insertion order (new keys go to the last chunk), plus a
+key -> chunk index.
+
+snapshot() takes the writers' lock just long enough to copy the list of chunk
+references (one per CHUNK_SIZE keys) and marks every chunk shared. A writer that
+then changes a shared chunk copies that chunk first, so the snapshot never sees the
+change. Records are appended under increasing IDs, which puts nearly all writes in
+the last chunk: after a snapshot, a burst of inserts pays for one copy of at most
+CHUNK_SIZE keys. Without writes in between, scans share one snapshot.
+
+Iterating the store (keys(), values(), items(), for ... in) goes through a snapshot,
+so every existing scan is safe as it is. Code that reads a store more than once
+and needs the passes to agree takes one snapshot() and reads that. Point reads and
+len() read the live store. Values are shared with the live store, not copied:
+writers replace records (store[key] = record) rather than mutating them.
+"""
+import threading
+from collections.abc import ItemsView, KeysView, Mapping, MutableMapping, ValuesView
+from itertools import chain
+
+CHUNK_SIZE = 4096
+
+
+class Snapshot(Mapping):
+    """Read-only view of a SnapshotDict as it was when taken.
+
+    Scans are as fast as over a dict; a lookup by key checks each chunk in turn,
+    so use the live store for point reads.
+    """
+
+    __slots__ = ('_chunks', '_len')
+
+    def __init__(self, chunks, length):
+        self._chunks = chunks
+        self._len = length
+
+    def __getitem__(self, key):
+        for chunk in self._chunks:
+            if key in chunk:
+                return chunk[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def __len__(self):
+        return self._len
+
+    def keys(self):
+        return _SnapshotKeys(self)
+
+    def values(self):
+        return _SnapshotValues(self)
+
+    def items(self):
+        return _SnapshotItems(self)
+
+
+class _SnapshotKeys(KeysView):
+    def __iter__(self):
+        return iter(self._mapping)
+
+
+class _SnapshotValues(ValuesView):
+    def __iter__(self):
+        return chain.from_iterable(map(dict.values, self._mapping._chunks))
+
+
+class _SnapshotItems(ItemsView):
+    def __iter__(self):
+        return chain.from_iterable(map(dict.items, self._mapping._chunks))
+
+
+class SnapshotDict(MutableMapping):
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._chunks = []
+        self._shared = []  # per chunk: held by a snapshot, so copy before changing it
+        self._where = {}  # key -> chunk index
+        self._snapshot = Snapshot((), 0)  # the latest snapshot, while no write has happened since
+
+    def _writable(self, index):
+        if self._shared[index]:
+            self._chunks[index] = dict(self._chunks[index])
+            self._shared[index] = False
+        return self._chunks[index]
+
+    # --- writes ---
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            index = self._where.get(key)
+            if index is None:
+                if not self._chunks or len(self._chunks[-1]) >= self.chunk_size:
+                    self._chunks.append({})
+                    self._shared.append(False)
+                index = self._where[key] = len(self._chunks) - 1
+            self._writable(index)[key] = value
+            self._snapshot = None
+
+    def __delitem__(self, key):
+        with self._lock:
+            index = self._where.pop(key)
+            del self._writable(index)[key]
+            self._snapshot = None
+
+    _missing = object()
+
+    def pop(self, key, default=_missing):
+        # One step under the lock, so two threads popping the same key can't both find it.
+        with self._lock:
+            index = self._where.pop(key, None)
+            if index is None:
+                if default is self._missing:
+                    raise KeyError(key)
+                return default
+            self._snapshot = None
+            return self._writable(index).pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # --- reads ---
+
+    def __getitem__(self, key):
+        return self._chunks[self._where[key]][key]
+
+    def get(self, key, default=None):
+        index = self._where.get(key)
+        if index is None:
+            return default
+        return self._chunks[index].get(key, default)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def __len__(self):
+        return len(self._where)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._shared = [True] * len(self._chunks)
+                self._snapshot = Snapshot(tuple(self._chunks), len(self._where))
+            return self._snapshot
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def items(self):
+        return self.snapshot().items()
+
+
+def join(snapshots):
+    """One Snapshot reading several in turn (the shards of app/shards.py)."""
+    snapshots = list(snapshots)
+    return Snapshot(tuple(chain.from_iterable(s._chunks for s in snapshots)), sum(map(len, snapshots)))
+
+
+def snapshot(store):
+    """A stable view of store for a long read. Shared stores read each query from one
+    SQLite transaction already, and are returned as they are."""
+    if hasattr(store, 'snapshot'):
+        return store.snapshot()
+    return store
@@ -0,0 +1,132 @@
+"""Record and collection version counters, and the ETags derived from them.
+
+Every stored record carries a "version" that is bumped whenever it is written, and
+each store has a collection-level version bumped on any insert or update. GET views
+compare the client's If-None-Match against the ETag built from these counters and
+answer 304 before serializing anything.
+
+The counters restart when the stores do, so every ETag also carries an epoch: a
+random id drawn at startup (or kept in the shared file in shared-store mode). A
+tag handed out before a restart then never matches data written after it.
+
+One record is sent in several representations: ?fields=/?profile= responses get
+a suffix per shape (g.etag_variant, set by app/response_profiles.py), and the
+compression hook appends the content coding, so no two bodies share a strong tag.
+"""
+import hashlib
+import secrets
+import threading
+
+from flask import g, make_response, request
+
+
+def new_epoch():
+    return secrets.token_hex(4)
+
+
+_epoch = new_epoch()
+
+
+def set_epoch(epoch):
+    global _epoch
+    _epoch = epoch
+
+
+class StoreVersions:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, name):
+        with self._lock:
+            version = self._versions.get(name, 0) + 1
+            self._versions[name] = version
+            return version
+
+    def get(self, name):
+        return self._versions.get(name, 0)
+
+    def reset(self):
+        with self._lock:
+            self._versions.clear()
+            set_epoch(new_epoch())
+
+
+def bump_version(store_versions, collection, record):
+    """Marks record as changed: bumps its own version and its collection's version."""
+    record['version'] = record.get('version', 0) + 1
+    store_versions.bump(collection)
+    return record
+
+
+_write_lock = threading.Lock()
+
+
+def compare_and_set(store, key, record, expected_version):
+    """Writes record at key only if the stored record still has expected_version.
+
+    Routes that read, change and write back a record which two requests may update
+    at once (accepting a ride) use this instead of a plain store write, and answer
+    409 when it returns False. Shared stores do it in one conditional UPDATE.
+    """
+    if hasattr(store, 'compare_and_set'):
+        return store.compare_and_set(key, record, expected_version)
+    with _write_lock:
+        current = store.get(key)
+        if current is None or current.get('version') != expected_version:
+            return False
+        store[key] = record
+        return True
+
+
+def update_record(store, key, update):
+    """Replaces the record at key with update(current record or None), atomically.
+
+    For records built up by many small appends (trip traces), where a lost update
+    would drop data. update may raise to leave the record unchanged.
+    """
+    if hasattr(store, 'update_item'):
+        return store.update_item(key, update)
+    with _write_lock:
+        record = update(store.get(key))
+        store[key] = record
+        return record
+
+
+def record_etag(kind, key, version):
+    return '%s-%s-v%s-%s' % (kind, key, version or 0, _epoch)
+
+
+def collection_etag(store_versions, collection, *query):
+    # The query (filters, owner id) is part of the tag so that differently filtered
+    # views of the same collection never share an ETag.
+    digest = hashlib.sha1(repr(query).encode()).hexdigest()[:12]
+    return '%s-c%d-%s-%s' % (collection, store_versions.get(collection), digest, _epoch)
+
+
+# Content codings the compression hook tags onto ETags ("<tag>-gzip").
+ENCODED_VARIANTS = ('gzip', 'br')
+
+
+def _variant(etag):
+    return etag + g.get('etag_variant', '')
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag):
+    """Returns a 304 response if the client already holds etag, in any encoding, otherwise None."""
+    etag = _variant(etag)
+    for held in (etag,) + tuple('%s-%s' % (etag, coding) for coding in ENCODED_VARIANTS):
+        if held in request.if_none_match:
+            return _set_validators(make_response('', 304), held)
+    return None
+
+
+def with_etag(response, etag):
+    return _set_validators(make_response(response), _variant(etag))
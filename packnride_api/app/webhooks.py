@@ -0,0 +1,322 @@
+"""Partner webhooks, delivered from an outbox.
+
+Partners register endpoints (a URL, the events they want, an optional secret)
+under /api/webhooks. A state transition calls notify(event, data), which writes
+one outbox record per subscribed endpoint and returns: remote latency never
+reaches the request path.
+
+The dispatcher delivers the outbox from its own pool of sender threads. Each
+endpoint has a queue of due notifications; a sender takes up to batch_size of them
+and POSTs them as one JSON body over a kept-alive connection. An endpoint gets at
+most max_connections of them at once, which caps its concurrent requests, and
+senders go round the endpoints so a slow one cannot hold them all. A 2xx response
+delivers the batch, which leaves the outbox. 408, 429, 5xx and network errors are
+retried with exponential backoff and jitter until max_attempts; any other
+response fails the batch at once. Failed records stay in the outbox with their
+last error.
+
+Bodies are signed with HMAC-SHA256 under the endpoint's secret, in
+X-PacknRide-Signature. Delivery is at least once: notifications carry their id so
+receivers can drop repeats.
+
+Pending records are reloaded from the outbox at startup. Under serve.py only the
+first worker dispatches; it learns of other workers' notifications from the
+shared change log.
+"""
+import datetime
+import hashlib
+import heapq
+import hmac
+import http.client
+import json
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from . import webhook_endpoints_db, webhook_outbox_db, id_manager, store_versions, change_log
+from .changes import change_follower
+from .jobs import jobs
+from .versioning import bump_version
+
+WEBHOOK_EVENTS = ('ride.accepted', 'ride.completed', 'incident.opened')
+RETRYABLE_STATUSES = (408, 429)
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def valid_url(url):
+    parts = urlsplit(url) if isinstance(url, str) else None
+    return parts is not None and parts.scheme in ('http', 'https') and bool(parts.hostname)
+
+
+class _Endpoint:
+    """Delivery state of one endpoint: its due notifications and its idle connections."""
+
+    def __init__(self, record):
+        parts = urlsplit(record['url'])
+        self.id = record['id']
+        self.secret = record.get('secret')
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self.removed = False
+        self.due = deque()
+        self.active = 0
+        self.idle = []
+
+
+class WebhookDispatcher:
+    def __init__(self, senders=8, batch_size=50, max_connections=4, timeout_seconds=5.0, max_attempts=8,
+                 backoff_seconds=1.0, max_backoff_seconds=300.0, clock=time.time):
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.clock = clock
+        self.dispatching = True
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._reset()
+
+    def _reset(self):
+        self._endpoints = {}  # endpoint id -> _Endpoint
+        self._pending = {}    # notification id -> outbox record, queued or waiting for a retry
+        self._retries = []    # heap of (next attempt, notification id)
+        self._in_flight = set()
+        self._turn = 0
+        self.totals = {"delivered": 0, "failed": 0, "retried": 0, "requests": 0, "connections": 0}
+
+    def init_app(self, app):
+        self.senders = app.config.get('WEBHOOK_SENDERS', self.senders)
+        self.batch_size = app.config.get('WEBHOOK_BATCH_SIZE', self.batch_size)
+        self.max_connections = app.config.get('WEBHOOK_MAX_CONNECTIONS', self.max_connections)
+        self.timeout_seconds = app.config.get('WEBHOOK_TIMEOUT_SECONDS', self.timeout_seconds)
+        self.max_attempts = app.config.get('WEBHOOK_MAX_ATTEMPTS', self.max_attempts)
+        self.backoff_seconds = app.config.get('WEBHOOK_BACKOFF_SECONDS', self.backoff_seconds)
+        self.max_backoff_seconds = app.config.get('WEBHOOK_MAX_BACKOFF_SECONDS', self.max_backoff_seconds)
+        self.dispatching = app.config.get('WEBHOOK_DISPATCH', self.dispatching)
+        if app.config.get('SHARED_STORE_PATH') and self.dispatching:
+            change_follower.register('webhook_outbox', self._remote_notification)
+        jobs.on_shutdown(self.stop)
+        app.extensions['webhooks'] = self
+
+    # --- outbox ---
+
+    def notify(self, event, data):
+        """Writes one outbox record per endpoint subscribed to event; returns them."""
+        records = []
+        for endpoint in list(webhook_endpoints_db.values()):
+            if event not in endpoint['events']:
+                continue
+            record = {
+                "id": id_manager.get_next_notification_id(), "endpoint_id": endpoint['id'], "event": event,
+                "data": data, "created_at": datetime.datetime.utcnow().isoformat(), "status": "pending", "attempts": 0,
+                "next_attempt_at": None, "last_error": None,
+            }
+            bump_version(store_versions, 'webhook_outbox', record)
+            webhook_outbox_db[record['id']] = record
+            change_log.record('webhook_outbox', record['id'], record)
+            self._queue(record)
+            records.append(record)
+        return records
+
+    def _remote_notification(self, change):
+        if change['op'] == 'upsert' and change['record'].get('version') == 1:
+            self._queue(change['record'])
+
+    def _queue(self, record):
+        if not self.dispatching:
+            return
+        with self._cond:
+            if record['id'] in self._pending or record['id'] in self._in_flight:
+                return
+            self._pending[record['id']] = record
+            if record['next_attempt_at'] and record['next_attempt_at'] > self.clock():
+                heapq.heappush(self._retries, (record['next_attempt_at'], record['id']))
+            else:
+                self._endpoint(record['endpoint_id']).due.append(record['id'])
+            self._cond.notify()
+
+    def _endpoint(self, endpoint_id):
+        endpoint = self._endpoints.get(endpoint_id)
+        if endpoint is None:
+            record = webhook_endpoints_db.get(endpoint_id)
+            endpoint = self._endpoints[endpoint_id] = _Endpoint(record or {"id": endpoint_id, "url": "http://removed/"})
+            endpoint.removed = record is None
+        return endpoint
+
+    def forget_endpoint(self, endpoint_id):
+        """Closes a removed endpoint's connections; its queued notifications fail when their turn comes."""
+        with self._cond:
+            endpoint = self._endpoints.get(endpoint_id)
+            if endpoint is not None:
+                endpoint.removed = True
+                for connection in endpoint.idle:
+                    connection.close()
+                endpoint.idle = []
+
+    def rebuild(self, records):
+        with self._cond:
+            in_flight, totals = self._in_flight, self.totals
+            for endpoint in self._endpoints.values():
+                for connection in endpoint.idle:
+                    connection.close()
+            self._reset()
+            self._in_flight, self.totals = in_flight, totals
+        for record in records:
+            if record['status'] == 'pending':
+                self._queue(record)
+
+    def clear(self):
+        with self._cond:
+            for endpoint in self._endpoints.values():
+                for connection in endpoint.idle:
+                    connection.close()
+            self._reset()
+
+    # --- senders ---
+
+    def start(self):
+        with self._cond:
+            if self._threads or not self.dispatching:
+                return
+            self._stopping = False
+        for index in range(self.senders):
+            thread = threading.Thread(target=self._sender, name=f'webhook-sender-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Finishes the requests in flight; queued notifications stay in the outbox."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._cond:
+            for endpoint in self._endpoints.values():
+                for connection in endpoint.idle:
+                    connection.close()
+                endpoint.idle = []
+
+    def _next_batch(self, now):
+        """Takes the next endpoint's batch, round-robin over endpoints below their connection cap."""
+        while self._retries and self._retries[0][0] <= now:
+            _, notification_id = heapq.heappop(self._retries)
+            record = self._pending.get(notification_id)
+            if record is not None:
+                self._endpoint(record['endpoint_id']).due.append(notification_id)
+        endpoints = list(self._endpoints.values())
+        for offset in range(len(endpoints)):
+            endpoint = endpoints[(self._turn + offset) % len(endpoints)]
+            if endpoint.due and endpoint.active < self.max_connections:
+                self._turn = (self._turn + offset + 1) % len(endpoints)
+                batch = [endpoint.due.popleft() for _ in range(min(self.batch_size, len(endpoint.due)))]
+                self._in_flight.update(batch)
+                endpoint.active += 1
+                return endpoint, [self._pending.pop(notification_id) for notification_id in batch]
+        return None, None
+
+    def _sender(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    endpoint, batch = self._next_batch(self.clock())
+                    if endpoint is not None:
+                        break
+                    self._cond.wait(self._retries[0][0] - self.clock() if self._retries else None)
+                connection = endpoint.idle.pop() if endpoint.idle else None
+            if endpoint.removed:
+                status, error, connection = None, 'endpoint removed', None
+            else:
+                status, error, connection = self._post(endpoint, connection, batch)
+            with self._cond:
+                endpoint.active -= 1
+                if connection is not None:
+                    endpoint.idle.append(connection)
+                self._settle(batch, status, error)
+                self._cond.notify_all()
+
+    def _post(self, endpoint, connection, batch):
+        """One POST of the batch; returns (status or None, error, connection to keep or None)."""
+        body = json.dumps({"notifications": [
+            {"id": r['id'], "event": r['event'], "created_at": r['created_at'], "data": r['data']} for r in batch
+        ]}, separators=(',', ':')).encode()
+        headers = {'Content-Type': 'application/json', 'User-Agent': 'PacknRide-Webhooks/1'}
+        if endpoint.secret:
+            headers['X-PacknRide-Signature'] = sign(endpoint.secret, body)
+        # A kept-alive connection may have been closed by the server while idle; retry those once on a new one.
+        for reused in ((True, False) if connection is not None else (False,)):
+            if not reused:
+                connection = endpoint.connection_class(endpoint.host, endpoint.port, timeout=self.timeout_seconds)
+                with self._cond:
+                    self.totals['connections'] += 1
+            try:
+                connection.request('POST', endpoint.path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                connection.close()
+                error = f"{type(exc).__name__}: {exc}"
+                continue
+            with self._cond:
+                self.totals['requests'] += 1
+            if response.will_close:
+                connection.close()
+                connection = None
+            return response.status, None if 200 <= response.status < 300 else f"HTTP {response.status}", connection
+        return None, error, None
+
+    def _settle(self, batch, status, error):
+        now = self.clock()
+        for record in batch:
+            self._in_flight.discard(record['id'])
+            record = dict(record, attempts=record['attempts'] + 1, last_error=error)
+            if status is not None and 200 <= status < 300:
+                self.totals['delivered'] += 1
+                webhook_outbox_db.pop(record['id'], None)
+                change_log.record('webhook_outbox', record['id'], None, op='delete')
+                continue
+            retryable = error != 'endpoint removed' and (status is None or status in RETRYABLE_STATUSES or status >= 500)
+            if retryable and record['attempts'] < self.max_attempts:
+                delay = min(self.backoff_seconds * 2 ** (record['attempts'] - 1), self.max_backoff_seconds)
+                record['next_attempt_at'] = now + delay * random.uniform(0.5, 1.0)
+                self.totals['retried'] += 1
+                self._pending[record['id']] = record
+                heapq.heappush(self._retries, (record['next_attempt_at'], record['id']))
+            else:
+                record['status'] = 'failed'
+                self.totals['failed'] += 1
+            bump_version(store_versions, 'webhook_outbox', record)
+            webhook_outbox_db[record['id']] = record
+            change_log.record('webhook_outbox', record['id'], record)
+
+    def wait_idle(self, timeout=10):
+        """Blocks until nothing is queued, waiting for a retry or in flight; for tests and benchmarks."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._cond:
+            return dict(self.totals, queued=len(self._pending) - len(self._retries), waiting_retry=len(self._retries),
+                        in_flight=len(self._in_flight), senders=len(self._threads))
+
+
+webhooks = WebhookDispatcher()
@@ -0,0 +1,68 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+from app import webhook_endpoints_db, webhook_outbox_db, id_manager, store_versions, change_log
+from app.monitoring_routes import is_admin_user
+from app.versioning import bump_version
+from app.webhooks import webhooks, valid_url, WEBHOOK_EVENTS
+import datetime
+
+webhooks_bp = Blueprint('webhooks_bp', __name__)
+
+# Partner subscriptions; delivery happens in app/webhooks.py, never in these requests.
+
+
+def _public(endpoint):
+    # The secret is write-only.
+    view = {k: v for k, v in endpoint.items() if k != 'secret'}
+    view['signed'] = bool(endpoint.get('secret'))
+    return view
+
+
+@webhooks_bp.route('', methods=['POST'])
+@jwt_required()
+def create_endpoint():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+    data = request.get_json(silent=True) or {}
+    url, events, secret = data.get('url'), data.get('events'), data.get('secret')
+    if not valid_url(url):
+        return jsonify({"error": "url must be an http or https URL"}), 400
+    if not isinstance(events, list) or not events or not set(events) <= set(WEBHOOK_EVENTS):
+        return jsonify({"error": f"events must be a non-empty list of: {', '.join(WEBHOOK_EVENTS)}"}), 400
+    if secret is not None and not (isinstance(secret, str) and secret):
+        return jsonify({"error": "secret must be a non-empty string"}), 400
+
+    endpoint_id = id_manager.get_next_webhook_endpoint_id()
+    endpoint = {"id": endpoint_id, "url": url, "events": sorted(set(events)), "secret": secret,
+                "created_at": datetime.datetime.utcnow().isoformat()}
+    bump_version(store_versions, 'webhook_endpoints', endpoint)
+    webhook_endpoints_db[endpoint_id] = endpoint
+    change_log.record('webhook_endpoints', endpoint_id, endpoint)
+    return jsonify(_public(endpoint)), 201
+
+
+@webhooks_bp.route('', methods=['GET'])
+@jwt_required()
+def list_endpoints():
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+    failed = {}
+    for notification in webhook_outbox_db.values():
+        if notification['status'] == 'failed':
+            failed[notification['endpoint_id']] = failed.get(notification['endpoint_id'], 0) + 1
+    endpoints = [dict(_public(e), failed_notifications=failed.get(e['id'], 0)) for e in webhook_endpoints_db.values()]
+    return jsonify({"endpoints": endpoints, "delivery": webhooks.stats()}), 200
+
+
+@webhooks_bp.route('/<int:endpoint_id>', methods=['DELETE'])
+@jwt_required()
+def delete_endpoint(endpoint_id):
+    if not is_admin_user():
+        return jsonify({"error": "Unauthorized. Admin access required."}), 403
+    endpoint = webhook_endpoints_db.pop(endpoint_id, None)
+    if endpoint is None:
+        return jsonify({"error": "Webhook endpoint not found"}), 404
+    bump_version(store_versions, 'webhook_endpoints', endpoint)
+    change_log.record('webhook_endpoints', endpoint_id, None, op='delete')
+    webhooks.forget_endpoint(endpoint_id)
+    return '', 204
@@ -0,0 +1,15 @@
+from app import create_app
+from app.asgi import create_asgi_app
+from config import app_config
+
+app = create_asgi_app(create_app(app_config))
+
+if __name__ == '__main__':
+    # Async serving mode: ride status streams run on the event loop, all other
+    # views on a small thread pool (ASGI_WORKER_THREADS).
+    import uvicorn
+
+    host = '0.0.0.0'
+    port = 5000
+    print(f"Starting PacknRide API (ASGI) on {host}:{port}")
+    uvicorn.run(app, host=host, port=port, log_level='info')
@@ -0,0 +1,83 @@
+"""Bulk import and export rate of driving events (bulk.py) into a fresh store file.
+
+Writes a dump of --drivers drivers and --events events, half of them without an
+event_id so that the block allocator is exercised, then times importing it into an
+empty store and exporting the store again, plain and gzip-compressed.
+
+    PYTHONPATH=. python benchmarks/bench_bulk.py --events 1000000 --dir /tmp
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import bulk
+from app.shared_store import close_connections, read_snapshot
+from app.utils import hash_password
+
+
+def _write_dump(path, drivers, events):
+    password_hash = hash_password('benchmark')
+    rng = random.Random(7)
+    with open(path, 'w') as f:
+        f.write(json.dumps(bulk.FORMAT) + '\n')
+        for driver_id in range(1, drivers + 1):
+            f.write(json.dumps({"store": "users", "record": {
+                "id": driver_id, "name": f"Driver {driver_id}", "email": f"d{driver_id}@example.com",
+                "password_hash": password_hash, "user_type": "driver", "is_admin": False}}) + '\n')
+        for event_id in range(1, events + 1):
+            event = {"driver_id": rng.randint(1, drivers), "ride_id": None,
+                     "event_type": rng.choice(('harsh_braking', 'speeding', 'rapid_acceleration')),
+                     "timestamp": f"2026-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00",
+                     "location_lat": -26.2 + rng.random() / 10, "location_lon": 28.0 + rng.random() / 10,
+                     "details": {}, "logged_at": "2026-01-29T00:00:00"}
+            if event_id % 2:
+                event["event_id"] = event_id
+            f.write(json.dumps({"store": "driving_events", "record": event}) + '\n')
+
+
+def _fresh_store(path):
+    close_connections()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return bulk.open_stores(path)
+
+
+def run(drivers, events, directory):
+    dump = os.path.join(directory, 'bench_bulk.ndjson')
+    store = os.path.join(directory, 'bench_bulk.sqlite3')
+    started = time.perf_counter()
+    _write_dump(dump, drivers, events)
+    print(f"dump: {os.path.getsize(dump) / 1e6:,.0f} MB written in {time.perf_counter() - started:.1f} s")
+
+    stores, ids, versions = _fresh_store(store)
+    started = time.perf_counter()
+    summary = bulk.Importer(stores, ids, versions).load(dump)
+    elapsed = time.perf_counter() - started
+    total = sum(summary['imported'].values())
+    print(f"import: {total:,} records in {elapsed:.1f} s ({total / elapsed:,.0f}/s, "
+          f"10M events in ~{10_000_000 / (total / elapsed) / 60:.1f} min)")
+
+    for name in ('bench_bulk.out.ndjson', 'bench_bulk.out.ndjson.gz'):
+        out = os.path.join(directory, name)
+        started = time.perf_counter()
+        bulk.export(stores, out, read_snapshot(store))
+        elapsed = time.perf_counter() - started
+        print(f"export {name.split('.', 2)[2]:>9}: {total / elapsed:>10,.0f} records/s, "
+              f"{os.path.getsize(out) / 1e6:,.0f} MB")
+        os.remove(out)
+    close_connections()
+    for path in (dump, store, store + '-wal', store + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--dir', default='.')
+    args = parser.parse_args()
+    run(args.drivers, args.events, args.dir)
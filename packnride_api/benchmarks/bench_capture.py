@@ -0,0 +1,121 @@
+"""Traffic capture overhead, and replays of the captured workload.
+
+Registers 20 passengers and 10 drivers, then drives --requests requests of a
+ride-hailing mix (rides requested, fetched, accepted and moved on, location
+heartbeats, nearby lookups) through a test client, with capture on for every other
+block of 1000, and compares the time per request. The workload is then captured
+from empty stores, registration (bcrypt) included, and replayed by replay.py in a
+fresh process at each --concurrency.
+
+    PYTHONPATH=. python benchmarks/bench_capture.py --requests 20000 --dir /tmp
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+from app import create_app
+from app.capture import traffic_capture, capture_files
+from config import TestingConfig
+
+
+class BenchConfig(TestingConfig):
+    RATELIMIT_ENABLED = False
+
+
+def _register(client, tag):
+    def register(email, user_type):
+        client.post('/auth/register', json={"name": email, "email": email, "password": "pw", "user_type": user_type})
+        token = client.post('/auth/login', json={"email": email, "password": "pw"}).get_json()['access_token']
+        return {'Authorization': f'Bearer {token}'}
+
+    passengers = [register(f'p{i}-{tag}@example.com', 'passenger') for i in range(20)]
+    drivers = [register(f'd{i}-{tag}@example.com', 'driver') for i in range(10)]
+    return passengers, drivers
+
+
+def _point(rng):
+    return -26.1 + rng.random() / 10, 28.0 + rng.random() / 10
+
+
+def _workload(client, n, rng, passengers, drivers):
+    rides = []  # (ride id, accepting driver's headers or None)
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.2 or not rides:
+            (pickup_lat, pickup_lon), (dropoff_lat, dropoff_lon) = _point(rng), _point(rng)
+            response = client.post('/api/rides/request', headers=rng.choice(passengers), json={
+                "pickup_location": "A", "dropoff_location": "B", "pickup_lat": pickup_lat, "pickup_lon": pickup_lon,
+                "dropoff_lat": dropoff_lat, "dropoff_lon": dropoff_lon})
+            rides.append((response.get_json()['ride']['id'], None))
+        elif roll < 0.5:
+            client.get(f'/api/rides/{rng.choice(rides)[0]}', headers=rng.choice(passengers))
+        elif roll < 0.65:
+            index = rng.randrange(len(rides))
+            ride_id, driver = rides[index]
+            if driver is None:
+                driver = rng.choice(drivers)
+                client.post(f'/api/rides/{ride_id}/accept', headers=driver)
+                rides[index] = (ride_id, driver)
+            else:
+                client.put(f'/api/rides/{ride_id}/status', headers=driver, json={"status": "en_route_pickup"})
+        elif roll < 0.9:
+            lat, lon = _point(rng)
+            client.put('/api/drivers/me/location', headers=rng.choice(drivers), json={"lat": lat, "lon": lon})
+        else:
+            client.get('/api/drivers/nearby?lat=-26.05&lon=28.05', headers=rng.choice(passengers))
+
+
+def run(n, directory, concurrencies):
+    app = create_app(BenchConfig)
+    client = app.test_client()
+    path = os.path.join(directory, 'bench_capture.ndjson.gz')
+    scratch = os.path.join(directory, 'bench_capture_scratch.ndjson.gz')
+    for name in capture_files(path) + capture_files(scratch):
+        os.remove(name)
+
+    # Capture on and off in alternate blocks, so that the stores growing doesn't favour either.
+    passengers, drivers = _register(client, 'timed')
+    rng, block, seconds = random.Random(1), 1000, {False: 0.0, True: 0.0}
+    for index in range(max(n // block, 2)):
+        capturing = index % 2 == 1
+        if capturing:
+            traffic_capture.open(scratch)
+        started = time.perf_counter()
+        _workload(client, block, rng, passengers, drivers)
+        seconds[capturing] += time.perf_counter() - started
+        traffic_capture.close()
+    blocks = max(n // block, 2) / 2 * block
+    plain, captured = seconds[False] / blocks * 1e6, seconds[True] / blocks * 1e6
+    print(f"without capture: {plain:.0f} us/request; with capture: {captured:.0f} us/request ({captured - plain:+.0f} us)")
+
+    # The capture that is replayed starts from empty stores, like the replays do.
+    from app import users_db, rides_db, id_manager
+    users_db.clear()
+    rides_db.clear()
+    id_manager.user_id_counter = id_manager.ride_id_counter = 0
+    traffic_capture.open(path)
+    passengers, drivers = _register(client, 'captured')
+    _workload(client, n, random.Random(2), passengers, drivers)
+    records = traffic_capture.records
+    traffic_capture.close()
+    size = sum(os.path.getsize(p) for p in capture_files(path))
+    print(f"{records:,} requests captured, {size / records:.0f} B each gzipped")
+
+    replay_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'replay.py')
+    for concurrency in concurrencies:
+        print(f"\nreplay.py --concurrency {concurrency}:", flush=True)
+        subprocess.run([sys.executable, replay_py, path, '--concurrency', str(concurrency)], check=True)
+    for name in capture_files(path) + capture_files(scratch):
+        os.remove(name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--dir', default='.')
+    args = parser.parse_args()
+    run(args.requests, args.dir, args.concurrency)
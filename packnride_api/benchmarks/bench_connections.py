@@ -0,0 +1,124 @@
+"""Connection capacity: threaded dev server vs the ASGI serving mode.
+
+Opens N concurrent ride status streams (GET /api/rides/<id>/stream) against a server
+running in this process, then pushes one status change and measures how long it takes
+to reach every subscriber.
+
+    PYTHONPATH=. python benchmarks/bench_connections.py --mode threaded --subscribers 500
+    PYTHONPATH=. python benchmarks/bench_connections.py --mode asgi --subscribers 5000
+"""
+import argparse
+import resource
+import selectors
+import socket
+import threading
+import time
+
+from app import create_app, rides_db
+from app.ride_events import ride_status_broker
+from config import TestingConfig
+
+
+def _raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = min(hard, max(soft, needed))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+def _setup(app):
+    app.extensions['rate_limiter'].enabled = False
+    client = app.test_client()
+    client.post('/auth/register', json={"name": "Bench", "email": "bench@example.com",
+                                        "password": "pw", "user_type": "passenger"})
+    token = client.post('/auth/login', json={"email": "bench@example.com", "password": "pw"}).get_json()['access_token']
+    ride_id = client.post('/api/rides/request', headers={'Authorization': f'Bearer {token}'},
+                          json={"pickup_location": "A", "dropoff_location": "B"}).get_json()['ride']['id']
+    return token, ride_id
+
+
+def _start_threaded(app, port):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    server.socket.listen(4096)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def _start_asgi(app, port):
+    import uvicorn
+    from app.asgi import create_asgi_app
+    config = uvicorn.Config(create_asgi_app(app), host='127.0.0.1', port=port, log_level='warning',
+                            backlog=4096, limit_concurrency=None)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join(5)
+    return stop
+
+
+def run(mode, subscribers, port, timeout):
+    _raise_fd_limit(subscribers * 2 + 256)
+    app = create_app(TestingConfig)
+    token, ride_id = _setup(app)
+    stop = (_start_asgi if mode == 'asgi' else _start_threaded)(app, port)
+    threads_before = threading.active_count()
+
+    request = (f'GET /api/rides/{ride_id}/stream HTTP/1.1\r\nHost: localhost\r\n'
+               f'Authorization: Bearer {token}\r\n\r\n').encode()
+    selector = selectors.DefaultSelector()
+    received = {}
+    started = time.perf_counter()
+    for i in range(subscribers):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(request)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, i)
+        received[i] = b''
+
+    def pump(marker, deadline):
+        pending = {i for i, data in received.items() if data.count(marker) == 0}
+        while pending and time.perf_counter() < deadline:
+            for key, _ in selector.select(timeout=0.1):
+                try:
+                    chunk = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                received[key.data] += chunk
+                if marker in received[key.data]:
+                    pending.discard(key.data)
+        return subscribers - len(pending)
+
+    connected = pump(b'"status": "pending"', started + timeout)
+    connect_time = time.perf_counter() - started
+    server_threads = threading.active_count() - threads_before
+
+    ride = dict(rides_db[ride_id], status='cancelled')
+    published = time.perf_counter()
+    ride_status_broker.publish(ride)
+    notified = pump(b'"status": "cancelled"', published + timeout)
+    fanout_time = time.perf_counter() - published
+
+    print(f"mode={mode} subscribers={subscribers}")
+    print(f"  streams established : {connected}/{subscribers} in {connect_time:.2f}s")
+    print(f"  extra server threads: {server_threads}")
+    print(f"  status fan-out      : {notified}/{subscribers} in {fanout_time * 1000:.1f} ms")
+
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['threaded', 'asgi'], default='asgi')
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+    run(args.mode, args.subscribers, args.port, args.timeout)
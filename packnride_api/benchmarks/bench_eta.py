@@ -0,0 +1,77 @@
+"""ETA lookup cost against a memory-mapped travel-time matrix.
+
+Builds a synthetic matrix for a --km x --km city in --cell-km cells (straight-line
+distance x 1.3 at a speed that drops towards the centre, standing in for a road
+graph), then times loading it, single lookups and batches of --batch origins to
+one pickup (what dispatch does), against the straight-line fallback.
+
+    PYTHONPATH=. python benchmarks/bench_eta.py --km 40 --cell-km 1 --batch 200
+"""
+import argparse
+import math
+import os
+import random
+import tempfile
+import time
+
+from app.eta import EtaService, write_matrix, cell_center
+from app.locations import haversine_km
+
+ORIGIN = (-26.35, 27.85)  # south-west corner of a Johannesburg-sized box
+
+
+def _build(path, km, cell_km):
+    side = int(km / cell_km)
+    centers = [cell_center(*ORIGIN, cell_km, side, index) for index in range(side * side)]
+    middle = centers[len(centers) // 2 + side // 2]
+
+    def speed(point):
+        return 15 + 25 * min(haversine_km(*point, *middle) / (km / 2), 1.0)
+
+    speeds = [speed(point) for point in centers]
+    times = (haversine_km(*a, *b) * 1.3 / ((sa + sb) / 2) * 3600 + 30
+             for a, sa in zip(centers, speeds) for b, sb in zip(centers, speeds))
+    write_matrix(path, *ORIGIN, cell_km, side, side, times)
+    return centers
+
+
+def _per_second(fn, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return rounds / (time.perf_counter() - started)
+
+
+def run(km, cell_km, batch):
+    rng = random.Random(11)
+    path = os.path.join(tempfile.mkdtemp(), 'eta.bin')
+    started = time.perf_counter()
+    centers = _build(path, km, cell_km)
+    built = time.perf_counter() - started
+    print(f"{len(centers):,} cells of {cell_km} km: {os.path.getsize(path) / 1e6:.1f} MB matrix built in {built:.1f} s")
+
+    def points(n):
+        return [(lat + rng.uniform(-0.004, 0.004), lon + rng.uniform(-0.004, 0.004)) for lat, lon in rng.sample(centers, n)]
+
+    mapped, fallback = EtaService(), EtaService()
+    started = time.perf_counter()
+    mapped.load(path)
+    print(f"load (mmap): {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    trip = points(2)
+    for name, service in (('matrix', mapped), ('straight line', fallback)):
+        single = _per_second(lambda: service.seconds(*trip[0], *trip[1]), 20000)
+        origins, pickup = points(batch), points(1)[0]
+        batched = _per_second(lambda: service.batch(origins, pickup), 200)
+        print(f"{name:>14}: {single:>9,.0f} single lookups/s, {batched * batch:>10,.0f} origins/s in batches of {batch}")
+    mapped.clear()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--km', type=float, default=40)
+    parser.add_argument('--cell-km', type=float, default=1.0)
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+    run(args.km, args.cell_km, args.batch)
@@ -0,0 +1,76 @@
+"""Serialization cost of large event/incident list responses.
+
+Compares Flask's default provider, FastJSONProvider (orjson when installed, stdlib
+otherwise) and FastJSONProvider with pre-encoded cached records.
+
+    PYTHONPATH=. python benchmarks/bench_json.py --events 50000
+    PYTHONPATH=. python benchmarks/bench_json.py --stdlib   # as if orjson were missing
+"""
+import argparse
+import datetime
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.json_provider import FastJSONProvider, RecordCache
+
+
+def _events(n):
+    now = datetime.datetime(2024, 1, 1)
+    return [{
+        "event_id": i, "driver_id": i % 500, "ride_id": i // 3,
+        "event_type": ("speeding", "harsh_braking", "idling")[i % 3],
+        "timestamp": (now + datetime.timedelta(seconds=i)).isoformat(),
+        "location_lat": -25.7479 + i * 1e-6, "location_lon": 28.2293 - i * 1e-6,
+        "details": {"speed_kmh": 60 + i % 80, "limit_kmh": 60},
+        "logged_at": (now + datetime.timedelta(seconds=i, milliseconds=5)).isoformat(),
+    } for i in range(n)]
+
+
+def _time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn().get_data())
+        best = min(best, time.perf_counter() - started)
+    return best, size
+
+
+def run(n, repeat, stdlib=False):
+    app = Flask(__name__)
+    events = _events(n)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    fast.use_orjson = fast.use_orjson and not stdlib
+    cache = RecordCache(max_entries=n)
+    cache._provider = fast
+
+    with app.app_context():
+        results = [
+            ('flask default (stdlib json)', _time(lambda: default.response({"events": events}), repeat)),
+            ('FastJSONProvider (%s)' % ('orjson' if fast.use_orjson else 'stdlib'),
+             _time(lambda: fast.response({"events": events}), repeat)),
+        ]
+        for e in events:
+            cache.encoded('driving_event', e['event_id'], e)
+        name = 'FastJSONProvider + cached records'
+        if not fast.supports_raw_json:
+            name += ' (unused: no orjson.Fragment)'
+        results.append((name, _time(
+            lambda: fast.response({"events": [cache.encoded('driving_event', e['event_id'], e) for e in events]}),
+            repeat)))
+
+    baseline = results[0][1][0]
+    print(f"events={n} (best of {repeat})")
+    for name, (seconds, size) in results:
+        print(f"  {name:<52} {seconds * 1000:8.1f} ms  {size / 1e6:6.2f} MB  {baseline / seconds:5.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stdlib', action='store_true', help='disable orjson in FastJSONProvider')
+    args = parser.parse_args()
+    run(args.events, args.repeat, args.stdlib)
@@ -0,0 +1,110 @@
+"""Driver location heartbeat cost at fleet scale.
+
+Replays N drivers each reporting every --interval seconds, against a simulated clock,
+for --minutes of heartbeats (with 1% of drivers going quiet every interval so expiry has
+work to do). Reports update throughput, the share of time spent expiring, memory, and the
+budget it leaves at the required rate. A second pass measures the full
+PUT /api/drivers/me/location path through the Flask test client.
+
+    PYTHONPATH=. python benchmarks/bench_locations.py --drivers 100000 --interval 4
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.locations import DriverLocationTable
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_table(drivers, interval, minutes, ttl):
+    clock = SimulatedClock()
+    table = DriverLocationTable(ttl_seconds=ttl, clock=clock)
+    rng = random.Random(7)
+    positions = [(-26.2 + rng.random(), 28.0 + rng.random()) for _ in range(drivers)]
+
+    tracemalloc.start()
+    for driver_id, (lat, lon) in enumerate(positions):
+        table.update(driver_id, lat, lon, name=f"driver {driver_id}")
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    rounds = int(minutes * 60 / interval)
+    step = interval / drivers
+    updates = 0
+    expire_seconds = 0.0
+    quiet = set()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        quiet.update(rng.sample(range(drivers), drivers // 100))
+        for driver_id in range(drivers):
+            clock.now += step
+            if driver_id in quiet:
+                continue
+            lat, lon = positions[driver_id]
+            lat += rng.uniform(-1e-4, 1e-4)
+            positions[driver_id] = (lat, lon)
+            table.update(driver_id, lat, lon)
+            updates += 1
+        t = time.perf_counter()
+        table.expire()
+        expire_seconds += time.perf_counter() - t
+    elapsed = time.perf_counter() - started
+
+    required = drivers / interval
+    per_second = updates / elapsed
+    print(f"table: drivers={drivers} interval={interval}s simulated={minutes} min ttl={ttl}s")
+    print(f"  updates             {updates:>12,}")
+    print(f"  throughput          {per_second:>12,.0f} updates/s (need {required:,.0f}/s, "
+          f"{100 * required / per_second:.1f}% of one core)")
+    print(f"  per update          {elapsed / updates * 1e6:>12.2f} us")
+    print(f"  explicit expire()   {expire_seconds * 1000:>12.1f} ms total")
+    print(f"  live after run      {len(table):>12,} (quiet drivers expired: {drivers - len(table):,})")
+    print(f"  memory              {memory / 1e6:>12.1f} MB ({memory / drivers:.0f} B/driver)")
+
+    t = time.perf_counter()
+    for _ in range(1000):
+        table.nearby(-25.7, 28.5, 2.0)
+    print(f"  nearby(2 km)        {(time.perf_counter() - t):>12.3f} ms/query")
+
+
+def run_endpoint(requests_):
+    from app import create_app, users_db
+    from config import TestingConfig
+
+    class BenchConfig(TestingConfig):
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    client = app.test_client()
+    users_db.clear()
+    client.post('/auth/register', json={"name": "Bench Driver", "email": "bench@example.com",
+                                        "password": "password", "user_type": "driver"})
+    token = client.post('/auth/login', json={"email": "bench@example.com", "password": "password"}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    started = time.perf_counter()
+    for i in range(requests_):
+        client.put('/api/drivers/me/location', headers=headers, json={"lat": -26.2 + i * 1e-6, "lon": 28.0})
+    elapsed = time.perf_counter() - started
+    print(f"endpoint: {requests_} PUT /api/drivers/me/location via test client")
+    print(f"  per request         {elapsed / requests_ * 1e6:>12.0f} us ({requests_ / elapsed:,.0f} req/s per core)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drivers', type=int, default=100000)
+    parser.add_argument('--interval', type=float, default=4.0)
+    parser.add_argument('--minutes', type=float, default=1.0)
+    parser.add_argument('--ttl', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    run_table(args.drivers, args.interval, args.minutes, args.ttl)
+    run_endpoint(args.requests)
@@ -0,0 +1,58 @@
+"""Pooling match pass throughput at peak pending volume.
+
+Fills a PoolingEngine with --pending pooled rides in a 40 x 40 km city. Trips start
+around --hubs popular pickup areas and head to random destinations 3-15 km away.
+It then times one matching pass and reports how many candidate pairs and triples
+were evaluated (against the n^2/2 pairs of a naive search), how many groups were
+proposed, and the distance they save.
+
+    PYTHONPATH=. python benchmarks/bench_pooling.py --pending 1000 5000 20000
+"""
+import argparse
+import math
+import random
+import time
+
+from app.pooling import PoolingEngine
+
+CENTER = (-26.15, 28.05)  # Johannesburg
+KM_PER_DEGREE = 111.32
+
+
+def _offset(lat, lon, dx_km, dy_km):
+    return lat + dy_km / KM_PER_DEGREE, lon + dx_km / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+
+
+def _fill(engine, n, hubs, rng):
+    hub_points = [_offset(*CENTER, rng.uniform(-20, 20), rng.uniform(-20, 20)) for _ in range(hubs)]
+    for ride_id in range(1, n + 1):
+        hub = rng.choice(hub_points)
+        pickup = _offset(*hub, rng.gauss(0, 1.0), rng.gauss(0, 1.0))
+        angle, distance = rng.uniform(0, 2 * math.pi), rng.uniform(3, 15)
+        dropoff = _offset(*pickup, distance * math.cos(angle), distance * math.sin(angle))
+        engine.update({"id": ride_id, "status": "pending", "pool": True, "group_id": None,
+                       "pickup_lat": pickup[0], "pickup_lon": pickup[1],
+                       "dropoff_lat": dropoff[0], "dropoff_lon": dropoff[1]})
+
+
+def run(pending_counts, hubs):
+    print(f"{'pending':>8} {'pass':>9} {'rides/s':>9} {'pairs':>9} {'naive pairs':>13} {'triples':>8} "
+          f"{'groups':>7} {'pooled':>7} {'saved km':>9}")
+    for n in pending_counts:
+        engine = PoolingEngine()
+        _fill(engine, n, hubs, random.Random(3))
+        started = time.perf_counter()
+        groups, stats = engine.match()
+        elapsed = time.perf_counter() - started
+        pooled = sum(len(ride_ids) for ride_ids, _, _, _ in groups)
+        saved = sum(saved_km for _, _, saved_km, _ in groups)
+        print(f"{n:>8,} {elapsed:>8.2f}s {n / elapsed:>9,.0f} {stats['pairs_checked']:>9,} {n * (n - 1) // 2:>13,} "
+              f"{stats['triples_checked']:>8,} {len(groups):>7,} {pooled:>7,} {saved:>9,.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pending', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--hubs', type=int, default=40)
+    args = parser.parse_args()
+    run(args.pending, args.hubs)
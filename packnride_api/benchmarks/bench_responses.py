@@ -0,0 +1,91 @@
+"""Bytes on the wire per request with sparse fieldsets, the compact profile and compression.
+
+Fills the stores with --rides rides for one passenger and --events driving events
+for one driver, then requests a ride page, one ride, and the driver's events in
+each response shape, without and with Accept-Encoding (gzip, and br when the
+brotli package is installed), and prints the mean response size and time per
+request. Also times compiling a field set against the cached lookup requests use.
+
+    PYTHONPATH=. python benchmarks/bench_responses.py --rides 200 --events 500 --repeat 200
+"""
+import argparse
+import datetime
+import time
+
+from app import create_app
+from app.response_profiles import brotli, compile_shape, shape_for
+from config import TestingConfig
+
+
+class BenchConfig(TestingConfig):
+    RATELIMIT_ENABLED = False
+
+
+SHAPES = {
+    'rides page': ('/api/rides/mine?limit=50', 'rides.id,rides.status,rides.driver_id,rides.requested_at,next_cursor'),
+    'ride': ('/api/rides/1', 'id,status,driver_id,eta'),
+    'driver events': ('/api/monitoring/drivers/2/events', 'events.event_type,events.timestamp'),
+}
+
+
+def _fill(client, rides, events):
+    def register(email, user_type):
+        client.post('/auth/register', json={"name": email, "email": email, "password": "pw", "user_type": user_type})
+        token = client.post('/auth/login', json={"email": email, "password": "pw"}).get_json()['access_token']
+        return {'Authorization': f'Bearer {token}'}
+
+    passenger, driver = register('passenger@example.com', 'passenger'), register('driver@example.com', 'driver')
+    for i in range(rides):
+        client.post('/api/rides/request', headers=passenger, json={
+            "pickup_location": f"{i} Jan Smuts Avenue", "dropoff_location": f"{i} Oxford Road",
+            "pickup_lat": -26.15 + i * 1e-4, "pickup_lon": 28.03, "dropoff_lat": -26.1, "dropoff_lon": 28.05})
+    started = datetime.datetime(2026, 1, 1)
+    for i in range(events):
+        client.post('/api/monitoring/events', headers=driver, json={
+            "driver_id": 2, "event_type": ("speeding", "harsh_braking", "idling")[i % 3],
+            "timestamp": (started + datetime.timedelta(seconds=i)).isoformat(),
+            "location_lat": -26.2 + i * 1e-5, "location_lon": 28.04, "details": {"speed_kmh": 60 + i % 40}})
+    return {'rides page': passenger, 'ride': passenger, 'driver events': driver}
+
+
+def run(rides, events, repeat):
+    app = create_app(BenchConfig)
+    client = app.test_client()
+    headers = _fill(client, rides, events)
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    print(f"{'response':<14} {'shape':<16} " + ' '.join(f"{e + ' B':>10} {'us':>6}" for e in encodings))
+    for name, (path, fields) in SHAPES.items():
+        sep = '&' if '?' in path else '?'
+        variants = {'full': path, 'fields': f"{path}{sep}fields={fields}", 'compact': f"{path}{sep}profile=compact",
+                    'compact+fields': f"{path}{sep}profile=compact&fields={fields}"}
+        for shape, url in variants.items():
+            cells = []
+            for encoding in encodings:
+                request_headers = dict(headers[name], **{'Accept-Encoding': encoding})
+                size, started = 0, time.perf_counter()
+                for _ in range(repeat):
+                    size += len(client.get(url, headers=request_headers).data)
+                cells.append(f"{size / repeat:>10,.0f} {(time.perf_counter() - started) / repeat * 1e6:>6.0f}")
+            print(f"{name:<14} {shape:<16} " + ' '.join(cells))
+
+    spec = SHAPES['rides page'][1]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        shape_for.cache_clear()
+        compile_shape.cache_clear()
+        shape_for(spec, 'compact')
+    compiled = (time.perf_counter() - started) / repeat * 1e6
+    started = time.perf_counter()
+    for _ in range(repeat):
+        shape_for(spec, 'compact')
+    cached = (time.perf_counter() - started) / repeat * 1e6
+    print(f"\nfield set compile: {compiled:.1f} us; cached lookup: {cached:.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rides', type=int, default=200)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rides, args.events, args.repeat)
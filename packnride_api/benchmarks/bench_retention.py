@@ -0,0 +1,105 @@
+"""Memory and latency before and after a retention compaction pass.
+
+Fills driving_events_db with --events synthetic events spread over --days days,
+in bursts of 5-20 events per driver-hour (events are only logged while driving),
+then runs one compaction pass under the default policies. It reports the memory
+held by the stores (sizes of the record dicts and their values) and the time of a per-driver event scan (what
+GET /drivers/<id>/events does) before and after the pass. While the pass runs, a
+probe thread wakes every millisecond, standing in for request threads; the report
+compares its worst wake-up delays with an idle run.
+
+    PYTHONPATH=. python benchmarks/bench_retention.py --events 1000000 --days 120
+"""
+import argparse
+import datetime
+import random
+import threading
+import time
+import sys
+
+from app import driving_events_db, event_summaries_db
+from app.retention import retention
+
+EVENT_TYPES = ('speeding', 'hard_braking', 'idling', 'rapid_acceleration', 'phone_use')
+
+
+def _fill(n, days, drivers, rng):
+    now = datetime.datetime.utcnow()
+    event_id = 0
+    while event_id < n:
+        driver_id = rng.randint(1, drivers)
+        hour = now - datetime.timedelta(hours=rng.randrange(days * 24))
+        for _ in range(min(rng.randint(5, 20), n - event_id)):
+            event_id += 1
+            _add(event_id, driver_id, hour.replace(minute=rng.randrange(60)), rng)
+
+
+def _add(event_id, driver_id, moment, rng):
+    event = {"event_id": event_id, "driver_id": driver_id, "ride_id": None,
+             "event_type": rng.choice(EVENT_TYPES), "timestamp": moment.isoformat(),
+             "location_lat": -25.7 + rng.random() / 10, "location_lon": 28.2 + rng.random() / 10,
+             "details": {}, "logged_at": moment.isoformat(), "version": 1}
+    driving_events_db[event_id] = event
+    retention.event_logged(event)
+
+
+def _store_bytes():
+    total = 0
+    for store in (driving_events_db, event_summaries_db):
+        total += sys.getsizeof(store)
+        for key, record in store.items():
+            total += sys.getsizeof(key) + sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+    return total
+
+
+def _scan_ms(driver_id):
+    started = time.perf_counter()
+    [e for e in driving_events_db.values() if e['driver_id'] == driver_id]
+    return (time.perf_counter() - started) * 1000
+
+
+def _probe(stop, delays):
+    while not stop.is_set():
+        started = time.perf_counter()
+        time.sleep(0.001)
+        delays.append((time.perf_counter() - started - 0.001) * 1000)
+
+
+def _worst(delays):
+    delays = sorted(delays)
+    return delays[int(len(delays) * 0.99)], delays[-1]
+
+
+def _probed(fn):
+    stop, delays = threading.Event(), []
+    probe = threading.Thread(target=_probe, args=(stop, delays))
+    probe.start()
+    result = fn()
+    stop.set()
+    probe.join()
+    return result, _worst(delays)
+
+
+def run(n, days, drivers):
+    rng = random.Random(5)
+    _fill(n, days, drivers, rng)
+    before = _store_bytes()
+    scan_before = _scan_ms(1)
+    print(f"events={n:,} over {days} days: {before / 1e6:.0f} MB in the stores, driver scan {scan_before:.0f} ms")
+
+    _, (idle_p99, idle_max) = _probed(lambda: time.sleep(2))
+    report, (p99, worst) = _probed(retention.run_pass)
+    after = _store_bytes()
+    print(f"pass: {report['events_compacted']:,} events compacted into {len(event_summaries_db):,} summaries "
+          f"in {report['seconds']} s, {report['slices']} slices, longest {report['max_slice_ms']} ms")
+    print(f"after: {len(driving_events_db):,} raw events, {after / 1e6:.0f} MB in the stores, driver scan {_scan_ms(1):.0f} ms")
+    print(f"probe wake-up delay p99/max: idle {idle_p99:.2f}/{idle_max:.2f} ms, during pass {p99:.2f}/{worst:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--drivers', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.events, args.days, args.drivers)
@@ -0,0 +1,52 @@
+"""Ride history lookup latency and index memory versus total ride count.
+
+Builds rides for --users passengers (and drivers), then times a 20-ride page for
+one user through RideHistoryIndex against scanning rides_db, for each total ride
+count given.
+
+    PYTHONPATH=. python benchmarks/bench_ride_history.py --rides 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from app.ride_history import RideHistoryIndex
+
+
+def _time(fn, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def run(ride_counts, users):
+    print(f"{'rides':>10} {'index page':>12} {'filtered page':>14} {'full scan':>12} {'index memory':>14} {'B/ride':>7}")
+    for total in ride_counts:
+        rng = random.Random(1)
+        rides = {}
+        index = RideHistoryIndex()
+        for ride_id in range(1, total + 1):
+            passenger_id, driver_id = rng.randrange(users), rng.randrange(users)
+            rides[ride_id] = {"id": ride_id, "passenger_id": passenger_id, "driver_id": driver_id,
+                              "status": rng.choice(('completed', 'completed', 'completed', 'cancelled'))}
+            index.add('passenger', passenger_id, ride_id)
+            index.add('driver', driver_id, ride_id)
+
+        user_id = 42
+        indexed = _time(lambda: [rides[i] for i in index.page('passenger', user_id, limit=20)[0]])
+        filtered = _time(lambda: index.page('passenger', user_id, limit=20,
+                                            accept=lambda i: rides[i]['status'] == 'cancelled'))
+        scan = _time(lambda: sorted((r for r in rides.values() if r['passenger_id'] == user_id),
+                                    key=lambda r: r['id'], reverse=True)[:20], repeat=max(1, 2000000 // total))
+        memory = index.memory_bytes()
+        print(f"{total:>10,} {indexed * 1e6:>10.1f}us {filtered * 1e6:>12.1f}us {scan * 1e3:>10.2f}ms "
+              f"{memory / 1e6:>11.1f} MB {memory / total:>7.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rides', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.rides, args.users)
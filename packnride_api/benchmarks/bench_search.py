@@ -0,0 +1,71 @@
+"""Incident search latency and index memory at scale.
+
+Indexes --reports synthetic incident reports (a few hundred common words, plus rare
+plate numbers), then times ranked queries with and without driver/status filters,
+against a linear substring scan over the same reports.
+
+    PYTHONPATH=. python benchmarks/bench_search.py --reports 1000000
+"""
+import argparse
+import random
+import time
+
+from app.search import IncidentSearchIndex
+
+WORDS = ("passenger driver complained late rude route traffic phone left behind music loud vehicle "
+         "speeding accident minor collision scratch door window payment cash card refund fare overcharged "
+         "airport station mall pickup dropoff waited cancelled app gps wrong address smell smoke clean "
+         "dirty seat belt air conditioning radio helpful friendly polite police stopped tyre flat").split()
+STATUSES = ('open', 'investigating', 'resolved', 'closed')
+TYPES = ('complaint', 'minor_accident', 'lost_item', 'payment_dispute', 'safety')
+
+
+def _reports(n, rng):
+    for report_id in range(1, n + 1):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+        if rng.random() < 0.001:
+            words.append(f"CA {rng.randint(100, 999)}-{rng.randint(100, 999)}")
+        yield {"report_id": report_id, "driver_id": rng.randint(1, 20000), "status": rng.choice(STATUSES),
+               "incident_type": rng.choice(TYPES), "description": ' '.join(words), "resolution_notes": None}
+
+
+def _time(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def run(n, repeat):
+    rng = random.Random(11)
+    index = IncidentSearchIndex()
+    reports = []
+    started = time.perf_counter()
+    for report in _reports(n, rng):
+        index.add(report)
+        reports.append(report)
+    build = time.perf_counter() - started
+    print(f"reports={n:,} indexed in {build:.1f} s, index memory {index.memory_bytes() / 1e6:.1f} MB")
+
+    plate = next(r['description'].split('CA ')[1] for r in reversed(reports) if 'CA ' in r['description'])
+    queries = [
+        ("rare plate number", f"CA {plate}", {}),
+        ("two common terms (AND)", "passenger complained", {}),
+        ("two common terms + driver", "passenger complained", {"driver_id": 42}),
+        ("two common terms + status", "passenger complained", {"status": "open"}),
+        ("three terms (OR)", "refund fare overcharged", {"match_all": False}),
+    ]
+    for name, query, options in queries:
+        seconds, (total, _hits) = _time(lambda: index.search(query, 20, **options), repeat)
+        print(f"  {name:<28} {seconds * 1000:9.1f} ms  {total:>9,} matches")
+
+    seconds, _ = _time(lambda: [r for r in reports if 'complained' in r['description']][:20], 1)
+    print(f"  {'linear scan (one term)':<28} {seconds * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.reports, args.repeat)
@@ -0,0 +1,96 @@
+"""Single rides store vs region shards (app/shards.py).
+
+Preloads --rides rides spread over --cities cities, then for --seconds runs --writers
+threads accepting random pending rides (compare_and_set, as POST /rides/<id>/accept
+does) alongside one dispatcher thread listing the pending rides of one city after
+another. On the single store the dispatcher filters every ride by position; on the
+sharded store it reads the city's shard. Finally it times the cross-region query
+behind GET /api/drivers/nearby without a position (drivers on an active ride), as
+one scan and fanned out with map_shards.
+
+    PYTHONPATH=. python benchmarks/bench_shards.py --rides 500000 --cities 20 --writers 4 --seconds 5
+"""
+import argparse
+import random
+import threading
+import time
+
+from app.shards import RegionShardedStore, ride_position
+from app.snapshots import SnapshotDict
+from app.versioning import compare_and_set
+
+
+def _cities(count, rng):
+    # Far enough apart to fall in different ~156 km regions.
+    return [(-35 + 1.6 * (i % 10) + rng.random() * 0.2, 18 + 1.6 * (i // 10) + rng.random() * 0.2) for i in range(count)]
+
+
+def _busy(rides):
+    return {r['driver_id'] for r in rides.values() if r['driver_id'] is not None and r['status'] not in ('completed', 'cancelled')}
+
+
+def run_mode(mode, rides, cities, writers, seconds, threads):
+    rng = random.Random(1)
+    centres = _cities(cities, rng)  # pickups fall within 0.1 degrees north-east of these
+    sharded = RegionShardedStore(ride_position, 3, threads)
+    store = sharded if mode == 'sharded' else SnapshotDict()
+    for ride_id in range(1, rides + 1):
+        lat, lon = centres[ride_id % cities]
+        store[ride_id] = {"id": ride_id, "driver_id": None, "status": "pending", "version": 1,
+                          "pickup_lat": lat + rng.random() * 0.1, "pickup_lon": lon + rng.random() * 0.1}
+    stop = threading.Event()
+    latencies, scans = [], []
+
+    def write(seed):
+        rng, mine = random.Random(seed), []
+        while not stop.is_set():
+            ride_id = rng.randint(1, rides)
+            ride = store[ride_id]
+            started = time.perf_counter()
+            compare_and_set(store, ride_id, dict(ride, driver_id=seed, status='accepted', version=ride['version'] + 1), ride['version'])
+            mine.append(time.perf_counter() - started)
+            time.sleep(0)
+        latencies.extend(mine)
+
+    def dispatch():
+        city = 0
+        while not stop.is_set():
+            lat, lon = centres[city % cities]
+            started = time.perf_counter()
+            if mode == 'sharded':
+                pending = [r for r in store.shard_at(lat, lon).values() if r['status'] == 'pending']
+            else:
+                pending = [r for r in store.values() if r['status'] == 'pending'
+                           and lat <= r['pickup_lat'] < lat + 0.1 and lon <= r['pickup_lon'] < lon + 0.1]
+            scans.append(time.perf_counter() - started)
+            city += 1
+
+    workers = [threading.Thread(target=write, args=(seed,)) for seed in range(writers)] + [threading.Thread(target=dispatch)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    started = time.perf_counter()
+    busy = set().union(*store.map_shards(_busy)) if mode == 'sharded' else _busy(store)
+    fan_out_ms = (time.perf_counter() - started) * 1e3
+
+    latencies.sort()
+    p = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1e6
+    print(f"{mode:>8} {len(latencies) / seconds:>9,.0f} {p(0.5):>7.1f} {p(0.99):>8.1f} {len(scans) / seconds:>8.1f} "
+          f"{sum(scans) / max(len(scans), 1) * 1e3:>8.2f} {fan_out_ms:>9.1f} {len(busy):>7,}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rides', type=int, default=500000)
+    parser.add_argument('--cities', type=int, default=20)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8, help='fan-out threads (STORE_FANOUT_THREADS)')
+    args = parser.parse_args()
+    print(f"{'mode':>8} {'accepts/s':>9} {'p50 us':>7} {'p99 us':>8} {'lists/s':>8} {'list ms':>8} {'busy ms':>9} {'busy':>7}")
+    for mode in ('single', 'sharded'):
+        run_mode(mode, args.rides, args.cities, args.writers, args.seconds, args.threads)
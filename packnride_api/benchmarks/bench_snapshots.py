@@ -0,0 +1,93 @@
+"""Reader/writer contention: admin scans of a store while other threads insert into it.
+
+Preloads --records incident-like records, then for --seconds runs --writers threads
+inserting new records (timing each insert) alongside one reader thread that scans the
+whole store the way GET /api/monitoring/incidents does (filter, sort). Three ways of
+sharing the store are compared:
+
+    dict      a plain dict, scanned live: the scan can fail with "dictionary changed size"
+    lock      a plain dict behind one lock, held by the reader for the whole scan
+    snapshot  app/snapshots.py SnapshotDict: the reader scans a copy-on-write snapshot
+
+    PYTHONPATH=. python benchmarks/bench_snapshots.py --records 200000 --writers 4 --seconds 5
+"""
+import argparse
+import itertools
+import threading
+import time
+
+from app.snapshots import SnapshotDict
+
+
+def _record(report_id):
+    return {"report_id": report_id, "driver_id": report_id % 500, "status": "open" if report_id % 3 else "resolved",
+            "created_at": f"2026-01-01T00:00:{report_id % 60:02d}", "description": "late pickup"}
+
+
+def _scan(values):
+    reports = [r for r in values if r['status'] == 'open']
+    reports.sort(key=lambda r: r['created_at'], reverse=True)
+    return len(reports)
+
+
+def run_mode(mode, records, writers, seconds):
+    store = SnapshotDict() if mode == 'snapshot' else {}
+    lock = threading.Lock()
+    for report_id in range(1, records + 1):
+        store[report_id] = _record(report_id)
+    ids = itertools.count(records + 1)
+    stop = threading.Event()
+    latencies, scans, errors = [], [], [0]
+
+    def write():
+        mine = []
+        while not stop.is_set():
+            report_id = next(ids)
+            started = time.perf_counter()
+            if mode == 'lock':
+                with lock:
+                    store[report_id] = _record(report_id)
+            else:
+                store[report_id] = _record(report_id)
+            mine.append(time.perf_counter() - started)
+            time.sleep(0)  # let the other threads interleave, as request threads would
+        latencies.extend(mine)
+
+    def read():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                if mode == 'lock':
+                    with lock:
+                        _scan(store.values())
+                else:
+                    _scan(store.values())
+            except RuntimeError:
+                errors[0] += 1
+                continue
+            scans.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=write) for _ in range(writers)] + [threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1e6
+    print(f"{mode:>8} {len(latencies) / seconds:>10,.0f} {p(0.5):>8.1f} {p(0.99):>9.1f} {latencies[-1] * 1e3:>8.1f} "
+          f"{len(scans) / seconds:>7.1f} {sum(scans) / max(len(scans), 1) * 1e3:>9.1f} {errors[0]:>7,}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--modes', nargs='+', default=['dict', 'lock', 'snapshot'])
+    args = parser.parse_args()
+    print(f"{'mode':>8} {'writes/s':>10} {'p50 us':>8} {'p99 us':>9} {'max ms':>8} {'scans/s':>7} {'scan ms':>9} {'errors':>7}")
+    for mode in args.modes:
+        run_mode(mode, args.records, args.writers, args.seconds)
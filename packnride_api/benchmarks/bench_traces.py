@@ -0,0 +1,76 @@
+"""Memory per trip minute of stored GPS traces.
+
+Simulates a trip sampled at --hz and compares the compact trace (app/polyline.py)
+with keeping the points as a list of dicts or as JSON text, plus the cost of
+decoding and simplifying it for display.
+
+    PYTHONPATH=. python benchmarks/bench_traces.py --minutes 30 --hz 1
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+from app.polyline import new_trace, append_points, decode_points, simplify, encode_polyline
+
+
+def _trip(minutes, hz):
+    rng = random.Random(3)
+    lat, lon, heading, t = -33.9249, 18.4241, 0.0, 1700000000.0
+    points = []
+    for _ in range(int(minutes * 60 * hz)):
+        heading += rng.uniform(-0.15, 0.15)
+        step = rng.uniform(5, 15) / hz / 111320  # 5-15 m/s in degrees
+        lat += step * math.cos(heading)
+        lon += step * math.sin(heading) / math.cos(math.radians(lat))
+        t += 1 / hz
+        points.append((round(lat, 6), round(lon, 6), t))
+    return points
+
+
+def _deep_size(points):
+    size = sys.getsizeof(points)
+    for p in points:
+        size += sys.getsizeof(p) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in p.items())
+    return size
+
+
+def run(minutes, hz, batch):
+    points = _trip(minutes, hz)
+    trace = new_trace(1)
+    started = time.perf_counter()
+    for i in range(0, len(points), batch):
+        append_points(trace, points[i:i + batch])
+    append_seconds = time.perf_counter() - started
+
+    as_dicts = [{"lat": lat, "lon": lon, "t": t} for lat, lon, t in points]
+    rows = [
+        ("compact trace (encoded str)", sys.getsizeof(trace['encoded'])),
+        ("JSON text of points", len(json.dumps(as_dicts))),
+        ("list of point dicts", _deep_size(as_dicts)),
+    ]
+    print(f"trip: {minutes} min at {hz} Hz = {len(points)} points, appended in batches of {batch}")
+    for name, size in rows:
+        print(f"  {name:<30} {size / minutes:>10,.0f} B/trip minute  {size / len(points):6.1f} B/point")
+
+    started = time.perf_counter()
+    decoded = decode_points(trace['encoded'])
+    decode_ms = (time.perf_counter() - started) * 1000
+    print(f"  append total {append_seconds * 1000:.1f} ms, full decode {decode_ms:.1f} ms")
+    for tolerance in (2, 5, 20):
+        started = time.perf_counter()
+        simplified = simplify(decoded, tolerance)
+        ms = (time.perf_counter() - started) * 1000
+        print(f"  simplify {tolerance:>2} m: {len(simplified):>6} points, "
+              f"{len(encode_polyline(simplified)):>6} B polyline, {ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--hz', type=float, default=1)
+    parser.add_argument('--batch', type=int, default=30)
+    args = parser.parse_args()
+    run(args.minutes, args.hz, args.batch)
@@ -0,0 +1,105 @@
+"""Webhook delivery throughput from the outbox to local stub endpoints.
+
+Starts a threaded HTTP/1.1 receiver that takes --latency-ms per request, registers
+--endpoints endpoints on it and writes --notifications notifications to the outbox,
+spread over the endpoints. It then times the dispatcher delivering them with and
+without batching and keep-alive, and compares an inline POST per notification
+(a new connection each time, as a request handler would do it).
+
+    PYTHONPATH=. python benchmarks/bench_webhooks.py --notifications 20000 --endpoints 4 --latency-ms 5
+"""
+import argparse
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app import webhook_endpoints_db, webhook_outbox_db
+from app.webhooks import webhooks
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        if not self.server.keep_alive:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _receiver(latency, keep_alive):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.latency, server.keep_alive = latency, keep_alive
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _ride(ride_id):
+    return {"id": ride_id, "passenger_id": 1, "driver_id": 2, "pickup_location": "Rosebank",
+            "dropoff_location": "Sandton", "status": "accepted", "version": 2}
+
+
+def _deliver(n, endpoints, latency, batch_size, keep_alive):
+    server = _receiver(latency, keep_alive)
+    webhook_endpoints_db.clear()
+    webhook_outbox_db.clear()
+    webhooks.clear()
+    for endpoint_id in range(1, endpoints + 1):
+        webhook_endpoints_db[endpoint_id] = {"id": endpoint_id, "events": [f'bench.{endpoint_id}'], "secret": 'x',
+                                             "url": f"http://127.0.0.1:{server.server_address[1]}/e{endpoint_id}"}
+    webhooks.senders, webhooks.batch_size = 16, batch_size
+    started = time.perf_counter()
+    for ride_id in range(n):
+        webhooks.notify(f'bench.{ride_id % endpoints + 1}', _ride(ride_id))
+    enqueued = time.perf_counter() - started
+    webhooks.start()
+    webhooks.wait_idle(timeout=600)
+    elapsed = time.perf_counter() - started
+    stats = webhooks.stats()
+    webhooks.stop()
+    server.shutdown()
+    server.server_close()
+    return enqueued, elapsed, stats
+
+
+def _inline(n, latency):
+    server = _receiver(latency, keep_alive=False)
+    url = f"http://127.0.0.1:{server.server_address[1]}/inline"
+    started = time.perf_counter()
+    for ride_id in range(n):
+        request = urllib.request.Request(url, data=b'{"notifications":[]}', headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(request).read()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+    return elapsed
+
+
+def run(n, endpoints, latency_ms):
+    latency = latency_ms / 1000
+    inline_n = min(n, 1000)
+    inline = _inline(inline_n, latency)
+    print(f"inline POST per notification: {inline_n / inline:>8,.0f} notifications/s, "
+          f"{inline / inline_n * 1000:.1f} ms added to each request")
+    print(f"{'batch':>5} {'keep-alive':>10} {'enqueue/notif':>14} {'delivered/s':>12} {'requests':>9} {'connections':>11}")
+    for batch_size, keep_alive in ((1, False), (1, True), (50, True)):
+        enqueued, elapsed, stats = _deliver(n, endpoints, latency, batch_size, keep_alive)
+        print(f"{batch_size:>5} {str(keep_alive):>10} {enqueued / n * 1e6:>11.1f} us {stats['delivered'] / elapsed:>12,.0f} "
+              f"{stats['requests']:>9,} {stats['connections']:>11,}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--notifications', type=int, default=20000)
+    parser.add_argument('--endpoints', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    args = parser.parse_args()
+    run(args.notifications, args.endpoints, args.latency_ms)
@@ -0,0 +1,101 @@
+"""Throughput of serve.py as the number of pre-forked workers grows.
+
+For each worker count, starts serve.py on a fresh shared store, seeds one passenger and
+ride, and hammers GET /api/rides/<id> from several client processes.
+
+    PYTHONPATH=. python benchmarks/bench_workers.py --workers 1 2 4 --clients 8 --seconds 5
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _request(conn, method, path, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def _seed(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    _request(conn, 'POST', '/auth/register', {"name": "Bench", "email": "bench@example.com",
+                                               "password": "pw", "user_type": "passenger"})
+    _, body = _request(conn, 'POST', '/auth/login', {"email": "bench@example.com", "password": "pw"})
+    token = json.loads(body)['access_token']
+    _, body = _request(conn, 'POST', '/api/rides/request',
+                       {"pickup_location": "A", "dropoff_location": "B"}, token)
+    return token, json.loads(body)['ride']['id']
+
+
+def _client(port, token, ride_id, seconds, out):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        status, _ = _request(conn, 'GET', f'/api/rides/{ride_id}', token=token)
+        if status == 200:
+            done += 1
+    out.put(done)
+
+
+def _wait_ready(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            if _request(conn, 'GET', '/health')[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def run(workers, clients, seconds, port):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, RATELIMIT_ENABLED='false', MAX_CONCURRENT_REQUESTS='0',
+                   PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py'), '--workers', str(workers),
+                                   '--host', '127.0.0.1', '--port', str(port),
+                                   '--store', os.path.join(tmp, 'store.sqlite3')],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_ready(port)
+            token, ride_id = _seed(port)
+            out = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=_client, args=(port, token, ride_id, seconds, out))
+                     for _ in range(clients)]
+            for p in procs:
+                p.start()
+            total = sum(out.get() for _ in procs)
+            for p in procs:
+                p.join()
+        finally:
+            server.terminate()
+            server.wait(10)
+    return total / seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=5057)
+    args = parser.parse_args()
+    print(f"cpus={os.cpu_count()} clients={args.clients}")
+    baseline = None
+    for n in args.workers:
+        rps = run(n, args.clients, args.seconds, args.port)
+        baseline = baseline or rps
+        print(f"  workers={n:<3} {rps:8.0f} req/s  ({rps / baseline:.2f}x)")
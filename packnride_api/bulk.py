@@ -0,0 +1,348 @@
+"""Bulk export and import of the shared store (the SQLite file serve.py runs on).
+
+    python bulk.py export --store packnride_store.sqlite3 dump.ndjson.gz
+    python bulk.py import --store packnride_store.sqlite3 dump.ndjson.gz [--renumber]
+
+A dump is NDJSON: a header line, then one {"store": ..., "record": {...}} line per
+record, users first so that everything referring to them comes later. Files ending
+in .gz are read and written gzip-compressed, and "-" is stdin/stdout. Export streams
+each table straight from SQLite in one read snapshot; the stored JSON is copied
+into the dump without being decoded.
+
+Import writes BATCH_SIZE records per transaction. Records keep their IDs (the ID
+counters are moved past them); records without one get IDs reserved in blocks of
+ID_BLOCK. With --renumber every record gets a new ID and references to users, rides
+are rewritten, so a dump can be merged into a store that already has data; users
+whose email already exists are mapped to the existing account instead. Users may
+carry a password_hash (any scheme passlib recognises) or a plain password, which is
+hashed here at bcrypt's cost of a fraction of a second each.
+
+Imports are not written to the change log: run them with the servers stopped, since
+workers build their indexes from the stores when they start.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import sys
+import time
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson installed
+    orjson = None
+
+FORMAT = {"format": "packnride-dump", "version": 1}
+BATCH_SIZE = 10000
+ID_BLOCK = 10000
+
+# store -> (ID counter, ID field); the order is the dump order.
+STORES = {
+    'users': ('user', 'id'),
+    'rides': ('ride', 'id'),
+    'driving_events': ('driving_event', 'event_id'),
+    'event_summaries': (None, None),
+    'driver_scores': (None, None),
+    'incident_reports': ('incident_report', 'report_id'),
+}
+
+if orjson is not None:
+    _loads = orjson.loads
+
+    def _dumps(value):
+        return orjson.dumps(value).decode()
+else:  # pragma: no cover
+    _loads = json.loads
+    _dumps = json.dumps
+
+
+class BulkError(Exception):
+    pass
+
+
+def open_dump(path, mode):
+    """Opens a dump for text reading ('r') or writing ('w'); gzip by extension, '-' for stdio."""
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        return contextlib.nullcontext(stream)
+    if path.endswith('.gz'):
+        # Level 1: several times faster than the default and most of the size saving.
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=1)
+    return open(path, mode, encoding='utf-8')
+
+
+class Progress:
+    """Counts per store, reported on one stderr line at most every `every` seconds."""
+
+    def __init__(self, stream=sys.stderr, every=1.0):
+        self.stream = stream
+        self.every = every
+        self.counts = {}
+        self.started = self._shown = time.monotonic()
+
+    def add(self, store, n=1):
+        self.counts[store] = self.counts.get(store, 0) + n
+        now = time.monotonic()
+        if self.stream is not None and now - self._shown >= self.every:
+            self._shown = now
+            self.stream.write('\r' + self._line(now))
+            self.stream.flush()
+
+    def _line(self, now):
+        total = sum(self.counts.values())
+        parts = ', '.join(f"{store} {n:,}" for store, n in self.counts.items())
+        return f"{parts} ({total / max(now - self.started, 1e-9):,.0f} records/s)"
+
+    def done(self):
+        if self.stream is not None:
+            self.stream.write('\r' + self._line(time.monotonic()) + '\n')
+            self.stream.flush()
+
+
+def export(stores, path, snapshot, only=None, progress=None):
+    """Writes the given stores (default: all) to a dump; returns the record count per store."""
+    progress = progress or Progress(stream=None)
+    with open_dump(path, 'w') as out, snapshot:
+        out.write(json.dumps(FORMAT) + '\n')
+        for name in STORES:
+            if only and name not in only:
+                continue
+            prefix = '{"store":"%s","record":' % name
+            for raw in stores[name].iter_json():
+                out.write(prefix + raw + '}\n')
+                progress.add(name)
+    progress.done()
+    return dict(progress.counts)
+
+
+class Importer:
+    def __init__(self, stores, ids, versions, renumber=False, batch_size=BATCH_SIZE, progress=None):
+        from app.heatmap import hour_of
+        from app.retention import summary_key
+        from app.utils import pwd_context
+        self.stores = stores
+        self.ids = ids
+        self.versions = versions
+        self.renumber = renumber
+        self.batch_size = batch_size
+        self.progress = progress or Progress(stream=None)
+        self.pwd_context = pwd_context
+        self.hour_of, self.summary_key = hour_of, summary_key
+        self.pending = {name: [] for name in STORES}
+        self.blocks = {}  # ID counter -> iterator over its reserved block
+        self.highest = {}  # ID counter -> highest ID written as given
+        self.user_ids = {}  # dump user id -> stored user id (--renumber)
+        self.ride_ids = {}
+        self.skipped = {}
+        self.errors = []
+        self.hashed = 0
+
+    # --- IDs ---
+
+    def _new_id(self, counter):
+        block = self.blocks.get(counter)
+        new_id = next(block, None) if block is not None else None
+        if new_id is None:
+            # Records that kept their ID may be above the counter: reserve past them.
+            if counter in self.highest:
+                self.ids.advance_to(counter, self.highest[counter])
+            block = self.blocks[counter] = iter(self.ids.reserve(counter, ID_BLOCK))
+            new_id = next(block)
+        return new_id
+
+    def _assign_id(self, name, record):
+        counter, field = STORES[name]
+        if counter is None:
+            return
+        if self.renumber or record.get(field) is None:
+            old = record.get(field)
+            record[field] = self._new_id(counter)
+            return old
+        if not isinstance(record[field], int):
+            raise BulkError(f"{field} must be an integer")
+        if record[field] > self.highest.get(counter, 0):
+            self.highest[counter] = record[field]
+        return record[field]
+
+    def _user(self, user_id, required=True):
+        if not self.renumber or user_id is None:
+            return user_id
+        if user_id not in self.user_ids:
+            if required:
+                raise BulkError(f"refers to user {user_id}, which is not earlier in the dump")
+            return None
+        return self.user_ids[user_id]
+
+    # --- records ---
+
+    def _prepare(self, name, record):
+        """Returns the (key, record) to store, None for nothing to store, or raises BulkError."""
+        if name == 'users':
+            return self._prepare_user(record)
+        if name == 'rides':
+            record['passenger_id'] = self._user(record.get('passenger_id'))
+            record['driver_id'] = self._user(record.get('driver_id'))
+            old = self._assign_id(name, record)
+            if self.renumber:
+                if old is not None:
+                    self.ride_ids[old] = record['id']
+                record['group_id'] = None  # groups are proposals; they are not exported
+            return record['id'], record
+        if name == 'driving_events':
+            record['driver_id'] = self._user(record.get('driver_id'))
+            if self.renumber:
+                record['ride_id'] = self.ride_ids.get(record.get('ride_id'))
+            self._assign_id(name, record)
+            return record['event_id'], record
+        if name == 'event_summaries':
+            record['driver_id'] = self._user(record.get('driver_id'))
+            hour = self.hour_of(record.get('hour'))
+            if hour is None or not record.get('event_type'):
+                raise BulkError("event summary needs event_type and an ISO hour")
+            return self.summary_key(record['driver_id'], record['event_type'], hour), record
+        if name == 'driver_scores':
+            record['driver_id'] = self._user(record.get('driver_id'))
+            return record['driver_id'], record
+        # incident_reports
+        record['driver_id'] = self._user(record.get('driver_id'))
+        record['reported_by_user_id'] = self._user(record.get('reported_by_user_id'), required=False)
+        if self.renumber:
+            record['ride_id'] = self.ride_ids.get(record.get('ride_id'))
+        self._assign_id(name, record)
+        return record['report_id'], record
+
+    def _prepare_user(self, record):
+        email = record.get('email')
+        if not isinstance(email, str) or not email:
+            raise BulkError("user needs an email")
+        password = record.pop('password', None)
+        if record.get('password_hash'):
+            if self.pwd_context.identify(record['password_hash']) is None:
+                raise BulkError(f"password_hash of {email} is not in a recognised format")
+        elif isinstance(password, str) and password:
+            record['password_hash'] = self.pwd_context.hash(password)
+            self.hashed += 1
+        else:
+            raise BulkError(f"user {email} needs a password_hash or password")
+        record.setdefault('is_admin', False)
+        if self.renumber:
+            existing = self.stores['users'].get(email)
+            if existing is not None:
+                if record.get('id') is not None:
+                    self.user_ids[record['id']] = existing['id']
+                return None
+        old = self._assign_id('users', record)
+        if self.renumber and old is not None:
+            self.user_ids[old] = record['id']
+        return email, record
+
+    def add(self, name, record, line_no=None):
+        if name not in STORES:
+            self._skip(name, line_no, f"unknown store {name!r}")
+            return
+        if not isinstance(record, dict):
+            self._skip(name, line_no, "record is not an object")
+            return
+        try:
+            item = self._prepare(name, record)
+        except BulkError as exc:
+            self._skip(name, line_no, str(exc))
+            return
+        if item is None:
+            return
+        record.setdefault('version', 1)
+        batch = self.pending[name]
+        batch.append(item)
+        if len(batch) >= self.batch_size:
+            self._flush(name)
+
+    def _skip(self, name, line_no, reason):
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+        if len(self.errors) < 10:
+            self.errors.append(f"line {line_no}: {reason}" if line_no else reason)
+
+    def _flush(self, name):
+        batch = self.pending[name]
+        if batch:
+            self.stores[name].update_many(batch, encode=_dumps)
+            self.progress.add(name, len(batch))
+            self.pending[name] = []
+
+    def finish(self):
+        for name in STORES:
+            self._flush(name)
+        for counter, highest in self.highest.items():
+            self.ids.advance_to(counter, highest)
+        # Cached list ETags must change.
+        for name in self.progress.counts:
+            self.versions.bump(name)
+        self.progress.done()
+        return {"imported": dict(self.progress.counts), "skipped": dict(self.skipped),
+                "passwords_hashed": self.hashed, "errors": list(self.errors)}
+
+    def load(self, path):
+        """Imports a dump; returns the summary from finish()."""
+        with open_dump(path, 'r') as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    entry = None
+                if not isinstance(entry, dict):
+                    self._skip('?', line_no, "not a JSON object")
+                    continue
+                if 'format' in entry:
+                    if entry.get('format') != FORMAT['format'] or entry.get('version', 0) > FORMAT['version']:
+                        raise BulkError(f"line {line_no}: unsupported dump format {entry}")
+                    continue
+                self.add(entry.get('store'), entry.get('record'), line_no)
+        return self.finish()
+
+
+def open_stores(path):
+    from app.shared_store import SharedStore, SharedIDManager, SharedStoreVersions
+    stores = {name: SharedStore(path, name) for name in STORES}
+    return stores, SharedIDManager(path), SharedStoreVersions(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk export/import of the PacknRide shared store.')
+    parser.add_argument('--store', default=os.environ.get('PACKNRIDE_SHARED_STORE', 'packnride_store.sqlite3'))
+    parser.add_argument('--quiet', action='store_true', help='no progress on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_cmd = commands.add_parser('export', help='write the stores to a dump')
+    export_cmd.add_argument('path', help="dump file (.gz to compress, '-' for stdout)")
+    export_cmd.add_argument('--only', nargs='+', choices=list(STORES), help='stores to export (default: all)')
+    import_cmd = commands.add_parser('import', help='load a dump into the stores')
+    import_cmd.add_argument('path', help="dump file (.gz if compressed, '-' for stdin)")
+    import_cmd.add_argument('--renumber', action='store_true',
+                            help='give every record a new ID, to merge into a store that has data')
+    import_cmd.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from app.shared_store import read_snapshot
+    path = os.path.abspath(args.store)
+    stores, ids, versions = open_stores(path)
+    progress = Progress(stream=None if args.quiet else sys.stderr)
+    if args.command == 'export':
+        export(stores, args.path, read_snapshot(path), only=args.only, progress=progress)
+        return 0
+    try:
+        summary = Importer(stores, ids, versions, renumber=args.renumber, batch_size=args.batch_size,
+                           progress=progress).load(args.path)
+    except BulkError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    for error in summary['errors']:
+        print(f"skipped {error}", file=sys.stderr)
+    print(json.dumps(summary['imported']), file=sys.stderr)
+    if summary['skipped']:
+        print(f"skipped: {json.dumps(summary['skipped'])}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
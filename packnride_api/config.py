@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file (if it exists)
@@ -11,6 +12,136 @@ class Config:
     DEBUG = False
     TESTING = False
 
+    # Idempotency-Key response cache for retried POSTs
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+    IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 10000))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+
+    # Admission control: (tokens per second, burst) per user and route, keyed by endpoint name
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_DEFAULT = (20.0, 40)
+    RATELIMIT_ROUTES = {
+        'monitoring_bp.log_driving_event': (10.0, 50),
+        'auth_bp.register': (1.0, 5),
+        'auth_bp.login': (1.0, 10),
+    }
+    RATELIMIT_EXEMPT = ('health_check',)
+    RATELIMIT_MAX_BUCKETS = 100000
+    RATELIMIT_IDLE_SECONDS = 300
+    # Requests beyond this many in flight get a 503 instead of queueing for a worker
+    MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', 64))
+
+    # Ride status streams and ASGI serving mode (asgi.py)
+    STREAM_KEEPALIVE_SECONDS = 15
+    STREAM_MAX_PER_USER = 5  # open status streams per user, in both serving modes
+    ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', 16))
+    ASGI_MAX_BODY_BYTES = 16 * 1024 * 1024
+
+    # Encoded-bytes cache for immutable records (driving events) embedded in list responses; 0 disables
+    JSON_RECORD_CACHE_SIZE = int(os.environ.get('JSON_RECORD_CACHE_SIZE', 50000))
+
+    # "Changes since" feed: newest entries kept in memory, older ones spilled to this file (or dropped if unset)
+    CHANGELOG_MAX_IN_MEMORY = int(os.environ.get('CHANGELOG_MAX_IN_MEMORY', 100000))
+    CHANGELOG_SPILL_PATH = os.environ.get('CHANGELOG_SPILL_PATH')
+    CHANGELOG_MAX_ROWS = 1000000  # shared-store mode keeps the log in SQLite instead
+    CHANGES_PAGE_LIMIT = 10000
+
+    # Driver location heartbeats: positions expire this long after the last PUT /api/drivers/me/location
+    DRIVER_LOCATION_TTL_SECONDS = int(os.environ.get('DRIVER_LOCATION_TTL_SECONDS', 30))
+    DRIVER_LOCATION_CELL_DEGREES = 0.01  # ~1.1 km grid cells for nearby lookups
+    NEARBY_DEFAULT_RADIUS_KM = 5.0
+    NEARBY_MAX_RADIUS_KM = 50.0
+
+    # Background jobs (app/jobs.py): worker threads, and an NDJSON journal that keeps deferred jobs across restarts
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+    JOBS_QUEUE_PATH = os.environ.get('JOBS_QUEUE_PATH')
+
+    # Shared-ride pooling (app/pooling.py): who may share a vehicle
+    POOL_MAX_PICKUP_KM = 2.0     # between pickups; also the index cell size
+    POOL_MAX_DROPOFF_KM = 3.0    # between dropoffs
+    POOL_MAX_DETOUR = 0.4        # in-vehicle distance at most 1.4x the direct trip
+    POOL_MAX_WAIT_SECONDS = 600  # extra wait before a pickup caused by earlier stops
+    POOL_SPEED_KMH = 30.0
+    POOL_MAX_GROUP_SIZE = 3
+    POOL_MAX_PARTNERS = 8        # best pairs per rider that are extended to triples
+    POOL_MATCH_DELAY_SECONDS = 5  # a pooled request queues one matching pass this much later
+
+    # Travel-time estimates (app/eta.py): a cell-to-cell matrix file, else straight line x circuity at a fixed speed
+    ETA_MATRIX_PATH = os.environ.get('ETA_MATRIX_PATH')
+    ETA_FALLBACK_SPEED_KMH = 25.0
+    ETA_CIRCUITY = 1.3
+    ETA_MAX_BATCH = 1000
+
+    # Partner webhooks (app/webhooks.py): outbox delivery by a pool of senders
+    WEBHOOK_DISPATCH = True          # serve.py dispatches from the first worker only
+    WEBHOOK_SENDERS = int(os.environ.get('WEBHOOK_SENDERS', 8))
+    WEBHOOK_BATCH_SIZE = 50          # notifications per POST
+    WEBHOOK_MAX_CONNECTIONS = 4      # kept-alive connections, and so concurrent requests, per endpoint
+    WEBHOOK_TIMEOUT_SECONDS = 5.0
+    WEBHOOK_MAX_ATTEMPTS = 8
+    WEBHOOK_BACKOFF_SECONDS = 1.0    # doubled after each failed attempt, with jitter
+    WEBHOOK_MAX_BACKOFF_SECONDS = 300.0
+
+    # Traffic capture for replay.py (app/capture.py): rotating gzip NDJSON of every request; unset disables
+    TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH')
+    TRAFFIC_CAPTURE_MAX_BYTES = 64 * 1024 * 1024  # uncompressed bytes per file before it is rotated
+    TRAFFIC_CAPTURE_BACKUPS = 10
+
+    # Responses (app/response_profiles.py): ?fields= projections, ?profile=compact, and gzip/brotli compression
+    RESPONSE_MAX_FIELDS = 100
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024))  # 0 disables compression
+    RESPONSE_GZIP_LEVEL = 5
+    RESPONSE_BROTLI_QUALITY = 4
+
+    # GPS traces appended while a ride is started
+    TRACE_MAX_BATCH_POINTS = 1000
+
+    # Geohash x hour heatmap of driving events and incidents
+    HEATMAP_RETENTION_HOURS = 24 * 90
+    HEATMAP_MAX_QUERY_HOURS = 24 * 31
+
+    # Fleet analytics rollups (one small row per hour, so long ranges are cheap)
+    ANALYTICS_MAX_QUERY_HOURS = 24 * 366
+
+    # Burst detection over driving events: event_type -> (events, within seconds)
+    ANOMALY_RULES = {
+        'hard_braking': (3, 300),
+        'harsh_braking': (3, 300),
+        'rapid_acceleration': (3, 300),
+        'speeding': (5, 600),
+    }
+    ANOMALY_WINDOW_BUCKETS = 10
+    ANOMALY_ALERT_COOLDOWN_SECONDS = 600
+    ANOMALY_MAX_ALERTS = 1000
+    ANOMALY_MAX_DRIVERS = 100000
+    ANOMALY_AUTO_INCIDENT = os.environ.get('ANOMALY_AUTO_INCIDENT', 'false').lower() == 'true'
+
+    # Driving event retention: event_type ('*' = default) -> (days kept raw, days kept as hourly summaries)
+    EVENT_RETENTION_POLICIES = {
+        '*': (30, 365),
+        'hard_braking': (90, 730),
+        'harsh_braking': (90, 730),
+        'speeding': (90, 730),
+        'idling': (7, 90),
+    }
+    RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 300))  # 0: no background compactor
+    RETENTION_SLICE_MS = 5    # longest stretch a compaction slice holds the interpreter
+    RETENTION_PAUSE_MS = 20   # gap between slices, left to request threads
+
+    LEADERBOARD_MAX_K = 1000
+    RIDE_HISTORY_MAX_PAGE = 100
+
+    # In-memory rides and users partitioned by the geohash cell of their pickup / home position (app/shards.py).
+    # 3 gives ~156 km regions, one per metro area; 0 keeps each in a single store
+    STORE_SHARD_PRECISION = int(os.environ.get('STORE_SHARD_PRECISION', 3))
+    # Threads for queries spanning regions. Pure-Python scans only run in parallel on free-threaded builds
+    STORE_FANOUT_THREADS = int(os.environ.get('STORE_FANOUT_THREADS', 1 if getattr(sys, '_is_gil_enabled', lambda: True)() else 8))
+
+    # Path of the SQLite file shared by pre-forked workers (set by serve.py); None keeps data in-process
+    SHARED_STORE_PATH = os.environ.get('PACKNRIDE_SHARED_STORE')
+    # How often each worker applies other workers' writes to its in-memory indexes (shared-store mode)
+    CHANGE_FOLLOW_INTERVAL_MS = 200
+
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
@@ -18,6 +149,14 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
+    # Test clients all share one address and register/login in quick succession
+    RATELIMIT_ROUTES = {'monitoring_bp.log_driving_event': (10.0, 50)}
+    RETENTION_INTERVAL_SECONDS = 0  # tests run compaction passes explicitly
+    ETA_MATRIX_PATH = None  # tests load their own matrices
+    JOBS_WORKERS = 0  # tests run due jobs explicitly
+    JOBS_QUEUE_PATH = None
+    WEBHOOK_SENDERS = 0  # tests start senders against a stub server
+    TRAFFIC_CAPTURE_PATH = None
     # Example: Use an in-memory SQLite database for tests if we add a DB
     # SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
 
@@ -0,0 +1,201 @@
+"""Replays captured traffic (app/capture.py) against a fresh in-process app and reports latencies.
+
+    python replay.py traffic.ndjson.gz --concurrency 8
+    python replay.py traffic.ndjson.gz --pacing original --speed 2
+    python replay.py traffic.ndjson.gz --save new.json --baseline old.json
+
+Requests are sent in captured order through Flask test clients, one per thread, so
+the numbers are the app's own cost without a network in between. --pacing fast
+sends each request as soon as one of --concurrency threads is free; --pacing
+original waits for each request's captured offset (divided by --speed). Requests
+carry a token minted for the captured identity, so no login is needed.
+
+With --concurrency 1 a replay is deterministic: the fresh app hands out the same
+IDs as the captured one, so paths like /api/rides/7/accept refer to the same
+records. With more threads, requests that depend on an earlier one may overtake
+it; the report counts responses whose status differs from the captured one.
+
+Latencies and mean response bytes (as sent: captured Accept-Encoding headers are
+replayed) are grouped by route, with numeric path segments folded into <id>.
+--save writes the report as JSON and --baseline prints the change against a saved
+one, so two builds can be compared on the same workload.
+
+The replay app keeps its data in memory (PACKNRIDE_SHARED_STORE is ignored), and
+does not deliver webhooks, rate-limit, or capture.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def route_of(record):
+    return f"{record['method']} {_ID_SEGMENT.sub('/<id>', record['path'].split('?', 1)[0])}"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def replay_config():
+    from config import app_config
+
+    class ReplayConfig(type(app_config)):
+        TRAFFIC_CAPTURE_PATH = None
+        RATELIMIT_ENABLED = False
+        WEBHOOK_DISPATCH = False
+        RETENTION_INTERVAL_SECONDS = 0
+        JOBS_QUEUE_PATH = None
+
+    return ReplayConfig
+
+
+class Replayer:
+    def __init__(self, app, concurrency=1, pacing='fast', speed=1.0):
+        self.app = app
+        self.concurrency = concurrency
+        self.pacing = pacing
+        self.speed = speed
+        self._clients = threading.local()
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._latencies = {}  # route -> [ms]
+        self._mismatches = {}  # route -> count
+        self._bytes = {}  # route -> response bytes, summed
+        self.sent = self.skipped = 0
+
+    def _token(self, identity):
+        from flask_jwt_extended import create_access_token
+        key = json.dumps(identity, sort_keys=True)
+        token = self._tokens.get(key)
+        if token is None:
+            with self.app.app_context():
+                token = create_access_token(identity=identity, expires_delta=False)
+            self._tokens[key] = token
+        return token
+
+    def _send(self, record):
+        client = getattr(self._clients, 'client', None)
+        if client is None:
+            client = self._clients.client = self.app.test_client()
+        headers = dict(record.get('headers', {}))
+        if record.get('identity') is not None:
+            headers['Authorization'] = f"Bearer {self._token(record['identity'])}"
+        kwargs = {'json': record['body']} if 'body' in record else {}
+        started = time.perf_counter()
+        response = client.open(record['path'], method=record['method'], headers=headers, **kwargs)
+        size = len(response.get_data())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.close()
+        route = route_of(record)
+        with self._lock:
+            self._latencies.setdefault(route, []).append(elapsed_ms)
+            self._bytes[route] = self._bytes.get(route, 0) + size
+            if response.status_code != record['status']:
+                self._mismatches[route] = self._mismatches.get(route, 0) + 1
+
+    def run(self, records):
+        """Replays the records; returns the report."""
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        started = time.perf_counter()
+
+        def send(record):
+            try:
+                self._send(record)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = []
+            for record in records:
+                if record.get('stream'):
+                    self.skipped += 1
+                    continue
+                if self.pacing == 'original':
+                    delay = started + record['t'] / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                slots.acquire()
+                futures.append(pool.submit(send, record))
+                self.sent += 1
+                if len(futures) >= 10000:
+                    for future in futures:
+                        future.result()
+                    futures = []
+            for future in futures:
+                future.result()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        routes = {}
+        for route, values in sorted(self._latencies.items()):
+            values.sort()
+            routes[route] = {"count": len(values), "p50_ms": percentile(values, 0.5),
+                             "p90_ms": percentile(values, 0.9), "p99_ms": percentile(values, 0.99),
+                             "max_ms": values[-1], "status_mismatches": self._mismatches.get(route, 0),
+                             "bytes_per_request": self._bytes.get(route, 0) / len(values)}
+        every = sorted(v for values in self._latencies.values() for v in values)
+        return {"requests": self.sent, "skipped_streams": self.skipped, "seconds": elapsed,
+                "requests_per_second": self.sent / elapsed if elapsed else None,
+                "p50_ms": percentile(every, 0.5), "p90_ms": percentile(every, 0.9),
+                "p99_ms": percentile(every, 0.99), "status_mismatches": sum(self._mismatches.values()),
+                "bytes_per_request": sum(self._bytes.values()) / len(every) if every else None,
+                "routes": routes}
+
+
+def _ms(value):
+    return '-' if value is None else f"{value:.2f}"
+
+
+def print_report(report, baseline=None, out=sys.stdout):
+    print(f"{report['requests']:,} requests in {report['seconds']:.1f} s ({report['requests_per_second']:,.0f}/s), "
+          f"p50 {_ms(report['p50_ms'])} ms, p99 {_ms(report['p99_ms'])} ms, {report.get('bytes_per_request') or 0:,.0f} B/request, "
+          f"{report['status_mismatches']} status mismatches, {report['skipped_streams']} streams skipped", file=out)
+    print(f"{'route':<48} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'diff':>5} {'bytes':>7}"
+          + ('  p50/p99 vs baseline' if baseline else ''), file=out)
+    for route, r in report['routes'].items():
+        line = (f"{route[:48]:<48} {r['count']:>7,} {_ms(r['p50_ms']):>8} {_ms(r['p90_ms']):>8} "
+                f"{_ms(r['p99_ms']):>8} {_ms(r['max_ms']):>8} {r['status_mismatches']:>5} {r.get('bytes_per_request', 0):>7,.0f}")
+        base = (baseline or {}).get('routes', {}).get(route)
+        if base:
+            line += f"  {r['p50_ms'] / base['p50_ms'] - 1:+.0%} / {r['p99_ms'] / base['p99_ms'] - 1:+.0%}"
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay captured PacknRide traffic against a fresh app.')
+    parser.add_argument('capture', help='TRAFFIC_CAPTURE_PATH of the capture (rotated files are included)')
+    parser.add_argument('--pacing', choices=('fast', 'original'), default='fast')
+    parser.add_argument('--speed', type=float, default=1.0, help='with --pacing original, replay this many times faster')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--save', help='write the report as JSON to this file')
+    parser.add_argument('--baseline', help='a report saved by an earlier --save to compare against')
+    args = parser.parse_args(argv)
+
+    # A replay must never write to a real store; empty, so a .env file can't set it either.
+    os.environ['PACKNRIDE_SHARED_STORE'] = ''
+    from app import create_app
+    from app.capture import read_capture
+    app = create_app(replay_config())
+    report = Replayer(app, args.concurrency, args.pacing, args.speed).run(read_capture(args.capture))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Production launcher: N pre-forked workers sharing one listening socket.
+
+Workers keep their data in a local SQLite file (see app/shared_store.py) instead of the
+per-process dicts, so any worker can serve any request and IDs stay globally unique.
+
+    python serve.py --workers 4 --port 5000 --store /var/lib/packnride/store.sqlite3
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def _serve_worker(sock, host, port, index):
+    from werkzeug.serving import make_server
+    from app import create_app
+    from config import app_config
+
+    # Event retention and webhook delivery run in one worker only; the others would race it for the same records.
+    if index != 0:
+        app_config.RETENTION_INTERVAL_SECONDS = 0
+        app_config.WEBHOOK_DISPATCH = False
+    # Each worker journals its own background jobs; a replacement picks up its predecessor's.
+    if app_config.JOBS_QUEUE_PATH:
+        app_config.JOBS_QUEUE_PATH = f"{app_config.JOBS_QUEUE_PATH}.{index}"
+    app = create_app(app_config)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        # os._exit() skips atexit: let running jobs finish here. Queued ones stay in the journal.
+        from app.jobs import jobs
+        jobs.stop(timeout=10)
+
+
+def _spawn(sock, host, port, index):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _serve_worker(sock, host, port, index)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run PacknRide API with pre-forked workers.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--store', default=os.environ.get('PACKNRIDE_SHARED_STORE', 'packnride_store.sqlite3'))
+    args = parser.parse_args()
+
+    # Set before anything imports config/app so every worker uses the shared store.
+    os.environ['PACKNRIDE_SHARED_STORE'] = os.path.abspath(args.store)
+
+    # Importing app creates the store tables once in the master; close its connection
+    # afterwards so no SQLite handle crosses fork().
+    import app  # noqa: F401
+    from app.shared_store import close_connections
+    close_connections()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    print(f"Starting PacknRide API on {args.host}:{args.port} with {args.workers} workers, "
+          f"store: {os.environ['PACKNRIDE_SHARED_STORE']}")
+    # Worker 0 also runs event retention.
+    workers = {_spawn(sock, args.host, args.port, index): index for index in range(args.workers)}
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, _status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if not stopping and index is not None:
+            # Replace crashed workers, but don't spin if they die on startup.
+            time.sleep(0.5)
+            workers[_spawn(sock, args.host, args.port, index)] = index
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,20 @@
 import pytest
-from app import create_app, users_db, rides_db, id_manager, driving_events_db, driver_scores_db, incident_reports_db
+from app import create_app, users_db, rides_db, id_manager, driving_events_db, driver_scores_db, incident_reports_db, trip_traces_db, event_summaries_db, ride_groups_db, webhook_endpoints_db, webhook_outbox_db, store_versions, change_log
+from app.idempotency import idempotency_cache
+from app.json_provider import record_cache
+from app.locations import driver_locations
+from app.heatmap import heatmap
+from app.anomaly import anomaly_detector
+from app.leaderboard import score_index
+from app.ride_history import ride_history
+from app.analytics import rollups
+from app.search import incident_search
+from app.retention import retention
+from app.pooling import pooling
+from app.eta import eta
+from app.jobs import jobs
+from app.webhooks import webhooks
+from app.rate_limit import rate_limiter
 from config import TestingConfig
 
 @pytest.fixture(scope='session')
@@ -17,12 +32,38 @@ def client(app):
     driving_events_db.clear()
     driver_scores_db.clear()
     incident_reports_db.clear()
+    trip_traces_db.clear()
+    event_summaries_db.clear()
+    ride_groups_db.clear()
+    webhook_endpoints_db.clear()
+    webhook_outbox_db.clear()
 
     # Reset IDManager counters
     id_manager.user_id_counter = 0
     id_manager.ride_id_counter = 0
     id_manager.driving_event_id_counter = 0
     id_manager.incident_report_id_counter = 0
+    id_manager.ride_group_id_counter = 0
+    id_manager.webhook_endpoint_id_counter = 0
+    id_manager.notification_id_counter = 0
+    store_versions.reset()
+    change_log.reset()
+
+    idempotency_cache.clear()
+    rate_limiter.reset()
+    record_cache.clear()
+    driver_locations.clear()
+    heatmap.clear()
+    anomaly_detector.clear()
+    score_index.clear()
+    ride_history.clear()
+    rollups.clear()
+    incident_search.clear()
+    retention.clear()
+    pooling.clear()
+    eta.clear()
+    jobs.clear()
+    webhooks.clear()
 
     with app.test_client() as client:
         with app.app_context():
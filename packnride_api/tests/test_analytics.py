@@ -0,0 +1,67 @@
+import datetime
+
+
+def _complete_ride(client, p_headers, d_headers, cancel=False):
+    ride_id = client.post('/api/rides/request', headers=p_headers, json={
+        "pickup_location": "Station", "dropoff_location": "Airport"}).get_json()['ride']['id']
+    if cancel:
+        client.put(f'/api/rides/{ride_id}/status', headers=p_headers, json={"status": "cancelled"})
+        return ride_id
+    client.post(f'/api/rides/{ride_id}/accept', headers=d_headers)
+    for status in ('en_route_pickup', 'arrived_pickup', 'started', 'completed'):
+        client.put(f'/api/rides/{ride_id}/status', headers=d_headers, json={"status": status})
+    return ride_id
+
+
+def test_rollups_follow_ride_transitions_and_events(client, registered_user, registered_driver, registered_admin):
+    p_headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    d_headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    a_headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    for cancel in (False, False, True):
+        _complete_ride(client, p_headers, d_headers, cancel)
+    client.post('/api/rides/request', headers=p_headers, json={"pickup_location": "A", "dropoff_location": "B"})
+    for _ in range(3):
+        client.post('/api/monitoring/events', headers=a_headers, json={
+            "driver_id": registered_driver["id"], "event_type": "idling",
+            "timestamp": datetime.datetime.utcnow().isoformat(), "location_lat": 0.0, "location_lon": 0.0})
+
+    summary = client.get('/api/analytics/rides/summary', headers=a_headers).get_json()
+    assert (summary['requested'], summary['completed'], summary['cancelled']) == (4, 2, 1)
+    assert summary['completion_rate'] == 0.5 and summary['cancellation_rate'] == 0.25
+    assert summary['rides_by_status'] == {"completed": 2, "cancelled": 1, "pending": 1}
+    assert summary['average_fare'] is not None
+    assert summary['events_per_driver_hour'] == 3
+
+    hourly = client.get('/api/analytics/rides/hourly', headers=a_headers).get_json()['hours']
+    assert sum(h['requested'] for h in hourly) == 4
+    # A quarter fits ANALYTICS_MAX_QUERY_HOURS though it is wider than the heatmap's limit; two years do not.
+    quarter = client.get('/api/analytics/rides/hourly?from=2024-01-01T00:00:00&to=2024-03-31T00:00:00', headers=a_headers)
+    assert quarter.status_code == 200 and quarter.get_json()['hours'] == []
+    assert client.get('/api/analytics/rides/hourly?from=2023-01-01T00:00:00&to=2024-12-31T00:00:00',
+                      headers=a_headers).status_code == 400
+
+    driver = client.get(f'/api/analytics/drivers/{registered_driver["id"]}', headers=a_headers).get_json()
+    assert driver['completed'] == 2 and driver['events'] == 3 and driver['active_hours'] == 1
+
+    rebuilt = client.post('/api/analytics/rebuild', headers=a_headers).get_json()
+    assert rebuilt['differences'] == []
+
+
+def test_rebuild_reports_drift(client, registered_user, registered_admin):
+    from app.analytics import rollups
+    p_headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    client.post('/api/rides/request', headers=p_headers, json={"pickup_location": "A", "dropoff_location": "B"})
+    rollups.by_status['pending'] += 5
+
+    a_headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    assert client.post('/api/analytics/rebuild', headers=a_headers).get_json()['differences'] == [
+        "/by_status/pending: live=6 rebuilt=1"]
+    assert client.get('/api/analytics/rides/summary', headers=p_headers).status_code == 403
+
+
+def test_rebuild_rollups_cli(app, client, registered_user):
+    p_headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    client.post('/api/rides/request', headers=p_headers, json={"pickup_location": "A", "dropoff_location": "B"})
+    result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+    assert result.exit_code == 0, result.output
+    assert 'from 1 rides' in result.output
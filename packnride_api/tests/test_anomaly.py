@@ -0,0 +1,83 @@
+import datetime
+
+from app.anomaly import AnomalyDetector, SlidingWindowCounter
+
+
+def _event(event_type, seconds, driver_id=7):
+    moment = datetime.datetime(2024, 5, 1, 8, 0, 0) + datetime.timedelta(seconds=seconds)
+    return {"event_id": seconds, "driver_id": driver_id, "event_type": event_type, "timestamp": moment.isoformat()}
+
+
+def test_window_counter_forgets_old_buckets():
+    counter = SlidingWindowCounter(window_seconds=100, buckets=10)
+    assert [counter.add(t) for t in (0, 5, 50)] == [1, 2, 3]
+    assert counter.add(105) == 2   # 0 and 5 slid out
+    assert counter.add(400) == 1
+    assert counter.add(10) is None  # older than anything the ring still holds
+
+
+def test_burst_raises_one_alert_per_cooldown():
+    detector = AnomalyDetector(rules={'hard_braking': (3, 300)}, cooldown_seconds=600)
+    alerts = [detector.observe(_event('hard_braking', t)) for t in (0, 100, 200, 250, 900, 1000, 1100)]
+    raised = [a for a in alerts if a]
+    assert [a['event_id'] for a in raised] == [200, 1100]
+    assert raised[0]['count'] == 3 and raised[0]['threshold'] == 3
+
+    # Spread out events and unruled types never alert
+    assert all(detector.observe(_event('hard_braking', t, driver_id=8)) is None for t in (0, 400, 800, 1200))
+    assert all(detector.observe(_event('lane_change', t)) is None for t in range(10))
+    assert [a['alert_id'] for a in detector.alerts()] == [2, 1]
+
+
+def test_future_timestamps_do_not_blind_the_window():
+    now = datetime.datetime(2024, 5, 1, 9, 0, 0).replace(tzinfo=datetime.timezone.utc).timestamp()
+    detector = AnomalyDetector(rules={'hard_braking': (3, 300)}, clock=lambda: now)
+    detector.observe({"event_id": 0, "driver_id": 7, "event_type": 'hard_braking', "timestamp": '2300-01-01T00:00:00'})
+    alerts = [detector.observe(_event('hard_braking', 3590 + t)) for t in range(6)]
+    assert [a['event_id'] for a in alerts if a] == [3592]  # the third real event alerts
+
+
+def test_driver_state_is_bounded():
+    detector = AnomalyDetector(rules={'speeding': (5, 600)}, max_drivers=100)
+    for driver_id in range(1000):
+        detector.observe(_event('speeding', 0, driver_id=driver_id))
+    assert len(detector._drivers) == 100
+
+
+def test_alert_opens_incident_when_enabled(client, registered_admin, registered_driver, monkeypatch):
+    from app.anomaly import anomaly_detector
+    monkeypatch.setattr(anomaly_detector, 'auto_incident', True)
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    now = datetime.datetime.utcnow()
+    responses = [client.post('/api/monitoring/events', headers=headers, json={
+        "driver_id": registered_driver["id"], "event_type": "hard_braking",
+        "timestamp": (now + datetime.timedelta(seconds=i)).isoformat(),
+        "location_lat": -25.7479, "location_lon": 28.2293}).get_json() for i in range(3)]
+
+    assert 'alert' not in responses[1]
+    alert = responses[2]['alert']
+    report = client.get(f'/api/monitoring/incidents/{alert["incident_report_id"]}', headers=headers).get_json()
+    assert report['incident_type'] == 'anomaly_alert'
+    assert report['reported_by_user_id'] is None
+
+    listed = client.get(f'/api/monitoring/alerts?driver_id={registered_driver["id"]}', headers=headers).get_json()
+    assert [a['alert_id'] for a in listed['alerts']] == [alert['alert_id']]
+
+
+def test_workers_count_each_others_events_and_share_alerts(tmp_path):
+    from app.shared_store import SharedStore, SharedIDManager
+    path = str(tmp_path / 'store.sqlite3')
+    ours, theirs = (AnomalyDetector(rules={'hard_braking': (3, 300)}) for _ in range(2))
+    for detector in (ours, theirs):
+        detector.store, detector._next_alert_id = SharedStore(path, 'anomaly_alerts'), SharedIDManager(path).get_next_anomaly_alert_id
+
+    theirs.observe(_event('hard_braking', 0))
+    ours._remote_event({"op": "upsert", "record": dict(_event('hard_braking', 0), version=1)})
+    assert ours.observe(_event('hard_braking', 10)) is None
+    alert = ours.observe(_event('hard_braking', 20))
+    assert alert['event_id'] == 20  # the other worker's event counted towards the burst
+    # Their copy of the same burst starts the cooldown without a second alert.
+    for t in (10, 20):
+        assert theirs.observe(_event('hard_braking', t), local=False) is None
+    assert theirs.observe(_event('hard_braking', 30)) is None
+    assert [a['alert_id'] for a in theirs.alerts(driver_id=7)] == [alert['alert_id']]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+from app.asgi import create_asgi_app
+from app.ride_events import ride_status_broker
+
+
+def _request_ride(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.post('/api/rides/request', headers=headers,
+                           json={"pickup_location": "A", "dropoff_location": "B"})
+    return response.get_json()['ride']['id']
+
+
+def _sse_events(messages):
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return [json.loads(line[len(b'data: '):]) for line in body.split(b'\n') if line.startswith(b'data: ')]
+
+
+def test_asgi_bridges_regular_requests(app):
+    asgi = create_asgi_app(app)
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/health', 'query_string': b'', 'headers': []}
+    asyncio.run(asgi(scope, receive, send))
+
+    assert sent[0]['status'] == 200
+    assert b''.join(m.get('body', b'') for m in sent[1:]) == b'PacknRide API is healthy!'
+
+
+def test_asgi_stream_pushes_status_changes(app, client, registered_user):
+    token = registered_user["token"]
+    ride_id = _request_ride(client, token)
+    asgi = create_asgi_app(app)
+    sent = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        never = asyncio.Event()
+
+        async def receive():
+            await never.wait()
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': f'/api/rides/{ride_id}/stream',
+                 'headers': [(b'authorization', f'Bearer {token}'.encode())]}
+        stream = asyncio.ensure_future(asgi(scope, receive, send))
+        while ride_status_broker.subscriber_count(ride_id) == 0:
+            await asyncio.sleep(0.01)
+
+        await loop.run_in_executor(None, lambda: app.test_client().put(
+            f'/api/rides/{ride_id}/status', headers={'Authorization': f'Bearer {token}'},
+            json={"status": "cancelled"}))
+        await asyncio.wait_for(stream, timeout=5)
+
+    asyncio.run(run())
+
+    assert sent[0]['status'] == 200
+    assert [event['status'] for event in _sse_events(sent)] == ['pending', 'cancelled']
+    assert ride_status_broker.subscriber_count(ride_id) == 0
+
+
+def test_asgi_stream_requires_participant(app, client, registered_user, registered_driver):
+    ride_id = _request_ride(client, registered_user["token"])
+    asgi = create_asgi_app(app)
+    sent = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': f'/api/rides/{ride_id}/stream',
+             'headers': [(b'authorization', f'Bearer {registered_driver["token"]}'.encode())]}
+    asyncio.run(asgi(scope, receive, send))
+    assert sent[0]['status'] == 403
+
+
+def test_threaded_stream_ends_on_terminal_status(client, registered_user):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    ride_id = _request_ride(client, registered_user["token"])
+    client.put(f'/api/rides/{ride_id}/status', headers=headers, json={"status": "cancelled"})
+
+    response = client.get(f'/api/rides/{ride_id}/stream', headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert b'"status": "cancelled"' in response.get_data()
+
+
+def test_asgi_stream_caps_streams_per_user(app, client, registered_user):
+    from app.ride_events import QueueSubscriber
+    ride_id = _request_ride(client, registered_user["token"])
+    held = [QueueSubscriber() for _ in range(app.config['STREAM_MAX_PER_USER'])]
+    for subscriber in held:
+        assert ride_status_broker.subscribe(ride_id, subscriber, registered_user["id"], len(held))
+    sent = []
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': f'/api/rides/{ride_id}/stream',
+             'headers': [(b'authorization', f'Bearer {registered_user["token"]}'.encode())]}
+    try:
+        asyncio.run(create_asgi_app(app)(scope, receive, send))
+    finally:
+        for subscriber in held:
+            ride_status_broker.unsubscribe(ride_id, subscriber)
+    assert sent[0]['status'] == 429
+    assert ride_status_broker.subscribe(ride_id, held[0], registered_user["id"], len(held))
+    ride_status_broker.unsubscribe(ride_id, held[0])
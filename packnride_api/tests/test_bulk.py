@@ -0,0 +1,109 @@
+import gzip
+import json
+
+import pytest
+
+import bulk
+from app.shared_store import read_snapshot
+from app.utils import hash_password, verify_password
+
+HASH = hash_password('secret123')
+
+
+def _dump(path, entries):
+    with open(path, 'w') as f:
+        f.write(json.dumps(bulk.FORMAT) + '\n')
+        for store, record in entries:
+            f.write(json.dumps({"store": store, "record": record}) + '\n')
+
+
+def _fixture_entries():
+    return [
+        ('users', {"id": 7, "name": "Pat", "email": "pat@example.com", "password_hash": HASH,
+                   "user_type": "passenger"}),
+        ('users', {"id": 9, "name": "Dee", "email": "dee@example.com", "password": "drive123",
+                   "user_type": "driver"}),
+        ('rides', {"id": 3, "passenger_id": 7, "driver_id": 9, "status": "completed", "group_id": 4}),
+        ('driving_events', {"event_id": 50, "driver_id": 9, "ride_id": 3, "event_type": "harsh_braking",
+                            "timestamp": "2026-01-01T10:00:00"}),
+        ('driving_events', {"driver_id": 9, "event_type": "speeding", "timestamp": "2026-01-01T10:05:00"}),
+        ('event_summaries', {"driver_id": 9, "event_type": "speeding", "hour": "2025-12-01T08:00:00", "count": 4}),
+        ('driver_scores', {"driver_id": 9, "safety_score": 88}),
+        ('incident_reports', {"report_id": 2, "driver_id": 9, "ride_id": 3, "reported_by_user_id": 7,
+                              "incident_type": "complaint", "description": "late"}),
+    ]
+
+
+def _open(tmp_path, name):
+    return bulk.open_stores(str(tmp_path / name))
+
+
+def test_import_keeps_ids_and_export_round_trips(tmp_path):
+    source = tmp_path / 'in.ndjson'
+    _dump(source, _fixture_entries())
+    stores, ids, versions = _open(tmp_path, 'a.sqlite3')
+    summary = bulk.Importer(stores, ids, versions, batch_size=2).load(str(source))
+
+    assert summary['imported'] == {"users": 2, "rides": 1, "driving_events": 2, "event_summaries": 1,
+                                   "driver_scores": 1, "incident_reports": 1}
+    assert summary['passwords_hashed'] == 1
+    dee = stores['users']['dee@example.com']
+    assert dee['id'] == 9 and 'password' not in dee and verify_password('drive123', dee['password_hash'])
+    # The event without an ID got one from a reserved block, above the IDs given.
+    assert sorted(stores['driving_events']) == [50, 51]
+    assert ids.get_next_user_id() == 10 and ids.get_next_driving_event_id() > 51
+    assert '9:speeding:490160' in stores['event_summaries']
+    assert versions.get('driving_events') == 1
+
+    dump = str(tmp_path / 'out.ndjson.gz')
+    counts = bulk.export(stores, dump, read_snapshot(stores['users'].path))
+    assert counts == summary['imported']
+    with gzip.open(dump, 'rt') as f:
+        assert json.loads(next(f)) == bulk.FORMAT
+        assert [json.loads(line)['store'] for line in f][:3] == ['users', 'users', 'rides']
+
+    copy, copy_ids, copy_versions = _open(tmp_path, 'b.sqlite3')
+    bulk.Importer(copy, copy_ids, copy_versions).load(dump)
+    for name in bulk.STORES:
+        assert dict(copy[name].items()) == dict(stores[name].items())
+
+
+def test_renumber_merges_into_a_store_with_data(tmp_path):
+    source = tmp_path / 'in.ndjson'
+    entries = _fixture_entries() + [
+        ('rides', {"id": 4, "passenger_id": 99, "status": "pending"}),  # unknown passenger
+        ('users', {"id": 11, "email": "nopass@example.com"}),
+    ]
+    _dump(source, entries)
+    stores, ids, versions = _open(tmp_path, 'a.sqlite3')
+    stores['users']['pat@example.com'] = {"id": 1, "email": "pat@example.com", "password_hash": HASH}
+    ids.advance_to('user', 1)
+    ids.advance_to('ride', 20)
+
+    summary = bulk.Importer(stores, ids, versions, renumber=True).load(str(source))
+    assert summary['skipped'] == {"rides": 1, "users": 1}
+    assert any('user 99' in error for error in summary['errors'])
+
+    assert stores['users']['pat@example.com']['id'] == 1  # existing account kept
+    dee_id = stores['users']['dee@example.com']['id']
+    (ride,) = stores['rides'].values()
+    assert ride['id'] > 20 and (ride['passenger_id'], ride['driver_id'], ride['group_id']) == (1, dee_id, None)
+    events = list(stores['driving_events'].values())
+    assert {e['driver_id'] for e in events} == {dee_id}
+    assert sorted(e['ride_id'] for e in events if e['ride_id'] is not None) == [ride['id']]
+    (report,) = stores['incident_reports'].values()
+    assert (report['driver_id'], report['ride_id'], report['reported_by_user_id']) == (dee_id, ride['id'], 1)
+    assert f'{dee_id}:speeding:490160' in stores['event_summaries']
+
+
+def test_rejects_unrecognised_hashes_and_newer_formats(tmp_path):
+    source = tmp_path / 'in.ndjson'
+    _dump(source, [('users', {"id": 1, "email": "x@example.com", "password_hash": "plaintext"}),
+                   ('trips', {"id": 1})])
+    stores, ids, versions = _open(tmp_path, 'a.sqlite3')
+    summary = bulk.Importer(stores, ids, versions).load(str(source))
+    assert summary['imported'] == {} and summary['skipped'] == {"users": 1, "trips": 1}
+
+    source.write_text(json.dumps({"format": "packnride-dump", "version": 2}) + '\n')
+    with pytest.raises(bulk.BulkError):
+        bulk.Importer(stores, ids, versions).load(str(source))
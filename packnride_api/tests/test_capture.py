@@ -0,0 +1,79 @@
+import gzip
+import json
+
+import pytest
+
+import replay
+from app import users_db, rides_db, id_manager, store_versions, change_log
+from app.capture import traffic_capture, read_capture, capture_files, REDACTED
+from app.pooling import pooling
+from app.ride_history import ride_history
+
+
+@pytest.fixture
+def capture(tmp_path):
+    path = str(tmp_path / 'traffic.ndjson.gz')
+    settings = traffic_capture.max_bytes, traffic_capture.backups
+    traffic_capture.open(path)
+    yield path
+    traffic_capture.close()
+    traffic_capture.max_bytes, traffic_capture.backups = settings
+
+
+def _session(client):
+    client.post('/auth/register', json={"name": "Pat", "email": "pat@example.com",
+                                        "password": "password123", "user_type": "passenger"})
+    token = client.post('/auth/login', json={"email": "pat@example.com",
+                                             "password": "password123"}).get_json()['access_token']
+    auth = {'Authorization': f'Bearer {token}'}
+    ride_id = client.post('/api/rides/request', headers=auth, json={
+        "pickup_location": "A", "dropoff_location": "B"}).get_json()['ride']['id']
+    client.get(f'/api/rides/{ride_id}', headers=auth)
+    client.get('/api/rides/99', headers=auth)
+
+
+def test_captures_requests_with_identity_and_redacted_passwords(client, capture):
+    _session(client)
+    traffic_capture.close()
+
+    records = list(read_capture(capture))
+    assert [(r['method'], r['path'], r['status']) for r in records] == [
+        ('POST', '/auth/register', 201), ('POST', '/auth/login', 200), ('POST', '/api/rides/request', 201),
+        ('GET', '/api/rides/1', 200), ('GET', '/api/rides/99', 404)]
+    assert records[0]['body']['password'] == REDACTED and 'identity' not in records[0]
+    assert records[2]['identity']['email'] == 'pat@example.com' and records[2]['body']['pickup_location'] == 'A'
+    assert 'body' not in records[3] and all(r['ms'] >= 0 and r['bytes'] > 0 for r in records)
+    with gzip.open(capture, 'rt') as f:
+        assert 'password123' not in f.read()
+
+
+def test_capture_rotates_and_reads_back_in_order(client, capture):
+    traffic_capture.max_bytes, traffic_capture.backups = 300, 2
+    for _ in range(20):
+        client.get('/health')
+    traffic_capture.close()
+    files = capture_files(capture)
+    assert files == [capture + '.2', capture + '.1', capture]  # the oldest were dropped
+    records = list(read_capture(capture))
+    assert 0 < len(records) < 20
+    assert [r['t'] for r in records] == sorted(r['t'] for r in records)
+
+
+def test_replay_reproduces_the_captured_statuses(app, client, capture):
+    _session(client)
+    traffic_capture.close()
+
+    # Start the replay from empty stores, as a fresh process would.
+    users_db.clear()
+    rides_db.clear()
+    id_manager.user_id_counter = id_manager.ride_id_counter = 0
+    store_versions.reset()
+    change_log.reset()
+    ride_history.clear()
+    pooling.clear()
+
+    report = replay.Replayer(app).run(read_capture(capture))
+    assert report['requests'] == 5 and report['status_mismatches'] == 0
+    assert report['routes']['GET /api/rides/<id>']['count'] == 2
+    assert users_db['pat@example.com']['password_hash'] and rides_db[1]['pickup_location'] == 'A'
+    json.dumps(report)  # --save writes it as JSON
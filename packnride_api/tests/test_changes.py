@@ -0,0 +1,88 @@
+import json
+
+from app.changes import ChangeLog
+
+
+def _changes(client, token, since=0, **params):
+    query = '&'.join(f'{k}={v}' for k, v in {'since': since, **params}.items())
+    response = client.get(f'/api/changes?{query}', headers={'Authorization': f'Bearer {token}'})
+    lines = [json.loads(line) for line in response.get_data().splitlines() if line]
+    return response, lines
+
+
+def test_changes_feed_returns_only_new_mutations(client, registered_admin, registered_driver):
+    response, changes = _changes(client, registered_admin["token"])
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert [c['store'] for c in changes] == ['users', 'users']
+    assert all('password_hash' not in c['record'] for c in changes)
+    last_seq = int(response.headers['X-Changes-Last-Seq'])
+    assert last_seq == changes[-1]['seq']
+
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    report = client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "complaint", "description": "Late pickup."
+    }).get_json()['report']
+    client.put(f'/api/monitoring/incidents/{report["report_id"]}', headers=headers, json={"status": "closed"})
+
+    _, changes = _changes(client, registered_admin["token"], since=last_seq)
+    assert [(c['store'], c['key'], c['record']['status']) for c in changes] == [
+        ('incident_reports', report["report_id"], 'open'),
+        ('incident_reports', report["report_id"], 'closed'),
+    ]
+
+
+def test_changes_feed_requires_admin(client, registered_user):
+    response, _ = _changes(client, registered_user["token"])
+    assert response.status_code == 403
+
+
+def test_changes_feed_reports_gone_when_history_dropped(client, registered_admin, monkeypatch):
+    from app import change_log
+    monkeypatch.setattr(change_log, '_oldest_seq', 5)
+    response, _ = _changes(client, registered_admin["token"], since=1)
+    assert response.status_code == 410
+    assert response.get_json()['oldest_seq'] == 5
+
+
+def test_changes_feed_rejects_a_cursor_from_another_epoch(client, registered_admin):
+    from app import change_log
+    response, _ = _changes(client, registered_admin["token"])
+    epoch = response.headers['X-Changes-Epoch']
+    assert _changes(client, registered_admin["token"], since=1, epoch=epoch)[0].status_code == 200
+
+    change_log.reset()  # as after a restart: seqs start over
+    response, _ = _changes(client, registered_admin["token"], since=1, epoch=epoch)
+    assert response.status_code == 410 and response.get_json()['epoch'] == change_log.epoch != epoch
+
+
+def test_change_log_spills_to_disk(tmp_path):
+    log = ChangeLog(max_in_memory=10, spill_path=str(tmp_path / 'changes.ndjson'))
+    log.reset()
+    for i in range(1, 51):
+        log.record('rides', i, {"id": i})
+
+    assert log.oldest_seq == 1
+    assert [c['seq'] for c in log.since(0, 100)] == list(range(1, 51))
+    assert [c['seq'] for c in log.since(37, 5)] == [38, 39, 40, 41, 42]
+    assert [c['key'] for c in log.since(45, 100)] == [46, 47, 48, 49, 50]
+
+
+def test_change_log_without_spill_drops_oldest():
+    log = ChangeLog(max_in_memory=10)
+    for i in range(1, 26):
+        log.record('rides', i, {"id": i})
+    assert log.oldest_seq > 1
+    assert [c['seq'] for c in log.since(log.oldest_seq - 1, 100)][-1] == 25
+
+
+def test_change_log_spills_in_batches_without_blocking_writers(tmp_path):
+    log = ChangeLog(max_in_memory=1000, spill_path=str(tmp_path / 'changes.ndjson'))
+    log.reset()
+    with log._spill_lock:  # another writer is busy spilling
+        for i in range(1, 1101):
+            log.record('rides', i, {"id": i})
+        assert len(log._entries) == 1100
+    log.record('rides', 1101, {"id": 1101})
+    assert len(log._entries) == 1101 - 256  # one batch, not half the log
+    assert [c['seq'] for c in log.since(0, 2000)] == list(range(1, 1102))
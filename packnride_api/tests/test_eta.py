@@ -0,0 +1,66 @@
+import pytest
+
+from app.eta import EtaService, eta, write_matrix, cell_center, UNKNOWN
+
+ORIGIN = (-26.2, 28.0)  # 2 x 2 cells of 1 km
+
+
+def _matrix(path):
+    # From cell a to cell b: 60 s within a cell, 100 s per cell step, except 3 -> 0 which has no route.
+    times = [60 if a == b else 100 * (abs(a // 2 - b // 2) + abs(a % 2 - b % 2)) for a in range(4) for b in range(4)]
+    times[3 * 4 + 0] = UNKNOWN
+    write_matrix(path, *ORIGIN, 1.0, 2, 2, times)
+    return str(path)
+
+
+def test_lookups_come_from_the_matrix(tmp_path):
+    service = EtaService()
+    service.load(_matrix(tmp_path / 'eta.bin'))
+    cells = [cell_center(*ORIGIN, 1.0, 2, index) for index in range(4)]
+    assert service.seconds(*cells[0], *cells[3]) == {"seconds": 200, "source": 'matrix'}
+    assert service.batch(cells, cells[1]) == [{"seconds": s, "source": 'matrix'} for s in (100, 60, 200, 100)]
+
+    # No route, or outside the grid: straight line x circuity at the fallback speed.
+    assert service.seconds(*cells[3], *cells[0])['source'] == 'estimate'
+    assert service.seconds(*cells[0], -26.0, 28.0)['source'] == 'estimate'
+    service.clear()
+    assert not service.loaded and service.seconds(*cells[0], *cells[3])['source'] == 'estimate'
+
+
+def test_rejects_files_that_are_not_matrices(tmp_path):
+    path = tmp_path / 'bad.bin'
+    path.write_bytes(b'not a matrix')
+    with pytest.raises(ValueError):
+        EtaService().load(str(path))
+    with pytest.raises(ValueError):
+        write_matrix(str(path), *ORIGIN, 1.0, 2, 2, [60] * 3)
+
+
+def test_rides_and_nearby_drivers_carry_etas(tmp_path, client, registered_user, registered_driver, registered_admin):
+    eta.load(_matrix(tmp_path / 'eta.bin'))
+    cells = [cell_center(*ORIGIN, 1.0, 2, index) for index in range(4)]
+    passenger = {'Authorization': f'Bearer {registered_user["token"]}'}
+    driver = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    ride = client.post('/api/rides/request', headers=passenger, json={
+        "pickup_location": "A", "dropoff_location": "B", "pickup_lat": cells[0][0], "pickup_lon": cells[0][1],
+        "dropoff_lat": cells[3][0], "dropoff_lon": cells[3][1]}).get_json()['ride']
+    assert ride['eta'] == {"trip": {"seconds": 200, "source": 'matrix'}}
+
+    client.put('/api/drivers/me/location', headers=driver, json={"lat": cells[1][0], "lon": cells[1][1]})
+    nearby = client.get(f'/api/drivers/nearby?lat={cells[0][0]}&lon={cells[0][1]}', headers=passenger).get_json()
+    assert nearby['available_drivers'][0]['eta'] == {"seconds": 100, "source": 'matrix'}
+
+    client.post(f'/api/rides/{ride["id"]}/accept', headers=driver)
+    response = client.get(f'/api/rides/{ride["id"]}', headers=passenger)
+    assert response.get_json()['eta']['driver'] == {"seconds": 100, "source": 'matrix'}
+    # The driver moving changes the ETag even though the ride itself did not change.
+    client.put('/api/drivers/me/location', headers=driver, json={"lat": cells[3][0], "lon": cells[3][1]})
+    moved = client.get(f'/api/rides/{ride["id"]}', headers={**passenger, 'If-None-Match': response.headers['ETag']})
+    assert moved.status_code == 200 and moved.get_json()['eta']['driver']['source'] == 'estimate'
+
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    body = client.post('/api/eta/batch', headers=admin, json={
+        "origins": [{"lat": lat, "lon": lon} for lat, lon in cells], "destination": {"lat": cells[0][0], "lon": cells[0][1]}})
+    assert [e['seconds'] for e in body.get_json()['etas'][:3]] == [60, 100, 100]
+    assert client.post('/api/eta/batch', headers=admin, json={"origins": [{"lat": 'x'}], "destination": {"lat": 0, "lon": 0}}).status_code == 400
+    assert client.post('/api/eta/batch', headers=passenger, json={"origins": [], "destination": {"lat": 0, "lon": 0}}).status_code == 403
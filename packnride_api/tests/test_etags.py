@@ -0,0 +1,67 @@
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_ride_etag_revalidation(client, registered_user, registered_driver):
+    headers = _auth(registered_user["token"])
+    ride = client.post('/api/rides/request', headers=headers,
+                       json={"pickup_location": "A", "dropoff_location": "B"}).get_json()['ride']
+    assert ride['version'] == 1
+
+    first = client.get(f'/api/rides/{ride["id"]}', headers=headers)
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert 'no-cache' in first.headers['Cache-Control']
+
+    unchanged = client.get(f'/api/rides/{ride["id"]}', headers={**headers, 'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.get_data() == b''
+    assert unchanged.headers['ETag'] == etag
+
+    client.post(f'/api/rides/{ride["id"]}/accept', headers=_auth(registered_driver["token"]))
+    changed = client.get(f'/api/rides/{ride["id"]}', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['version'] == 2
+    assert changed.headers['ETag'] != etag
+
+
+def test_score_etag_changes_on_update(client, registered_admin, registered_driver):
+    headers = _auth(registered_admin["token"])
+    url = f'/api/monitoring/drivers/{registered_driver["id"]}/score'
+    etag = client.get(url, headers=headers).headers['ETag']
+    assert client.get(url, headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    client.put(url, headers=headers, json={"overall_safety_score": 70})
+    response = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 1
+
+
+def test_incident_list_uses_collection_version(client, registered_admin, registered_driver):
+    headers = _auth(registered_admin["token"])
+    report = client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "complaint", "description": "Loud music."
+    }).get_json()['report']
+
+    list_etag = client.get('/api/monitoring/incidents', headers=headers).headers['ETag']
+    filtered_etag = client.get('/api/monitoring/incidents?status=open', headers=headers).headers['ETag']
+    assert list_etag != filtered_etag
+    assert client.get('/api/monitoring/incidents', headers={**headers, 'If-None-Match': list_etag}).status_code == 304
+
+    detail_etag = client.get(f'/api/monitoring/incidents/{report["report_id"]}', headers=headers).headers['ETag']
+    client.put(f'/api/monitoring/incidents/{report["report_id"]}', headers=headers, json={"status": "closed"})
+
+    assert client.get('/api/monitoring/incidents', headers={**headers, 'If-None-Match': list_etag}).status_code == 200
+    assert client.get(f'/api/monitoring/incidents/{report["report_id"]}',
+                      headers={**headers, 'If-None-Match': detail_etag}).status_code == 200
+
+
+def test_etags_do_not_survive_a_restart(client, registered_user):
+    from app import store_versions
+    headers = _auth(registered_user["token"])
+    ride = client.post('/api/rides/request', headers=headers,
+                       json={"pickup_location": "A", "dropoff_location": "B"}).get_json()['ride']
+    etag = client.get(f'/api/rides/{ride["id"]}', headers=headers).headers['ETag']
+
+    store_versions.reset()  # counters start over, as after a restart; so does the epoch
+    assert client.get(f'/api/rides/{ride["id"]}', headers={**headers, 'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,73 @@
+import datetime
+
+from app.heatmap import Heatmap, geohash_code, geohash_string, hour_of
+
+
+def test_geohash_matches_reference():
+    # Well-known example: 57.64911, 10.40744 -> u4pruydqqvj
+    assert geohash_string(geohash_code(57.64911, 10.40744, 7), 7) == 'u4pruyd'
+    assert geohash_string(geohash_code(57.64911, 10.40744, 7) >> 10, 5) == 'u4pru'
+
+
+def test_counts_roll_up_by_precision_hour_and_bbox():
+    hour = hour_of('2024-05-01T08:15:00')
+    heatmap = Heatmap(clock=lambda: (hour + 2) * 3600)
+    for _ in range(3):
+        heatmap.add(-26.2041, 28.0473, hour, 'hard_braking')       # Johannesburg
+    heatmap.add(-26.2042, 28.0474, hour + 1, 'speeding')
+    heatmap.add(-33.9249, 18.4241, hour, 'speeding')               # Cape Town
+
+    johannesburg = (-26.5, 27.8, -26.0, 28.3)
+    cells = heatmap.query(johannesburg, 5, hour, hour + 1)
+    assert len(cells) == 1
+    assert cells[0]['count'] == 4
+    assert cells[0]['by_type'] == {'hard_braking': 3, 'speeding': 1}
+
+    assert heatmap.query(johannesburg, 5, hour, hour)[0]['count'] == 3
+    assert heatmap.query(johannesburg, 5, hour, hour + 1, {'speeding'})[0]['count'] == 1
+    world = heatmap.query((-90, -180, 90, 180), 2, hour, hour + 1)
+    assert sum(c['count'] for c in world) == 5
+
+
+def test_hours_are_bounded_by_the_server_clock():
+    now_hour = hour_of('2024-05-01T08:15:00')
+    heatmap = Heatmap(retention_hours=24, clock=lambda: now_hour * 3600 + 600)
+    assert heatmap.add(-26.2, 28.0, now_hour, 'speeding')
+    # A client clock far in the future neither prunes current tiles nor creates future ones.
+    assert heatmap.add(-26.2, 28.0, hour_of('2300-01-01T00:00:00'), 'speeding')
+    assert not heatmap.add(-26.2, 28.0, now_hour - 24, 'speeding')
+    assert [c['count'] for c in heatmap.query((-90, -180, 90, 180), 2, now_hour, now_hour)] == [2]
+    assert heatmap.query((-90, -180, 90, 180), 2, now_hour + 1, now_hour + 1000) == []
+
+
+def test_heatmap_endpoint(client, registered_admin, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    two_hours_ago = (datetime.datetime.utcnow() - datetime.timedelta(hours=2)).replace(minute=15)
+    for event_type in ('hard_braking', 'hard_braking', 'speeding'):
+        client.post('/api/monitoring/events', headers=headers, json={
+            "driver_id": registered_driver["id"], "event_type": event_type, "timestamp": two_hours_ago.isoformat(),
+            "location_lat": -25.7479, "location_lon": 28.2293})
+    client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "accident", "description": "Minor collision.",
+        "location_lat": -25.7480, "location_lon": 28.2290})
+
+    response = client.get('/api/monitoring/heatmap?bbox=-26,28,-25.5,28.5&zoom=10'
+                          f'&from={two_hours_ago.isoformat()}&to={two_hours_ago.isoformat()}', headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['precision'] == 4
+    assert body['total'] == 3
+    assert body['cells'][0]['by_type'] == {'hard_braking': 2, 'speeding': 1}
+
+    # The incident is binned under its creation time (now)
+    assert client.get('/api/monitoring/heatmap?bbox=-26,28,-25.5,28.5&types=incident',
+                      headers=headers).get_json()['total'] == 1
+
+    assert client.get('/api/monitoring/heatmap?bbox=1,2,3', headers=headers).status_code == 400
+    assert client.get('/api/monitoring/heatmap?from=2020-01-01T00:00:00&to=2024-01-01T00:00:00',
+                      headers=headers).status_code == 400
+
+
+def test_heatmap_requires_admin(client, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    assert client.get('/api/monitoring/heatmap', headers=headers).status_code == 403
@@ -0,0 +1,95 @@
+import datetime
+import threading
+
+from app import rides_db, driving_events_db
+from app.idempotency import IdempotencyCache
+
+
+def test_ride_request_replay_returns_cached_response(client, registered_user):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}', 'Idempotency-Key': 'ride-abc'}
+    payload = {"pickup_location": "1 Main St", "dropoff_location": "10 End Rd"}
+
+    first = client.post('/api/rides/request', headers=headers, json=payload)
+    second = client.post('/api/rides/request', headers=headers, json=payload)
+
+    assert first.status_code == 201
+    assert second.status_code == 201
+    assert second.headers.get('Idempotent-Replayed') == 'true'
+    assert second.get_json()['ride']['id'] == first.get_json()['ride']['id']
+    assert len(rides_db) == 1
+
+
+def test_ride_request_key_reused_with_different_body(client, registered_user):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}', 'Idempotency-Key': 'ride-abc'}
+    client.post('/api/rides/request', headers=headers, json={"pickup_location": "A", "dropoff_location": "B"})
+    response = client.post('/api/rides/request', headers=headers, json={"pickup_location": "A", "dropoff_location": "C"})
+    assert response.status_code == 422
+    assert len(rides_db) == 1
+
+
+def test_requests_without_key_are_not_deduplicated(client, registered_user):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    payload = {"pickup_location": "A", "dropoff_location": "B"}
+    client.post('/api/rides/request', headers=headers, json=payload)
+    client.post('/api/rides/request', headers=headers, json=payload)
+    assert len(rides_db) == 2
+
+
+def test_driving_event_replay(client, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_driver["token"]}', 'Idempotency-Key': 'evt-1'}
+    event_data = {
+        "driver_id": registered_driver["id"], "event_type": "speeding",
+        "timestamp": datetime.datetime.utcnow().isoformat(), "location_lat": 0.0, "location_lon": 0.0
+    }
+    first = client.post('/api/monitoring/events', headers=headers, json=event_data)
+    second = client.post('/api/monitoring/events', headers=headers, json=event_data)
+    assert first.status_code == second.status_code == 201
+    assert second.get_json()['event']['event_id'] == first.get_json()['event']['event_id']
+    assert len(driving_events_db) == 1
+
+
+def test_cache_coalesces_concurrent_duplicates():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=10, wait_seconds=5)
+    leader, is_leader = cache.begin((1, 'k'), 'fp')
+    assert is_leader
+
+    results = []
+
+    def duplicate():
+        entry, dup_is_leader = cache.begin((1, 'k'), 'fp')
+        assert not dup_is_leader
+        entry.done.wait(5)
+        results.append(entry.body)
+
+    threads = [threading.Thread(target=duplicate) for _ in range(3)]
+    for t in threads:
+        t.start()
+    cache.complete((1, 'k'), leader, 201, b'{"ok": true}', 'application/json')
+    for t in threads:
+        t.join()
+    assert results == [b'{"ok": true}'] * 3
+
+
+def test_cache_is_size_and_ttl_bounded():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=2)
+    for i in range(5):
+        entry, _ = cache.begin((1, str(i)), 'fp')
+        cache.complete((1, str(i)), entry, 200, b'{}', 'application/json')
+    assert len(cache) == 2
+
+    cache.ttl_seconds = 0
+    entry, _ = cache.begin((1, 'x'), 'fp')
+    cache.complete((1, 'x'), entry, 200, b'{}', 'application/json')
+    _, is_leader = cache.begin((1, 'x'), 'fp')
+    assert is_leader
+
+
+def test_running_requests_do_not_block_eviction():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=3)
+    slow, _ = cache.begin((1, 'slow'), 'fp')  # still running while the others complete
+    for i in range(10):
+        entry, _ = cache.begin((1, str(i)), 'fp')
+        cache.complete((1, str(i)), entry, 200, b'{}', 'application/json')
+    assert len(cache) == 3  # the running request counts against max_entries
+    assert cache.begin((1, 'slow'), 'fp') == (slow, False)
+    assert cache.begin((1, '9'), 'fp')[1] is False and cache.begin((1, '0'), 'fp')[1] is True
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from app.jobs import JobScheduler, jobs
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_delay_priority_and_dedup():
+    clock, ran = Clock(), []
+    scheduler = JobScheduler(workers=0, clock=clock)
+    scheduler.register('record', ran.append)
+    scheduler.enqueue('record', 'later', delay=10)
+    scheduler.enqueue('record', 'low', priority=5)
+    scheduler.enqueue('record', 'high', priority=1)
+    first = scheduler.enqueue('record', 'deduped', dedup_key='k')
+    assert scheduler.enqueue('record', 'dropped', dedup_key='k') == first
+    with pytest.raises(KeyError):
+        scheduler.enqueue('missing')
+
+    assert scheduler.run_pending() == 3
+    assert ran == ['deduped', 'high', 'low']
+    clock.now += 10
+    scheduler.run_pending()
+    assert ran[-1] == 'later'
+    # Once the deduplicated job has run, the key can be queued again.
+    assert scheduler.enqueue('record', 'again', dedup_key='k') != first
+
+
+def test_periodic_jobs_and_metrics():
+    clock, ran = Clock(), []
+
+    def flaky(_payload):
+        ran.append(clock.now)
+        if len(ran) == 2:
+            raise RuntimeError('boom')
+
+    scheduler = JobScheduler(workers=0, clock=clock)
+    scheduler.register('tick', flaky)
+    scheduler.every('tick', 60)
+    for _ in range(3):
+        clock.now += 60
+        scheduler.run_pending()
+    clock.now += 200  # missed slots are skipped, not run back to back
+    assert scheduler.run_pending() == 1
+    assert ran == [1060, 1120, 1180, 1380]
+    stats = scheduler.stats()['handlers']['tick']
+    assert (stats['runs'], stats['failures'], stats['last_error']) == (4, 1, 'RuntimeError: boom')
+    assert stats['max_wait_ms'] == 140000  # the 1240 slot ran at 1380; the next one is 1420
+    assert scheduler.queued() == 1 and scheduler.run_pending(now=1419) == 0 and scheduler.run_pending(now=1420) == 1
+
+
+def test_journal_keeps_deferred_jobs_across_restarts(tmp_path):
+    path, ran = str(tmp_path / 'jobs.ndjson'), []
+    first = JobScheduler(workers=0, queue_path=path)
+    first.register('record', ran.append)
+    first.start()
+    first.enqueue('record', {'n': 1})
+    first.enqueue('record', {'n': 2}, delay=3600)
+    first.run_pending()
+    first.stop()
+
+    second = JobScheduler(workers=0, queue_path=path)
+    second.register('record', ran.append)
+    second.start()
+    assert second.queued() == 1 and second.stats()['durable']
+    second.run_pending(now=second.clock() + 3600)
+    second.stop()
+    assert ran == [{'n': 1}, {'n': 2}]
+
+
+def test_workers_run_jobs_and_stop_gracefully():
+    done, hook = threading.Event(), []
+    scheduler = JobScheduler(workers=2)
+    scheduler.register('set', lambda _payload: done.set())
+    scheduler.on_shutdown(lambda: hook.append('closed'))
+    scheduler.start()
+    scheduler.enqueue('set')
+    assert done.wait(5)
+    scheduler.stop(timeout=5)
+    assert hook == ['closed'] and scheduler.stats()['workers'] == 0
+
+
+def test_pooled_requests_queue_one_match_pass(client, registered_user, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    for pickup, dropoff in (((-26.146, 28.041), (-26.107, 28.056)), ((-26.148, 28.043), (-26.106, 28.058))):
+        client.post('/api/rides/request', headers=headers, json={
+            "pickup_location": "Rosebank", "dropoff_location": "Sandton", "pool": True,
+            "pickup_lat": pickup[0], "pickup_lon": pickup[1], "dropoff_lat": dropoff[0], "dropoff_lon": dropoff[1]})
+    assert jobs.queued() == 1
+    jobs.run_pending(now=jobs.clock() + 60)
+
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    stats = client.get('/api/monitoring/jobs', headers=admin).get_json()
+    assert stats['handlers']['pooling.match']['runs'] == 1
+    ride = client.get('/api/rides/1', headers=headers).get_json()
+    assert ride['group_id'] == 1
+    assert client.get('/api/monitoring/jobs', headers=headers).status_code == 403
@@ -0,0 +1,68 @@
+import dataclasses
+import datetime
+import json
+
+import pytest
+
+from app.json_provider import FastJSONProvider, RawJSON, record_cache
+
+
+@dataclasses.dataclass
+class Point:
+    lat: float
+    lon: float
+
+
+class SlottedPoint:
+    __slots__ = ('lat', 'lon')
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+
+
+@pytest.fixture(params=[True, False], ids=['orjson', 'stdlib'])
+def provider(app, request, monkeypatch):
+    json_provider = FastJSONProvider(app)
+    monkeypatch.setattr(json_provider, 'use_orjson', request.param)
+    return json_provider
+
+
+def test_encodes_records_and_raw_fragments(provider):
+    payload = {
+        "point": Point(1.5, 2.5),
+        "slotted": SlottedPoint(3.0, 4.0),
+        "events": [RawJSON(b'{"event_id":1}'), RawJSON(b'{"event_id":2}')],
+        "note": "\x00deadbeef:0\x00",
+    }
+    decoded = json.loads(provider.dumps(payload))
+    assert decoded == {
+        "point": {"lat": 1.5, "lon": 2.5},
+        "slotted": {"lat": 3.0, "lon": 4.0},
+        "events": [{"event_id": 1}, {"event_id": 2}],
+        "note": "\x00deadbeef:0\x00",
+    }
+
+
+def test_response_is_compact_and_sorted(provider):
+    response = provider.response({"b": 1, "a": [1, 2]})
+    assert response.mimetype == 'application/json'
+    assert response.get_data() == b'{"a":[1,2],"b":1}\n'
+
+
+def test_driver_events_reuse_cached_encoding(app, client, registered_driver, monkeypatch):
+    monkeypatch.setattr(app.json, 'use_orjson', False)
+    headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    for event_type in ("speeding", "idling"):
+        client.post('/api/monitoring/events', headers=headers, json={
+            "driver_id": registered_driver["id"], "event_type": event_type,
+            "timestamp": datetime.datetime.utcnow().isoformat(), "location_lat": 0.0, "location_lon": 0.0
+        })
+
+    first = client.get(f'/api/monitoring/drivers/{registered_driver["id"]}/events', headers=headers)
+    assert len(record_cache) == 2
+    second = client.get(f'/api/monitoring/drivers/{registered_driver["id"]}/events', headers=headers)
+
+    assert first.get_data() == second.get_data()
+    assert [e['event_type'] for e in second.get_json()['events']] == ["idling", "speeding"]
+    assert len(record_cache) == 2
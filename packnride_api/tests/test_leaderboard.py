@@ -0,0 +1,73 @@
+import random
+
+from app.leaderboard import ScoreIndex
+
+
+def test_index_tracks_score_changes():
+    index = ScoreIndex()
+    rng = random.Random(5)
+    scores = {}
+    for _ in range(2000):
+        driver_id = rng.randrange(200)
+        scores[driver_id] = rng.randint(0, 100)
+        index.update({"driver_id": driver_id, "overall_safety_score": scores[driver_id]})
+
+    expected = sorted(((v, d) for d, v in scores.items()), reverse=True)[:10]
+    assert [(d, v) for d, v, _ in index.top('overall_safety_score', 10)] == [(d, v) for v, d in expected]
+    worst = sorted((v, d) for d, v in scores.items())[:5]
+    assert [(d, v) for d, v, _ in index.top('overall_safety_score', 5, descending=False)] == [(d, v) for v, d in worst]
+
+    index.remove(expected[0][1])
+    assert index.top('overall_safety_score', 1)[0][0] == expected[1][1]
+    assert index.top('efficiency_score', 10) == []
+
+
+def test_top_filters_by_update_time():
+    index = ScoreIndex()
+    index.update({"driver_id": 1, "efficiency_score": 90, "last_updated_timestamp": "2024-01-01T00:00:00"})
+    index.update({"driver_id": 2, "efficiency_score": 80, "last_updated_timestamp": "2024-05-01T00:00:00"})
+    assert [d for d, _, _ in index.top('efficiency_score', 5, updated_since="2024-04-29")] == [2]
+
+
+def test_filtered_top_matches_a_full_scan_on_both_paths():
+    index = ScoreIndex()
+    rng = random.Random(7)
+    records = {}
+    for _ in range(3000):
+        driver_id = rng.randrange(1000)
+        records[driver_id] = {"driver_id": driver_id, "efficiency_score": rng.randint(0, 100),
+                              "last_updated_timestamp": "2024-05-%02dT00:00:00" % rng.randint(1, 30)}
+        index.update(records[driver_id])
+
+    # "30" leaves few recent drivers (selected directly), "05" most of them (walked).
+    for since in ("2024-05-30", "2024-05-05"):
+        for descending in (True, False):
+            recent = [(r['efficiency_score'], d) for d, r in records.items() if r['last_updated_timestamp'] >= since]
+            expected = sorted(recent, reverse=descending)[:10]
+            top = index.top('efficiency_score', 10, descending=descending, updated_since=since)
+            assert [(v, d) for d, v, _ in top] == expected
+
+
+def test_leaderboard_endpoint(client, registered_admin, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    client.put(f'/api/monitoring/drivers/{registered_driver["id"]}/score', headers=headers,
+               json={"overall_safety_score": 72.5, "efficiency_score": 88})
+
+    response = client.get('/api/monitoring/leaderboard?metric=overall_safety_score&order=asc&k=100', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['drivers'] == [{
+        "rank": 1, "driver_id": registered_driver["id"], "overall_safety_score": 72.5,
+        "last_updated_timestamp": response.get_json()['drivers'][0]['last_updated_timestamp']}]
+
+    client.put(f'/api/monitoring/drivers/{registered_driver["id"]}/score', headers=headers,
+               json={"overall_safety_score": 95})
+    drivers = client.get('/api/monitoring/leaderboard', headers=headers).get_json()['drivers']
+    assert [d['overall_safety_score'] for d in drivers] == [95]
+
+    assert client.get('/api/monitoring/leaderboard?metric=name', headers=headers).status_code == 400
+    assert client.get('/api/monitoring/leaderboard?k=0', headers=headers).status_code == 400
+    assert client.get('/api/monitoring/leaderboard?updated_since=last-week', headers=headers).status_code == 400
+    recent = client.get('/api/monitoring/leaderboard?updated_since=2024-05-01T00:00:00%2B02:00', headers=headers)
+    assert [d['driver_id'] for d in recent.get_json()['drivers']] == [registered_driver["id"]]
+    driver_headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    assert client.get('/api/monitoring/leaderboard', headers=driver_headers).status_code == 403
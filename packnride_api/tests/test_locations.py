@@ -0,0 +1,79 @@
+from app.locations import DriverLocationTable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _put_location(client, token, **body):
+    return client.put('/api/drivers/me/location', headers={'Authorization': f'Bearer {token}'}, json=body)
+
+
+def test_heartbeat_feeds_nearby_search(client, registered_user, registered_driver):
+    response = _put_location(client, registered_driver["token"], lat=-33.9249, lon=18.4241, heading=90)
+    assert response.status_code == 204
+
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    drivers = client.get('/api/drivers/nearby?lat=-33.93&lon=18.42&radius_km=2', headers=headers).get_json()['available_drivers']
+    assert [d['id'] for d in drivers] == [registered_driver["id"]]
+    assert drivers[0]['name'] == 'Test Driver'
+    assert drivers[0]['location'] == {"lat": -33.9249, "lon": 18.4241}
+    assert drivers[0]['distance_km'] < 2
+
+    far = client.get('/api/drivers/nearby?lat=-26.2&lon=28.04&radius_km=5', headers=headers).get_json()
+    assert far['available_drivers'] == []
+    assert client.get('/api/drivers/nearby?lat=-26.2&lon=28.04&radius_km=5000', headers=headers).status_code == 400
+
+    listing = client.get('/api/drivers/nearby', headers=headers).get_json()['available_drivers']
+    assert listing[0]['current_status'] == 'available'
+
+    _put_location(client, registered_driver["token"], status='offline')
+    listing = client.get('/api/drivers/nearby', headers=headers).get_json()['available_drivers']
+    assert listing[0]['location'] is None and listing[0]['current_status'] == 'unknown'
+
+
+def test_heartbeat_validation(client, registered_user, registered_driver):
+    assert _put_location(client, registered_user["token"], lat=0, lon=0).status_code == 403
+    assert _put_location(client, registered_driver["token"], lat=95, lon=0).status_code == 400
+    assert _put_location(client, registered_driver["token"], lon=0).status_code == 400
+    assert _put_location(client, registered_driver["token"], lat=0, lon=0, status='asleep').status_code == 400
+
+
+def test_stale_drivers_expire_without_scans():
+    clock = FakeClock()
+    table = DriverLocationTable(ttl_seconds=30, clock=clock)
+    table.update(1, 10.0, 10.0)
+    table.update(2, 10.001, 10.001)
+
+    for _ in range(10):
+        clock.now += 5
+        table.update(1, 10.0, 10.0)  # driver 1 keeps reporting, driver 2 went quiet
+    assert table.get(1) is not None
+    assert table.get(2) is None
+    assert len(table) == 1
+
+    clock.now += 31
+    table.expire()
+    assert len(table) == 0
+
+
+def test_moving_driver_changes_cell():
+    table = DriverLocationTable(cell_degrees=0.01, clock=FakeClock())
+    table.update(1, 10.0, 10.0)
+    table.update(1, 10.5, 10.5)
+    assert table.nearby(10.0, 10.0, 1) == []
+    assert [d['id'] for d in table.nearby(10.5, 10.5, 1)] == [1]
+
+
+def test_wide_search_walks_populated_cells():
+    table = DriverLocationTable(cell_degrees=0.01, clock=FakeClock())
+    table.update(1, 10.0, 10.0)
+    table.update(2, 10.3, 10.3)
+    table.update(3, 12.0, 12.0)
+    # 50 km spans ~8,000 cells, far more than the three populated ones.
+    assert [d['id'] for d in table.nearby(10.0, 10.0, 50)] == [1, 2]
+    assert [d['id'] for d in table.nearby(89.9, 0.0, 50)] == []
@@ -107,6 +107,17 @@ def test_update_driver_score_invalid_value(client, registered_admin, registered_
     assert response.status_code == 400
 
 
+def test_update_driver_score_invalid_field_changes_nothing(client, registered_admin, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    url = f'/api/monitoring/drivers/{registered_driver["id"]}/score'
+    client.put(url, headers=headers, json={"overall_safety_score": 80, "efficiency_score": 70})
+    before = dict(driver_scores_db[registered_driver["id"]])
+
+    response = client.put(url, headers=headers, json={"overall_safety_score": 50, "punctuality_score": "late"})
+    assert response.status_code == 400
+    assert driver_scores_db[registered_driver["id"]] == before  # no half-applied update, no version bump
+
+
 # --- Test Incident Logging & Reporting Endpoints ---
 
 def test_log_incident_report_by_admin(client, registered_admin, registered_driver):
@@ -0,0 +1,121 @@
+import threading
+
+from app.pooling import PoolingEngine, bearing_sector
+
+
+def _ride(ride_id, pickup, dropoff):
+    return {"id": ride_id, "status": "pending", "pool": True, "group_id": None,
+            "pickup_lat": pickup[0], "pickup_lon": pickup[1], "dropoff_lat": dropoff[0], "dropoff_lon": dropoff[1]}
+
+
+def test_bearing_sectors():
+    assert bearing_sector(0, 0, 1, 0) == 0      # north
+    assert bearing_sector(0, 0, 0, 1) == 2      # east
+    assert bearing_sector(0, 0, -1, 0) == 4     # south
+
+
+def test_groups_riders_heading_the_same_way():
+    engine = PoolingEngine()
+    # Three riders from Rosebank towards Sandton, one going the other way, one from far away.
+    engine.update(_ride(1, (-26.146, 28.041), (-26.107, 28.056)))
+    engine.update(_ride(2, (-26.148, 28.043), (-26.106, 28.058)))
+    engine.update(_ride(3, (-26.145, 28.040), (-26.108, 28.055)))
+    engine.update(_ride(4, (-26.107, 28.056), (-26.146, 28.041)))
+    engine.update(_ride(5, (-25.746, 28.188), (-25.707, 28.203)))
+
+    groups, stats = engine.match()
+    assert [sorted(ride_ids) for ride_ids, _, _, _ in groups] == [[1, 2, 3]]
+    route_km, saved_km, stops = groups[0][1:]
+    assert saved_km > route_km  # three trips for little more than the price of one
+    assert [s['stop'] for s in stops] == ['pickup'] * 3 + ['dropoff'] * 3
+    # Only nearby riders heading the same way were ever paired.
+    assert stats['pending'] == 5 and stats['pairs_checked'] == 3 and stats['triples_checked'] == 1
+
+
+def test_detour_limit_rejects_out_of_the_way_pickups():
+    # Rider 2 is picked up 2 km north of rider 1's straight 11 km trip east.
+    for max_detour, feasible in ((0.1, False), (0.5, True)):
+        engine = PoolingEngine(max_detour=max_detour)
+        engine.update(_ride(1, (0.0, 0.0), (0.0, 0.1)))
+        engine.update(_ride(2, (0.018, 0.0), (0.0, 0.11)))
+        assert (engine.evaluate([1, 2]) is not None) == feasible
+
+
+def test_index_follows_ride_state():
+    engine = PoolingEngine()
+    ride = _ride(1, (0.0, 0.0), (0.0, 0.1))
+    engine.update(ride)
+    assert len(engine) == 1
+    engine.update(dict(ride, status='accepted'))
+    assert len(engine) == 0
+    engine.rebuild([ride, dict(_ride(2, (0.0, 0.0), (0.0, 0.1)), pool=False)])
+    assert len(engine) == 1
+
+
+def test_requests_are_not_held_up_by_a_matching_pass():
+    engine = PoolingEngine()
+    engine.update(_ride(1, (-26.146, 28.041), (-26.107, 28.056)))
+    engine.update(_ride(2, (-26.148, 28.043), (-26.106, 28.058)))
+    search = engine._best_order
+    updated = []
+
+    def best_order_while_a_ride_is_requested(ride_ids, rides):
+        writer = threading.Thread(target=engine.update, args=(_ride(3, (-26.145, 28.040), (-26.108, 28.055)),))
+        writer.start()
+        writer.join(1)
+        updated.append(not writer.is_alive())
+        return search(ride_ids, rides)
+
+    engine._best_order = best_order_while_a_ride_is_requested
+    groups, stats = engine.match()
+    assert updated == [True]  # the update went through mid-search
+    assert [sorted(g[0]) for g in groups] == [[1, 2]] and stats['pending'] == 2 and len(engine) == 3
+
+
+def test_match_endpoint_proposes_groups(client, registered_user, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    ride_ids = []
+    for pickup, dropoff in (((-26.146, 28.041), (-26.107, 28.056)), ((-26.148, 28.043), (-26.106, 28.058))):
+        response = client.post('/api/rides/request', headers=headers, json={
+            "pickup_location": "Rosebank", "dropoff_location": "Sandton", "pool": True,
+            "pickup_lat": pickup[0], "pickup_lon": pickup[1], "dropoff_lat": dropoff[0], "dropoff_lon": dropoff[1]})
+        assert response.status_code == 201
+        ride_ids.append(response.get_json()['ride']['id'])
+    assert client.post('/api/rides/request', headers=headers, json={
+        "pickup_location": "A", "dropoff_location": "B", "pool": True}).status_code == 400
+
+    assert client.post('/api/rides/pool/match', headers=headers).status_code == 403
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    body = client.post('/api/rides/pool/match', headers=admin).get_json()
+    assert [g['ride_ids'] for g in body['groups']] == [ride_ids]
+    group_id = body['groups'][0]['group_id']
+
+    ride = client.get(f'/api/rides/{ride_ids[0]}', headers=headers).get_json()
+    assert ride['group_id'] == group_id
+    assert client.get(f'/api/rides/groups/{group_id}', headers=headers).get_json()['status'] == 'proposed'
+    # Grouped rides leave the index, so the next pass proposes nothing.
+    assert client.post('/api/rides/pool/match', headers=admin).get_json()['groups'] == []
+
+
+def test_lost_race_takes_the_group_off_every_ride(client, registered_user, monkeypatch):
+    from app import routes, rides_db, change_log
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    for _ in range(2):
+        client.post('/api/rides/request', headers=headers, json={
+            "pickup_location": "Rosebank", "dropoff_location": "Sandton", "pool": True,
+            "pickup_lat": -26.146, "pickup_lon": 28.041, "dropoff_lat": -26.107, "dropoff_lon": 28.056})
+    rides_db[2] = dict(rides_db[2], status='accepted', driver_id=9)  # ride 2 was taken first
+    real_compare_and_set = routes.compare_and_set
+
+    def accepted_during_rollback(store, key, record, expected_version):
+        if record.get('group_id') is None and rides_db[key]['status'] == 'pending':
+            # A driver accepts ride 1 between the rollback's read and its write.
+            current = rides_db[key]
+            rides_db[key] = dict(current, status='accepted', driver_id=8, version=current['version'] + 1)
+        return real_compare_and_set(store, key, record, expected_version)
+
+    monkeypatch.setattr(routes, 'compare_and_set', accepted_during_rollback)
+    assert routes._assign_group([1, 2], 77) is None
+    assert rides_db[1]['group_id'] is None and rides_db[1]['driver_id'] == 8
+    last = list(change_log.since(change_log.last_seq - 1, 1))[0]
+    assert (last['key'], last['record']['group_id'], last['record']['status']) == (1, None, 'accepted')
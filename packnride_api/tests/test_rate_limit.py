@@ -0,0 +1,54 @@
+import datetime
+
+from app.rate_limit import TokenBucketStore, rate_limiter
+
+
+def _event(driver_id):
+    return {
+        "driver_id": driver_id, "event_type": "speeding",
+        "timestamp": datetime.datetime.utcnow().isoformat(), "location_lat": 0.0, "location_lon": 0.0
+    }
+
+
+def test_driving_event_flood_is_rate_limited(client, registered_driver, monkeypatch):
+    monkeypatch.setitem(rate_limiter.route_limits, 'monitoring_bp.log_driving_event', (0.001, 3))
+    headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+
+    statuses = [client.post('/api/monitoring/events', headers=headers, json=_event(registered_driver["id"])).status_code
+                for _ in range(5)]
+    assert statuses == [201, 201, 201, 429, 429]
+
+    limited = client.post('/api/monitoring/events', headers=headers, json=_event(registered_driver["id"]))
+    assert limited.status_code == 429
+    assert int(limited.headers['Retry-After']) >= 1
+
+
+def test_rate_limit_buckets_are_per_user(client, registered_driver, registered_admin, monkeypatch):
+    monkeypatch.setitem(rate_limiter.route_limits, 'monitoring_bp.log_driving_event', (0.001, 1))
+    driver_headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    admin_headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+
+    assert client.post('/api/monitoring/events', headers=driver_headers, json=_event(registered_driver["id"])).status_code == 201
+    assert client.post('/api/monitoring/events', headers=driver_headers, json=_event(registered_driver["id"])).status_code == 429
+    assert client.post('/api/monitoring/events', headers=admin_headers, json=_event(registered_driver["id"])).status_code == 201
+
+
+def test_concurrency_limit_returns_503(client, monkeypatch):
+    monkeypatch.setattr(rate_limiter.concurrency, 'in_flight', rate_limiter.concurrency.max_concurrent)
+    response = client.get('/api/')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_bucket_refill_and_idle_eviction():
+    store = TokenBucketStore(max_buckets=2, idle_seconds=10)
+    assert store.consume('a', rate=1.0, burst=1, now=0.0) == 0.0
+    assert store.consume('a', rate=1.0, burst=1, now=0.5) == 0.5
+    assert store.consume('a', rate=1.0, burst=1, now=1.5) == 0.0
+
+    store.consume('b', rate=1.0, burst=1, now=2.0)
+    store.consume('c', rate=1.0, burst=1, now=3.0)
+    assert len(store) == 2
+
+    store.consume('d', rate=1.0, burst=1, now=100.0)
+    assert len(store) <= 2
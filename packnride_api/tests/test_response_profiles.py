@@ -0,0 +1,79 @@
+import datetime
+import gzip
+import json
+
+from app.response_profiles import compile_shape, parse_fields
+
+
+def _request_rides(client, token, count):
+    headers = {'Authorization': f'Bearer {token}'}
+    for i in range(count):
+        client.post('/api/rides/request', headers=headers,
+                    json={"pickup_location": f"Pickup {i}", "dropoff_location": f"Dropoff {i}"})
+    return headers
+
+
+def test_fields_select_keys_at_any_depth(client, registered_user):
+    headers = _request_rides(client, registered_user['token'], 2)
+
+    ride = client.get('/api/rides/1?fields=id,status', headers=headers).get_json()
+    assert ride == {"id": 1, "status": "pending"}
+    page = client.get('/api/rides/mine?fields=rides.id,rides.pickup_location,next_cursor,missing',
+                      headers=headers).get_json()
+    assert page == {"rides": [{"id": 2, "pickup_location": "Pickup 1"}, {"id": 1, "pickup_location": "Pickup 0"}],
+                    "next_cursor": None}
+
+    assert client.get('/api/rides/1?fields=id,,status', headers=headers).status_code == 400
+    assert client.get('/api/rides/1?profile=tiny', headers=headers).status_code == 400
+    # Error bodies are never reshaped.
+    assert client.get('/api/rides/99?fields=id', headers=headers).get_json() == {"error": "Ride not found"}
+
+
+def test_compact_profile_shortens_keys_and_timestamps(client, registered_user):
+    headers = _request_rides(client, registered_user['token'], 1)
+    full = client.get('/api/rides/1', headers=headers).get_json()
+    ride = client.get('/api/rides/1?profile=compact', headers=headers).get_json()
+    assert ride['pid'] == full['passenger_id'] and ride['st'] == 'pending' and ride['v'] == full['version']
+    requested = datetime.datetime.fromisoformat(full['requested_at']).replace(tzinfo=datetime.timezone.utc)
+    assert ride['rqt'] == round(requested.timestamp(), 3)
+    assert 'passenger_id' not in ride
+
+    both = client.get('/api/rides/1?profile=compact&fields=updated_at,status', headers=headers).get_json()
+    assert set(both) == {'upt', 'st'} and isinstance(both['upt'], float)
+    # One compiled function per field set, however the set is spelled.
+    assert compile_shape(parse_fields('status, id'), 'compact') is compile_shape(parse_fields('id,status'), 'compact')
+
+
+def test_large_responses_are_compressed_when_accepted(client, registered_user):
+    headers = _request_rides(client, registered_user['token'], 20)
+    plain = client.get('/api/rides/mine', headers=headers)
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+
+    response = client.get('/api/rides/mine', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) < len(plain.data) / 3
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+
+    small = client.get('/api/rides/1', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_each_shape_and_encoding_gets_its_own_etag(client, registered_user, registered_admin, registered_driver):
+    headers = _request_rides(client, registered_user['token'], 1)
+    tags = {url: client.get(url, headers=headers).headers['ETag']
+            for url in ('/api/rides/1', '/api/rides/1?fields=id,status', '/api/rides/1?fields=status,id',
+                        '/api/rides/1?profile=compact')}
+    assert len(set(tags.values())) == 3 and tags['/api/rides/1?fields=id,status'] == tags['/api/rides/1?fields=status,id']
+    shaped = client.get('/api/rides/1?fields=id', headers=dict(headers, **{'If-None-Match': tags['/api/rides/1']}))
+    assert shaped.status_code == 200 and shaped.get_json() == {"id": 1}
+
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    for _ in range(10):
+        client.post('/api/monitoring/incidents', headers=admin, json={
+            "driver_id": registered_driver["id"], "incident_type": "complaint", "description": "Late pickup. " * 10})
+    plain = client.get('/api/monitoring/incidents', headers=admin).headers['ETag']
+    gzipped = dict(admin, **{'Accept-Encoding': 'gzip'})
+    compressed = client.get('/api/monitoring/incidents', headers=gzipped)
+    assert compressed.headers['Content-Encoding'] == 'gzip' and compressed.headers['ETag'] == plain[:-1] + '-gzip"'
+    revalidated = client.get('/api/monitoring/incidents', headers=dict(gzipped, **{'If-None-Match': compressed.headers['ETag']}))
+    assert revalidated.status_code == 304 and revalidated.headers['ETag'] == compressed.headers['ETag']
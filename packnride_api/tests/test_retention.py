@@ -0,0 +1,81 @@
+import datetime
+
+from app import driving_events_db, event_summaries_db, change_log
+from app.retention import retention, current_hour
+
+
+def _log(client, headers, driver_id, event_type, days_ago, lat=-25.75):
+    timestamp = (datetime.datetime.utcnow() - datetime.timedelta(days=days_ago)).replace(minute=30).isoformat()
+    return client.post('/api/monitoring/events', headers=headers, json={
+        "driver_id": driver_id, "event_type": event_type, "timestamp": timestamp,
+        "location_lat": lat, "location_lon": 28.23}).get_json()['event']
+
+
+def test_pass_summarizes_then_drops(client, registered_driver, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    driver_id = registered_driver["id"]
+    old_speeding = [_log(client, headers, driver_id, 'speeding', 100, lat=lat) for lat in (-25.0, -26.0)]
+    fresh = _log(client, headers, driver_id, 'speeding', 1)
+    _log(client, headers, driver_id, 'idling', 10)    # idling: 7 days raw, 90 days summarized
+    _log(client, headers, driver_id, 'idling', 120)   # already past both tiers
+
+    report = retention.run_pass()
+    assert (report['events_compacted'], report['raw_events_after']) == (4, 1)
+    assert list(driving_events_db) == [fresh['event_id']]
+
+    summaries = client.get(f'/api/monitoring/drivers/{driver_id}/event-summaries', headers=headers).get_json()['summaries']
+    assert sorted((s['event_type'], s['count']) for s in summaries) == [('idling', 1), ('speeding', 2)]
+    speeding = next(s for s in summaries if s['event_type'] == 'speeding')
+    assert speeding['location_lat'] == -25.5
+    assert speeding['first_timestamp'] == old_speeding[0]['timestamp']
+
+    # Summarized events still count in the analytics; the dropped one no longer does.
+    driver = client.get(f'/api/analytics/drivers/{driver_id}', headers=headers).get_json()
+    assert driver['events'] == 4
+    assert client.post('/api/analytics/rebuild', headers=headers).get_json()['differences'] == []
+
+    # The event past both tiers is logged as a dropped summary, so other workers' rollups follow.
+    deletes = [(c['store'], c['record'] and c['record']['count']) for c in change_log.since(0, 100) if c['op'] == 'delete']
+    assert sorted(deletes, key=str) == [('driving_events', None)] * 4 + [('event_summaries', 1)]
+
+    # A year on, the idling summary has expired; speeding summaries are kept for 730 days,
+    # and the fresh speeding event is now past its 90 raw days too.
+    retention.run_pass(current_hour() + 24 * 365)
+    assert sorted(s['count'] for s in event_summaries_db.values() if s['event_type'] == 'speeding') == [1, 2]
+    assert not [s for s in event_summaries_db.values() if s['event_type'] == 'idling']
+    status = client.get('/api/monitoring/retention', headers=headers).get_json()
+    assert status['totals'] == {"events_compacted": 5, "summaries_dropped": 1, "passes": 2}
+    assert status['policies']['idling'] == {"raw_days": 7, "summary_days": 90}
+
+
+def test_pass_runs_in_bounded_slices(client, registered_driver, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    for _ in range(30):
+        _log(client, headers, registered_driver["id"], 'hard_braking', 200)
+    settings = retention.slice_seconds, retention.pause_seconds, retention.batch_size
+    retention.slice_seconds, retention.pause_seconds, retention.batch_size = 0.0, 0.0, 8
+    try:
+        report = retention.run_pass()
+    finally:
+        retention.slice_seconds, retention.pause_seconds, retention.batch_size = settings
+    assert report['slices'] == 4  # an expired budget still handles one batch per slice
+    assert report['events_compacted'] == 30 and not driving_events_db
+    assert retention.queued() == (0, 1)
+
+
+def test_future_stamped_events_expire_from_now(client, registered_driver, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    future = _log(client, headers, registered_driver["id"], 'speeding', -1000)  # a client clock years ahead
+    assert retention.run_pass(current_hour() + 24 * 89)['events_compacted'] == 0
+    assert retention.run_pass(current_hour() + 24 * 91)['events_compacted'] == 1
+    assert future['event_id'] not in driving_events_db
+
+
+def test_compact_events_cli(app, client, registered_driver, registered_admin):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    _log(client, headers, registered_driver["id"], 'speeding', 95)
+    result = app.test_cli_runner().invoke(args=['compact-events'])
+    assert result.exit_code == 0, result.output
+    assert 'Compacted 1 events' in result.output
+    assert client.get('/api/monitoring/retention', headers={
+        'Authorization': f'Bearer {registered_driver["token"]}'}).status_code == 403
@@ -0,0 +1,49 @@
+from app.ride_history import RideHistoryIndex
+
+
+def test_index_pages_newest_first_with_cursor():
+    index = RideHistoryIndex()
+    for ride_id in range(1, 26):
+        index.add('passenger', 7, ride_id)
+    index.add('driver', 3, 20)
+    index.add('driver', 3, 5)  # an older ride accepted later
+
+    first, cursor = index.page('passenger', 7, limit=10)
+    assert first == list(range(25, 15, -1)) and cursor == 16
+    second, cursor = index.page('passenger', 7, before=cursor, limit=10)
+    assert second == list(range(15, 5, -1))
+    third, cursor = index.page('passenger', 7, before=cursor, limit=10)
+    assert third == list(range(5, 0, -1)) and cursor is None
+
+    assert index.page('driver', 3)[0] == [20, 5]
+    assert index.page('passenger', 7, limit=3, accept=lambda ride_id: ride_id % 2 == 0)[0] == [24, 22, 20]
+    assert index.page('passenger', 99) == ([], None)
+
+
+def test_rebuild_matches_incremental():
+    rides = [{"id": i, "passenger_id": i % 3, "driver_id": (i % 2) or None} for i in range(1, 50)]
+    index = RideHistoryIndex()
+    index.rebuild(rides)
+    assert index.page('passenger', 1, limit=100)[0] == [i for i in range(49, 0, -1) if i % 3 == 1]
+    assert index.page('driver', 1, limit=100)[0] == [i for i in range(49, 0, -1) if i % 2]
+    assert index.memory_bytes() > 0
+
+
+def test_my_rides_endpoint(client, registered_user, registered_driver):
+    p_headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    d_headers = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    ride_ids = [client.post('/api/rides/request', headers=p_headers, json={
+        "pickup_location": f"Stop {i}", "dropoff_location": "Home"}).get_json()['ride']['id'] for i in range(5)]
+    client.post(f'/api/rides/{ride_ids[1]}/accept', headers=d_headers)
+    client.put(f'/api/rides/{ride_ids[3]}/status', headers=p_headers, json={"status": "cancelled"})
+
+    page = client.get('/api/rides/mine?limit=3', headers=p_headers).get_json()
+    assert [r['id'] for r in page['rides']] == ride_ids[:1:-1]
+    rest = client.get(f'/api/rides/mine?limit=3&cursor={page["next_cursor"]}', headers=p_headers).get_json()
+    assert [r['id'] for r in rest['rides']] == [ride_ids[1], ride_ids[0]] and rest['next_cursor'] is None
+
+    cancelled = client.get('/api/rides/mine?status=cancelled', headers=p_headers).get_json()
+    assert [r['id'] for r in cancelled['rides']] == [ride_ids[3]]
+    driver_rides = client.get('/api/rides/mine', headers=d_headers).get_json()
+    assert [r['id'] for r in driver_rides['rides']] == [ride_ids[1]]
+    assert client.get('/api/rides/mine?limit=0', headers=p_headers).status_code == 400
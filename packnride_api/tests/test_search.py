@@ -0,0 +1,67 @@
+from app.search import IncidentSearchIndex
+
+
+def _report(report_id, description, driver_id=1, status='open', incident_type='complaint', notes=None):
+    return {"report_id": report_id, "driver_id": driver_id, "status": status, "incident_type": incident_type,
+            "description": description, "resolution_notes": notes}
+
+
+def test_ranked_search_with_filters():
+    index = IncidentSearchIndex()
+    index.add(_report(1, "Passenger complained about loud music."))
+    index.add(_report(2, "Passenger complained, then complained again about the route.", driver_id=2))
+    index.add(_report(3, "Vehicle CA 123-456 seen speeding.", incident_type='minor_accident', status='closed'))
+    index.add(_report(4, "Passenger left a phone behind."))
+
+    total, hits = index.search("passenger complained")
+    assert total == 2
+    assert [report_id for _, report_id in hits] == [2, 1]
+    assert index.search("passenger complained", driver_id=1)[1][0][1] == 1
+    assert index.search("ca 123-456")[1][0][1] == 3
+    assert index.search("accident", status='closed')[1][0][1] == 3
+    assert index.search("accident", status='open') == (0, [])
+    assert index.search("passenger phone", match_all=False)[0] == 3
+    assert index.search("unicorn") == (0, [])
+
+
+def test_replace_reindexes_updated_text():
+    index = IncidentSearchIndex()
+    old = _report(1, "Driver was rude.")
+    index.add(old)
+    new = dict(old, status='resolved', resolution_notes="Driver apologised in writing.")
+    index.replace(old, new)
+
+    assert index.search("apologised")[1][0][1] == 1
+    assert index.search("rude", status='open') == (0, [])
+    assert index.search("rude", status='resolved')[0] == 1
+
+    index.remove(new)
+    assert index.search("rude") == (0, [])
+
+
+def test_non_string_fields_are_indexed_as_text():
+    index = IncidentSearchIndex()
+    index.add(_report(1, 12345, incident_type=None))
+    assert index.search("12345")[0] == 1
+
+
+def test_search_endpoint(client, registered_admin, registered_driver):
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    report = client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "complaint",
+        "description": "Passenger complained about the air conditioning."}).get_json()['report']
+    client.put(f'/api/monitoring/incidents/{report["report_id"]}', headers=headers,
+               json={"resolution_notes": "Plate GP 77-12 flagged for service."})
+
+    body = client.get('/api/monitoring/incidents/search?q=passenger+complained', headers=headers).get_json()
+    assert [r['report']['report_id'] for r in body['results']] == [report["report_id"]]
+    assert client.get('/api/monitoring/incidents/search?q=GP+77-12', headers=headers).get_json()['total_matches'] == 1
+    assert client.get('/api/monitoring/incidents/search?q=complained&status=closed',
+                      headers=headers).get_json()['total_matches'] == 0
+    assert client.get('/api/monitoring/incidents/search', headers=headers).status_code == 400
+
+    invalid = client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "complaint", "description": 12345})
+    assert invalid.status_code == 400
+    from app import incident_reports_db
+    assert len(incident_reports_db) == 1
@@ -0,0 +1,95 @@
+import threading
+
+from app import users_db, rides_db
+from app.shards import RegionShardedStore, ride_position, UNPLACED
+
+JOHANNESBURG = (-26.2, 28.04)
+CAPE_TOWN = (-33.92, 18.42)
+
+
+def _ride(ride_id, position=None, **fields):
+    ride = {"id": ride_id, "driver_id": None, "status": "pending", "version": 1}
+    if position:
+        ride.update(pickup_lat=position[0], pickup_lon=position[1])
+    return dict(ride, **fields)
+
+
+def test_records_are_stored_in_the_shard_of_their_region():
+    store = RegionShardedStore(ride_position, precision=3)
+    store[1] = _ride(1, JOHANNESBURG)
+    store[2] = _ride(2, CAPE_TOWN)
+    store[3] = _ride(3)
+    assert set(store.regions()) == {UNPLACED, store.region_at(*JOHANNESBURG), store.region_at(*CAPE_TOWN)}
+    assert [r['id'] for r in store.shard_at(*JOHANNESBURG).values()] == [1]
+    assert store[2]['pickup_lat'] == CAPE_TOWN[0] and store.get(4) is None and 3 in store and len(store) == 3
+    assert sorted(store) == [1, 2, 3]
+
+    store[1] = _ride(1, CAPE_TOWN)  # a record whose position changes moves to its new region
+    assert sorted(r['id'] for r in store.shard_at(*CAPE_TOWN).values()) == [1, 2]
+    assert len(store.shard_at(*JOHANNESBURG)) == 0
+    del store[2]
+    assert sorted(store) == [1, 3] and len(store) == 2
+    store.clear()
+    assert len(store) == 0 and list(store.values()) == []
+
+
+def test_compare_and_set_and_fan_out_per_shard():
+    store = RegionShardedStore(ride_position, precision=3, fan_out_threads=4)
+    store[1] = _ride(1, JOHANNESBURG)
+    store[2] = _ride(2, CAPE_TOWN, driver_id=7, status="accepted")
+    assert store.compare_and_set(1, _ride(1, JOHANNESBURG, driver_id=8, status="accepted", version=2), 1)
+    assert not store.compare_and_set(1, _ride(1, JOHANNESBURG, driver_id=9, version=2), 1)
+    assert not store.compare_and_set(5, _ride(5), 0)
+    assert store.update_item(6, lambda ride: _ride(6, CAPE_TOWN)) == store[6]
+
+    busy = store.map_shards(lambda rides: {r['driver_id'] for r in rides.values() if r['driver_id']})
+    assert len(busy) == 2 and set().union(*busy) == {7, 8}
+
+
+def test_register_with_home_position_and_nearby_fallback(client, registered_user):
+    response = client.post('/auth/register', json={
+        "name": "Home Driver", "email": "home@example.com", "password": "pw", "user_type": "driver",
+        "home_lat": JOHANNESBURG[0], "home_lon": JOHANNESBURG[1]})
+    assert response.status_code == 201
+    assert users_db.region_of(users_db["home@example.com"]) == users_db.region_at(*JOHANNESBURG)
+    assert client.post('/auth/register', json={
+        "name": "Bad", "email": "bad@example.com", "password": "pw", "home_lat": 91, "home_lon": 0}).status_code == 400
+
+    # Drivers on an active ride in any region are left out of the fallback listing.
+    driver_id = response.get_json()['user']['id']
+    rides_db[100] = _ride(100, CAPE_TOWN, driver_id=driver_id, status="accepted")
+    headers = {'Authorization': f'Bearer {registered_user["token"]}'}
+    drivers = client.get('/api/drivers/nearby', headers=headers).get_json()['available_drivers']
+    assert drivers == []
+    rides_db[100] = _ride(100, CAPE_TOWN, driver_id=driver_id, status="completed")
+    drivers = client.get('/api/drivers/nearby', headers=headers).get_json()['available_drivers']
+    assert [d['id'] for d in drivers] == [driver_id]
+
+
+def test_plain_writes_wait_for_the_region_write_lock():
+    store = RegionShardedStore(ride_position, precision=3)
+    store[1] = _ride(1, JOHANNESBURG)
+    lock = store._write_locks[store.region_at(*JOHANNESBURG)]
+    with lock:  # as held by compare_and_set between its version check and its write
+        writer = threading.Thread(target=store.__setitem__, args=(1, _ride(1, JOHANNESBURG, version=2)))
+        writer.start()
+        writer.join(0.1)
+        assert writer.is_alive() and store[1]['version'] == 1
+    writer.join()
+    assert store[1]['version'] == 2
+
+
+def test_pending_rides_near_a_region_border(client, registered_user, registered_driver):
+    passenger = {'Authorization': f'Bearer {registered_user["token"]}'}
+    for pickup in ((-26.71, 28.04), (-26.73, 28.04), CAPE_TOWN, (-26.72, 28.05)):  # regions split at -26.71875
+        client.post('/api/rides/request', headers=passenger, json={
+            "pickup_location": "A", "dropoff_location": "B", "pickup_lat": pickup[0], "pickup_lon": pickup[1],
+            "dropoff_lat": -26.1, "dropoff_lon": 28.05})
+    driver = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    client.post('/api/rides/4/accept', headers=driver)
+
+    response = client.get('/api/rides/pending?lat=-26.72&lon=28.04&radius_km=5', headers=driver)
+    assert [r['id'] for r in response.get_json()['rides']] == [1, 2]
+    assert rides_db.region_of(rides_db[1]) != rides_db.region_of(rides_db[2])
+    assert client.get('/api/rides/pending?lat=-26.72&lon=28.04', headers=passenger).status_code == 403
+    assert client.get('/api/rides/pending?lat=-26.72', headers=driver).status_code == 400
@@ -0,0 +1,222 @@
+import datetime
+import multiprocessing
+
+from app.shared_store import SharedStore, SharedIDManager
+
+
+def test_shared_store_behaves_like_a_dict(tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    rides = SharedStore(path, 'rides')
+    rides[1] = {"id": 1, "status": "pending"}
+    rides[2] = {"id": 2, "status": "accepted"}
+
+    assert rides.get(1)["status"] == "pending"
+    assert rides.get(3) is None
+    assert 2 in rides and 3 not in rides
+    assert len(rides) == 2
+    assert sorted(rides) == [1, 2]
+    assert sorted(r["id"] for r in rides.values()) == [1, 2]
+
+    ride = rides[1]
+    ride["status"] = "accepted"
+    rides[1] = ride
+    assert SharedStore(path, 'rides')[1]["status"] == "accepted"
+
+    del rides[2]
+    assert list(rides.items()) == [(1, {"id": 1, "status": "accepted"})]
+    rides.clear()
+    assert len(rides) == 0
+
+
+def test_string_keys_round_trip(tmp_path):
+    users = SharedStore(str(tmp_path / 'store.sqlite3'), 'users')
+    users["a@example.com"] = {"id": 1}
+    assert list(users) == ["a@example.com"]
+
+
+def _allocate(path, count, out):
+    ids = SharedIDManager(path)
+    out.put([ids.get_next_ride_id() for _ in range(count)])
+
+
+def test_ids_are_unique_across_processes(tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    SharedIDManager(path)
+    ctx = multiprocessing.get_context('fork')
+    out = ctx.Queue()
+    workers = [ctx.Process(target=_allocate, args=(path, 200, out)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    allocated = [i for _ in workers for i in out.get(timeout=30)]
+    for w in workers:
+        w.join()
+
+    assert sorted(allocated) == list(range(1, 801))
+
+
+def test_shared_change_log_sequence(tmp_path):
+    from app.shared_store import SharedChangeLog
+    log = SharedChangeLog(str(tmp_path / 'store.sqlite3'))
+    log.record('users', 'a@example.com', {"id": 1, "password_hash": "x"})
+    log.record('rides', 1, {"id": 1})
+
+    assert log.last_seq == 2
+    changes = list(log.since(0, 10))
+    assert [(c['seq'], c['store'], c['key']) for c in changes] == [(1, 'users', 'a@example.com'), (2, 'rides', 1)]
+    assert 'password_hash' not in changes[0]['record']
+
+
+def test_change_follower_applies_only_other_processes_writes(tmp_path):
+    from app.changes import ChangeFollower
+    from app.shared_store import SharedChangeLog, connect
+    path = str(tmp_path / 'store.sqlite3')
+    ours, theirs = SharedChangeLog(path), SharedChangeLog(path)
+    follower = ChangeFollower()
+    seen, gaps = [], []
+    follower.register('rides', lambda change: seen.append(change['key']))
+    follower.on_gap(lambda: gaps.append(True))
+    follower.start(ours, ours.last_seq, interval_seconds=3600)
+    try:
+        ours.record('rides', 1, {"id": 1})
+        theirs.record('rides', 2, {"id": 2})
+        theirs.record('users', 'a@example.com', {"id": 1})
+        assert follower.catch_up() == 2
+        assert seen == [2] and not gaps
+
+        theirs.record('rides', 3, {"id": 3})
+        connect(path).execute('DELETE FROM changes')  # pruned before the follower got to it
+        theirs.record('rides', 4, {"id": 4})
+        follower.catch_up()
+        assert gaps == [True] and seen == [2]
+    finally:
+        follower.stop()
+
+
+def _accept(path, driver_id, both_read, out):
+    from app.versioning import compare_and_set
+    rides = SharedStore(path, 'rides')
+    ride = rides[1]
+    read_version = ride['version']
+    both_read.wait(30)
+    ride.update(driver_id=driver_id, status='accepted', version=read_version + 1)
+    out.put(compare_and_set(rides, 1, ride, read_version))
+
+
+def test_compare_and_set_lets_one_of_two_workers_win(tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    SharedStore(path, 'rides')[1] = {"id": 1, "status": "pending", "driver_id": None, "version": 1}
+    ctx = multiprocessing.get_context('fork')
+    out, both_read = ctx.Queue(), ctx.Barrier(2)
+    workers = [ctx.Process(target=_accept, args=(path, driver_id, both_read, out)) for driver_id in (7, 8)]
+    for w in workers:
+        w.start()
+    results = sorted(out.get(timeout=30) for _ in workers)
+    for w in workers:
+        w.join()
+
+    assert results == [False, True]
+    assert SharedStore(path, 'rides')[1]['version'] == 2
+
+
+def test_compare_and_set_on_a_dict():
+    from app.versioning import compare_and_set
+    rides = {1: {"id": 1, "version": 2}}
+    assert not compare_and_set(rides, 1, {"id": 1, "version": 2}, 1)
+    assert compare_and_set(rides, 1, {"id": 1, "version": 3}, 2)
+    assert not compare_and_set(rides, 2, {"id": 2, "version": 1}, None)
+    assert rides == {1: {"id": 1, "version": 3}}
+
+
+def test_rate_buckets_are_shared_between_workers(tmp_path):
+    from app.shared_store import SharedTokenBucketStore
+    path = str(tmp_path / 'store.sqlite3')
+    one, two = SharedTokenBucketStore(path), SharedTokenBucketStore(path)
+    assert one.consume(('user:1', 'main_bp.request_ride'), 1, 2, now=100.0) == 0
+    assert two.consume(('user:1', 'main_bp.request_ride'), 1, 2, now=100.0) == 0
+    assert one.consume(('user:1', 'main_bp.request_ride'), 1, 2, now=100.0) == 1.0
+    assert two.consume(('user:1', 'main_bp.request_ride'), 1, 2, now=101.0) == 0
+    assert len(one) == 1
+
+
+def test_idempotency_keys_are_shared_between_workers(tmp_path):
+    from app.shared_store import SharedIdempotencyCache
+    path = str(tmp_path / 'store.sqlite3')
+    one, two = SharedIdempotencyCache(path), SharedIdempotencyCache(path)
+    entry, leader = one.begin((1, 'key'), 'fp')
+    duplicate, duplicate_leads = two.begin((1, 'key'), 'fp')
+    assert leader and not duplicate_leads
+    assert not duplicate.done.wait(0.05)
+
+    one.complete((1, 'key'), entry, 201, b'{"ride": 1}', 'application/json')
+    assert duplicate.done.wait(1)
+    assert (duplicate.status, duplicate.body) == (201, b'{"ride": 1}')
+
+    # An abandoned claim is taken over by the next request.
+    entry, _ = one.begin((1, 'other'), 'fp')
+    one.abandon((1, 'other'), entry)
+    assert two.begin((1, 'other'), 'fp')[1]
+
+
+def test_indexes_follow_other_workers_writes(client, tmp_path, monkeypatch):
+    import app as app_module
+    from app.analytics import rollups
+    from app.changes import ChangeFollower
+    from app.heatmap import heatmap
+    from app.leaderboard import score_index
+    from app.ride_history import ride_history
+    from app.search import incident_search
+    from app.shared_store import SharedChangeLog
+    path = str(tmp_path / 'store.sqlite3')
+    ours, theirs = SharedChangeLog(path), SharedChangeLog(path)
+    follower = ChangeFollower()
+    monkeypatch.setattr(app_module, 'change_follower', follower)
+    app_module._follow_other_workers()
+    follower.start(ours, ours.last_seq, interval_seconds=3600)
+    try:
+        ride = {"id": 1, "passenger_id": 10, "driver_id": None, "status": "pending",
+                "requested_at": "2024-05-01T08:00:00", "version": 1}
+        theirs.record('rides', 1, ride)
+        theirs.record('rides', 1, dict(ride, driver_id=20, status='accepted', version=2))
+        theirs.record('driver_scores', 20, {"driver_id": 20, "overall_safety_score": 80, "version": 1})
+        report = {"report_id": 1, "driver_id": 20, "description": "Minor collision", "status": "open",
+                  "location_lat": -26.2, "location_lon": 28.0, "created_at": datetime.datetime.utcnow().isoformat(),
+                  "version": 1}
+        theirs.record('incident_reports', 1, report)
+        theirs.record('incident_reports', 1, dict(report, description="Windscreen cracked", version=2))
+        follower.catch_up()
+    finally:
+        follower.stop()
+
+    assert ride_history.page('passenger', 10)[0] == [1] and ride_history.page('driver', 20)[0] == [1]
+    assert rollups.snapshot()['by_status'] == {'accepted': 1}
+    assert score_index.top('overall_safety_score', 1)[0][:2] == (20, 80)
+    assert incident_search.search('collision')[0] == 0 and incident_search.search('windscreen')[0] == 1
+    assert sum(c['count'] for c in heatmap.query((-90, -180, 90, 180), 2, 0, 10**7)) == 1
+
+
+def test_driver_positions_are_shared_between_workers(tmp_path):
+    from app.changes import ChangeFollower
+    from app.locations import DriverLocationTable
+    from app.shared_store import SharedChangeLog
+    path = str(tmp_path / 'store.sqlite3')
+    ours, theirs = DriverLocationTable(), DriverLocationTable()
+    ours.store, ours.change_log = SharedStore(path, 'driver_positions'), SharedChangeLog(path)
+    theirs.store, theirs.change_log = SharedStore(path, 'driver_positions'), SharedChangeLog(path)
+    follower = ChangeFollower()
+    follower.register('driver_positions', ours._remote_position)
+    follower.start(ours.change_log, ours.change_log.last_seq, interval_seconds=3600)
+    try:
+        theirs.update(7, -26.2, 28.04, heading=90, name='Thandi')
+        follower.catch_up()
+        assert [d['id'] for d in ours.nearby(-26.2, 28.04, 1)] == [7] and ours.get(7)['name'] == 'Thandi'
+
+        restarted = DriverLocationTable()
+        restarted.store = SharedStore(path, 'driver_positions')
+        restarted.rebuild()
+        assert restarted.get(7)['location'] == {"lat": -26.2, "lon": 28.04}
+
+        theirs.remove(7)
+        follower.catch_up()
+        assert ours.get(7) is None and len(theirs.store) == 0
+    finally:
+        follower.stop()
@@ -0,0 +1,88 @@
+import threading
+
+from app.snapshots import SnapshotDict, snapshot
+
+
+def test_behaves_like_a_dict_in_insertion_order():
+    store = SnapshotDict(chunk_size=3)
+    for key in range(1, 8):
+        store[key] = {"id": key}
+    store[2] = {"id": 2, "status": "resolved"}
+    del store[5]
+    store[5] = {"id": 5}
+    assert list(store) == [1, 2, 3, 4, 6, 7, 5]
+    assert len(store) == 7 and 5 in store and 9 not in store
+    assert store[2]["status"] == "resolved" and store.get(9) is None and store.get(9, 0) == 0
+    assert store.pop(7)["id"] == 7 and store.pop(7, None) is None
+    assert dict(store.items()) == {k: v for k, v in store.items()}
+    store.clear()
+    assert len(store) == 0 and list(store.values()) == []
+
+
+def test_snapshot_is_unchanged_by_later_writes():
+    store = SnapshotDict(chunk_size=2)
+    for key in range(1, 6):
+        store[key] = key
+    view = snapshot(store)
+    assert snapshot(store) is view  # no writes in between: shared
+
+    store[1] = 'changed'
+    del store[3]
+    store[6] = 6
+    assert list(view.items()) == [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)]
+    assert view[3] == 3 and len(view) == 5
+    assert list(store.items()) == [(1, 'changed'), (2, 2), (4, 4), (5, 5), (6, 6)]
+
+
+def test_scans_run_while_other_threads_write():
+    store = SnapshotDict(chunk_size=64)
+    for key in range(5000):
+        store[key] = {"id": key}
+    stop = threading.Event()
+    failures = []
+
+    def write():
+        key = 5000
+        try:
+            while not stop.is_set():
+                store[key] = {"id": key}
+                store.pop(key - 4000, None)  # both writers pop the same keys
+                key += 1
+        except Exception as e:
+            failures.append(e)
+
+    writers = [threading.Thread(target=write) for _ in range(2)]
+    for writer in writers:
+        writer.start()
+    try:
+        for _ in range(200):
+            view = store.snapshot()
+            ids = [record["id"] for record in view.values()]  # a plain dict raises RuntimeError here
+            assert len(ids) == len(view) == len(set(ids))
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join()
+    assert failures == []
+
+
+def test_plain_mappings_are_returned_as_they_are():
+    store = {"a": 1}
+    assert snapshot(store) is store
+
+
+def test_route_updates_leave_earlier_snapshots_whole(client, registered_admin, registered_driver):
+    from app import incident_reports_db, driver_scores_db
+    headers = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    client.post('/api/monitoring/incidents', headers=headers, json={
+        "driver_id": registered_driver["id"], "incident_type": "vehicle_issue", "description": "Flat tire"})
+    client.put(f'/api/monitoring/drivers/{registered_driver["id"]}/score', headers=headers,
+               json={"overall_safety_score": 80})
+    reports, scores = snapshot(incident_reports_db), snapshot(driver_scores_db)
+
+    client.put('/api/monitoring/incidents/1', headers=headers, json={"status": "resolved"})
+    client.put(f'/api/monitoring/drivers/{registered_driver["id"]}/score', headers=headers,
+               json={"overall_safety_score": 60})
+    assert (reports[1]['status'], reports[1]['version']) == ('open', 1)
+    assert (scores[registered_driver["id"]]['overall_safety_score'], scores[registered_driver["id"]]['version']) == (80, 1)
+    assert incident_reports_db[1]['status'] == 'resolved' and driver_scores_db[registered_driver["id"]]['version'] == 2
@@ -0,0 +1,85 @@
+import math
+
+from app.polyline import new_trace, append_points, decode_points, simplify, encode_polyline
+
+
+def _started_ride(client, passenger, driver):
+    p_headers = {'Authorization': f'Bearer {passenger["token"]}'}
+    d_headers = {'Authorization': f'Bearer {driver["token"]}'}
+    ride_id = client.post('/api/rides/request', headers=p_headers, json={
+        "pickup_location": "Station", "dropoff_location": "Airport"}).get_json()['ride']['id']
+    client.post(f'/api/rides/{ride_id}/accept', headers=d_headers)
+    for status in ('en_route_pickup', 'arrived_pickup', 'started'):
+        client.put(f'/api/rides/{ride_id}/status', headers=d_headers, json={"status": status})
+    return ride_id, p_headers, d_headers
+
+
+def test_trace_round_trip_is_exact_to_a_microdegree():
+    points = [(-33.9249 + i * 0.0001, 18.4241 - i * 0.00007, 1700000000 + i) for i in range(300)]
+    trace = new_trace(1)
+    append_points(trace, points[:100])
+    append_points(trace, points[100:])
+
+    decoded = decode_points(trace['encoded'])
+    assert len(decoded) == trace['point_count'] == 300
+    assert all(abs(a[0] - b[0]) < 1e-6 and abs(a[1] - b[1]) < 1e-6 and a[2] == b[2] for a, b in zip(points, decoded))
+    assert len(trace['encoded']) < 300 * 8
+
+
+def test_out_of_order_points_are_rejected_without_changing_trace():
+    trace = append_points(new_trace(1), [(0.0, 0.0, 100)])
+    try:
+        append_points(trace, [(0.0, 0.001, 101), (0.0, 0.002, 99)])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+    assert trace['point_count'] == 1
+
+
+def test_simplify_keeps_corners():
+    straight = [(0.0, i * 0.0001, i) for i in range(50)]
+    turn = [(i * 0.0001, 0.0049, 50 + i) for i in range(1, 50)]
+    simplified = simplify(straight + turn, tolerance_m=1)
+    assert [p[2] for p in simplified] == [0, 49, 99]
+    assert simplify(straight + turn, 0) == straight + turn
+
+
+def test_encode_polyline_matches_reference():
+    # Example from the encoded polyline algorithm documentation
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_driver_uploads_trace_and_passenger_reads_it(client, registered_user, registered_driver):
+    ride_id, p_headers, d_headers = _started_ride(client, registered_user, registered_driver)
+    points = [{"lat": -33.9 + 0.0001 * math.sin(i / 10), "lon": 18.4 + 0.0001 * i, "t": 1700000000 + i} for i in range(120)]
+
+    response = client.post(f'/api/rides/{ride_id}/trace', headers=d_headers, json={"points": points[:60]})
+    assert response.status_code == 200
+    client.post(f'/api/rides/{ride_id}/trace', headers=d_headers, json={"points": points[60:]})
+
+    full = client.get(f'/api/rides/{ride_id}/trace', headers=p_headers).get_json()
+    assert full['returned_points'] == 120
+    assert full['points'][5] == {"lat": round(points[5]['lat'], 6), "lon": round(points[5]['lon'], 6), "t": points[5]['t']}
+    assert full['stats']['duration_seconds'] == 119
+    assert full['stats']['bytes_per_minute'] > 0
+
+    display = client.get(f'/api/rides/{ride_id}/trace?tolerance_m=5&format=polyline', headers=p_headers).get_json()
+    assert display['returned_points'] < 120
+    assert isinstance(display['polyline'], str)
+
+    # Each batch is a versioned write that shows up in the change log.
+    from app import change_log, trip_traces_db
+    assert trip_traces_db[ride_id]['version'] == 2
+    assert [c['record']['point_count'] for c in change_log.since(0, 100) if c['store'] == 'trip_traces'] == [60, 120]
+
+
+def test_trace_upload_rules(client, registered_user, registered_driver):
+    ride_id, p_headers, d_headers = _started_ride(client, registered_user, registered_driver)
+    point = {"lat": 1.0, "lon": 2.0, "t": 1700000000}
+    assert client.post(f'/api/rides/{ride_id}/trace', headers=p_headers, json={"points": [point]}).status_code == 403
+    assert client.post(f'/api/rides/{ride_id}/trace', headers=d_headers, json={"points": [{"lat": 1.0}]}).status_code == 400
+
+    client.put(f'/api/rides/{ride_id}/status', headers=d_headers, json={"status": "completed"})
+    assert client.post(f'/api/rides/{ride_id}/trace', headers=d_headers, json={"points": [point]}).status_code == 409
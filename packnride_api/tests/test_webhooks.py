@@ -0,0 +1,123 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import webhook_outbox_db
+from app.webhooks import webhooks, sign
+
+
+class StubReceiver(ThreadingHTTPServer):
+    """Local partner endpoint: answers each POST with the next queued status (default 200)."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.statuses, self.bodies, self.clients = [], [], set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/hooks"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.clients.add(self.client_address)
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+            if status == 200:
+                self.server.bodies.append((json.loads(body), self.headers.get('X-PacknRide-Signature'), body))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def receiver():
+    server = StubReceiver()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings = webhooks.senders, webhooks.backoff_seconds, webhooks.batch_size
+    webhooks.senders, webhooks.backoff_seconds = 2, 0.01
+    yield server
+    webhooks.stop()
+    webhooks.senders, webhooks.backoff_seconds, webhooks.batch_size = settings
+    server.shutdown()
+    server.server_close()
+
+
+def _subscribe(client, admin, url, events, **extra):
+    return client.post('/api/webhooks', headers=admin, json={"url": url, "events": events, **extra})
+
+
+def test_transitions_are_delivered_in_batches_over_kept_alive_connections(client, registered_user, registered_driver,
+                                                                          registered_admin, receiver):
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    response = _subscribe(client, admin, receiver.url, ['ride.accepted', 'ride.completed'], secret='s3cret')
+    assert response.status_code == 201 and 'secret' not in response.get_json()
+
+    passenger = {'Authorization': f'Bearer {registered_user["token"]}'}
+    driver = {'Authorization': f'Bearer {registered_driver["token"]}'}
+    for _ in range(3):
+        ride_id = client.post('/api/rides/request', headers=passenger, json={
+            "pickup_location": "A", "dropoff_location": "B"}).get_json()['ride']['id']
+        client.post(f'/api/rides/{ride_id}/accept', headers=driver)
+    # Written to the outbox only: nothing is sent until the senders run.
+    assert len(webhook_outbox_db) == 3 and not receiver.bodies
+
+    webhooks.start()
+    assert webhooks.wait_idle(5)
+    delivered = [n for body, _, _ in receiver.bodies for n in body['notifications']]
+    assert [(n['event'], n['data']['id']) for n in delivered] == [('ride.accepted', 1), ('ride.accepted', 2), ('ride.accepted', 3)]
+    body, signature, raw = receiver.bodies[0]
+    assert len(receiver.bodies) == 1 and signature == sign('s3cret', raw)
+    assert not webhook_outbox_db
+
+    client.put(f'/api/rides/{ride_id}/status', headers=driver, json={"status": "en_route_pickup"})
+    for status in ('arrived_pickup', 'started', 'completed'):
+        client.put(f'/api/rides/{ride_id}/status', headers=driver, json={"status": status})
+    assert webhooks.wait_idle(5)
+    assert receiver.bodies[-1][0]['notifications'][0]['event'] == 'ride.completed'
+    assert len(receiver.clients) == 1  # both POSTs reused one connection
+    assert webhooks.stats()['connections'] == 1
+
+
+def test_retries_with_backoff_then_fails_permanently(client, registered_admin, registered_driver, receiver):
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    _subscribe(client, admin, receiver.url, ['incident.opened'])
+    receiver.statuses = [503, 429]
+    client.post('/api/monitoring/incidents', headers=admin, json={
+        "driver_id": registered_driver['id'], "incident_type": "complaint", "description": "late"})
+    webhooks.start()
+    assert webhooks.wait_idle(5)
+    assert [n['event'] for n in receiver.bodies[0][0]['notifications']] == ['incident.opened']
+    assert webhooks.stats()['retried'] == 2
+
+    # Other client errors are not retried; the record stays in the outbox as failed.
+    receiver.statuses = [410]
+    client.post('/api/monitoring/incidents', headers=admin, json={
+        "driver_id": registered_driver['id'], "incident_type": "complaint", "description": "rude"})
+    assert webhooks.wait_idle(5)
+    (failed,) = webhook_outbox_db.values()
+    assert (failed['status'], failed['attempts'], failed['last_error']) == ('failed', 1, 'HTTP 410')
+    listing = client.get('/api/webhooks', headers=admin).get_json()
+    assert listing['endpoints'][0]['failed_notifications'] == 1 and listing['delivery']['failed'] == 1
+
+
+def test_endpoint_validation(client, registered_user, registered_admin):
+    admin = {'Authorization': f'Bearer {registered_admin["token"]}'}
+    assert _subscribe(client, admin, 'ftp://example.com', ['ride.accepted']).status_code == 400
+    assert _subscribe(client, admin, 'https://example.com/h', ['ride.teleported']).status_code == 400
+    user = {'Authorization': f'Bearer {registered_user["token"]}'}
+    assert _subscribe(client, user, 'https://example.com/h', ['ride.accepted']).status_code == 403
+    endpoint_id = _subscribe(client, admin, 'https://example.com/h', ['ride.accepted']).get_json()['id']
+    assert client.delete(f'/api/webhooks/{endpoint_id}', headers=admin).status_code == 204
+    assert client.delete(f'/api/webhooks/{endpoint_id}', headers=admin).status_code == 404